@@ -0,0 +1,185 @@
+"""/exportfoodorders on 3,000 orders: orders CSV plus meal summary.
+
+The in-memory collections evaluate the queries and aggregation pipelines and
+charge ``ROUND_TRIP`` seconds per query. "before" is the old export: a
+``find`` over the orders with a ``find_one`` per order for its user, then
+another ``find`` over the paid orders counted in Python. "after" is
+``Food._orders_csv`` and ``Food._meal_summary_csv``, one aggregation each,
+run concurrently. Both produce the same files, which is checked.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_food_export
+"""
+import asyncio
+import csv
+import datetime
+import importlib
+import io
+import random
+from collections import Counter
+from time import perf_counter
+from types import SimpleNamespace
+
+food_menu = importlib.import_module("zns-chatbot.food_menu")
+food_module = importlib.import_module("zns-chatbot.plugins.food")
+memory_db = importlib.import_module("zns-chatbot.memory_db")
+
+ORDERS = 3_000
+ROUND_TRIP = 0.0005  # seconds
+PASS_KEY = "bench_pass"
+BOT_ID = 1
+
+
+def make_order(rng: random.Random, user_id: int, menu: dict) -> dict:
+    details = {}
+    for day_key, day_menu in menu.items():
+        lunch_items = day_menu["lunch"]
+        lunch_type = rng.choice(["no-lunch", "individual-items", "combo-with-soup", "combo-no-soup"])
+        if lunch_type == "individual-items":
+            lunch = {"type": lunch_type, "items": rng.sample(range(len(lunch_items)), 3)}
+        elif lunch_type == "no-lunch":
+            lunch = {"type": lunch_type}
+        else:
+            lunch = {
+                "type": lunch_type,
+                "items": {
+                    f"{item['category']}_index": index
+                    for index, item in rng.sample(list(enumerate(lunch_items)), 6)
+                },
+            }
+        details[day_key] = {"lunch": lunch, "dinner": rng.sample(range(len(day_menu["dinner"])), 2)}
+    total, is_complete = food_menu.MenuIndex(menu).price(details)
+    order = {
+        "user_id": user_id,
+        "pass_key": PASS_KEY,
+        "order_details": details,
+        "total": total,
+        "is_complete": is_complete,
+        "payment_status": rng.choice([None, "paid", "paid", "proof_submitted"]),
+    }
+    if order["payment_status"] == "paid":
+        order["payment_confirmed_date"] = datetime.datetime(2026, 1, 1)
+    return order
+
+
+def make_food() -> tuple:
+    food = food_module.Food.__new__(food_module.Food)
+    food.menu_file = food_menu.MenuFile(food_module.MENU_PATH)
+    # Food.bot is the telegram Bot, whose own user is Bot.bot
+    food.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=BOT_ID))))
+    food.default_pass_key = lambda: PASS_KEY
+    rng = random.Random(3)
+    database = memory_db.MemoryDatabase(latency=ROUND_TRIP)
+    food.user_db = database.collection("users", (
+        {"bot_id": BOT_ID, "user_id": n, "username": f"user{n}", "print_name": f"User {n}"}
+        for n in range(ORDERS)
+    ))
+    food.food_db = database.collection(
+        "food", (make_order(rng, n, food.menu) for n in range(ORDERS)),
+    )
+    return food, database
+
+
+async def before(food) -> tuple[bytes, bytes]:
+    """The old export's queries and counting."""
+    menu = food.menu
+    output = io.StringIO()
+    writer = csv.writer(output)
+    columns = [
+        (day_key, meal_type)
+        for day_key, config in menu.items()
+        for meal_type in ("lunch", "dinner")
+        if config.get(meal_type)
+    ]
+    writer.writerow([
+        "ID Пользователя", "Username", "Print Name", "Legal Name", "Оплачено",
+        "Платеж Подтвержден", "Итого Сумма",
+        *(
+            f"{food.DAY_NAMES_RU[day_key]} {'Обед' if meal_type == 'lunch' else 'Ужин'}"
+            for day_key, meal_type in columns
+        ),
+    ])
+    async for order in food.food_db.find({"pass_key": PASS_KEY}):
+        user_doc = await food.user_db.find_one({"user_id": order["user_id"], "bot_id": BOT_ID}) or {}
+        writer.writerow([
+            order["user_id"], user_doc.get("username", ""), user_doc.get("print_name", ""),
+            user_doc.get("legal_name", ""),
+            "Да" if order.get("payment_status") == "paid" else "Нет",
+            "Да" if order.get("payment_confirmed_date") is not None else "Нет",
+            order.get("total", 0.0),
+            *(
+                food._extract_meal_textual_contents(
+                    meal_type, day_key, order["order_details"].get(day_key, {}), menu[day_key],
+                )
+                for day_key, meal_type in columns
+            ),
+        ])
+    orders_csv = output.getvalue().encode("utf-8")
+
+    counts = Counter()
+    async for order in food.food_db.find({
+        "pass_key": PASS_KEY, "payment_status": "paid", "payment_confirmed_date": {"$exists": True},
+    }):
+        for day_key, day_order in order["order_details"].items():
+            lunch = day_order.get("lunch") or {}
+            items = lunch.get("items")
+            if lunch.get("type") == "individual-items":
+                counts.update((day_key, "lunch", "price", int(index)) for index in items)
+            elif lunch.get("type") in food_menu.LUNCH_COMBOS:
+                counts[(day_key, "combo", lunch["type"])] += 1
+                categories = food_menu.LUNCH_SUB_CATEGORIES
+                if lunch["type"] == "combo-with-soup":
+                    categories = ["soup", *categories]
+                counts.update(
+                    (day_key, "lunch", "Комбо", int(items[f"{category}_index"]))
+                    for category in categories
+                    if items.get(f"{category}_index") is not None
+                )
+            counts.update((day_key, "dinner", "price", int(index)) for index in day_order.get("dinner", []))
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for key, count in counts.items():
+        day_name = food.DAY_NAMES_RU[key[0]]
+        if key[1] == "combo":
+            price = food_menu.LUNCH_COMBOS[key[2]][0]
+            name = food.COMBO_WITH_SOUP_RU if key[2] == "combo-with-soup" else food.COMBO_NO_SOUP_RU
+            writer.writerow([day_name, "Обед", name, price, count, price * count])
+            continue
+        _, meal_type, price_kind, index = key
+        item = menu[key[0]][meal_type][index]
+        price = item.get("price", 0) if price_kind == "price" else price_kind
+        writer.writerow([
+            day_name, "Обед" if meal_type == "lunch" else "Ужин", item.get("title_ru"),
+            price, count, price * count if price_kind == "price" else "",
+        ])
+    return orders_csv, output.getvalue().encode("utf-8")
+
+
+async def after(food) -> tuple[bytes, bytes]:
+    return await asyncio.gather(food._orders_csv(), food._meal_summary_csv())
+
+
+def summary_rows(data: bytes, skip_header: bool) -> list:
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    return sorted(rows[1:] if skip_header else rows)
+
+
+async def main():
+    results = {}
+    for name, export in (("before", before), ("after", after)):
+        food, database = make_food()
+        started = perf_counter()
+        results[name] = await export(food)
+        elapsed = perf_counter() - started
+        round_trips = sum(database.ops().values())
+        print(f"{name:>6}: {elapsed:.2f}s, {round_trips} queries")
+    assert results["before"][0] == results["after"][0], "orders CSV differs"
+    assert summary_rows(results["before"][1], False) == summary_rows(results["after"][1], True), (
+        "meal summary differs"
+    )
+    print(f"{ORDERS} orders, identical files, {ROUND_TRIP * 1000:g}ms per query")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
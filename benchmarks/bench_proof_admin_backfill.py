@@ -0,0 +1,72 @@
+"""Startup ``proof_admin`` backfill on 10k passes.
+
+The in-memory collection charges ``ROUND_TRIP`` seconds per round trip. "before" is
+the old loop, one ``update_one`` per pass; "after" is
+``Passes.backfill_proof_admins``, one ``update_many`` per picked admin.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_proof_admin_backfill
+"""
+import asyncio
+import importlib
+from time import perf_counter
+from types import SimpleNamespace
+
+memory_db = importlib.import_module("zns-chatbot.memory_db")
+passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+
+PASSES = 10_000
+ADMINS = [101, 102, 103]
+ROUND_TRIP = 0.0002  # seconds
+PASS_KEY = "bench_pass"
+
+
+def make_collection() -> "memory_db.MemoryCollection":
+    return memory_db.MemoryCollection(
+        (
+            {"bot_id": 1, "pass_key": PASS_KEY, "user_id": n, "state": "waitlist"}
+            for n in range(PASSES)
+        ),
+        latency=ROUND_TRIP,
+    )
+
+
+def make_passes(pass_db) -> "passes_module.Passes":
+    passes = passes_module.Passes.__new__(passes_module.Passes)
+    passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+    passes.pass_db = pass_db
+    passes.payment_admins = {PASS_KEY: ADMINS}
+    return passes
+
+
+async def before(passes) -> None:
+    async for pass_doc in passes.pass_db.find(
+        {"bot_id": 1, "pass_key": PASS_KEY, "proof_admin": {"$exists": False}}
+    ):
+        await passes.pass_db.update_one(
+            {"bot_id": 1, "pass_key": PASS_KEY, "user_id": pass_doc["user_id"]},
+            {"$set": {"proof_admin": passes.pick_payment_admin(PASS_KEY)}},
+            upsert=True,
+        )
+
+
+async def after(passes) -> None:
+    await passes.backfill_proof_admins(PASS_KEY)
+
+
+async def main():
+    for name, backfill in (("before", before), ("after", after)):
+        pass_db = make_collection()
+        started = perf_counter()
+        await backfill(make_passes(pass_db))
+        elapsed = perf_counter() - started
+        assert all("proof_admin" in doc for doc in pass_db.docs)
+        print(
+            f"{name + ':':7} {sum(pass_db.ops.values())} round trips, "
+            f"{elapsed:.2f}s for {PASSES} passes"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
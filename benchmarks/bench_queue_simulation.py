@@ -0,0 +1,91 @@
+"""One queue recalculation over synthetic waitlists of 1k, 10k and 50k.
+
+Runs ``queue_simulator.simulate`` on a fresh waitlist, with a tenth of it
+coupled. The event sells a quarter of the waitlist over three tiers and has no
+concurrent assignment limit. Reports wall time and database operations. With
+``ROUND_TRIP`` seconds charged per operation, ``estimate`` is roughly what
+the same run would cost against a real database.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_queue_simulation
+"""
+import asyncio
+from datetime import datetime, timedelta
+import importlib
+
+events = importlib.import_module("zns-chatbot.events")
+queue_simulator = importlib.import_module("zns-chatbot.queue_simulator")
+
+SIZES = (1_000, 10_000, 50_000)
+ROUND_TRIP = 0.0005  # seconds
+PASS_KEY = "bench_pass"
+BOT_ID = 1
+
+
+def make_event(size: int) -> "events.EventInfo":
+    sold = size // 4
+    return events.EventInfo(
+        key=PASS_KEY,
+        amount_cap_per_role=sold,
+        payment_admin=[100],
+        hidden_payment_admins=[],
+        finish_date=None,
+        title_long={"default": PASS_KEY},
+        title_short={"default": PASS_KEY},
+        country_emoji="",
+        thread_channel="",
+        thread_id=None,
+        thread_locale="en",
+        require_passport=False,
+        price=None,
+        pass_types=(
+            events.EventPassType(amount=sold // 5, price=100, start=datetime(2000, 1, 1)),
+            events.EventPassType(amount=sold * 2 // 5, price=150, start=datetime.max),
+            events.EventPassType(amount=sold * 2 // 5, price=200, start=datetime.max),
+        ),
+        pass_assignment_rule="distributed",
+        disable_max_concurrent_assignments=True,
+    )
+
+
+def make_snapshot(size: int) -> "queue_simulator.QueueSnapshot":
+    start = datetime(2026, 1, 1)
+    passes = []
+    for user_id in range(size):
+        doc = {
+            "bot_id": BOT_ID,
+            "pass_key": PASS_KEY,
+            "user_id": user_id,
+            "role": "leader" if user_id % 3 else "follower",
+            "state": "waitlist",
+            "type": "solo",
+            "date_created": start + timedelta(seconds=user_id),
+        }
+        if user_id % 20 in (0, 1):
+            # couples sign up together, leader first
+            partner = user_id + 1 if user_id % 20 == 0 else user_id - 1
+            doc.update(
+                type="couple",
+                couple=partner,
+                role="leader" if user_id % 20 == 0 else "follower",
+            )
+        passes.append(doc)
+    users = [{"bot_id": BOT_ID, "user_id": n, "first_name": f"user {n}"} for n in range(size)]
+    return queue_simulator.QueueSnapshot(BOT_ID, PASS_KEY, passes, users)
+
+
+async def main():
+    for size in SIZES:
+        report = await queue_simulator.simulate(make_snapshot(size), make_event(size))
+        ops = sum(report.db_ops.values())
+        print(
+            f"{size:>6} waitlisted: {len(report.assignments)} assigned, "
+            f"{report.notified} notified, {report.elapsed:.2f}s, {ops} db operations "
+            f"({ops / size:.1f} per waitlisted), "
+            f"estimate {report.elapsed + ops * ROUND_TRIP:.1f}s at {ROUND_TRIP * 1000:g}ms/op"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Passes collection round-trips per assignment while draining a waitlist.
+
+Every assignment collects the queue stats, writes the assigned pass and
+then renders the tier status, which collects the stats again. The in-memory
+collection evaluates the pipelines over the waitlist and charges
+``ROUND_TRIP`` seconds per aggregation. "before" issues the three facets as
+separate aggregations and has no cache, like the old ``_collect_queue_stats``.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_queue_stats
+"""
+import asyncio
+import importlib
+from time import perf_counter
+from types import SimpleNamespace
+
+passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+pass_stats = importlib.import_module("zns-chatbot.pass_stats")
+memory_db = importlib.import_module("zns-chatbot.memory_db")
+
+WAITLIST = 2000
+ASSIGNMENTS = 200
+ROUND_TRIP = 0.0005  # seconds
+PASS_KEY = "bench_pass"
+
+
+def make_docs() -> list[dict]:
+    return [
+        {
+            "bot_id": 1,
+            "pass_key": PASS_KEY,
+            "user_id": n,
+            "role": "leader" if n % 2 else "follower",
+            "state": "waitlist",
+            "price": 100,
+            "pass_type_index": n % 3,
+        }
+        for n in range(WAITLIST)
+    ]
+
+
+class SplitFacetsCollection(memory_db.MemoryCollection):
+    """Runs every facet of the stats pipeline as an aggregation of its own."""
+
+    def aggregate(self, pipeline, **kwargs):
+        match, facet = pipeline
+        return MergedFacets({
+            name: super(SplitFacetsCollection, self).aggregate([match, *stages])
+            for name, stages in facet["$facet"].items()
+        })
+
+
+class MergedFacets:
+    def __init__(self, cursors: dict):
+        self.cursors = cursors
+
+    async def to_list(self, length):
+        return [{name: await cursor.to_list(None) for name, cursor in self.cursors.items()}]
+
+
+async def drain(pass_db, collection) -> tuple[float, float]:
+    passes = passes_module.Passes.__new__(passes_module.Passes)
+    passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+    passes.pass_db = pass_db
+    started = perf_counter()
+    for n in range(ASSIGNMENTS):
+        await passes._collect_queue_stats(PASS_KEY)
+        await pass_db.update_one(
+            {"bot_id": 1, "pass_key": PASS_KEY, "user_id": n},
+            {"$set": {"state": "assigned"}},
+        )
+        await passes._collect_queue_stats(PASS_KEY)  # tier status shown to the user
+    return collection.ops["aggregate"] / ASSIGNMENTS, perf_counter() - started
+
+
+async def main():
+    before = SplitFacetsCollection(make_docs(), latency=ROUND_TRIP)
+    per_assignment, elapsed = await drain(before, before)
+    print(
+        f"before: {per_assignment:.1f} aggregations per assignment, "
+        f"{elapsed:.2f}s for {ASSIGNMENTS} assignments"
+    )
+
+    after = memory_db.MemoryCollection(make_docs(), latency=ROUND_TRIP)
+    per_assignment, elapsed = await drain(
+        pass_stats.VersionedPassesCollection(after), after,
+    )
+    print(
+        f"after:  {per_assignment:.1f} aggregations per assignment, "
+        f"{elapsed:.2f}s for {ASSIGNMENTS} assignments"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""Dispatch cost per update: polling every plugin vs. the routing index.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_routing
+"""
+import importlib
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram import CallbackQuery, Chat, Message, MessageEntity, Update, User
+from telegram.ext import CallbackQueryHandler, CommandHandler, filters
+
+routing = importlib.import_module("zns-chatbot.routing")
+base_plugin = importlib.import_module("zns-chatbot.plugins.base_plugin")
+PRIORITY_BASIC = base_plugin.PRIORITY_BASIC
+PRIORITY_NOT_ACCEPTING = base_plugin.PRIORITY_NOT_ACCEPTING
+
+COMMANDS_PER_PLUGIN = 5
+ROUNDS = 2000
+BOT_USERNAME = "bench_bot"
+
+USER = User(id=7, first_name="Bench", is_bot=False)
+CHAT = Chat(id=7, type=Chat.PRIVATE)
+
+
+async def _noop(*_args):
+    pass
+
+
+def make_plugin(index: int) -> base_plugin.BasePlugin:
+    name = f"plugin{index}"
+    commands = {f"{name}_{n}": "handle_command" for n in range(COMMANDS_PER_PLUGIN)}
+
+    class Plugin(base_plugin.BasePlugin):
+        pass
+
+    Plugin.name = name
+    Plugin.commands = commands
+    Plugin.callback_prefix = name
+    plugin = Plugin.__new__(Plugin)
+    plugin.handle_command = _noop
+    plugin.handle_callback_query = _noop
+    # Pre-index behaviour: every plugin re-checks its own handlers.
+    plugin.checkers = [CommandHandler(command, _noop) for command in commands]
+    plugin.cbq_checker = CallbackQueryHandler(_noop, pattern=f"^{name}\\|.*")
+    return plugin
+
+
+def poll_message(plugins, update):
+    chosen = None
+    for plugin in plugins:
+        for checker in plugin.checkers:
+            if checker.check_update(update):
+                chosen = chosen or (PRIORITY_BASIC, plugin)
+    return chosen
+
+
+def poll_callback(plugins, update):
+    chosen = None
+    for plugin in plugins:
+        if plugin.cbq_checker.check_update(update):
+            chosen = chosen or (PRIORITY_BASIC, plugin)
+    return chosen
+
+
+class FreeText(base_plugin.BasePlugin):
+    name = "free_text"
+
+    def test_message(self, update, state, web_app_data):
+        if (filters.TEXT & ~filters.COMMAND).check_update(update):
+            return PRIORITY_BASIC, None
+        return PRIORITY_NOT_ACCEPTING, None
+
+
+def command_update(command: str) -> Update:
+    text = f"/{command} arg"
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=CHAT,
+        from_user=USER,
+        text=text,
+        entities=[MessageEntity(MessageEntity.BOT_COMMAND, 0, len(command) + 1)],
+    )
+    # CommandHandler reads the bot username from the message's bot.
+    message.set_bot(SimpleNamespace(username=BOT_USERNAME))
+    return Update(update_id=1, message=message)
+
+
+def callback_update(data: str) -> Update:
+    query = CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data)
+    return Update(update_id=1, callback_query=query)
+
+
+def per_update_us(fn) -> float:
+    return timeit.timeit(fn, number=ROUNDS) / ROUNDS * 1e6
+
+
+def bench(count: int):
+    plugins = [make_plugin(index) for index in range(count)]
+    router = routing.PluginRouter(
+        {plugin.name: plugin for plugin in plugins} | {"free_text": FreeText.__new__(FreeText)}
+    )
+    last = plugins[-1].name
+    command = command_update(f"{last}_{COMMANDS_PER_PLUGIN - 1}")
+    callback = callback_update(f"{last}|start")
+
+    return {
+        "command/poll": per_update_us(lambda: poll_message(plugins, command)),
+        "command/index": per_update_us(
+            lambda: router.route_message(command, {}, None, BOT_USERNAME)
+        ),
+        "callback/poll": per_update_us(lambda: poll_callback(plugins, callback)),
+        "callback/index": per_update_us(lambda: router.route_callback_query(callback, {})),
+    }
+
+
+def main():
+    for count in (8, 50):
+        results = bench(count)
+        print(f"{count} plugins:")
+        for name, value in results.items():
+            print(f"  {name:<16} {value:8.2f} us/update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Mass notification against a fake Bot API that enforces flood limits.
+
+The fake API allows ``GLOBAL_RATE`` messages per second in total and
+``CHAT_RATE`` per chat and answers everything above with ``RetryAfter``,
+like Telegram does. Limits are scaled up so the run takes seconds.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_send_scheduler
+"""
+import asyncio
+import importlib
+import logging
+import warnings
+from collections import deque
+from time import monotonic
+
+from telegram.error import RetryAfter
+
+send_scheduler = importlib.import_module("zns-chatbot.send_scheduler")
+
+SCALE = 10
+GLOBAL_RATE = 30 * SCALE
+CHAT_RATE = 1 * SCALE
+RECIPIENTS = 600
+MESSAGES_PER_CHAT = 2
+INTERACTIVE_REPLIES = 20
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.window: deque[float] = deque()
+        self.last_by_chat: dict[int, float] = {}
+        self.accepted = 0
+        self.flooded = 0
+
+    async def send_message(self, chat_id: int):
+        await asyncio.sleep(0.002)  # network round-trip
+        now = monotonic()
+        while self.window and now - self.window[0] > 1:
+            self.window.popleft()
+        last = self.last_by_chat.get(chat_id)
+        if len(self.window) >= GLOBAL_RATE or (last is not None and now - last < 1 / CHAT_RATE):
+            self.flooded += 1
+            raise RetryAfter(1)
+        self.window.append(now)
+        self.last_by_chat[chat_id] = now
+        self.accepted += 1
+        return True
+
+
+async def unscheduled(api: FakeBotApi):
+    async def send(chat_id):
+        try:
+            await api.send_message(chat_id)
+        except RetryAfter:
+            pass
+
+    await asyncio.gather(*(
+        send(chat_id)
+        for _ in range(MESSAGES_PER_CHAT)
+        for chat_id in range(RECIPIENTS)
+    ))
+
+
+async def scheduled(api: FakeBotApi):
+    scheduler = send_scheduler.SendScheduler(
+        global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, max_retries=10,
+    )
+    reply_latency = []
+
+    async def send(chat_id, priority):
+        started = monotonic()
+        await scheduler.process_request(
+            api.send_message, (chat_id,), {}, "sendMessage", {"chat_id": chat_id}, priority,
+        )
+        if priority == send_scheduler.SEND_INTERACTIVE:
+            reply_latency.append(monotonic() - started)
+
+    async def replies():
+        for n in range(INTERACTIVE_REPLIES):
+            await asyncio.sleep(0.05)
+            await send(-1_000_000 - n, send_scheduler.SEND_INTERACTIVE)
+
+    await asyncio.gather(
+        replies(),
+        *(
+            send(chat_id, send_scheduler.SEND_BULK)
+            for _ in range(MESSAGES_PER_CHAT)
+            for chat_id in range(RECIPIENTS)
+        ),
+    )
+    return scheduler.stats(), max(reply_latency)
+
+
+async def main():
+    warnings.simplefilter("ignore")
+    logging.disable(logging.WARNING)
+    total = RECIPIENTS * MESSAGES_PER_CHAT
+
+    api = FakeBotApi()
+    started = monotonic()
+    await unscheduled(api)
+    print(
+        f"unscheduled: {api.accepted}/{total} delivered, {api.flooded} RetryAfter, "
+        f"{monotonic() - started:.2f}s"
+    )
+
+    api = FakeBotApi()
+    started = monotonic()
+    stats, reply_latency = await scheduled(api)
+    print(
+        f"scheduled:   {api.accepted - INTERACTIVE_REPLIES}/{total} delivered, "
+        f"{api.flooded} RetryAfter, {monotonic() - started:.2f}s, "
+        f"worst interactive reply {reply_latency * 1000:.0f}ms"
+    )
+    print(f"scheduler stats: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -441,6 +441,7 @@ passes-adm-payment-proof-received =
 
 passes-announce-user-registered =
     {$name} applied for a {$role} pass!
+passes-announce-users-registered = {$count} new dancers:
 passes-button-cancel = ❌ Cancel ⚠️
 passes-button-change-name = 🏷 Change name
 passes-button-exit = 🚪 Exit
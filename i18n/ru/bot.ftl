@@ -482,6 +482,7 @@ passes-adm-payment-proof-received =
     <b>Внимание</b>, не стоит помечать отсутствие оплаты раньше времени, лучше сначала удостовериться.
 
 passes-announce-user-registered = {$name} подал заявку на пасс {passes-role}!
+passes-announce-users-registered = Новых заявок: {$count}
 passes-button-cancel = ❌ Отменить ⚠️
 passes-button-change-name = 🏷 Изменить имя
 passes-button-exit = 🚪 Выйти
@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+from types import MethodType, SimpleNamespace
+import unittest
+
+batch_loader = importlib.import_module("zns-chatbot.batch_loader")
+MemoryCollection = importlib.import_module("zns-chatbot.memory_db").MemoryCollection
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+class BatchLoaderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_keys_of_one_tick_are_batched_and_deduplicated(self):
+        batches = []
+
+        async def batch(keys):
+            batches.append(sorted(keys))
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = batch_loader.BatchLoader(batch)
+        self.assertEqual(await loader.load_many([1, 2, 1, 3]), [10, 20, 10, None])
+        self.assertEqual(batches, [[1, 2, 3]])
+
+        # nothing is cached between ticks
+        self.assertEqual(await loader.load(1), 10)
+        self.assertEqual(batches, [[1, 2, 3], [1]])
+
+    async def test_errors_reach_every_caller(self):
+        async def batch(keys):
+            raise RuntimeError("down")
+
+        loader = batch_loader.BatchLoader(batch)
+        results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class FormatMessageLoadingTests(unittest.IsolatedAsyncioTestCase):
+    async def test_admin_notification_batches_lookups(self):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.base_app = SimpleNamespace(
+            bot=SimpleNamespace(bot=SimpleNamespace(id=1)),
+            localization=lambda key, args=None, locale=None: f"{locale}:{key}:{args['coupleName']}",
+        )
+        passes.user_db = MemoryCollection([
+            {"bot_id": 1, "user_id": 10, "legal_name": "Ann", "language_code": "ru"},
+            {"bot_id": 1, "user_id": 20, "legal_name": "Bob"},
+            {"bot_id": 1, "user_id": 99, "legal_name": "Admin"},
+        ])
+        passes.pass_db = MemoryCollection([
+            {"bot_id": 1, "pass_key": "pk", "user_id": 10, "couple": 20,
+             "proof_admin": 99, "price": 100, "state": "paid"},
+            {"bot_id": 1, "pass_key": "pk", "user_id": 20, "couple": 10,
+             "proof_admin": 99, "price": 100, "state": "paid", "role": "follower"},
+        ])
+        passes.pass_keys = ["pk"]
+        passes.refresh_events_cache = lambda: None
+        passes.get_event_localization_keys = MethodType(lambda _self, pass_key, lc: {}, passes)
+        update = SimpleNamespace(
+            user=99, bot=SimpleNamespace(id=1), update=None, language_code="en",
+            l=lambda key, **kwargs: f"en:{key}:{kwargs['coupleName']}",
+        )
+        upd = passes_module.PassUpdate(passes, update)
+        upd.set_pass_key("pk")
+
+        user_text, admin_text = await asyncio.gather(
+            upd.format_message("accepted", user=10, for_user=10),
+            upd.format_message("adm-accepted", user=10),
+        )
+
+        self.assertEqual(user_text, "ru:accepted:Bob")
+        self.assertEqual(admin_text, "en:adm-accepted:Bob")
+        # user+recipient, own pass, couple+admin users, couple pass
+        self.assertEqual(sum(passes.user_db.ops.values()) + sum(passes.pass_db.ops.values()), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import importlib
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+
+telegram_module = importlib.import_module("zns-chatbot.telegram")
+DeadlineScheduler = telegram_module.DeadlineScheduler
+
+
+class FakeUsers:
+    def __init__(self, users: list[dict]):
+        self.users = users
+        self.finds = 0
+        self.claims = 0
+
+    async def create_index(self, *args, **kwargs):
+        return "index"
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        users = [u for u in self.users if "deadline" in u["state"]]
+
+        async def gen():
+            for user in users:
+                yield user
+        return gen()
+
+    async def find_one_and_update(self, query, update, projection=None):
+        self.claims += 1
+        window = query["state.deadline"]
+        for user in self.users:
+            state = user["state"]
+            if (
+                user["user_id"] == query["user_id"]
+                and state.get("state") == query["state.state"]
+                and "deadline" in state
+                and window["$gte"] <= state["deadline"] <= window["$lte"]
+            ):
+                user["state"] = update["$set"]["state"]
+                return {"_id": user["user_id"], "state": state}
+        return None
+
+
+class DeadlineSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    def _scheduler(self, users: list[dict]):
+        app = SimpleNamespace(
+            users_collection=FakeUsers(users),
+            bot=SimpleNamespace(bot=SimpleNamespace(id=1)),
+        )
+        return DeadlineScheduler(app, []), app.users_collection
+
+    def _state(self, seconds: float, name="waiting_text"):
+        return {
+            "state": name,
+            "timeout_callback": "timeout",
+            "deadline": datetime.datetime.now() + datetime.timedelta(seconds=seconds),
+        }
+
+    async def _run(self, scheduler, seconds: float):
+        fired = []
+
+        class Recorder:
+            def __init__(self, user_id, app, plugins, state):
+                fired.append((user_id, state["state"]))
+
+            async def process(self):
+                pass
+
+        with mock.patch.object(telegram_module, "TGDeadline", Recorder):
+            task = asyncio.create_task(scheduler.start())
+            await asyncio.sleep(seconds)
+            task.cancel()
+        return fired
+
+    async def test_deadlines_fire_in_order_without_polling(self):
+        users = [
+            {"user_id": 1, "state": self._state(0.15)},
+            {"user_id": 2, "state": self._state(0.05)},
+            {"user_id": 3, "state": {"state": ""}},
+        ]
+        scheduler, db = self._scheduler(users)
+
+        fired = await self._run(scheduler, 0.3)
+
+        self.assertEqual(fired, [(2, "waiting_text"), (1, "waiting_text")])
+        self.assertEqual(db.finds, 1)
+        self.assertEqual(db.claims, 2)
+
+    async def test_pushed_deadline_wakes_sleeping_runner(self):
+        users = [
+            {"user_id": 1, "state": self._state(60)},
+            {"user_id": 2, "state": {"state": ""}},
+        ]
+        scheduler, _ = self._scheduler(users)
+
+        async def push_later():
+            await asyncio.sleep(0.02)
+            users[1]["state"] = self._state(0.02, "waiting_everything")
+            scheduler.push(2, users[1]["state"])
+
+        asyncio.create_task(push_later())
+        fired = await self._run(scheduler, 0.15)
+
+        self.assertEqual(fired, [(2, "waiting_everything")])
+
+    async def test_replaced_or_cleared_deadline_is_skipped(self):
+        users = [
+            {"user_id": 1, "state": self._state(0.03)},
+            {"user_id": 2, "state": self._state(0.03)},
+        ]
+        scheduler, db = self._scheduler(users)
+
+        async def change_states():
+            await asyncio.sleep(0.01)
+            # user 1 answered in time, user 2 got a new, later deadline
+            users[0]["state"] = {"state": ""}
+            users[1]["state"] = self._state(0.1)
+            scheduler.push(2, users[1]["state"])
+
+        asyncio.create_task(change_states())
+        fired = await self._run(scheduler, 0.06)
+        self.assertEqual(fired, [])
+        self.assertEqual(db.claims, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import importlib
+from datetime import datetime, timedelta
+import random
+from types import SimpleNamespace
+import unittest
+
+events = importlib.import_module("zns-chatbot.events")
+
+BASE = datetime(2026, 1, 1)
+
+
+def day(n: int) -> datetime:
+    return BASE + timedelta(days=n)
+
+
+def make_event(key: str, starts: list[datetime], finish_date: datetime | None, amounts=None):
+    amounts = amounts or [10] * len(starts)
+    return events.EventInfo(
+        key=key,
+        amount_cap_per_role=80,
+        payment_admin=[],
+        hidden_payment_admins=[],
+        finish_date=finish_date,
+        title_long={"default": key},
+        title_short={"default": key},
+        country_emoji="",
+        thread_channel="",
+        thread_id=None,
+        thread_locale="en",
+        require_passport=False,
+        price=None,
+        pass_types=tuple(
+            events.EventPassType(amount=amount, price=100, start=start)
+            for amount, start in zip(amounts, starts)
+        ),
+        pass_assignment_rule="distributed",
+    )
+
+
+def naive_closest(all_events, now):
+    active = [event for event in all_events if event.is_active(now)]
+    if not active:
+        return None
+    started = [event for event in active if event.sell_start <= now]
+    if started:
+        return max(started, key=lambda event: event.sell_start)
+    return min(active, key=lambda event: event.sell_start)
+
+
+def naive_time_floor(pass_types, now):
+    floor = None
+    for index, pass_type in enumerate(pass_types):
+        if pass_type.start <= now:
+            floor = index
+    if floor is None and pass_types:
+        return 0
+    return floor
+
+
+class PassTypesTests(unittest.TestCase):
+    def test_tables_match_walking_the_tiers(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            n = rng.randint(0, 6)
+            raw = tuple(
+                events.EventPassType(
+                    amount=rng.randint(0, 9), price=100, start=day(rng.randint(0, 10)),
+                )
+                for _ in range(n)
+            )
+            pass_types = events.PassTypes(raw)
+            self.assertEqual(pass_types, raw)
+            expected_start = min((p.start for p in raw), default=datetime.max)
+            self.assertEqual(pass_types.sell_start, expected_start)
+            for tier_index in range(n):
+                self.assertEqual(
+                    pass_types.prior_capacity(tier_index, "paired"),
+                    sum(p.amount // 2 for p in raw[:tier_index]),
+                )
+                self.assertEqual(
+                    pass_types.prior_capacity(tier_index, "distributed"),
+                    sum(p.amount for p in raw[:tier_index]),
+                )
+            for now in range(-1, 12):
+                self.assertEqual(
+                    pass_types.time_floor(day(now)), naive_time_floor(raw, day(now)),
+                )
+
+    def test_event_info_compiles_its_tiers(self):
+        event = make_event("a", [day(3), day(1)], None)
+        self.assertIsInstance(event.pass_types, events.PassTypes)
+        self.assertEqual(event.sell_start, day(1))
+        self.assertIs(events.PassTypes.of(event.pass_types), event.pass_types)
+
+
+class EventsViewsTests(unittest.TestCase):
+    def _events(self, infos):
+        app = SimpleNamespace(
+            config=SimpleNamespace(mongo_db=SimpleNamespace(events_collection="events")),
+            mongodb=None,
+        )
+        registry = events.Events(app)
+        registry._set_events({info.key: info for info in infos})
+        return registry
+
+    def test_closest_active_event_matches_a_scan(self):
+        rng = random.Random(11)
+        for _ in range(100):
+            infos = [
+                make_event(
+                    f"e{n}",
+                    [day(rng.randint(0, 20)) for _ in range(rng.randint(0, 3))],
+                    rng.choice([None, day(rng.randint(0, 25))]),
+                )
+                for n in range(rng.randint(0, 6))
+            ]
+            registry = self._events(infos)
+            all_events = tuple(sorted(infos, key=lambda event: event.sell_start))
+            self.assertEqual(registry.all_events(), all_events)
+            for now in range(-1, 27):
+                self.assertEqual(
+                    registry.active_events(day(now)),
+                    tuple(event for event in all_events if event.is_active(day(now))),
+                )
+                self.assertIs(
+                    registry.closest_active_event(day(now)), naive_closest(all_events, day(now)),
+                )
+
+    def test_refresh_bumps_the_generation(self):
+        registry = self._events([make_event("a", [day(0)], None)])
+        generation = registry.generation
+        registry._set_events({})
+        self.assertEqual(registry.generation, generation + 1)
+        self.assertEqual(registry.all_events(), ())
+        with self.assertRaises(RuntimeError):
+            registry.closest_active_pass_key(day(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
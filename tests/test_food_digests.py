@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime
+import importlib
+from types import SimpleNamespace
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    food_digests = importlib.import_module("zns-chatbot.food_digests")
+    food_module = importlib.import_module("zns-chatbot.plugins.food")
+except Exception as exc:  # pragma: no cover - environment-specific
+    food_module = None
+    IMPORT_ERROR = exc
+
+MENU = {
+    "friday": {
+        "lunch": [{"title_ru": "Борщ", "price": 100, "category": "soup"}],
+        "dinner": [{"title_ru": "Рыба", "price": 300, "category": "main"}],
+    },
+}
+
+
+class FakeFood:
+    def __init__(self, orders):
+        self.orders = orders
+        self.find_one_calls = 0
+        self.release_find_one: asyncio.Event | None = None
+
+    async def find_one(self, query):
+        self.find_one_calls += 1
+        found = next((
+            dict(order) for order in self.orders
+            if all(order.get(key) == value for key, value in query.items()
+                   if not isinstance(value, dict))
+        ), None)
+        if self.release_find_one is not None:
+            await self.release_find_one.wait()
+        return found
+
+    async def update_one(self, query, update):
+        for order in self.orders:
+            if all(order.get(key) == value for key, value in query.items()):
+                order.update(update["$set"])
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        for order in self.orders:
+            if all(order.get(key) == value for key, value in query.items()
+                   if not isinstance(value, dict)):
+                order.update(update.get("$set", {}))
+                return dict(order)
+        return None
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class FoodDigestCacheTests(unittest.TestCase):
+    def test_digests_expire(self):
+        cache = food_digests.FoodDigestCache(ttl=-1)
+        cache.put(5, cache.version(5), {"friday": {}})
+        self.assertIsNone(cache.get(5, cache.version(5)))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_digest_is_dropped(self):
+        cache = food_digests.FoodDigestCache(max_size=2)
+        for user_id in (1, 2):
+            cache.put(user_id, cache.version(user_id), {"user": user_id})
+        cache.get(1, cache.version(1))
+        cache.put(3, cache.version(3), {"user": 3})
+
+        self.assertIsNone(cache.get(2, cache.version(2)))
+        self.assertEqual(cache.get(1, cache.version(1)), {"user": 1})
+        self.assertEqual(cache.get(3, cache.version(3)), {"user": 3})
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class FoodDigestTests(unittest.IsolatedAsyncioTestCase):
+    def _food(self):
+        raw = FakeFood([{
+            "_id": 1,
+            "user_id": 5,
+            "pass_key": "pk",
+            "payment_status": "paid",
+            "payment_confirmed_date": "2026-01-01",
+            "order_details": {"friday": {"lunch": {"type": "no-lunch"}, "dinner": [0]}},
+        }])
+        food = food_module.Food.__new__(food_module.Food)
+        food.order_digests = food_digests.FoodDigestCache()
+        food.food_db = raw
+        menu_index = SimpleNamespace(days=MENU, price=lambda order_data: (0, False))
+        food.menu_file = SimpleNamespace(current=lambda: (MENU, menu_index), generation=1)
+        food.default_pass_key = lambda: "pk"
+        food.events = SimpleNamespace(
+            get_event=lambda pass_key: SimpleNamespace(is_active=lambda now: True),
+        )
+        food.deadline = datetime(2100, 1, 1)
+        return raw, food
+
+    async def test_digest_is_cached_until_the_order_changes(self):
+        raw, food = self._food()
+        expected = {"friday": {"lunch": food.NO_LUNCH_RU, "dinner": "Рыба"}}
+
+        self.assertEqual(await food.get_order_contents_by_user(5), expected)
+        self.assertEqual(await food.get_order_contents_by_user(5), expected)
+        self.assertEqual(raw.find_one_calls, 1)
+
+        # someone else's order leaves the digest alone
+        food.order_digests.bump(6)
+        await food.get_order_contents_by_user(5)
+        self.assertEqual(raw.find_one_calls, 1)
+
+        # saving the order, here emptying it, drops the digest
+        await food.save_order(5, "pk", {})
+        self.assertEqual(await food.get_order_contents_by_user(5), {})
+        self.assertEqual(raw.find_one_calls, 2)
+
+        food.menu_file.generation = 2
+        await food.get_order_contents_by_user(5)
+        self.assertEqual(raw.find_one_calls, 3)
+
+    async def test_digest_read_during_a_write_is_not_cached(self):
+        raw, food = self._food()
+        raw.release_find_one = asyncio.Event()
+
+        reading = asyncio.create_task(food.get_order_contents_by_user(5))
+        await asyncio.sleep(0)
+        await food.save_order(5, "pk", {})
+        raw.release_find_one.set()
+        self.assertTrue(await reading)
+
+        self.assertEqual(await food.get_order_contents_by_user(5), {})
+        self.assertEqual(raw.find_one_calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import csv
+import importlib
+import io
+from types import SimpleNamespace
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    food_module = importlib.import_module("zns-chatbot.plugins.food")
+    MemoryDatabase = importlib.import_module("zns-chatbot.memory_db").MemoryDatabase
+except Exception as exc:  # pragma: no cover - environment-specific
+    food_module = None
+    IMPORT_ERROR = exc
+
+MENU = {
+    "friday": {
+        "lunch": [
+            {"title_ru": "Борщ", "price": 100, "category": "soup"},
+            {"title_ru": "Котлета", "price": 200, "category": "main"},
+            {"title_ru": "Пюре", "price": 50, "category": "side"},
+            {"title_ru": "Салат", "price": 80, "category": "salad"},
+        ],
+        "dinner": [{"title_ru": "Рыба", "price": 300, "category": "main"}],
+    },
+}
+
+
+def paid(user_id: int, order_details: dict, **fields) -> dict:
+    return {
+        "user_id": user_id,
+        "pass_key": "pk",
+        "payment_status": "paid",
+        "payment_confirmed_date": "2026-01-01",
+        "order_details": order_details,
+        **fields,
+    }
+
+
+def read_csv(data: bytes) -> list[list[str]]:
+    return list(csv.reader(io.StringIO(data.decode("utf-8"))))
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class FoodExportTests(unittest.IsolatedAsyncioTestCase):
+    def _food(self, orders=(), users=()):
+        food = food_module.Food.__new__(food_module.Food)
+        food.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1))))
+        food.config = SimpleNamespace(food=SimpleNamespace(admins=[7]))
+        food.menu_file = SimpleNamespace(current=lambda: (MENU, None))
+        food.default_pass_key = lambda: "pk"
+        database = MemoryDatabase()
+        food.user_db = database.collection("users", users)
+        food.food_db = database.collection("food", orders)
+        return food
+
+    async def test_orders_come_with_their_users(self):
+        food = self._food(
+            orders=[
+                paid(1, {"friday": {"lunch": {"type": "no-lunch"}, "dinner": [0]}}, total=300),
+                {"user_id": 2, "pass_key": "pk", "total": 0, "order_details": {}},
+                paid(3, {}, pass_key="other"),
+            ],
+            users=[
+                {"bot_id": 1, "user_id": 1, "username": "ann", "print_name": "Ann"},
+                {"bot_id": 2, "user_id": 2, "username": "bob", "print_name": "Bob"},
+            ],
+        )
+
+        rows = read_csv(await food._orders_csv())
+
+        self.assertEqual(rows[0][-2:], ["Пятница Обед", "Пятница Ужин"])
+        self.assertEqual(rows[1:], [
+            ["1", "ann", "Ann", "", "Да", "Да", "300", food.NO_LUNCH_RU, "Рыба"],
+            ["2", "", "", "", "Нет", "Нет", "0", "", ""],
+        ])
+        self.assertEqual(food.food_db.ops, {"aggregate": 1})
+        self.assertIsNone(await self._food()._orders_csv())
+
+    async def test_summary_counts_stored_order_shapes(self):
+        food = self._food(orders=[
+            # indices saved as strings count as the same dish, unknown ones are dropped
+            paid(1, {"friday": {
+                "lunch": {"type": "individual-items", "items": ["1", 1, 7]},
+                "dinner": [0, "0"],
+            }}),
+            paid(2, {"friday": {
+                "lunch": {"type": "combo-with-soup", "items": {
+                    "soup_index": 0, "main_index": "1", "side_index": 2, "salad_index": 3,
+                }},
+                "dinner": [0],
+            }}),
+            # a soup left over from an earlier combo-with-soup pick isn't served
+            paid(3, {"friday": {"lunch": {"type": "combo-no-soup", "items": {
+                "soup_index": 0, "main_index": 1, "side_index": 2, "salad_index": 3,
+            }}}}),
+            # items of the wrong shape still count the combo but no dishes
+            paid(4, {"friday": {"lunch": {"type": "combo-no-soup", "items": [1, 2, 3]}}}),
+            paid(5, {"friday": {"lunch": {"type": "individual-items", "items": {"1": 1}}, "dinner": 0}}),
+            # days that aren't on the menu anymore
+            paid(6, {"sunday": {"dinner": [0]}}),
+            # not paid, not confirmed or another event
+            paid(7, {"friday": {"dinner": [0]}}, payment_status="proof_submitted"),
+            {"user_id": 8, "pass_key": "pk", "payment_status": "paid", "order_details": {"friday": {"dinner": [0]}}},
+            paid(9, {"friday": {"dinner": [0]}}, pass_key="other"),
+        ])
+
+        rows = read_csv(await food._meal_summary_csv())
+
+        self.assertEqual(rows[1:], [
+            ["Пятница", "Обед", food.COMBO_WITH_SOUP_RU, "665", "1", "665"],
+            ["Пятница", "Обед", food.COMBO_NO_SOUP_RU, "555", "2", "1110"],
+            ["Пятница", "Обед", "Котлета", "200", "2", "400"],
+            ["Пятница", "Обед", "Борщ", "Комбо", "1", ""],
+            ["Пятница", "Обед", "Котлета", "Комбо", "2", ""],
+            ["Пятница", "Обед", "Пюре", "Комбо", "2", ""],
+            ["Пятница", "Обед", "Салат", "Комбо", "2", ""],
+            ["Пятница", "Ужин", "Рыба", "300", "3", "900"],
+        ])
+        self.assertEqual(food.food_db.ops, {"aggregate": 1})
+
+    async def test_summary_pipeline_entries(self):
+        food = self._food(orders=[
+            paid(1, {"friday": {"lunch": {"type": "combo-no-soup", "items": {
+                "soup_index": 0, "main_index": 1,
+            }}}}),
+            paid(2, {"friday": {"lunch": {"type": "combo-no-soup", "items": [1]}}}),
+        ])
+
+        groups = await food.food_db.aggregate(food._meal_summary_pipeline(MENU)).to_list(None)
+
+        # a missing sub-index leaves the entry without one, a list of items maps to []
+        self.assertCountEqual([(group["_id"], group["count"]) for group in groups], [
+            ({"day": "friday", "kind": "combo", "index": "combo-no-soup"}, 2),
+            ({"day": "friday", "kind": "combo_soup", "index": None}, 2),
+            ({"day": "friday", "kind": "combo_main", "index": 1}, 1),
+            ({"day": "friday", "kind": "combo_main", "index": []}, 1),
+            ({"day": "friday", "kind": "combo_side"}, 1),
+            ({"day": "friday", "kind": "combo_side", "index": []}, 1),
+            ({"day": "friday", "kind": "combo_salad"}, 1),
+            ({"day": "friday", "kind": "combo_salad", "index": []}, 1),
+        ])
+
+    async def test_summary_without_paid_orders(self):
+        food = self._food(orders=[
+            paid(1, {"friday": {"dinner": [0]}}, payment_status=None),
+            paid(2, {"sunday": {"dinner": [0]}}),
+        ])
+        self.assertIsNone(await food._meal_summary_csv())
+        self.assertIsNone(await self._food()._meal_summary_csv())
+
+    async def test_export_sends_both_files(self):
+        food = self._food(orders=[paid(1, {"friday": {"dinner": [0]}}, total=300)])
+        documents = []
+        replies = []
+
+        async def reply_document(document, caption):
+            documents.append(document.filename)
+
+        async def reply(text):
+            replies.append(text)
+
+        update = SimpleNamespace(
+            user=7,
+            reply=reply,
+            update=SimpleNamespace(effective_message=SimpleNamespace(reply_document=reply_document)),
+        )
+
+        await food.handle_export_orders_cmd(update)
+
+        self.assertEqual(replies, [])
+        self.assertEqual(food.food_db.ops, {"aggregate": 2})
+        self.assertTrue(documents[0].startswith("food_orders_"))
+        self.assertTrue(documents[1].startswith("meal_summary_"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+from datetime import datetime
+import importlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    food_menu = importlib.import_module("zns-chatbot.food_menu")
+    food_module = importlib.import_module("zns-chatbot.plugins.food")
+    MemoryCollection = importlib.import_module("zns-chatbot.memory_db").MemoryCollection
+except Exception as exc:  # pragma: no cover - environment-specific
+    food_module = None
+    IMPORT_ERROR = exc
+
+MENU = {
+    "friday": {
+        "lunch": [
+            {"price": 100, "category": "soup"},
+            {"price": 200, "category": "main"},
+            {"price": "n/a", "category": "side"},
+        ],
+        "dinner": [{"price": 300, "category": "main"}, {"price": 50, "category": "dessert"}],
+    },
+    "saturday": {"dinner": [{"price": 400, "category": "main"}]},
+}
+COMBO = {"soup_index": 0, "main_index": 1, "side_index": 2, "salad_index": 2}
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class MenuIndexTests(unittest.TestCase):
+    def test_prices_and_completeness(self):
+        index = food_menu.MenuIndex(MENU)
+        self.assertEqual(index.days, ("friday", "saturday"))
+
+        self.assertEqual(index.price({}), (0, False))
+        self.assertEqual(index.price({"friday": {"lunch": {"type": "no-lunch"}}}), (0, True))
+        self.assertEqual(
+            index.price({
+                "friday": {"lunch": {"type": "combo-with-soup", "items": COMBO}, "dinner": [0, "1"]},
+                "saturday": {"dinner": [0]},
+            }),
+            (food_menu.LUNCH_WITH_SOUP_PRICE + 750, True),
+        )
+        # a combo missing a category doesn't count, dinner still does
+        self.assertEqual(
+            index.price({
+                "friday": {"lunch": {"type": "combo-no-soup", "items": {"main_index": 1}}, "dinner": [1]},
+            }),
+            (50, False),
+        )
+        # invalid, out of range and unpriced items are skipped
+        self.assertEqual(
+            index.price({"friday": {"lunch": {"type": "individual-items", "items": [0, 1, 2, 9, "x"]}}}),
+            (300, True),
+        )
+        self.assertEqual(
+            index.price({"friday": {"lunch": {"type": "individual-items", "items": {}}}}), (0, False),
+        )
+        self.assertEqual(index.price({"friday": {"lunch": {"type": "buffet"}}}), (0, False))
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class MenuFileTests(unittest.TestCase):
+    def test_reloads_when_the_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "menu.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(MENU, f)
+            menu_file = food_menu.MenuFile(path)
+            _, index = menu_file.current()
+            self.assertEqual(index.days, ("friday", "saturday"))
+
+            self.assertFalse(menu_file.reload())
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"sunday": MENU["saturday"]}, f)
+            os.utime(path, ns=(0, 10**9))
+            menu_file._checked = float("-inf")
+            menu, index = menu_file.current()
+            self.assertEqual(list(menu), ["sunday"])
+            self.assertEqual(index.dinner, {"sunday": (400,)})
+
+            # a broken file keeps the previous menu
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("{")
+            os.utime(path, ns=(0, 2 * 10**9))
+            menu_file._checked = float("-inf")
+            with self.assertLogs(food_menu.logger, "ERROR"):
+                self.assertIs(menu_file.current()[1], index)
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class SaveOrderTests(unittest.IsolatedAsyncioTestCase):
+    def _food(self, docs=()):
+        food = food_module.Food.__new__(food_module.Food)
+        food.events = SimpleNamespace(
+            get_event=lambda pass_key: SimpleNamespace(is_active=lambda now: True),
+        )
+        food.deadline = datetime.max
+        food.menu_file = SimpleNamespace(current=lambda: (MENU, food_menu.MenuIndex(MENU)))
+        food.food_db = MemoryCollection(docs)
+        food.order_digests = food_module.FoodDigestCache()
+        return food
+
+    async def test_inserts_then_updates_in_place(self):
+        food = self._food()
+        order = {"friday": {"lunch": {"type": "no-lunch"}, "dinner": [0]}}
+
+        saved = await food.save_order(1, "pk", order)
+        self.assertEqual((saved["total"], saved["is_complete"]), (300, True))
+        self.assertIn("created_at", saved)
+
+        food.food_db.docs[0]["proof_admin"] = 7
+        saved = await food.save_order(1, "pk", {"friday": {"lunch": {"type": "no-lunch"}}})
+        self.assertEqual((saved["total"], saved["proof_admin"]), (0, None))
+        self.assertEqual(len(food.food_db.docs), 1)
+        # miss + upsert for the insert, the edit hit the status-guarded update directly
+        self.assertEqual(food.food_db.ops, {"find_one_and_update": 3})
+
+    async def test_locked_orders_refuse_changes(self):
+        order = {"friday": {"lunch": {"type": "no-lunch"}, "dinner": [0]}}
+        paid = {
+            "_id": 5, "user_id": 1, "pass_key": "pk", "order_details": order, "total": 300,
+            "payment_status": "paid", "proof_admin": 7,
+        }
+        food = self._food([paid])
+
+        saved = await food.save_order(1, "pk", order)
+        self.assertEqual((saved["payment_status"], saved["proof_admin"]), ("paid", 7))
+        self.assertIn("last_updated", saved)
+
+        with self.assertRaises(ValueError):
+            await food.save_order(1, "pk", {"friday": {"lunch": {"type": "no-lunch"}}})
+        self.assertEqual(food.food_db.docs[0]["order_details"], order)
+        self.assertEqual(len(food.food_db.docs), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta
+import importlib
+from types import SimpleNamespace
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    food_module = importlib.import_module("zns-chatbot.plugins.food")
+except Exception as exc:  # pragma: no cover - environment-specific
+    food_module = None
+    IMPORT_ERROR = exc
+
+DEADLINE = datetime(2026, 6, 5, 1)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class FakePasses:
+    def __init__(self, candidates):
+        self.pass_db = SimpleNamespace(aggregate=self.aggregate, name="passes")
+        self.candidates = candidates
+        self.pipelines = []
+        self.flagged = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor([{"user_id": uid} for uid in self.candidates])
+
+    async def update_pass_fields(self, user_ids, pass_key, set_fields):
+        self.flagged.append((sorted(user_ids), pass_key, set_fields))
+
+
+class FakeFoodUpdate:
+    def __init__(self, food, user_id):
+        self.food = food
+        self.l = lambda key: key
+
+        async def reply(text, **kwargs):
+            await food._sending()
+            food.sent.append((user_id, text))
+
+        self.update = SimpleNamespace(user=user_id, reply=reply)
+
+    async def send_notification(self, kind):
+        await self.update.reply(f"food-notification-message-{kind}")
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class FoodNotificationPlannerTests(unittest.TestCase):
+    def _food(self):
+        food = food_module.Food.__new__(food_module.Food)
+        food.deadline = DEADLINE
+        food.config = SimpleNamespace(food=SimpleNamespace(
+            notification_first_time=timedelta(days=4),
+            notification_last_time=timedelta(days=1),
+            notify_after=timedelta(hours=3),
+        ))
+        return food
+
+    def test_sleeps_until_the_next_window(self):
+        food = self._food()
+        first_opens = DEADLINE - timedelta(days=4)
+        last_opens = DEADLINE - timedelta(days=1)
+
+        self.assertEqual(
+            food.plan_notifications(first_opens - timedelta(hours=2)), ([], 7200),
+        )
+        self.assertEqual(food.plan_notifications(first_opens)[0], ["first"])
+        # the gap between the windows
+        due, delay = food.plan_notifications(last_opens - timedelta(hours=1))
+        self.assertEqual((due, delay), ([], 3600))
+        self.assertEqual(food.plan_notifications(last_opens), (["last"], None))
+        self.assertEqual(food.plan_notifications(DEADLINE), ([], None))
+
+
+@unittest.skipIf(food_module is None, f"food plugin unavailable: {IMPORT_ERROR!r}")
+class FoodRemindersTests(unittest.IsolatedAsyncioTestCase):
+    async def test_reminders_fan_out_and_flag_once(self):
+        food = food_module.Food.__new__(food_module.Food)
+        food.config = SimpleNamespace(food=SimpleNamespace(notify_after=timedelta(hours=3)))
+        passes = FakePasses(candidates=list(range(20)))
+        food.base_app = SimpleNamespace(
+            passes=passes, bot=SimpleNamespace(bot=SimpleNamespace(id=1)),
+        )
+        unpaid = [{"user_id": 100}, {"user_id": 101}]
+        food.food_db = SimpleNamespace(
+            name="food", find=lambda query, projection=None: FakeCursor(unpaid),
+        )
+        food.sent = []
+        in_flight = 0
+        peak = 0
+
+        async def sending():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+
+        async def create_food_update_for_user(user_id):
+            if user_id == 3:
+                raise RuntimeError("blocked the bot")
+            return FakeFoodUpdate(food, user_id)
+
+        food._sending = sending
+        food.create_food_update_for_user = create_food_update_for_user
+
+        await food.send_food_reminders("first", "pk")
+
+        self.assertEqual(len(passes.pipelines), 1)
+        lookup = passes.pipelines[0][1]["$lookup"]
+        self.assertEqual(lookup["from"], "food")
+        self.assertLessEqual(peak, food_module.FOOD_NOTIFICATION_CONCURRENCY)
+        self.assertGreater(peak, 1)
+        self.assertEqual(len(food.sent), 21)
+        self.assertIn((100, "food-notification-message-first"), food.sent)
+        self.assertEqual(passes.flagged, [(
+            [uid for uid in range(20) if uid != 3],
+            "pk",
+            {"notified_food_first": True},
+        )])
+
+
+if __name__ == "__main__":
+    unittest.main()
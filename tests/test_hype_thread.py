@@ -0,0 +1,98 @@
+import importlib
+from types import SimpleNamespace
+import unittest
+
+MemoryCollection = importlib.import_module("zns-chatbot.memory_db").MemoryCollection
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class HypeThreadTests(unittest.IsolatedAsyncioTestCase):
+    def _passes(self, n, thread_channel="hype"):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        self.sent = []
+
+        async def send_message(**kwargs):
+            self.sent.append(kwargs)
+
+        bot = SimpleNamespace(id=1, send_message=send_message)
+        passes.base_app = SimpleNamespace(
+            bot=SimpleNamespace(bot=bot),
+            localization=lambda key, args, locale: (
+                f"{args['count']} new" if key == "passes-announce-users-registered"
+                else f"{args['name']}/{args['role']}"
+            ),
+        )
+        passes.pass_db = MemoryCollection([
+            {
+                "_id": i, "bot_id": 1, "pass_key": "pk", "user_id": i,
+                "role": "leader", "date_created": n - i,
+            }
+            for i in range(n)
+        ])
+        passes.user_db = MemoryCollection([
+            {"bot_id": 1, "user_id": i, "first_name": f"u{i}"} for i in range(n)
+        ])
+        event = SimpleNamespace(
+            thread_channel=thread_channel, thread_id=7, thread_locale="en",
+        )
+        passes.get_event = lambda pass_key: event
+        return passes
+
+    async def test_single_registration_keeps_the_single_message(self):
+        passes = self._passes(1)
+        self.assertFalse(await passes.publish_registrations("pk"))
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0]["text"], "u0/leader")
+        self.assertEqual(self.sent[0]["chat_id"], "@hype")
+        self.assertEqual(self.sent[0]["message_thread_id"], 7)
+
+    async def test_burst_is_announced_in_batches(self):
+        passes = self._passes(passes_module.HYPE_THREAD_BATCH + 5)
+
+        self.assertTrue(await passes.publish_registrations("pk"))
+        self.assertEqual(passes.user_db.ops["find"], 1)
+        self.assertEqual(passes.pass_db.ops["update_many"], 1)
+        lines = self.sent[0]["text"].split("\n")
+        self.assertEqual(lines[0], f"{passes_module.HYPE_THREAD_BATCH} new")
+        self.assertEqual(len(lines), passes_module.HYPE_THREAD_BATCH + 1)
+        # oldest registrations go first
+        self.assertEqual(lines[1], f"u{passes_module.HYPE_THREAD_BATCH + 4}/leader")
+
+        self.assertFalse(await passes.publish_registrations("pk"))
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(len(self.sent[1]["text"].split("\n")), 6)
+        self.assertFalse(await passes.publish_registrations("pk"))
+        self.assertEqual(len(self.sent), 2)
+        self.assertTrue(all("sent_to_hype_thread" in d for d in passes.pass_db.docs))
+
+    async def test_passes_claimed_by_a_concurrent_run_are_not_announced(self):
+        passes = self._passes(3)
+        update_many = passes.pass_db.update_many
+
+        async def racing_update_many(query, update, **kwargs):
+            await passes.pass_db.update_one(
+                {"user_id": 0}, {"$set": {"sent_to_hype_thread": True, "hype_claim": "other run"}},
+            )
+            return await update_many(query, update, **kwargs)
+
+        passes.pass_db.update_many = racing_update_many
+        self.assertFalse(await passes.publish_registrations("pk"))
+        self.assertEqual(self.sent[0]["text"].split("\n"), ["2 new", "u2/leader", "u1/leader"])
+
+    async def test_passes_are_claimed_without_a_thread(self):
+        passes = self._passes(3, thread_channel="")
+        self.assertFalse(await passes.publish_registrations("pk"))
+        self.assertEqual(self.sent, [])
+        self.assertEqual(passes.user_db.ops["find"], 0)
+        self.assertTrue(all("sent_to_hype_thread" in d for d in passes.pass_db.docs))
+
+
+if __name__ == "__main__":
+    unittest.main()
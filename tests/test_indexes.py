@@ -0,0 +1,128 @@
+import importlib
+import unittest
+from types import SimpleNamespace
+
+
+indexes = importlib.import_module("zns-chatbot.indexes")
+IndexRegistry = indexes.IndexRegistry
+IndexSpec = indexes.IndexSpec
+
+
+COLLSCAN_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "SORT",
+            "inputStage": {"stage": "COLLSCAN", "direction": "forward"},
+        },
+    },
+}
+IXSCAN_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "queryPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1_bot_id_1"},
+            },
+        },
+    },
+}
+
+
+class FakeCursor:
+    def __init__(self, plan):
+        self.plan = plan
+        self.sorted_by = None
+
+    def sort(self, keys):
+        self.sorted_by = keys
+        return self
+
+    async def explain(self):
+        return self.plan
+
+
+class FakeCollection:
+    def __init__(self, plan=IXSCAN_PLAN, fail_index=False):
+        self.plan = plan
+        self.fail_index = fail_index
+        self.created = []
+
+    async def create_index(self, keys, **kwargs):
+        if self.fail_index:
+            raise RuntimeError("not authorized")
+        self.created.append((keys, kwargs))
+
+    def find(self, query):
+        return FakeCursor(self.plan)
+
+
+class IndexRegistryTests(unittest.IsolatedAsyncioTestCase):
+    def _app(self, **collections):
+        names = {
+            "users_collection": "users",
+            "passes_collection": "passes",
+            "messages_collection": "messages",
+        }
+        db = {names[k]: v for k, v in collections.items()}
+        for name in names.values():
+            db.setdefault(name, FakeCollection())
+        return SimpleNamespace(
+            mongodb=db,
+            config=SimpleNamespace(mongo_db=SimpleNamespace(**names)),
+        )
+
+    def _plugin(self, *specs):
+        return SimpleNamespace(indexes=specs)
+
+    async def test_plugins_contribute_and_duplicates_are_dropped(self):
+        spec = IndexSpec("passes_collection", [("pass_key", 1)], probe={"pass_key": ""})
+        app = self._app()
+        registry = IndexRegistry(app, [self._plugin(spec), self._plugin(spec)])
+
+        await registry.ensure()
+
+        self.assertEqual(len(registry.specs), len(indexes.CORE_INDEXES) + 1)
+        self.assertEqual(app.mongodb["passes"].created, [([("pass_key", 1)], {})])
+        self.assertIn(
+            (
+                [("bot_id", 1), ("state.deadline", 1)],
+                {"partialFilterExpression": {"state.deadline": {"$exists": True}}},
+            ),
+            app.mongodb["users"].created,
+        )
+
+    async def test_failed_index_does_not_stop_the_others(self):
+        spec = IndexSpec("passes_collection", [("pass_key", 1)])
+        app = self._app(users_collection=FakeCollection(fail_index=True))
+
+        await IndexRegistry(app, [self._plugin(spec)]).ensure()
+
+        self.assertEqual(len(app.mongodb["passes"].created), 1)
+
+    async def test_check_reports_collscan_only(self):
+        spec = IndexSpec(
+            "messages_collection", [("user_id", 1), ("date", 1)],
+            probe={"user_id": 0}, probe_sort=[("date", -1)],
+        )
+        app = self._app(messages_collection=FakeCollection(COLLSCAN_PLAN))
+
+        problems = await IndexRegistry(app, [self._plugin(spec)]).check()
+
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith("messages_collection {'user_id': 0}: COLLSCAN"))
+
+    def test_plan_stages_walks_nested_plans(self):
+        plan = {
+            "stage": "OR",
+            "inputStages": [
+                {"stage": "IXSCAN"},
+                {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}},
+            ],
+        }
+        self.assertCountEqual(
+            indexes.plan_stages(plan), ["OR", "IXSCAN", "FETCH", "COLLSCAN"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -33,10 +33,20 @@ def _matches(document, query):
                 exists = False
                 break
             value = value[part]
+        values = value if isinstance(value, list) else [value]
         if isinstance(expected, dict) and "$exists" in expected:
             if exists != expected["$exists"]:
                 return False
-        elif not exists or value != expected:
+        elif isinstance(expected, dict) and "$ne" in expected:
+            if exists and expected["$ne"] in values:
+                return False
+        elif isinstance(expected, dict) and "$lt" in expected:
+            if not exists or not value < expected["$lt"]:
+                return False
+        elif isinstance(expected, dict) and "$in" in expected:
+            if not exists or value not in expected["$in"]:
+                return False
+        elif not exists or (value != expected and expected not in values):
             return False
     return True
 
@@ -91,6 +101,7 @@ class _Collection:
                     key: value for key, value in query.items()
                     if not isinstance(value, dict)
                 }
+                document.update(update.get("$setOnInsert", {}))
                 self._apply_update(document, update)
                 self.documents.append(document)
                 return _Result(0)
@@ -111,10 +122,16 @@ class _Collection:
 
     @staticmethod
     def _apply_update(document, update):
-        document.update(update.get("$setOnInsert", {}))
         document.update(update.get("$set", {}))
         for key in update.get("$unset", {}):
             document.pop(key, None)
+        for key, amount in update.get("$inc", {}).items():
+            document[key] = document.get(key, 0) + amount
+        for key, value in update.get("$addToSet", {}).items():
+            if value not in document.setdefault(key, []):
+                document[key].append(value)
+        for key, value in update.get("$pull", {}).items():
+            document[key] = [item for item in document.get(key, []) if item != value]
 
 
 def _orders_service(event_key="grodno_26"):
@@ -126,6 +143,8 @@ def _orders_service(event_key="grodno_26"):
     service.capacity_db = _Collection()
     service._capacity_slots_ready = set()
     service._capacity_slots_lock = asyncio.Lock()
+    service._capacity_cache = None
+    service._capacity_generation = 0
     return service
 
 
@@ -181,6 +200,63 @@ class ShuttleCapacityTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(service.food_db.documents, [])
 
 
+class CapacityCounterTests(unittest.IsolatedAsyncioTestCase):
+    async def test_counter_is_reconciled_with_existing_orders(self):
+        service = _orders_service()
+        order_ids = [ObjectId() for _ in range(3)]
+        service.food_db.documents.extend(
+            {"_id": order_id, "event_key": "grodno_26", "choice": {"extras": {"shuttle": 65}}}
+            for order_id in order_ids
+        )
+        service.capacity_db.documents.append({
+            "_id": "grodno_26:shuttle",
+            "event_key": "grodno_26",
+            "service": "shuttle",
+            "count": 2,
+            "reservations": [order_ids[1], ObjectId()],
+        })
+
+        self.assertTrue(await service.reserve_shuttle_seat(order_ids[0]))
+
+        counter = await service.capacity_db.find_one({"_id": "grodno_26:shuttle"})
+        self.assertEqual(counter["reservations"], [order_ids[1], order_ids[0], order_ids[2]])
+        self.assertEqual(counter["count"], 3)
+
+    async def test_availability_of_all_services_is_one_cached_read(self):
+        service = _orders_service()
+        reads = 0
+        find = service.capacity_db.find
+
+        def counting_find(query, projection=None):
+            nonlocal reads
+            reads += 1
+            return find(query, projection)
+
+        service.capacity_db.find = counting_find
+        for _ in range(20):
+            self.assertTrue(await service.reserve_service_seat(
+                orders_module.GRODNO_OVERVIEW_SERVICE, ObjectId(),
+            ))
+
+        choice = {"extras": {orders_module.GRODNO_OVERVIEW_SERVICE: 25}}
+        self.assertEqual(await service.services_available(), {
+            orders_module.SHUTTLE_SERVICE: True,
+            orders_module.GRODNO_OVERVIEW_SERVICE: False,
+            orders_module.GRODNO_GORODNITSA_SERVICE: True,
+        })
+        self.assertTrue((await service.services_available(choice))[
+            orders_module.GRODNO_OVERVIEW_SERVICE
+        ])
+        self.assertTrue(await service.shuttle_available())
+        self.assertEqual(reads, 1)
+
+        order_id = ObjectId()
+        self.assertTrue(await service.reserve_shuttle_seat(order_id))
+        await service.release_shuttle_seat(order_id)
+        await service.shuttle_available()
+        self.assertEqual(reads, 2)
+
+
 class OrderEventScopingTests(unittest.IsolatedAsyncioTestCase):
     async def test_order_lookup_excludes_previous_events(self):
         service = _orders_service()
@@ -0,0 +1,124 @@
+import importlib
+from types import SimpleNamespace
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+MemoryCollection = importlib.import_module("zns-chatbot.memory_db").MemoryCollection
+VersionedPassesCollection = importlib.import_module("zns-chatbot.pass_stats").VersionedPassesCollection
+
+
+def pass_doc(user_id, **fields):
+    return {"bot_id": 1, "pass_key": "pk", "user_id": user_id, "state": "waitlist", **fields}
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class PassBulkWritesTests(unittest.IsolatedAsyncioTestCase):
+    def _passes(self, docs):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+        passes.pass_db = MemoryCollection(docs)
+        passes.payment_admins = {"pk": [7, 8]}
+        return passes
+
+    async def test_couple_is_updated_in_one_write(self):
+        passes = self._passes([pass_doc(1), pass_doc(2)])
+        await passes.update_pass_fields([1, 2], "pk", set_fields={"state": "assigned"})
+        self.assertEqual(dict(passes.pass_db.ops), {"update_many": 1})
+        self.assertEqual({doc["state"] for doc in passes.pass_db.docs}, {"assigned"})
+
+    async def test_missing_passes_are_still_created(self):
+        passes = self._passes([pass_doc(1)])
+        await passes.update_pass_fields([1, 2], "pk", set_fields={"comment": "x"})
+        self.assertEqual(
+            sorted((doc["user_id"], doc["comment"]) for doc in passes.pass_db.docs),
+            [(1, "x"), (2, "x")],
+        )
+
+    async def test_backfill_writes_once_per_admin(self):
+        docs = [pass_doc(n) for n in range(50)] + [pass_doc(99, proof_admin=5)]
+        passes = self._passes(docs)
+        self.assertEqual(await passes.backfill_proof_admins("pk"), 50)
+        self.assertLessEqual(passes.pass_db.ops["update_many"], 2)
+        self.assertNotIn("update_one", passes.pass_db.ops)
+        admins = {doc["user_id"]: doc["proof_admin"] for doc in passes.pass_db.docs}
+        self.assertTrue(all(admins[n] in (7, 8) for n in range(50)))
+        self.assertEqual(admins[99], 5)
+
+    async def test_transaction_is_skipped_without_a_replica_set(self):
+        seen = []
+
+        async def body(txn):
+            seen.append(txn)
+            return "done"
+
+        self.assertEqual(await passes_module.run_pass_transaction(MemoryCollection(), body), "done")
+        self.assertEqual(seen, [{}])
+
+    async def test_topology_is_discovered_before_it_is_checked(self):
+        client = AsyncIOMotorClient("mongodb://127.0.0.1:1", serverSelectionTimeoutMS=50, connect=False)
+        self.addCleanup(client.close)
+        pass_db = client["db"]["passes"]
+        self.assertEqual(client.topology_description.topology_type_name, "Unknown")
+        command = AsyncMock(side_effect=ServerSelectionTimeoutError("no servers"))
+
+        with patch.object(AsyncIOMotorDatabase, "command", command):
+            self.assertIsNone(await passes_module._transaction_client(pass_db))
+        command.assert_awaited_once_with("ping")
+
+    async def test_transient_errors_rerun_the_whole_transaction(self):
+        pass_db = VersionedPassesCollection(MemoryCollection())
+        settled = []
+        pass_db.finish_transaction = lambda session: settled.append(session) or _done()
+
+        class FakeSession:
+            in_transaction = True
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def with_transaction(self, callback):
+                # what the driver does on TransientTransactionError
+                for attempt in range(2):
+                    try:
+                        return await callback(self)
+                    except OperationFailure as e:
+                        if attempt or not e.has_error_label("TransientTransactionError"):
+                            raise
+
+        session = FakeSession()
+        client = SimpleNamespace(start_session=lambda: _done(session))
+        attempts = []
+
+        async def body(txn):
+            attempts.append(txn)
+            if len(attempts) == 1:
+                raise OperationFailure(
+                    "write conflict", 112, {"errorLabels": ["TransientTransactionError"]},
+                )
+            return len(attempts)
+
+        with patch.object(passes_module, "_transaction_client", lambda db: _done(client)):
+            self.assertEqual(await passes_module.run_pass_transaction(pass_db, body), 2)
+        self.assertEqual(attempts, [{"session": session}] * 2)
+        self.assertEqual(settled, [session])
+
+
+async def _done(value=None):
+    return value
+
+
+if __name__ == "__main__":
+    unittest.main()
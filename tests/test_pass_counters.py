@@ -0,0 +1,287 @@
+import importlib
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+
+memory_db = importlib.import_module("zns-chatbot.memory_db")
+pass_stats = importlib.import_module("zns-chatbot.pass_stats")
+MemoryCollection = memory_db.MemoryCollection
+VersionedPassesCollection = pass_stats.VersionedPassesCollection
+write_counted = pass_stats.write_counted
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+def pass_doc(user_id, role, state="waitlist", **fields):
+    return {
+        "bot_id": 1, "pass_key": "pk", "user_id": user_id,
+        "role": role, "state": state, "price": 100, **fields,
+    }
+
+
+class PassCountersTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.raw = MemoryCollection()
+        self.counters_db = MemoryCollection()
+        self.passes = VersionedPassesCollection(self.raw, counters_collection=self.counters_db)
+        for n in range(3):
+            await self.raw.insert_one(pass_doc(n, "leader"))
+        await self.raw.insert_one(pass_doc(10, "follower", "paid", pass_type_index=0))
+        self.assertTrue(await self.passes.counters.reconcile(1, "pk"))
+
+    def _stored(self, user_id) -> dict:
+        return next(doc for doc in self.raw.docs if doc["user_id"] == user_id)
+
+    async def _recount(self) -> dict:
+        fresh = pass_stats.PassCounters(MemoryCollection(), self.raw)
+        await fresh.reconcile(1, "pk")
+        return await fresh.get(1, "pk")
+
+    async def _assert_in_sync(self):
+        counters = await self.passes.counters.get(1, "pk")
+        fresh = await self._recount()
+        for section in ("state", "balance", "sold"):
+            self.assertEqual(
+                pass_stats._without_zeros(counters[section]), fresh[section], section,
+            )
+
+    async def _write(self, query, update, changes, **kwargs):
+        return await write_counted(
+            self.passes, 1, "pk", {"bot_id": 1, "pass_key": "pk", **query}, update, changes, **kwargs,
+        )
+
+    async def test_counted_writes_keep_counters_in_sync(self):
+        await self._write(
+            {"user_id": 0, "state": "waitlist"},
+            {"$set": {"state": "assigned", "pass_type_index": 1}},
+            {"state": "assigned", "pass_type_index": 1},
+        )
+        await self._write({"user_id": 1}, {"$set": {"state": "paid", "price": 0}}, {"state": "paid", "price": 0})
+        await self._write({"user_id": 2}, None, None)
+        await self._write(
+            {"user_id": 11},
+            {"$set": {"role": "follower", "state": "waitlist", "price": 100}},
+            {"role": "follower", "state": "waitlist", "price": 100},
+            upsert=True,
+        )
+        result = await self._write(
+            {"user_id": {"$in": [10, 11]}}, {"$set": {"state": "rejected"}}, {"state": "rejected"}, many=True,
+        )
+        self.assertEqual(result.matched_count, 2)
+
+        await self._assert_in_sync()
+        counters = await self.passes.counters.get(1, "pk")
+        self.assertEqual(counters["sold"]["1"]["leader"], 1)
+        self.assertEqual(counters["balance"]["paid"].get("leader", 0), 0)
+        self.assertEqual(counters["state"]["paid"]["leader"], 1)
+        self.assertEqual(counters["pending"], {})
+
+    async def test_write_that_lost_its_race_counts_nothing(self):
+        before = await self.passes.counters.get(1, "pk")
+
+        result = await self._write(
+            {"user_id": 10, "state": "waitlist"}, {"$set": {"state": "assigned"}}, {"state": "assigned"},
+        )
+
+        self.assertEqual(result.matched_count, 0)
+        after = await self.passes.counters.get(1, "pk")
+        for section in ("state", "balance", "sold"):
+            self.assertEqual(pass_stats._without_zeros(after[section]), before[section])
+
+    async def test_update_many_runs_as_one_native_write(self):
+        self.raw.ops.clear()
+
+        await self._write(
+            {"user_id": {"$in": [0, 1, 2]}}, {"$set": {"state": "assigned"}}, {"state": "assigned"}, many=True,
+        )
+
+        self.assertEqual(dict(self.raw.ops), {"find": 1, "update_many": 1})
+        await self._assert_in_sync()
+
+    async def test_update_many_that_matched_other_passes_recounts(self):
+        update_many = self.raw.update_many
+
+        async def racing_update_many(query, update, **kwargs):
+            await self.raw.insert_one(pass_doc(12, "leader"))
+            return await update_many(query, update, **kwargs)
+
+        self.raw.update_many = racing_update_many
+        await self._write({"state": "waitlist"}, {"$set": {"state": "assigned"}}, {"state": "assigned"}, many=True)
+
+        await self._assert_in_sync()
+        self.assertEqual((await self.passes.counters.get(1, "pk"))["state"]["assigned"]["leader"], 4)
+
+    async def test_single_write_rereads_a_pass_that_changed_under_it(self):
+        find_one = self.raw.find_one
+
+        async def racing_find_one(query, projection=None, **kwargs):
+            doc = await find_one(query, projection, **kwargs)
+            if self._stored(0)["role"] == "leader":
+                self._stored(0)["role"] = "follower"  # somebody else's write lands
+                await self.passes.counters.finish(
+                    1, "pk", {"state.waitlist.leader": -1, "balance.waitlist.leader": -1,
+                              "state.waitlist.follower": 1, "balance.waitlist.follower": 1}, None,
+                )
+            return doc
+
+        self.raw.find_one = racing_find_one
+        await self._write({"user_id": 0}, {"$set": {"state": "assigned"}}, {"state": "assigned"})
+
+        self.assertEqual(self._stored(0)["state"], "assigned")
+        await self._assert_in_sync()
+
+    async def test_reconcile_waits_for_pending_writes(self):
+        async with self.passes.counted(1, "pk") as moves:
+            self.assertEqual(len((await self.passes.counters.get(1, "pk"))["pending"]), 1)
+            before = dict(self._stored(0))
+            self._stored(0)["state"] = "assigned"
+            # a recount now would count the write its $inc then counts again
+            self.assertFalse(await self.passes.counters.reconcile(1, "pk"))
+            moves.move(before, self._stored(0))
+
+        await self._assert_in_sync()
+        self.assertTrue(await self.passes.counters.reconcile(1, "pk"))
+
+    async def test_reconcile_drops_writes_that_never_finished(self):
+        key = pass_stats.PassCounters.key(1, "pk")
+        await self.counters_db.update_one(
+            {"_id": key},
+            {"$set": {"pending.dead": datetime.now() - 2 * pass_stats.COUNTED_WRITE_TIMEOUT}},
+        )
+
+        self.assertTrue(await self.passes.counters.reconcile(1, "pk"))
+        self.assertEqual((await self.passes.counters.get(1, "pk"))["pending"], {})
+
+    async def test_failed_block_recounts(self):
+        with self.assertRaises(RuntimeError):
+            async with self.passes.counted(1, "pk"):
+                self._stored(0)["state"] = "assigned"
+                raise RuntimeError("write failed half way")
+
+        await self._assert_in_sync()
+        self.assertEqual((await self.passes.counters.get(1, "pk"))["pending"], {})
+
+    async def test_stats_version_is_bumped_after_the_counters(self):
+        cache = self.passes.stats_cache
+        version = cache.version("pk")
+        seen = []
+        original_update_one = self.counters_db.update_one
+
+        async def update_one(query, update, **kwargs):
+            seen.append(cache.version("pk"))
+            return await original_update_one(query, update, **kwargs)
+
+        self.counters_db.update_one = update_one
+        await self._write({"user_id": 0}, {"$set": {"state": "assigned"}}, {"state": "assigned"})
+        # begin and finish both run before the last bump
+        self.assertEqual(len(seen), 2)
+        self.assertNotEqual(cache.version("pk"), seen[-1])
+
+        async def failing_update_one(query, update, **kwargs):
+            if "$unset" in update:
+                raise RuntimeError("counters down")
+            return await original_update_one(query, update, **kwargs)
+
+        self.counters_db.update_one = failing_update_one
+        version = cache.version("pk")
+        await self._write({"user_id": 1}, {"$set": {"state": "assigned"}}, {"state": "assigned"})
+        self.assertNotEqual(cache.version("pk"), version)
+        # the write stays pending, so only a recount after the timeout may repair it
+        self.assertEqual(len((await self.passes.counters.get(1, "pk"))["pending"]), 1)
+        self.assertFalse(await self.passes.counters.reconcile(1, "pk"))
+
+    async def test_transaction_writes_count_in_it_and_settle_when_over(self):
+        cache = self.passes.stats_cache
+        changed = []
+        self.passes.on_change(changed.append)
+        version = cache.version("pk")
+        seq = (await self.passes.counters.get(1, "pk"))["seq"]
+        sessions = []
+        update_one = self.counters_db.update_one
+
+        async def counters_update_one(query, update, **kwargs):
+            sessions.append(kwargs.get("session"))
+            return await update_one(query, update, **kwargs)
+
+        self.counters_db.update_one = counters_update_one
+        session = SimpleNamespace(in_transaction=True)
+        await self._write(
+            {"user_id": 0}, {"$set": {"state": "assigned"}}, {"state": "assigned"}, session=session,
+        )
+        counters = await self.passes.counters.get(1, "pk")
+        # no pending announcement: the $inc commits or aborts with the write
+        self.assertEqual((counters["seq"], counters["pending"]), (seq + 1, {}))
+        self.assertEqual(sessions, [session])
+        self.assertEqual((cache.version("pk"), changed), (version, []))
+
+        await self.passes.finish_transaction(session)
+        await self._assert_in_sync()
+        self.assertNotEqual(cache.version("pk"), version)
+        self.assertEqual(changed, ["pk"])
+
+    async def test_state_changes_are_reported_per_pass_key(self):
+        changed = []
+        self.passes.on_change(changed.append)
+        await self.passes.update_one(
+            {"bot_id": 1, "pass_key": "pk", "user_id": 0},
+            {"$set": {"sent_to_hype_thread": True}},
+        )
+        await self.passes.update_one(
+            {"bot_id": 1, "pass_key": "pk", "user_id": 0},
+            {"$set": {"state": "rejected"}},
+        )
+        await self.passes.delete_one({"bot_id": 1, "user_id": 1})
+        self.assertEqual(changed, ["pk", None])
+
+    async def test_reconcile_repairs_drift_and_detects_races(self):
+        key = pass_stats.PassCounters.key(1, "pk")
+        await self.counters_db.update_one({"_id": key}, {"$inc": {"state.waitlist.leader": 5}})
+
+        self.assertTrue(await self.passes.counters.reconcile(1, "pk"))
+        await self._assert_in_sync()
+
+        counters = self.passes.counters
+        original_aggregate = self.raw.aggregate
+
+        def racing_aggregate(pipeline):
+            self.counters_db.docs[0]["seq"] += 1
+            return original_aggregate(pipeline)
+
+        self.raw.aggregate = racing_aggregate
+        self.assertFalse(await counters.reconcile(1, "pk"))
+
+    async def test_reconcile_refuses_while_a_write_is_pending(self):
+        token = await self.passes.counters.begin(1, "pk")
+        self.assertIsNotNone(token)
+        self.assertFalse(await self.passes.counters.reconcile(1, "pk"))
+
+        await self.passes.counters.finish(1, "pk", {}, token)
+        self.assertTrue(await self.passes.counters.reconcile(1, "pk"))
+
+    @unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+    async def test_queue_stats_are_read_from_counters(self):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+        passes.pass_db = self.passes
+
+        def no_aggregations(pipeline):
+            raise AssertionError("queue stats must come from the counters")
+
+        self.raw.aggregate = no_aggregations
+        stats = await passes._collect_queue_stats("pk")
+
+        self.assertEqual(stats["role_counts"]["leader"]["waitlist"], 3)
+        self.assertEqual(stats["role_counts"]["follower"]["RA"], 1)
+        self.assertEqual(stats["full_role_counts"]["follower"]["paid"], 1)
+        self.assertEqual(stats["participants_total"], 1)
+        self.assertEqual(stats["tier_usage_by_role"]["follower"], {0: 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import importlib
+import unittest
+from types import SimpleNamespace
+
+
+pass_stats = importlib.import_module("zns-chatbot.pass_stats")
+QueueStatsCache = pass_stats.QueueStatsCache
+VersionedPassesCollection = pass_stats.VersionedPassesCollection
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+FACET_RESULT = [{
+    "balance": [
+        {"_id": {"state": "assigned", "role": "leader"}, "count": 3},
+        {"_id": {"state": "paid", "role": "leader"}, "count": 2},
+        {"_id": {"state": "waitlist", "role": "follower"}, "count": 7},
+    ],
+    "full": [
+        {"_id": {"state": "assigned", "role": "leader"}, "count": 4},
+        {"_id": {"state": "paid", "role": "leader"}, "count": 2},
+        {"_id": {"state": "waitlist", "role": "follower"}, "count": 7},
+    ],
+    "sold": [
+        {"_id": {"role": "leader", "pass_type_index": 0}, "count": 5},
+        {"_id": {"role": "leader", "pass_type_index": 1}, "count": 1},
+    ],
+}]
+
+
+class FakeCursor:
+    def __init__(self, result):
+        self.result = result
+
+    async def to_list(self, length):
+        return self.result
+
+
+class FakePasses:
+    def __init__(self):
+        self.pipelines = []
+        self.writes = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor(FACET_RESULT)
+
+    async def update_one(self, query, update, upsert=False):
+        self.writes.append(query)
+
+    async def insert_one(self, document):
+        self.writes.append(document)
+
+
+class QueueStatsCacheTests(unittest.TestCase):
+    def test_stale_version_is_not_stored(self):
+        cache = QueueStatsCache()
+        version = cache.version("a")
+        cache.bump("a")
+        cache.put("a", version, {"x": 1})
+        self.assertIsNone(cache.get("a"))
+
+    def test_bump_is_per_pass_key(self):
+        cache = QueueStatsCache()
+        cache.put("a", cache.version("a"), {"x": 1})
+        cache.put("b", cache.version("b"), {"x": 2})
+        cache.bump("a")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), {"x": 2})
+        cache.bump()
+        self.assertIsNone(cache.get("b"))
+
+    def test_returned_stats_are_copies(self):
+        cache = QueueStatsCache()
+        cache.put("a", cache.version("a"), {"role_counts": {"leader": {}}})
+        cache.get("a")["role_counts"]["leader"]["RA"] = 10
+        self.assertEqual(cache.get("a"), {"role_counts": {"leader": {}}})
+
+
+class VersionedPassesCollectionTests(unittest.IsolatedAsyncioTestCase):
+    async def test_writes_bump_their_pass_key(self):
+        collection = VersionedPassesCollection(FakePasses())
+        cache = collection.stats_cache
+        cache.put("a", cache.version("a"), {})
+        cache.put("b", cache.version("b"), {})
+
+        await collection.update_one({"pass_key": "a", "user_id": 1}, {"$set": {"state": "paid"}})
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), {})
+
+        await collection.insert_one({"user_id": 1})
+        self.assertIsNone(cache.get("b"))
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class CollectQueueStatsTests(unittest.IsolatedAsyncioTestCase):
+    def _passes(self):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+        passes.pass_db = VersionedPassesCollection(FakePasses())
+        return passes
+
+    async def test_one_round_trip_and_parsed_stats(self):
+        passes = self._passes()
+
+        stats = await passes._collect_queue_stats("pass_2026_1")
+
+        self.assertEqual(len(passes.pass_db._collection.pipelines), 1)
+        self.assertIn("$facet", passes.pass_db._collection.pipelines[0][1])
+        self.assertEqual(stats["role_counts"]["leader"]["RA"], 5)
+        self.assertEqual(stats["full_role_counts"]["leader"]["RA"], 6)
+        self.assertEqual(stats["role_counts"]["follower"]["waitlist"], 7)
+        self.assertEqual(stats["participants_total"], 6)
+        self.assertEqual(stats["tier_usage_total"], {0: 5, 1: 1})
+        self.assertEqual(stats["tier_usage_by_role"]["leader"], {0: 5, 1: 1})
+
+    async def test_cached_until_a_pass_of_the_key_changes(self):
+        passes = self._passes()
+
+        await passes._collect_queue_stats("pass_2026_1")
+        await passes._collect_queue_stats("pass_2026_1")
+        self.assertEqual(len(passes.pass_db._collection.pipelines), 1)
+
+        await passes.pass_db.update_one(
+            {"bot_id": 1, "pass_key": "pass_2026_1", "user_id": 5},
+            {"$set": {"state": "assigned"}},
+        )
+        await passes._collect_queue_stats("pass_2026_1")
+        self.assertEqual(len(passes.pass_db._collection.pipelines), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import timedelta
+import importlib
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class PassTimeoutsTests(unittest.IsolatedAsyncioTestCase):
+    def test_due_instants_follow_the_pass_fields(self):
+        PassTimeouts = passes_module.PassTimeouts
+        now = passes_module.now_msk()
+
+        self.assertEqual(PassTimeouts.due({"state": "waitlist", "date_created": now}), {})
+        self.assertEqual(
+            PassTimeouts.due({"state": "waiting-for-couple", "date_created": now}),
+            {"invitation": now + passes_module.INVITATION_TIMEOUT},
+        )
+        self.assertEqual(
+            PassTimeouts.due({"state": "assigned", "date_assignment": now}),
+            {"notify": now + passes_module.PAYMENT_TIMEOUT_NOTIFY},
+        )
+        notified = {"state": "assigned", "date_assignment": now, "notified_deadline_close": now}
+        self.assertEqual(PassTimeouts.due(notified), {
+            "cancel": now + timedelta(days=2),
+            "notify2": now + timedelta(days=1),
+        })
+        notified["notified_deadline_close2"] = now
+        self.assertEqual(list(PassTimeouts.due(notified)), ["cancel"])
+
+    async def test_fires_due_timeouts_and_skips_replaced_ones(self):
+        now = passes_module.now_msk()
+        docs = {
+            "pk": [
+                {"user_id": 1, "state": "assigned",
+                 "date_assignment": now - passes_module.PAYMENT_TIMEOUT_NOTIFY},
+                {"user_id": 2, "state": "waiting-for-couple",
+                 "date_created": now - passes_module.INVITATION_TIMEOUT + timedelta(seconds=0.05)},
+                {"user_id": 3, "state": "assigned", "date_assignment": now},
+            ],
+        }
+        fired = []
+
+        async def load(pass_key):
+            return [dict(doc) for doc in docs[pass_key]]
+
+        async def fire(user_id, pass_key, action):
+            fired.append((user_id, action))
+
+        timeouts = passes_module.PassTimeouts(load, fire)
+        await timeouts.reconcile(["pk"])
+        runner = asyncio.create_task(timeouts.run())
+        try:
+            await asyncio.sleep(0.01)
+            self.assertEqual(fired, [(1, "notify")])
+
+            # user 2 accepted the invitation before the timeout
+            docs["pk"][1]["state"] = "assigned"
+            docs["pk"][1]["date_assignment"] = now
+            timeouts.mark_dirty("pk")
+            await asyncio.sleep(0.1)
+            self.assertEqual(fired, [(1, "notify")])
+
+            # the notification didn't go through: retried on the next sweep
+            await timeouts.reconcile(["pk"])
+            await asyncio.sleep(0.01)
+            self.assertEqual(fired, [(1, "notify"), (1, "notify")])
+        finally:
+            runner.cancel()
+
+
+if __name__ == "__main__":
+    unittest.main()
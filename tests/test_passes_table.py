@@ -0,0 +1,94 @@
+from datetime import datetime
+import importlib
+import io
+import os
+from types import SimpleNamespace
+import unittest
+
+import openpyxl
+
+passes_table = importlib.import_module("zns-chatbot.passes_table")
+MemoryCollection = importlib.import_module("zns-chatbot.memory_db").MemoryCollection
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+def load_rows(data: bytes) -> list[list]:
+    ws = openpyxl.load_workbook(io.BytesIO(data)).active
+    return [[cell.value for cell in row] for row in ws.iter_rows()]
+
+
+class PassesTableTests(unittest.TestCase):
+    def test_rows_and_widths(self):
+        table = passes_table.PassesTable()
+        created = datetime(2026, 1, 2, 3, 4, 5, 678000)
+        table.add(
+            "pk",
+            {"user_id": 1, "username": "a_rather_long_username_value"},
+            {"state": "paid", "price": 100, "proof_admin": 7, "date_created": created},
+            200,
+        )
+        row = dict(zip(passes_table.PASSES_TABLE_FIELDS, table.rows[0]))
+        self.assertEqual(row["pass_key"], "pk")
+        self.assertEqual(row["price"], 200)
+        self.assertEqual(row["price_per_one"], 100)
+        self.assertEqual(row["proof_admin_received"], 7)
+        self.assertEqual(row["date_created"], "2026-01-02 03:04:05.678")
+
+        widths = dict(zip(passes_table.PASSES_TABLE_FIELDS, table.widths()))
+        self.assertEqual(widths["username"], len("a_rather_long_username_value"))
+        self.assertEqual(widths["language_code"], 2)
+
+        data = passes_table.build_passes_workbook(
+            table.headers, table.rows, table.widths(), table.sort_column(),
+        )
+        ws = openpyxl.load_workbook(io.BytesIO(data)).active
+        self.assertEqual(ws.title, "Passes")
+        self.assertEqual(ws.freeze_panes, "A2")
+        self.assertTrue(ws["A1"].font.b)
+        self.assertEqual(ws.column_dimensions["B"].width, widths["username"])
+        self.assertEqual(load_rows(data)[1][0], 1)
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class PassesTableCommandTests(unittest.IsolatedAsyncioTestCase):
+    async def test_export_fetches_users_once_per_pass_key(self):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.pass_keys = ["pk1", "pk2"]
+        passes.refresh_events_cache = lambda: None
+        passes.config = SimpleNamespace(telegram=SimpleNamespace(admins={1}))
+        passes.pass_db = MemoryCollection([
+            {"bot_id": 777, "pass_key": key, "user_id": uid, "state": "paid", "price": 10}
+            for key in passes.pass_keys
+            for uid in range(100, 150)
+        ])
+        passes.user_db = MemoryCollection([
+            {"bot_id": 777, "user_id": uid, "username": f"user{uid}"}
+            for uid in range(100, 150)
+        ])
+        sent = []
+
+        async def send_document(chat_id, document, caption=None):
+            sent.append(document)
+
+        update = SimpleNamespace(
+            user=1, bot=SimpleNamespace(id=777, send_document=send_document),
+            l=None, update=None,
+        )
+        cwd_files = set(os.listdir())
+        await passes_module.PassUpdate(passes, update).handle_passes_table_cmd()
+
+        self.assertEqual(passes.user_db.ops["find"], 2)
+        self.assertEqual(set(os.listdir()), cwd_files)
+        rows = load_rows(sent[0].input_file_content)
+        self.assertEqual(len(rows), 101)
+        self.assertEqual(rows[1][:2], [100, "user100"])
+
+
+if __name__ == "__main__":
+    unittest.main()
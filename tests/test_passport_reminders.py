@@ -0,0 +1,71 @@
+import asyncio
+import importlib
+from types import MethodType, SimpleNamespace
+import unittest
+
+memory_db = importlib.import_module("zns-chatbot.memory_db")
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class PassportReminderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_one_aggregation_bounded_sends_one_flag_update(self):
+        database = memory_db.MemoryDatabase()
+        users = database.collection(
+            "users",
+            [{"bot_id": 1, "user_id": n} for n in range(30)]
+            + [{"bot_id": 1, "user_id": 30, "passport_number": "x"}]
+            + [{"bot_id": 1, "user_id": 31, "notified_passport_data_required": True}],
+        )
+        pass_docs = [
+            {"bot_id": 1, "pass_key": "pk", "user_id": n, "state": "paid"}
+            for n in range(32)
+        ]
+        pass_docs.append({"bot_id": 1, "pass_key": "pk", "user_id": 40, "state": "waitlist"})
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.base_app = SimpleNamespace(bot=SimpleNamespace(bot=SimpleNamespace(id=1)))
+        passes.user_db = users
+        passes.pass_db = database.collection("passes", pass_docs)
+
+        running = 0
+        peak = 0
+
+        class FakeUpdate:
+            def __init__(self, user_id):
+                self.user_id = user_id
+
+            def set_pass_key(self, pass_key):
+                pass
+
+            async def require_passport_data(self):
+                nonlocal running, peak
+                if self.user_id == 7:
+                    raise RuntimeError("blocked the bot")
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def create_update_from_user(_self, user_id):
+            return FakeUpdate(user_id)
+
+        passes.create_update_from_user = MethodType(create_update_from_user, passes)
+
+        notified = await passes.remind_passport_data("pk")
+
+        self.assertEqual(sorted(notified), [n for n in range(30) if n != 7])
+        self.assertEqual(database.ops(), {"passes.aggregate": 1, "users.update_many": 1})
+        self.assertLessEqual(peak, passes_module.PASSPORT_REMINDER_CONCURRENCY)
+        flagged = {doc["user_id"] for doc in users.docs if doc.get("notified_passport_data_required")}
+        self.assertEqual(flagged, set(range(32)) - {7, 30})
+        self.assertEqual(await passes.passport_reminder_candidates("pk"), [7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import importlib
+from types import MethodType, SimpleNamespace
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class QueueRecalculationTests(unittest.IsolatedAsyncioTestCase):
+    def _passes(self, pass_keys):
+        passes = passes_module.Passes.__new__(passes_module.Passes)
+        passes.pass_keys = list(pass_keys)
+        passes._queue_locks = {}
+        passes._queue_notify_locks = {}
+        passes._queue_recalc_pending = set()
+        passes.refresh_events_cache = lambda: None
+        self.log: list[tuple[str, str]] = []
+        self.gates: dict[tuple[str, str], asyncio.Event] = {}
+
+        async def assign(_self, pass_key):
+            self.log.append(("assign", pass_key))
+            gate = self.gates.get(("assign", pass_key))
+            if gate is not None:
+                await gate.wait()
+
+        async def notify(_self, pass_key):
+            self.log.append(("notify", pass_key))
+            gate = self.gates.get(("notify", pass_key))
+            if gate is not None:
+                await gate.wait()
+
+        passes._assign_queue_pk = MethodType(assign, passes)
+        passes._notify_queue_pk = MethodType(notify, passes)
+        return passes
+
+    async def test_slow_pass_key_does_not_block_others(self):
+        passes = self._passes(["slow", "fast"])
+        self.gates[("assign", "slow")] = asyncio.Event()
+
+        task = asyncio.create_task(passes.recalculate_queues())
+        await asyncio.sleep(0.01)
+        self.assertIn(("notify", "fast"), self.log)
+        self.assertNotIn(("notify", "slow"), self.log)
+
+        self.gates[("assign", "slow")].set()
+        await task
+        self.assertIn(("notify", "slow"), self.log)
+
+    async def test_calls_during_a_run_coalesce_per_key(self):
+        passes = self._passes(["a", "b"])
+        gate = self.gates[("assign", "a")] = asyncio.Event()
+
+        first = asyncio.create_task(passes.recalculate_queue("a"))
+        await asyncio.sleep(0)
+        for _ in range(3):
+            await passes.recalculate_queue("a")
+        await passes.recalculate_queue("b")
+        gate.set()
+        await first
+
+        self.assertEqual(self.log.count(("assign", "a")), 2)
+        self.assertEqual(self.log.count(("assign", "b")), 1)
+
+    async def test_notifications_run_outside_the_assignment_lock(self):
+        passes = self._passes(["a"])
+        notify_gate = self.gates[("notify", "a")] = asyncio.Event()
+
+        first = asyncio.create_task(passes.recalculate_queue("a"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.log, [("assign", "a"), ("notify", "a")])
+
+        second = asyncio.create_task(passes.recalculate_queue("a"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.log[-1], ("assign", "a"))
+
+        notify_gate.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(self.log.count(("notify", "a")), 2)
+
+    async def test_dirty_pass_keys_are_recalculated_once_per_burst(self):
+        passes = self._passes(["a", "b", "c"])
+        passes.base_app = SimpleNamespace(bot_started=asyncio.Event())
+        passes.base_app.bot_started.set()
+        passes.config = SimpleNamespace(passes=SimpleNamespace(queue_recalc_debounce=0.05))
+        passes._queue_dirty = set()
+        passes._queue_dirty_event = asyncio.Event()
+
+        worker = asyncio.create_task(passes._queue_recalc_worker())
+        try:
+            for pass_key in ("a", "b", "a", "gone"):
+                passes.mark_queue_dirty(pass_key)
+                await asyncio.sleep(0.01)
+            self.assertEqual(self.log, [])
+
+            await asyncio.sleep(0.1)
+            self.assertEqual(sorted(self.log), [
+                ("assign", "a"), ("assign", "b"), ("notify", "a"), ("notify", "b"),
+            ])
+
+            self.log.clear()
+            passes.mark_queue_dirty(None)
+            await asyncio.sleep(0.1)
+            self.assertEqual(self.log.count(("assign", "c")), 1)
+            self.assertEqual(len(self.log), 6)
+        finally:
+            worker.cancel()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import importlib
+from dataclasses import replace
+from datetime import datetime, timedelta
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    events = importlib.import_module("zns-chatbot.events")
+    queue_simulator = importlib.import_module("zns-chatbot.queue_simulator")
+except Exception as exc:  # pragma: no cover - environment-specific
+    queue_simulator = None
+    IMPORT_ERROR = exc
+
+PASS_KEY = "pass_sim"
+
+
+def make_event(*amounts: int):
+    return events.EventInfo(
+        key=PASS_KEY,
+        amount_cap_per_role=80,
+        payment_admin=[100],
+        hidden_payment_admins=[],
+        finish_date=None,
+        title_long={"default": PASS_KEY},
+        title_short={"default": PASS_KEY},
+        country_emoji="",
+        thread_channel="",
+        thread_id=None,
+        thread_locale="en",
+        require_passport=False,
+        price=None,
+        pass_types=tuple(
+            events.EventPassType(
+                amount=amount,
+                price=100 * (n + 1),
+                start=datetime(2000, 1, 1) if n == 0 else datetime.max,
+            )
+            for n, amount in enumerate(amounts)
+        ),
+        pass_assignment_rule="distributed",
+        disable_max_concurrent_assignments=True,
+    )
+
+
+def make_snapshot(roles: str, couples: tuple[tuple[int, int], ...] = ()):
+    start = datetime(2026, 1, 1)
+    passes = [
+        {
+            "bot_id": 1,
+            "pass_key": PASS_KEY,
+            "user_id": n,
+            "role": "leader" if role == "l" else "follower",
+            "state": "waitlist",
+            "type": "solo",
+            "date_created": start + timedelta(minutes=n),
+        }
+        for n, role in enumerate(roles)
+    ]
+    for a, b in couples:
+        passes[a].update(type="couple", couple=b)
+        passes[b].update(type="couple", couple=a)
+    users = [{"bot_id": 1, "user_id": n} for n in range(len(roles))]
+    return queue_simulator.QueueSnapshot(1, PASS_KEY, passes, users)
+
+
+@unittest.skipIf(queue_simulator is None, f"queue simulator unavailable: {IMPORT_ERROR!r}")
+class QueueSimulatorTests(unittest.IsolatedAsyncioTestCase):
+    async def test_assigns_by_tier_and_notifies_the_rest(self):
+        snapshot = make_snapshot("lflflflf", couples=((6, 7),))
+        report = await queue_simulator.simulate(snapshot, make_event(2, 4))
+
+        self.assertEqual(report.waitlist, 8)
+        self.assertEqual(len(report.assignments), 6)
+        self.assertEqual([a.user_id for a in report.assignments], [0, 1, 2, 3, 4, 5])
+        self.assertEqual(
+            {tier: dict(roles) for tier, roles in report.by_tier().items()},
+            {0: {"leader": 1, "follower": 1}, 1: {"leader": 2, "follower": 2}},
+        )
+        self.assertEqual({a.price for a in report.assignments if a.tier == 1}, {200})
+        self.assertEqual(report.notified, 2)
+        self.assertGreater(report.db_ops["passes.update_one"], 0)
+        # the snapshot itself is left untouched
+        self.assertTrue(all(doc["state"] == "waitlist" for doc in snapshot.passes))
+
+    async def test_couples_are_assigned_together(self):
+        snapshot = make_snapshot("lf", couples=((0, 1),))
+        report = await queue_simulator.simulate(snapshot, make_event(4))
+
+        self.assertEqual(
+            sorted((a.user_id, a.couple, a.tier) for a in report.assignments),
+            [(0, 1, 0), (1, 0, 0)],
+        )
+
+    async def test_tolerance_and_tiers_can_be_tried_out(self):
+        snapshot = make_snapshot("llllllf")
+        event = make_event(6)
+
+        strict = await queue_simulator.simulate(snapshot, event)
+        loose = await queue_simulator.simulate(snapshot, event, tolerance=100)
+        smaller = await queue_simulator.simulate(
+            snapshot, replace(event, pass_types=(replace(event.pass_types[0], amount=1),)),
+            tolerance=100,
+        )
+
+        self.assertEqual(len(strict.assignments), 2)
+        self.assertEqual(len(loose.assignments), 6)
+        self.assertEqual(len(smaller.assignments), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import importlib
+import unittest
+from datetime import datetime
+
+from telegram import CallbackQuery, Chat, Message, MessageEntity, PhotoSize, Update, User
+from telegram.ext import filters
+
+
+routing = importlib.import_module("zns-chatbot.routing")
+base_plugin = importlib.import_module("zns-chatbot.plugins.base_plugin")
+
+USER = User(id=7, first_name="Test", is_bot=False)
+CHAT = Chat(id=7, type=Chat.PRIVATE)
+
+
+def message_update(text=None, photo=None):
+    entities = []
+    if text is not None and text.startswith("/"):
+        entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text.split()[0]))]
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=CHAT,
+        from_user=USER,
+        text=text,
+        entities=entities,
+        photo=photo or [],
+    )
+    return Update(update_id=1, message=message)
+
+
+def callback_update(data):
+    query = CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data)
+    return Update(update_id=1, callback_query=query)
+
+
+class CommandPlugin(base_plugin.BasePlugin):
+    name = "cmd"
+    commands = {"cmd": "handle_start", "cmd_admin": "handle_admin"}
+    callback_prefix = "cmd"
+    content_filters = ((filters.PHOTO, "handle_photo"),)
+
+    def __init__(self, admins=()):
+        self.admins = set(admins)
+
+    def accepts_route(self, update):
+        if update.effective_message is not None and update.effective_message.text == "/cmd_admin":
+            return update.effective_user.id in self.admins
+        return True
+
+    async def handle_start(self, update):
+        pass
+
+    async def handle_admin(self, update):
+        pass
+
+    async def handle_photo(self, update):
+        pass
+
+    async def handle_callback_query(self, update):
+        pass
+
+
+class FreeTextPlugin(base_plugin.BasePlugin):
+    name = "text"
+
+    def __init__(self):
+        pass
+
+    def test_message(self, message, state, web_app_data):
+        if (filters.TEXT & ~filters.COMMAND).check_update(message):
+            return base_plugin.PRIORITY_BASIC, None
+        return base_plugin.PRIORITY_NOT_ACCEPTING, None
+
+
+class PluginRouterTests(unittest.TestCase):
+    def setUp(self):
+        self.commands = CommandPlugin()
+        self.text = FreeTextPlugin()
+        self.router = routing.PluginRouter({"cmd": self.commands, "text": self.text})
+
+    def test_command_and_mention_are_indexed(self):
+        route = self.router.route_message(message_update("/CMD@ZnsBot arg"), {}, None, "znsbot")
+        self.assertIs(route.plugin, self.commands)
+        self.assertEqual(route.handle, self.commands.handle_start)
+
+        self.assertIsNone(
+            self.router.route_message(message_update("/cmd@other_bot"), {}, None, "znsbot")
+        )
+
+    def test_guarded_command_falls_through(self):
+        self.assertIsNone(self.router.route_message(message_update("/cmd_admin"), {}, None))
+
+        router = routing.PluginRouter({"cmd": CommandPlugin(admins=[USER.id])})
+        route = router.route_message(message_update("/cmd_admin"), {}, None)
+        self.assertEqual(route.handle.__name__, "handle_admin")
+
+    def test_content_filter_and_free_text_fallback(self):
+        photo = [PhotoSize(file_id="f", file_unique_id="u", width=1, height=1)]
+        route = self.router.route_message(message_update(photo=photo), {}, None)
+        self.assertEqual(route.handle, self.commands.handle_photo)
+
+        route = self.router.route_message(message_update("hello"), {}, None)
+        self.assertIs(route.plugin, self.text)
+        self.assertIsNone(route.handle)
+        self.assertEqual(self.router.message_fallbacks, [self.text])
+
+    def test_callback_prefix_lookup(self):
+        route = self.router.route_callback_query(callback_update("cmd|start|1"), {})
+        self.assertEqual(route.handle, self.commands.handle_callback_query)
+
+        self.assertIsNone(self.router.route_callback_query(callback_update("cmdx|start"), {}))
+        self.assertIsNone(self.router.route_callback_query(callback_update("cmd"), {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import importlib
+import unittest
+from time import monotonic
+
+from telegram.error import RetryAfter
+
+
+send_scheduler = importlib.import_module("zns-chatbot.send_scheduler")
+SendScheduler = send_scheduler.SendScheduler
+
+
+class FakeApi:
+    def __init__(self, flood_first: int = 0):
+        self.calls: list[tuple[float, int, str]] = []
+        self.flood_first = flood_first
+
+    def endpoint(self, chat_id, text):
+        async def call():
+            if self.flood_first > 0:
+                self.flood_first -= 1
+                raise RetryAfter(0)
+            self.calls.append((monotonic(), chat_id, text))
+            return True
+        return call
+
+
+class SendSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def _send(self, scheduler, api, chat_id, text, priority=None, endpoint="sendMessage"):
+        return await scheduler.process_request(
+            api.endpoint(chat_id, text), (), {}, endpoint, {"chat_id": chat_id}, priority,
+        )
+
+    async def test_interactive_replies_overtake_bulk(self):
+        scheduler = SendScheduler(global_rate=50, chat_rate=1000)
+        api = FakeApi()
+        bulk = [
+            asyncio.create_task(self._send(scheduler, api, n, "bulk", send_scheduler.SEND_BULK))
+            for n in range(100)
+        ]
+        await asyncio.sleep(0.05)
+        await self._send(scheduler, api, 9999, "reply")
+
+        sent_before_reply = [text for _, _, text in api.calls].index("reply")
+        self.assertLess(sent_before_reply, 100)
+        await asyncio.gather(*bulk)
+        self.assertEqual(len(api.calls), 101)
+
+    async def test_background_priority_comes_from_context(self):
+        scheduler = SendScheduler(global_rate=20, chat_rate=1000)
+        api = FakeApi()
+
+        async def notifier():
+            send_scheduler.send_priority.set(send_scheduler.SEND_BULK)
+            await asyncio.gather(*(self._send(scheduler, api, n, "bulk") for n in range(20)))
+
+        background = asyncio.create_task(notifier())
+        await asyncio.sleep(0.1)
+        self.assertGreater(scheduler.stats()["waiting_bulk"], 0)
+        await self._send(scheduler, api, 9999, "reply")
+        self.assertLess([text for _, _, text in api.calls].index("reply"), 10)
+        await background
+
+    async def test_per_chat_rate_is_enforced(self):
+        scheduler = SendScheduler(global_rate=1000, chat_rate=50)
+        api = FakeApi()
+
+        await asyncio.gather(*(self._send(scheduler, api, 1, str(n)) for n in range(6)))
+
+        elapsed = api.calls[-1][0] - api.calls[0][0]
+        self.assertGreaterEqual(elapsed, 5 / 50 * 0.9)
+
+    async def test_retry_after_is_retried(self):
+        scheduler = SendScheduler(global_rate=1000, chat_rate=1000)
+        api = FakeApi(flood_first=2)
+
+        self.assertTrue(await self._send(scheduler, api, 1, "x"))
+        self.assertEqual(scheduler.stats()["retried"], 2)
+
+        api.flood_first = scheduler.max_retries + 1
+        with self.assertRaises(RetryAfter):
+            await self._send(scheduler, api, 2, "y")
+
+    async def test_other_endpoints_are_not_limited(self):
+        scheduler = SendScheduler(global_rate=1, chat_rate=1)
+        api = FakeApi()
+
+        await asyncio.gather(*(
+            self._send(scheduler, api, 1, str(n), endpoint="answerCallbackQuery")
+            for n in range(10)
+        ))
+
+        self.assertEqual(scheduler.stats()["sent"], 0)
+        self.assertEqual(len(api.calls), 10)
+
+    async def test_chat_actions_do_not_delay_the_reply(self):
+        scheduler = SendScheduler(global_rate=1000, chat_rate=1)
+        api = FakeApi()
+
+        await self._send(scheduler, api, 1, "typing", endpoint="sendChatAction")
+        started = monotonic()
+        await self._send(scheduler, api, 1, "reply")
+
+        self.assertLess(monotonic() - started, 0.5)
+        self.assertEqual(scheduler.stats()["sent"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
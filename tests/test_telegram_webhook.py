@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+import json
+import unittest
+from types import SimpleNamespace
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+import tornado.web
+
+
+server = importlib.import_module("zns-chatbot.server")
+
+SECRET = "webhook-secret"
+RECORDED_UPDATE = {
+    "update_id": 10001,
+    "message": {
+        "message_id": 5,
+        "date": 1760000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "/passes",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+    },
+}
+
+
+class TelegramWebhookHandlerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.update_queue = asyncio.Queue()
+        self.base_app = SimpleNamespace(
+            bot=SimpleNamespace(bot=None, update_queue=self.update_queue),
+            events=None,
+            config=None,
+        )
+        app = tornado.web.Application([(
+            r"/tg_webhook/([^/]+)",
+            server.TelegramWebhookHandler,
+            {"app": self.base_app, "secret": SECRET},
+        )])
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = tornado.httpserver.HTTPServer(app)
+        self.server.add_sockets([sock])
+        self.client = tornado.httpclient.AsyncHTTPClient()
+
+    async def asyncTearDown(self):
+        self.server.stop()
+        await self.server.close_all_connections()
+
+    async def _post(self, path_secret=SECRET, header_secret=SECRET, body=None):
+        response = await self.client.fetch(
+            f"http://127.0.0.1:{self.port}/tg_webhook/{path_secret}",
+            method="POST",
+            body=json.dumps(RECORDED_UPDATE) if body is None else body,
+            headers={"X-Telegram-Bot-Api-Secret-Token": header_secret},
+            raise_error=False,
+        )
+        return response.code
+
+    async def test_update_is_queued(self):
+        self.assertEqual(await self._post(), 200)
+
+        update = self.update_queue.get_nowait()
+        self.assertEqual(update.update_id, 10001)
+        self.assertEqual(update.effective_message.text, "/passes")
+
+    async def test_wrong_secrets_are_rejected(self):
+        self.assertEqual(await self._post(path_secret="nope"), 403)
+        self.assertEqual(await self._post(header_secret="nope"), 403)
+        self.assertTrue(self.update_queue.empty())
+
+    async def test_not_started_bot_asks_for_redelivery(self):
+        self.base_app.bot = None
+
+        self.assertEqual(await self._post(), 503)
+
+    async def test_malformed_body(self):
+        self.assertEqual(await self._post(body="{"), 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import importlib
+import unittest
+
+
+scheduler_module = importlib.import_module("zns-chatbot.update_scheduler")
+UpdateScheduler = scheduler_module.UpdateScheduler
+
+
+class UpdateSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def _drain(self, scheduler):
+        while scheduler.stats()["users"]:
+            await asyncio.sleep(0.001)
+
+    async def test_updates_of_one_user_run_in_order(self):
+        scheduler = UpdateScheduler(workers=8, callback_query_max_age=60)
+        seen = []
+
+        def job(n):
+            async def run():
+                await asyncio.sleep(0.001 * (5 - n))
+                seen.append(n)
+            return run
+
+        for n in range(5):
+            scheduler.submit(1, job(n))
+        await self._drain(scheduler)
+
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+        self.assertEqual(scheduler.processed, 5)
+
+    async def test_worker_budget_is_global(self):
+        scheduler = UpdateScheduler(workers=3, callback_query_max_age=60)
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.005)
+            running -= 1
+
+        for user_id in range(20):
+            scheduler.submit(user_id, job)
+        self.assertEqual(scheduler.stats()["queued"], 20)
+        await self._drain(scheduler)
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+    async def test_stale_callback_queries_are_shed(self):
+        scheduler = UpdateScheduler(workers=1, callback_query_max_age=0.01)
+        done = []
+
+        async def slow():
+            await asyncio.sleep(0.03)
+            done.append("slow")
+
+        async def callback():
+            done.append("callback")
+
+        async def message():
+            done.append("message")
+
+        scheduler.submit(1, slow)
+        scheduler.submit(2, callback, is_callback_query=True)
+        scheduler.submit(2, message)
+        await self._drain(scheduler)
+
+        self.assertEqual(done, ["slow", "message"])
+        self.assertEqual(scheduler.shed, 1)
+
+    async def test_full_user_queue_drops_updates(self):
+        scheduler = UpdateScheduler(workers=1, callback_query_max_age=60, user_queue_limit=2)
+
+        async def job():
+            await asyncio.sleep(0)
+
+        results = [scheduler.submit(1, job) for _ in range(3)]
+        await self._drain(scheduler)
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(scheduler.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import asyncio
+import importlib
+import unittest
+from types import SimpleNamespace
+
+
+user_cache_module = importlib.import_module("zns-chatbot.user_cache")
+UserCache = user_cache_module.UserCache
+CachedUsersCollection = user_cache_module.CachedUsersCollection
+TGState = importlib.import_module("zns-chatbot.tg_state").TGState
+TGUpdate = importlib.import_module("zns-chatbot.telegram").TGUpdate
+
+PROFILE = {
+    "username": "dancer",
+    "first_name": "Ann",
+    "last_name": "Lee",
+    "language_code": "en",
+    "print_name": "Ann Lee",
+}
+
+
+class FakeUsers:
+    def __init__(self, documents):
+        self.documents = documents
+        self.find_one_calls = 0
+        self.update_one_calls = 0
+        self.release_find_one: asyncio.Event | None = None
+
+    async def find_one(self, query):
+        self.find_one_calls += 1
+        if self.release_find_one is not None:
+            await self.release_find_one.wait()
+        for document in self.documents:
+            if all(document.get(key) == value for key, value in query.items()):
+                return dict(document)
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        self.update_one_calls += 1
+        for document in self.documents:
+            if all(document.get(key) == value for key, value in query.items()
+                   if not isinstance(value, dict)):
+                document.update(update.get("$set", {}))
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+
+class UserCacheTests(unittest.IsolatedAsyncioTestCase):
+    def _collection(self, **cache_kwargs):
+        raw = FakeUsers([{"user_id": 5, "bot_id": 1, "state": {"state": ""}, **PROFILE}])
+        return raw, CachedUsersCollection(raw, UserCache(**cache_kwargs))
+
+    def _app(self, users):
+        return SimpleNamespace(
+            config=None,
+            bot=SimpleNamespace(bot=SimpleNamespace(id=1, username="zns_bot")),
+            users_collection=users,
+        )
+
+    async def _load(self, users, user_id=5):
+        return await TGState(user_id, self._app(users)).load_user()
+
+    def _update(self, users, **profile):
+        fields = {**PROFILE, **profile}
+        effective_user = SimpleNamespace(
+            id=5,
+            username=fields["username"],
+            first_name=fields["first_name"],
+            last_name=fields["last_name"],
+            language_code=fields["language_code"],
+            full_name=fields["print_name"],
+            name=fields["username"],
+        )
+        update = SimpleNamespace(
+            effective_user=effective_user,
+            effective_chat=None,
+            message=None,
+            callback_query=None,
+        )
+        context = SimpleNamespace(application=SimpleNamespace(base_app=self._app(users)))
+        return TGUpdate(update, context)
+
+    async def test_write_through_keeps_cached_document_fresh(self):
+        raw, users = self._collection()
+        await self._load(users)
+        await users.update_one(
+            {"user_id": 5, "bot_id": 1},
+            {"$set": {"state.state": "waiting_text", "role": "leader"}, "$inc": {"starts_called": 1}},
+        )
+
+        document = await self._load(users)
+
+        self.assertEqual(raw.find_one_calls, 1)
+        self.assertEqual(document["state"]["state"], "waiting_text")
+        self.assertEqual(document["role"], "leader")
+        self.assertEqual(document["starts_called"], 1)
+
+    async def test_conditional_write_evicts_document(self):
+        raw, users = self._collection()
+        await self._load(users)
+        await users.update_one(
+            {"user_id": 5, "bot_id": 1, "passport_number": {"$exists": False}},
+            {"$set": {"notified": True}},
+        )
+
+        document = await self._load(users)
+
+        self.assertEqual(raw.find_one_calls, 2)
+        self.assertTrue(document["notified"])
+
+    async def test_cached_copy_is_not_shared(self):
+        _, users = self._collection()
+        document = await self._load(users)
+        document["state"]["state"] = "mutated"
+
+        self.assertEqual((await self._load(users))["state"]["state"], "")
+
+    async def test_write_during_load_discards_stale_read(self):
+        raw, users = self._collection()
+        raw.release_find_one = asyncio.Event()
+        loading = asyncio.create_task(self._load(users))
+        await asyncio.sleep(0)
+        raw.release_find_one.set()
+        await users.update_one({"user_id": 5, "bot_id": 1}, {"$set": {"role": "follower"}})
+        await loading
+
+        self.assertIsNone(users.cache.get((1, 5)))
+
+    async def test_get_state_skips_unchanged_profile_write(self):
+        raw, users = self._collection()
+        update = self._update(users)
+        await update.get_state()
+        await self._update(users).get_state()
+
+        self.assertEqual(raw.find_one_calls, 1)
+        self.assertEqual(raw.update_one_calls, 0)
+        self.assertEqual(update.state, {"state": ""})
+
+    async def test_get_state_writes_changed_profile(self):
+        raw, users = self._collection()
+        await self._update(users).get_state()
+        await self._update(users, username="dancer2").get_state()
+        await self._update(users, username="dancer2").get_state()
+
+        self.assertEqual(raw.update_one_calls, 1)
+        self.assertEqual(raw.find_one_calls, 1)
+        self.assertEqual(raw.documents[0]["username"], "dancer2")
+
+    async def test_ttl_and_size_eviction(self):
+        cache = UserCache(ttl=-1, max_size=10)
+        cache.finish_load((1, 1), cache.begin_load((1, 1)), {"user_id": 1})
+        self.assertIsNone(cache.get((1, 1)))
+
+        cache = UserCache(ttl=60, max_size=2)
+        for user_id in range(3):
+            key = (1, user_id)
+            cache.finish_load(key, cache.begin_load(key), {"user_id": user_id})
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get((1, 0)))
+        self.assertIsNotNone(cache.get((1, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
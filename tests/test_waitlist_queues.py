@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+import importlib
+import unittest
+
+IMPORT_ERROR: Exception | None = None
+try:
+    passes_module = importlib.import_module("zns-chatbot.plugins.passes")
+    events_module = importlib.import_module("zns-chatbot.events")
+    queue_simulator = importlib.import_module("zns-chatbot.queue_simulator")
+    pass_stats = importlib.import_module("zns-chatbot.pass_stats")
+except Exception as exc:  # pragma: no cover - environment-specific
+    passes_module = None
+    IMPORT_ERROR = exc
+
+BASE_TS = datetime(2026, 1, 1, 12, 0, 0)
+ASSIGNED = ("assigned", "paid")
+
+
+def wl(user_id: int, role: str, sec: int, couple: int | None = None) -> dict:
+    doc = {
+        "bot_id": 1,
+        "pass_key": "pk",
+        "user_id": user_id,
+        "role": role,
+        "state": "waitlist",
+        "date_created": BASE_TS + timedelta(seconds=sec),
+    }
+    if couple is not None:
+        doc["couple"] = couple
+    return doc
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class WaitlistQueuesTests(unittest.TestCase):
+    def test_tops_and_first_solo(self):
+        queues = passes_module.WaitlistQueues([
+            wl(1, "leader", 0, couple=2),
+            wl(3, "leader", 1),
+            wl(2, "follower", 0, couple=1),
+        ])
+        self.assertEqual(queues.top("leader")["user_id"], 1)
+        self.assertEqual(queues.first_solo("leader")["user_id"], 3)
+        self.assertIsNone(queues.first_solo("follower"))
+
+    def test_refresh_drops_users_that_left_and_keeps_order(self):
+        queues = passes_module.WaitlistQueues([
+            wl(1, "leader", 0, couple=2),
+            wl(3, "leader", 1),
+            wl(2, "follower", 0, couple=1),
+        ])
+        solo = wl(1, "leader", 0)
+
+        self.assertTrue(queues.refresh({1, 2}, {1: solo}))
+        self.assertIs(queues.top("leader"), solo)
+        self.assertIsNone(queues.top("follower"))
+        self.assertFalse(queues.refresh({1}, {1: solo}))
+
+    def test_add_and_remove_keep_known_users(self):
+        queues = passes_module.WaitlistQueues([wl(1, "leader", 0), wl(2, "follower", 5)])
+        self.assertEqual(queues.newest, BASE_TS + timedelta(seconds=5))
+
+        queues.add([wl(3, "leader", 9)])
+        queues.remove({1})
+        self.assertIsNone(queues.get(1))
+        self.assertEqual(queues.top("leader")["user_id"], 3)
+        self.assertEqual(queues.known, {1, 2, 3})
+        self.assertEqual(queues.newest, BASE_TS + timedelta(seconds=9))
+
+
+def nonzero(counts: dict | None) -> dict:
+    return {
+        outer: {inner: n for inner, n in by_role.items() if n}
+        for outer, by_role in (counts or {}).items()
+        if any(by_role.values())
+    }
+
+
+def make_event(amount: int):
+    return events_module.EventInfo(
+        key="pk",
+        amount_cap_per_role=amount,
+        payment_admin=[100],
+        hidden_payment_admins=[],
+        finish_date=None,
+        title_long={"default": "pk"},
+        title_short={"default": "pk"},
+        country_emoji="",
+        thread_channel="",
+        thread_id=None,
+        thread_locale="en",
+        require_passport=False,
+        price=None,
+        pass_types=(
+            events_module.EventPassType(amount=amount, price=100, start=datetime(2000, 1, 1)),
+        ),
+        pass_assignment_rule="distributed",
+        disable_max_concurrent_assignments=True,
+    )
+
+
+@unittest.skipIf(passes_module is None, f"passes plugin unavailable: {IMPORT_ERROR!r}")
+class QueuePlanTests(unittest.IsolatedAsyncioTestCase):
+    async def _passes(self, docs, amount=200):
+        snapshot = queue_simulator.QueueSnapshot(
+            1, "pk", docs, [{"bot_id": 1, "user_id": doc["user_id"]} for doc in docs],
+        )
+        passes = queue_simulator.SimulatedPasses(snapshot, make_event(amount))
+        await passes.pass_db.counters.reconcile(1, "pk")
+        passes.database.ops().clear()
+        for collection in (passes.passes_collection, passes.counters_collection, passes.user_db):
+            collection.ops.clear()
+        return passes
+
+    def _state(self, passes, user_id):
+        return next(doc for doc in passes.passes_collection.docs if doc["user_id"] == user_id)
+
+    def _assigned(self, passes):
+        return sorted(
+            doc["user_id"] for doc in passes.passes_collection.docs if doc["state"] in ASSIGNED
+        )
+
+    async def _assert_counters_exact(self, passes):
+        kept = await passes.pass_db.counters.get(1, "pk")
+        self.assertTrue(await passes.pass_db.counters.reconcile(1, "pk"))
+        recounted = await passes.pass_db.counters.get(1, "pk")
+        for section in ("state", "balance", "sold"):
+            self.assertEqual(nonzero(kept.get(section)), nonzero(recounted.get(section)), section)
+
+    async def test_plan_is_written_in_one_bulk_write(self):
+        pairs = 50
+        docs = [wl(n, "leader", n) for n in range(pairs)]
+        docs += [wl(1000 + n, "follower", n) for n in range(pairs)]
+        docs += [wl(2000, "leader", pairs, couple=2001), wl(2001, "follower", pairs, couple=2000)]
+        passes = await self._passes(docs)
+
+        await passes._assign_queue_pk("pk")
+
+        self.assertEqual(len(self._assigned(passes)), 2 * pairs + 2)
+        self.assertEqual(self._state(passes, 2000)["couple"], 2001)
+        ops = passes.db_ops()
+        self.assertEqual(ops["passes.bulk_write"], 1)
+        self.assertEqual(ops["passes.update_one"], 0)
+        # the waitlist, the assigned passes for the messages, the sign-up check
+        self.assertEqual(ops["passes.find"], 3)
+        self.assertEqual(
+            sorted(user for user, key, _ in passes.messages if key == "passes-pass-assigned"),
+            self._assigned(passes),
+        )
+        await self._assert_counters_exact(passes)
+
+    async def test_changed_passes_are_assigned_on_their_own(self):
+        docs = [
+            wl(1, "leader", 0),
+            wl(2, "follower", 0),
+            wl(3, "leader", 1, couple=4),
+            wl(4, "follower", 1, couple=3),
+        ]
+        passes = await self._passes(docs)
+        write_queue_plan = passes._write_queue_plan
+
+        async def racing(pass_key, event, plan):
+            # between planning and writing, 1 switches role and 4 leaves
+            for user_id, changes in ((1, {"role": "follower"}), (4, {"state": "cancelled"})):
+                await pass_stats.write_counted(
+                    passes.pass_db, 1, "pk", {"user_id": user_id, "pass_key": "pk"},
+                    {"$set": changes}, changes,
+                )
+            return await write_queue_plan(pass_key, event, plan)
+
+        passes._write_queue_plan = racing
+        await passes._assign_queue_pk("pk")
+
+        self.assertEqual(self._assigned(passes), [1, 2, 3])
+        self.assertEqual(self._state(passes, 1)["role"], "follower")
+        # the half of the couple the bulk wrote was put back, then assigned solo
+        self.assertEqual(self._state(passes, 3)["type"], "solo")
+        self.assertNotIn("couple", self._state(passes, 3))
+        self.assertEqual(self._state(passes, 4)["state"], "cancelled")
+        self.assertEqual(passes.db_ops()["passes.replace_one"], 1)
+        await self._assert_counters_exact(passes)
+
+    async def test_sign_ups_during_a_run_join_it(self):
+        passes = await self._passes([wl(1, "leader", 0), wl(2, "follower", 0)])
+        show_pass_edit = queue_simulator.SimulatedPassUpdate.show_pass_edit
+        late = [wl(3, "leader", 10), wl(4, "follower", 10)]
+
+        async def signing_up(upd, user, u_pass, text_key=None):
+            while late:
+                doc = late.pop()
+                await pass_stats.write_counted(
+                    passes.pass_db, 1, "pk", {"user_id": doc["user_id"], "pass_key": "pk"},
+                    {"$setOnInsert": doc}, {name: doc.get(name) for name in pass_stats.COUNTED_FIELDS},
+                    upsert=True,
+                )
+            await show_pass_edit(upd, user, u_pass, text_key)
+
+        queue_simulator.SimulatedPassUpdate.show_pass_edit = signing_up
+        try:
+            await passes._assign_queue_pk("pk")
+        finally:
+            queue_simulator.SimulatedPassUpdate.show_pass_edit = show_pass_edit
+
+        self.assertEqual(self._assigned(passes), [1, 2, 3, 4])
+        self.assertEqual(passes.db_ops()["passes.bulk_write"], 2)
+        await self._assert_counters_exact(passes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from asyncio import Future, create_task, gather, get_running_loop, shield
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """DataLoader-style batching of lookups by key.
+
+    Keys requested within one event loop tick are collected and resolved
+    with a single call to *batch*, which gets the distinct keys and returns
+    a mapping of the ones it found. Concurrent requests for the same key
+    share one lookup. Nothing is cached once a batch is resolved, so a
+    loader can live as long as the request it serves without going stale.
+    """
+
+    def __init__(self, batch: Callable[[list[K]], Awaitable[dict[K, V]]]):
+        self._batch = batch
+        self._pending: dict[K, Future] = {}
+        self.batches = 0
+
+    async def load(self, key: K) -> V | None:
+        future = self._pending.get(key)
+        if future is None:
+            loop = get_running_loop()
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            future = self._pending[key] = loop.create_future()
+        # a cancelled caller must not cancel the lookup other callers share
+        return await shield(future)
+
+    async def load_many(self, keys: list[K]) -> list[V | None]:
+        return list(await gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        create_task(self._resolve(pending))
+
+    async def _resolve(self, pending: dict[K, Future]):
+        self.batches += 1
+        try:
+            found = await self._batch(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(key))
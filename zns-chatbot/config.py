@@ -1,3 +1,4 @@
+import hashlib
 import re
 from datetime import date, datetime, time, timedelta
 from typing import Tuple, Type
@@ -30,6 +31,15 @@ class GoogleSettings(IgnoreExtraSettings):
 class TelegramSettings(IgnoreExtraSettings):
     token: SecretStr = Field()
     admins: set[int] = Field({379278985})
+    update_workers: int = Field(64, gt=0, description="updates handled at once")
+    callback_query_max_age: float = Field(
+        30, description="seconds a queued callback query stays relevant"
+    )
+    global_send_rate: float = Field(30, gt=0, description="messages per second")
+    chat_send_rate: float = Field(1, gt=0, description="messages per second per chat")
+    group_send_rate: float = Field(
+        20 / 60, gt=0, description="messages per second per group or channel"
+    )
 
 
 class LanguageModel(IgnoreExtraSettings):
@@ -88,6 +98,12 @@ class ServerSettings(IgnoreExtraSettings):
     base: str = Field("http://localhost:8085")
     port: int = Field(8085)
     auth_timeout: float = Field(1, description="days till auth expire")
+    telegram_webhook: bool = Field(
+        False, description="receive updates via webhook instead of polling"
+    )
+    telegram_webhook_secret: SecretStr = Field(
+        "", description="defaults to a hash of the bot token"
+    )
 
 
 class Photo(IgnoreExtraSettings):
@@ -124,6 +140,12 @@ class Food(IgnoreExtraSettings):
     notify_after: timedelta = Field(timedelta(hours=3))
 
 
+class Passes(IgnoreExtraSettings):
+    queue_recalc_debounce: float = Field(
+        2, ge=0, description="seconds to collect pass changes before recalculating queues"
+    )
+
+
 class Massages(IgnoreExtraSettings):
     max_massages_a_day: int = Field(3)
     notify_client_prior_long: timedelta = Field(timedelta(hours=1))
@@ -149,6 +171,7 @@ class Config(IgnoreExtraSettings):
     food: Food = Food()
     orders: Orders = Orders()
     massages: Massages = Massages()
+    passes: Passes = Passes()
     parties: list[Party] = [
         Party(
             start=datetime(2025, 9, 25, 20),
@@ -204,3 +227,12 @@ def full_link(app, link):
         elif port is None:
             link = re.sub(r"http://(([a-z]+)\.)?localhost(:\d+)?/", f"https://complynx.net/testbot/{host}/", link)
     return link
+
+
+def telegram_webhook_secret(config: Config) -> str:
+    secret = config.server.telegram_webhook_secret.get_secret_value()
+    if secret != "":
+        return secret
+    return hashlib.sha256(
+        f"webhook {config.telegram.token.get_secret_value()}".encode()
+    ).hexdigest()
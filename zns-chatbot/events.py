@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from asyncio import CancelledError, Lock, Task, create_task, sleep
+from bisect import bisect_left, bisect_right
 from contextlib import suppress
 from dataclasses import dataclass
 from datetime import datetime
+from itertools import accumulate
 import logging
 from typing import Protocol, cast
 
@@ -57,6 +59,58 @@ class EventPassType:
     blocked_by_date: bool = False
 
 
+class PassTypes(tuple):
+    """The tiers of an event, compiled once for the assignment math.
+
+    A tuple of :class:`EventPassType` that also carries each tier's capacity
+    per assignment rule, prefix sums of those, and the tiers' start times
+    arranged for bisection. Tier lookups made on every assignment decision
+    then don't walk the tiers.
+    """
+
+    def __new__(cls, pass_types=()):
+        self = super().__new__(cls, pass_types)
+        self._capacity = {
+            "distributed": tuple(pass_type.amount for pass_type in self),
+            "paired": tuple(pass_type.amount // 2 for pass_type in self),
+        }
+        self._prior_capacity = {
+            rule: tuple(accumulate(capacity, initial=0))
+            for rule, capacity in self._capacity.items()
+        }
+        # earliest start of each tier and the ones after it; non-decreasing
+        earliest = datetime.max
+        floors = []
+        for pass_type in reversed(self):
+            earliest = min(earliest, pass_type.start)
+            floors.append(earliest)
+        self._start_floors = tuple(reversed(floors))
+        self.sell_start = earliest
+        return self
+
+    @classmethod
+    def of(cls, pass_types) -> "PassTypes":
+        return pass_types if isinstance(pass_types, cls) else cls(pass_types)
+
+    @staticmethod
+    def _rule(assignment_rule: str) -> str:
+        return "paired" if assignment_rule == "paired" else "distributed"
+
+    def capacity(self, tier_index: int, assignment_rule: str) -> int:
+        """Passes sold in the tier; paired tiers sell half per role."""
+        return self._capacity[self._rule(assignment_rule)][tier_index]
+
+    def prior_capacity(self, tier_index: int, assignment_rule: str) -> int:
+        """Capacity of all the tiers before *tier_index*."""
+        return self._prior_capacity[self._rule(assignment_rule)][tier_index]
+
+    def time_floor(self, reference_time: datetime) -> int | None:
+        """The last tier that has started, else the first one."""
+        if not self:
+            return None
+        return max(bisect_right(self._start_floors, reference_time) - 1, 0)
+
+
 def _normalize_admins(raw: list[int] | int | None) -> list[int]:
     if raw is None:
         return []
@@ -141,19 +195,21 @@ class EventInfo:
     thread_locale: str
     require_passport: bool
     price: int | None
-    pass_types: tuple[EventPassType, ...]
+    pass_types: PassTypes
     pass_assignment_rule: str
     disable_max_concurrent_assignments: bool = False
 
+    def __post_init__(self) -> None:
+        if not isinstance(self.pass_types, PassTypes):
+            object.__setattr__(self, "pass_types", PassTypes(self.pass_types))
+
     @property
     def sell_start(self) -> datetime:
-        if not self.pass_types:
-            return datetime.max
-        return min(pass_type.start for pass_type in self.pass_types)
+        return self.pass_types.sell_start
 
     @classmethod
     def from_settings(cls, key: str, settings: EventSettings) -> "EventInfo":
-        pass_types: tuple[EventPassType, ...] = tuple(
+        pass_types = PassTypes(
             EventPassType(
                 amount=pass_type.amount,
                 price=pass_type.price,
@@ -205,6 +261,48 @@ class EventInfo:
         return reference_time < self.finish_date
 
 
+@dataclass(frozen=True, slots=True)
+class _EventViews:
+    """Sorted views of one generation of the events cache.
+
+    Between two consecutive finish dates the set of active events does not
+    change, so it is precomputed per interval and found by bisection.
+    """
+
+    generation: int
+    all: tuple[EventInfo, ...]
+    finish_dates: tuple[datetime, ...]
+    active: tuple[tuple[EventInfo, ...], ...]
+    active_starts: tuple[tuple[datetime, ...], ...]
+
+    @classmethod
+    def build(cls, generation: int, events: dict[str, EventInfo]) -> "_EventViews":
+        all_events = tuple(sorted(events.values(), key=lambda item: item.sell_start))
+        finish_dates = tuple(sorted({
+            event.finish_date for event in all_events if event.finish_date is not None
+        }))
+        active = tuple(
+            tuple(
+                event for event in all_events
+                if event.finish_date is None
+                or bisect_left(finish_dates, event.finish_date) >= interval
+            )
+            for interval in range(len(finish_dates) + 1)
+        )
+        return cls(
+            generation=generation,
+            all=all_events,
+            finish_dates=finish_dates,
+            active=active,
+            active_starts=tuple(
+                tuple(event.sell_start for event in group) for group in active
+            ),
+        )
+
+    def interval(self, reference_time: datetime) -> int:
+        return bisect_right(self.finish_dates, reference_time)
+
+
 class Events:
     # Couple notes: 1. There is no need in several instances of app race prevention as only one can run
     # 2. If no events are active it is ok to fail certain actions
@@ -220,6 +318,7 @@ class Events:
             db[self._collection_name] if db is not None else None
         )
         self._events: dict[str, EventInfo] = {}
+        self._views: _EventViews = _EventViews.build(0, {})
         self._refresh_lock: Lock = Lock()
         self._refresh_task: Task[None] | None = None
 
@@ -252,23 +351,32 @@ class Events:
         if self._collection is None:
             if self._events:
                 logger.warning("MongoDB is unavailable. Event cache has been cleared.")
-            self._events = {}
+            self._set_events({})
             return
         async with self._refresh_lock:
             docs = cast(list[dict[str, object]], await self._collection.find({}).to_list(None))
             loaded: dict[str, EventInfo] = self._parse_event_docs(docs)
             if loaded:
-                self._events = loaded
+                self._set_events(loaded)
                 return
             logger.warning("No events loaded from collection %s.", self._collection_name)
-            self._events = {}
+            self._set_events({})
+
+    def _set_events(self, events: dict[str, EventInfo]) -> None:
+        self._events = events
+        self._views = _EventViews.build(self._views.generation + 1, events)
+
+    @property
+    def generation(self) -> int:
+        """Bumped on every refresh; anything derived from the events can key on it."""
+        return self._views.generation
 
     def all_events(self) -> tuple[EventInfo, ...]:
-        return tuple(sorted(self._events.values(), key=lambda item: item.sell_start))
+        return self._views.all
 
     def active_events(self, reference_time: datetime | None = None) -> tuple[EventInfo, ...]:
         now: datetime = reference_time or datetime.now()
-        return tuple(event for event in self.all_events() if event.is_active(now))
+        return self._views.active[self._views.interval(now)]
 
     def all_pass_keys(self) -> list[str]:
         return [event.key for event in self.all_events()]
@@ -280,14 +388,19 @@ class Events:
         return self._events.get(pass_key)
 
     def closest_active_event(self, reference_time: datetime | None = None) -> EventInfo | None:
+        """The active event that started selling last, else the next one to start."""
         now: datetime = reference_time or datetime.now()
-        active: list[EventInfo] = list(self.active_events(now))
+        views = self._views
+        interval = views.interval(now)
+        active = views.active[interval]
         if not active:
             return None
-        started: list[EventInfo] = [event for event in active if event.sell_start <= now]
+        starts = views.active_starts[interval]
+        started = bisect_right(starts, now)
         if started:
-            return max(started, key=lambda event: event.sell_start)
-        return min(active, key=lambda event: event.sell_start)
+            # the first of the events that started at that same time
+            return active[bisect_left(starts, starts[started - 1])]
+        return active[0]
 
     def closest_active_pass_key(self, reference_time: datetime | None = None) -> str:
         event: EventInfo | None = self.closest_active_event(reference_time)
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from copy import deepcopy
+import time
+from typing import Hashable
+
+FOOD_DIGEST_TTL = 120  # seconds
+FOOD_DIGEST_CACHE_SIZE = 10000
+
+
+class FoodDigestCache:
+    """Order digest per user, valid until an order of that user changes.
+
+    Food bumps the version of a user whenever it saves, deletes or accepts
+    payment for that user's order. Digests computed for an older version
+    are never returned, including ones whose read was still running when
+    the write happened. The version also carries a caller supplied tag,
+    such as the menu generation the digest was rendered with.
+
+    Writes made outside this process (another replica, a manual fix in
+    Mongo) don't bump anything, so digests also expire after *ttl*
+    seconds; at most *max_size* are kept, least recently used first out.
+    """
+
+    def __init__(self, ttl: float = FOOD_DIGEST_TTL, max_size: int = FOOD_DIGEST_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._versions: dict[int, int] = {}
+        self._generation = 0
+        self._digests: OrderedDict[int, tuple[tuple, float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._digests)
+
+    def version(self, user_id: int, tag: Hashable = None) -> tuple:
+        return tag, self._generation, self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int | None = None):
+        if user_id is None:
+            self._generation += 1
+            self._digests.clear()
+            return
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self._digests.pop(user_id, None)
+
+    def get(self, user_id: int, version: tuple) -> dict | None:
+        entry = self._digests.get(user_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        if entry[1] < time.monotonic():
+            del self._digests[user_id]
+            self.misses += 1
+            return None
+        self._digests.move_to_end(user_id)
+        self.hits += 1
+        return deepcopy(entry[2])
+
+    def put(self, user_id: int, version: tuple, digest: dict):
+        if version != self.version(user_id, version[0]):
+            return
+        self._digests[user_id] = (version, time.monotonic() + self.ttl, deepcopy(digest))
+        self._digests.move_to_end(user_id)
+        while len(self._digests) > self.max_size:
+            self._digests.popitem(last=False)
+
@@ -0,0 +1,153 @@
+"""The food menu, compiled for pricing orders.
+
+``static/menu_2025_1.json`` lists the lunch and dinner items of every day.
+:class:`MenuIndex` flattens it into price tables per day and meal, and
+:class:`MenuFile` recompiles it when the file changes on disk, so menu
+edits don't need a restart.
+"""
+import json
+import logging
+import os
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+LUNCH_NO_SOUP_PRICE = 555
+LUNCH_WITH_SOUP_PRICE = 665
+LUNCH_SUB_CATEGORIES = ["main", "side", "salad"]
+# combo type -> (price, categories the order has to pick an item of)
+LUNCH_COMBOS = {
+    "combo-with-soup": (LUNCH_WITH_SOUP_PRICE, ("soup", *LUNCH_SUB_CATEGORIES)),
+    "combo-no-soup": (LUNCH_NO_SOUP_PRICE, tuple(LUNCH_SUB_CATEGORIES)),
+}
+MENU_RELOAD_CHECK_INTERVAL = 5  # seconds between checks of the menu file
+
+
+def _prices(items: list) -> tuple[int | float | None, ...]:
+    return tuple(
+        item["price"]
+        if isinstance(item, dict) and isinstance(item.get("price"), (int, float))
+        else None
+        for item in items
+    )
+
+
+class MenuIndex:
+    """Prices of the menu by day and meal, for days that serve the meal."""
+
+    def __init__(self, menu: dict):
+        self.days = tuple(menu)
+        self.lunch = {
+            day: _prices(config["lunch"]) for day, config in menu.items() if config.get("lunch")
+        }
+        self.dinner = {
+            day: _prices(config["dinner"]) for day, config in menu.items() if config.get("dinner")
+        }
+
+    def price(self, order_data: dict) -> tuple[int | float, bool]:
+        """Total of *order_data* and whether it is complete.
+
+        An order is complete when it has a valid lunch choice for every day
+        that serves lunch; dinner is optional.
+        """
+        picked: list[int | float] = []
+        complete = True
+        for day in self.days:
+            day_order = order_data.get(day)
+            if not isinstance(day_order, dict):
+                day_order = {}
+            if day in self.lunch:
+                lunch = day_order.get("lunch")
+                if lunch is None or not self._pick_lunch(day, lunch, picked):
+                    complete = False
+            if day in self.dinner and "dinner" in day_order:
+                items = day_order["dinner"]
+                if isinstance(items, list):
+                    picked.extend(self._item_prices(day, "dinner", items))
+        return sum(picked), complete
+
+    def _pick_lunch(self, day: str, lunch, picked: list) -> bool:
+        lunch_type = lunch.get("type") if isinstance(lunch, dict) else None
+        if lunch_type == "no-lunch":
+            return True
+        if lunch_type == "individual-items":
+            items = lunch.get("items", [])
+            if not isinstance(items, list):
+                logger.warning(
+                    f"Malformed 'items' for 'individual-items' lunch on {day}. "
+                    f"Expected list, got {type(items)}."
+                )
+                return False
+            picked.extend(self._item_prices(day, "lunch", items))
+            return True
+        combo = LUNCH_COMBOS.get(lunch_type)
+        if combo is None:
+            logger.warning(f"Invalid or missing lunch_type '{lunch_type}' for {day}.")
+            return False
+        price, categories = combo
+        items = lunch.get("items", {})
+        if not isinstance(items, dict) or any(
+            items.get(f"{category}_index") is None for category in categories
+        ):
+            return False
+        picked.append(price)
+        return True
+
+    def _item_prices(self, day: str, meal: str, indices: list):
+        prices = (self.lunch if meal == "lunch" else self.dinner)[day]
+        for raw_index in indices:
+            try:
+                index = int(raw_index)  # the client might send string indices
+            except (ValueError, TypeError):
+                logger.warning(f"Invalid {meal} item index format: '{raw_index}' for {day}.")
+                continue
+            if not 0 <= index < len(prices):
+                logger.warning(
+                    f"Invalid {meal} item index {index} for {day} (max: {len(prices) - 1})."
+                )
+                continue
+            if prices[index] is None:
+                logger.warning(f"{meal.capitalize()} item {day}-{meal}-{index} has no valid price.")
+                continue
+            yield prices[index]
+
+
+class MenuFile:
+    """The menu JSON and its :class:`MenuIndex`, reloaded when the file's mtime changes.
+
+    The file is checked at most every ``MENU_RELOAD_CHECK_INTERVAL`` seconds.
+    A file that fails to load keeps the previous menu in place.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime: int | None = None
+        self._checked = monotonic()
+        self.generation = 0  # bumped on every (re)load
+        self.menu: dict = {}
+        self.index = MenuIndex({})
+        self.reload()
+
+    def current(self) -> tuple[dict, MenuIndex]:
+        now = monotonic()
+        if now - self._checked >= MENU_RELOAD_CHECK_INTERVAL:
+            self._checked = now
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Failed to reload the menu from {self.path}: {e}", exc_info=True)
+        return self.menu, self.index
+
+    def reload(self) -> bool:
+        """Recompiles the menu if the file changed; returns whether it did."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            menu = json.load(f)
+        self.menu, self.index = menu, MenuIndex(menu)
+        self.generation += 1
+        if self._mtime is not None:
+            logger.info(f"Menu reloaded from {self.path}")
+        self._mtime = mtime
+        return True
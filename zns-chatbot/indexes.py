@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Any, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    """An index the bot relies on.
+
+    ``collection`` is the name of the collection setting in ``MongoDB``
+    config (e.g. ``"users_collection"``). ``probe`` and ``probe_sort`` describe
+    a hot query served by this index; the self-check explains it and reports
+    a COLLSCAN if the planner doesn't use any index for it.
+    """
+    collection: str
+    keys: list[tuple[str, int]]
+    options: dict[str, Any] | None = None
+    probe: dict[str, Any] | None = None
+    probe_sort: list[tuple[str, int]] | None = None
+
+
+# Indexes for the queries of the core (telegram.py, server.py), not of a plugin.
+CORE_INDEXES = (
+    IndexSpec(
+        "users_collection",
+        [("user_id", 1), ("bot_id", 1)],
+        probe={"user_id": 0, "bot_id": 0},
+    ),
+    IndexSpec(
+        "users_collection",
+        [("username", 1), ("bot_id", 1)],
+        probe={"username": "", "bot_id": 0},
+    ),
+    IndexSpec(
+        "users_collection",
+        [("bot_id", 1), ("state.deadline", 1)],
+        {"partialFilterExpression": {"state.deadline": {"$exists": True}}},
+        probe={"bot_id": 0, "state.deadline": {"$exists": True}},
+    ),
+)
+
+
+def plan_stages(plan: dict) -> list[str]:
+    """Lists all stage names of an explain() plan tree."""
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key in ("inputStage", "queryPlan"):
+            if isinstance(node.get(key), dict):
+                pending.append(node[key])
+        for child in node.get("inputStages", ()):
+            pending.append(child)
+    return stages
+
+
+class IndexRegistry:
+    """Indexes declared by the core and by every plugin's ``indexes``."""
+
+    def __init__(self, app, plugins=()):
+        self.app = app
+        self.specs: list[IndexSpec] = []
+        seen = set()
+        for spec in [*CORE_INDEXES, *(s for p in plugins for s in p.indexes)]:
+            key = (spec.collection, tuple(spec.keys))
+            if key in seen:
+                continue
+            seen.add(key)
+            self.specs.append(spec)
+
+    def _collection(self, spec: IndexSpec):
+        return self.app.mongodb[getattr(self.app.config.mongo_db, spec.collection)]
+
+    async def ensure(self):
+        """Creates all indexes. Existing ones are a no-op on the server side."""
+        created = 0
+        for spec in self.specs:
+            try:
+                await self._collection(spec).create_index(spec.keys, **(spec.options or {}))
+                created += 1
+            except Exception as e:
+                logger.error(
+                    f"failed to create index {spec.keys} on {spec.collection}: {e}",
+                    exc_info=1,
+                )
+        logger.info(f"ensured {created}/{len(self.specs)} indexes")
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.ensure())
+
+    async def check(self) -> list[str]:
+        """Explains every probe query, returns descriptions of those doing a COLLSCAN."""
+        problems = []
+        for spec in self.specs:
+            if spec.probe is None:
+                continue
+            cursor = self._collection(spec).find(spec.probe)
+            if spec.probe_sort is not None:
+                cursor = cursor.sort(spec.probe_sort)
+            try:
+                explained = await cursor.explain()
+            except Exception as e:
+                problems.append(f"{spec.collection} {spec.probe}: explain failed: {e}")
+                continue
+            stages = plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+            if "COLLSCAN" in stages:
+                problems.append(
+                    f"{spec.collection} {spec.probe}: COLLSCAN ({' <- '.join(stages)})"
+                )
+        return problems
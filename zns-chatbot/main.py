@@ -4,6 +4,8 @@ import logging
 import random
 from .config import Config
 from .events import Events
+from .indexes import IndexRegistry
+from .pass_stats import VersionedPassesCollection
 from .telegram import create_telegram_bot
 from .cached_localization import Localization
 from fluent.runtime import FluentResourceLoader
@@ -11,6 +13,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from .plugins import plugins
 from .server import create_server
 from .storage import Storage
+from .user_cache import CachedUsersCollection
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,8 @@ class App(object):
     users_collection = None
     storage = None
     events = None
+    deadlines = None
+    indexes = None
 
 async def main(cfg: Config):
     app = App()
@@ -35,14 +40,23 @@ async def main(cfg: Config):
     if cfg.mongo_db.address != "":
         logger.info(f"db address {cfg.mongo_db.address}")
         app.mongodb = AsyncIOMotorClient(cfg.mongo_db.address).get_database()
-        app.passes_collection = app.mongodb[cfg.mongo_db.passes_collection]
-        app.users_collection = app.mongodb[cfg.mongo_db.users_collection]
+        app.passes_collection = VersionedPassesCollection(
+            app.mongodb[cfg.mongo_db.passes_collection],
+            counters_collection=app.mongodb[cfg.mongo_db.passes_collection + "_counters"],
+        )
+        app.users_collection = CachedUsersCollection(
+            app.mongodb[cfg.mongo_db.users_collection]
+        )
         app.storage = Storage(app.mongodb[cfg.mongo_db.bots_storage])
     app.events = Events(app)
     try:
         await app.events.start()
         await create_server(cfg, app)
-        async with create_telegram_bot(cfg, app, {plugin.name: plugin for plugin in [plugin(app) for plugin in plugins]}) as bot:
+        plugin_objects = {plugin.name: plugin for plugin in [plugin(app) for plugin in plugins]}
+        if app.mongodb is not None:
+            app.indexes = IndexRegistry(app, plugin_objects.values())
+            app.indexes.start()
+        async with create_telegram_bot(cfg, app, plugin_objects) as bot:
             logger.info("running event loop")
 
             await asyncio.Event().wait()
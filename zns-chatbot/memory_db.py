@@ -0,0 +1,1005 @@
+"""In-memory stand-in for the Mongo collections of the bot.
+
+The queue simulator, the tests and the benchmarks all run the plugins
+against :class:`MemoryCollection` instead of a database. It covers the part
+of the query, update and aggregation languages the plugins use, with the
+Mongo semantics they rely on: a missing field is not null in aggregation
+expressions, a null query matches missing fields, field paths reach into
+arrays of documents, and expression objects drop fields that evaluate to
+missing. Anything else raises ``NotImplementedError`` rather than guess.
+
+Every call counts as one operation in :attr:`MemoryCollection.ops`, and
+*latency* seconds are spent per round trip to approximate a real server.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+from itertools import count, islice
+from typing import Any, AsyncIterator, Iterable, Iterator
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+class _Missing:
+    def __repr__(self):
+        return "MISSING"
+
+    def __bool__(self):
+        return False
+
+
+MISSING = _Missing()  # a field that isn't there, as opposed to one that is null
+
+
+def _copy(value):
+    """Copy of a stored value; BSON scalars are immutable and shared."""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _type_rank(value) -> int:
+    """BSON comparison order of the types the bot stores."""
+    if value is MISSING:
+        return 0
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value):
+    """Key ordering values the way Mongo sorts them, missing and null first."""
+    rank = _type_rank(value)
+    if rank in (0, 1):
+        return (rank, 0)
+    if rank == 4:
+        return (rank, tuple((k, sort_key(v)) for k, v in value.items()))
+    if rank == 5:
+        return (rank, tuple(sort_key(v) for v in value))
+    return (rank, value)
+
+
+def _compare(left, right) -> int:
+    left, right = sort_key(left), sort_key(right)
+    return (left > right) - (left < right)
+
+
+def get_field(doc, path: str):
+    """The value at a dotted *path* the way aggregation reads it.
+
+    A path through an array of documents yields the array of their values;
+    a path that doesn't resolve is :data:`MISSING`.
+    """
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list):
+            value = [
+                item[part] for item in value
+                if isinstance(item, dict) and part in item
+            ]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return MISSING
+    return value
+
+
+def _query_values(doc, parts: list[str]) -> list:
+    """Every value a query on *parts* compares against, MISSING if none."""
+    if not parts:
+        return [doc]
+    if isinstance(doc, list):
+        values = [
+            value for item in doc if isinstance(item, (dict, list))
+            for value in _query_values(item, parts)
+        ]
+        if parts[0].isdigit() and int(parts[0]) < len(doc):
+            values += _query_values(doc[int(parts[0])], parts[1:])
+        return [value for value in values if value is not MISSING] or [MISSING]
+    if isinstance(doc, dict) and parts[0] in doc:
+        return _query_values(doc[parts[0]], parts[1:])
+    return [MISSING]
+
+
+def _candidates(values: list) -> list:
+    """Values plus the elements of the arrays among them, as a query sees them."""
+    if not any(isinstance(value, list) for value in values):
+        return values
+    result = []
+    for value in values:
+        result.append(value)
+        if isinstance(value, list):
+            result.extend(value)
+    return result
+
+
+def _equals(values: list, operand) -> bool:
+    if operand is None:
+        return any(value is None or value is MISSING for value in _candidates(values))
+    return any(value is not MISSING and value == operand for value in _candidates(values))
+
+
+_in_sets: dict[int, tuple[list, frozenset | None]] = {}
+
+
+def _in(values: list, operand: list) -> bool:
+    # the same $in list is checked against every document of a scan
+    cached = _in_sets.get(id(operand))
+    if cached is None or cached[0] is not operand:
+        try:
+            members = frozenset(operand)
+        except TypeError:
+            members = None
+        _in_sets.clear()
+        _in_sets[id(operand)] = cached = (operand, members)
+    members = cached[1]
+    if members is None:
+        return any(_equals(values, item) for item in operand)
+    for value in _candidates(values):
+        if value is MISSING:
+            value = None
+        try:
+            if value in members:
+                return True
+        except TypeError:
+            pass
+    return False
+
+
+def _condition(values: list, operator: str, operand) -> bool:
+    if operator == "$eq":
+        return _equals(values, operand)
+    if operator == "$ne":
+        return not _equals(values, operand)
+    if operator == "$in":
+        return _in(values, operand)
+    if operator == "$nin":
+        return not _in(values, operand)
+    if operator == "$exists":
+        return any(value is not MISSING for value in values) == bool(operand)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        for value in _candidates(values):
+            if value is MISSING or _type_rank(value) != _type_rank(operand):
+                continue
+            order = _compare(value, operand)
+            if (
+                (operator == "$gt" and order > 0)
+                or (operator == "$gte" and order >= 0)
+                or (operator == "$lt" and order < 0)
+                or (operator == "$lte" and order <= 0)
+            ):
+                return True
+        return False
+    if operator == "$not":
+        return not _conditions(values, operand)
+    if operator == "$size":
+        return any(isinstance(value, list) and len(value) == operand for value in values)
+    if operator == "$elemMatch":
+        return any(
+            isinstance(value, list) and any(
+                matches(item, operand) if isinstance(item, dict) else _conditions([item], operand)
+                for item in value
+            )
+            for value in values
+        )
+    raise NotImplementedError(f"query operator {operator}")
+
+
+def _conditions(values: list, cond: dict) -> bool:
+    return all(_condition(values, operator, operand) for operator, operand in cond.items())
+
+
+def _is_operator_doc(cond) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(key.startswith("$") for key in cond)
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    """Whether *doc* matches the Mongo *query*."""
+    for key, cond in (query or {}).items():
+        if key.startswith("$"):
+            if key == "$and":
+                if not all(matches(doc, sub) for sub in cond):
+                    return False
+            elif key == "$or":
+                if not any(matches(doc, sub) for sub in cond):
+                    return False
+            elif key == "$nor":
+                if any(matches(doc, sub) for sub in cond):
+                    return False
+            else:
+                raise NotImplementedError(f"query operator {key}")
+            continue
+        if "." in key:
+            values = _query_values(doc, key.split("."))
+        else:
+            value = doc.get(key, MISSING)
+            if not isinstance(cond, dict) and not isinstance(value, list):
+                # the common case: a plain field equal to a plain value
+                if cond is None:
+                    if value is not None and value is not MISSING:
+                        return False
+                elif value is MISSING or value != cond:
+                    return False
+                continue
+            values = [value]
+        if _is_operator_doc(cond):
+            for operator, operand in cond.items():
+                if not _condition(values, operator, operand):
+                    return False
+        elif not _equals(values, cond):
+            return False
+    return True
+
+
+def _truthy(value) -> bool:
+    if value is MISSING or value is None or value is False:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value != 0
+    return True
+
+
+def evaluate(expr, doc: dict, variables: dict | None = None):
+    """Evaluates the aggregation expression *expr* against *doc*."""
+    variables = variables if variables is not None else {}
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, _, path = expr[2:].partition(".")
+        if name == "ROOT" or name == "CURRENT":
+            value = variables.get(name, doc)
+        elif name == "REMOVE":
+            return MISSING
+        elif name in variables:
+            value = variables[name]
+        else:
+            raise NotImplementedError(f"variable $${name}")
+        return get_field(value, path) if path else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        return get_field(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_present(evaluate(item, doc, variables)) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith("$"):
+        operator, args = next(iter(expr.items()))
+        return _operator(operator, args, doc, variables)
+    result = {}
+    for key, value in expr.items():
+        value = evaluate(value, doc, variables)
+        if value is not MISSING:
+            result[key] = value
+    return result
+
+
+def _present(value):
+    """Missing array elements become null, as in Mongo."""
+    return None if value is MISSING else value
+
+
+def _operator(operator: str, args, doc: dict, variables: dict):
+    def arg(value):
+        return evaluate(value, doc, variables)
+
+    def arg_list() -> list:
+        return [arg(value) for value in (args if isinstance(args, list) else [args])]
+
+    if operator == "$literal":
+        return args
+    if operator == "$cond":
+        if isinstance(args, dict):
+            condition, then, otherwise = args["if"], args["then"], args["else"]
+        else:
+            condition, then, otherwise = args
+        return arg(then) if _truthy(arg(condition)) else arg(otherwise)
+    if operator == "$ifNull":
+        *values, default = args
+        for value in values:
+            value = arg(value)
+            if value is not MISSING and value is not None:
+                return value
+        return arg(default)
+    if operator in ("$and", "$or"):
+        values = (_truthy(value) for value in arg_list())
+        return all(values) if operator == "$and" else any(values)
+    if operator == "$not":
+        return not _truthy(arg_list()[0])
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        left, right = arg_list()
+        order = _compare(left, right)
+        return {
+            "$eq": order == 0, "$ne": order != 0,
+            "$gt": order > 0, "$gte": order >= 0,
+            "$lt": order < 0, "$lte": order <= 0,
+        }[operator]
+    if operator == "$in":
+        value, array = arg_list()
+        if not isinstance(array, list):
+            raise TypeError("$in needs an array")
+        return any(_compare(value, item) == 0 for item in array)
+    if operator == "$isArray":
+        return isinstance(arg_list()[0], list)
+    if operator == "$size":
+        value = arg_list()[0]
+        if not isinstance(value, list):
+            raise TypeError("$size needs an array")
+        return len(value)
+    if operator == "$concatArrays":
+        values = arg_list()
+        if any(value is None or value is MISSING for value in values):
+            return None
+        return [item for value in values for item in value]
+    if operator in ("$map", "$filter"):
+        values = arg(args["input"])
+        if values is None or values is MISSING:
+            return None
+        name = args.get("as", "this")
+        if operator == "$map":
+            return [
+                _present(evaluate(args["in"], doc, {**variables, name: value}))
+                for value in values
+            ]
+        return [
+            value for value in values
+            if _truthy(evaluate(args["cond"], doc, {**variables, name: value}))
+        ]
+    if operator in ("$add", "$sum"):
+        values = arg_list()
+        if operator == "$sum" and len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        numbers = [value for value in values if _type_rank(value) == 2]
+        if operator == "$add" and len(numbers) != len(values):
+            return None
+        return sum(numbers)
+    if operator == "$arrayElemAt":
+        array, index = arg_list()
+        if not isinstance(array, list):
+            return None
+        return array[index] if -len(array) <= index < len(array) else MISSING
+    raise NotImplementedError(f"expression operator {operator}")
+
+
+def _freeze(value):
+    """Hashable twin of a BSON value, for grouping."""
+    if value is MISSING:
+        return None
+    if isinstance(value, dict):
+        return ("{", tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ("[", tuple(_freeze(item) for item in value))
+    return (type(value).__name__, value) if isinstance(value, bool) else value
+
+
+def _accumulate(spec: dict, docs: list[dict]):
+    (operator, expr), = spec.items()
+    if operator == "$count":
+        return len(docs)
+    values = [evaluate(expr, doc) for doc in docs]
+    if operator == "$sum":
+        return sum(value for value in values if _type_rank(value) == 2)
+    if operator == "$first":
+        return _present(values[0]) if values else None
+    if operator == "$last":
+        return _present(values[-1]) if values else None
+    if operator == "$push":
+        return [value for value in values if value is not MISSING]
+    if operator == "$addToSet":
+        result = []
+        for value in values:
+            if value is not MISSING and value not in result:
+                result.append(value)
+        return result
+    if operator in ("$min", "$max"):
+        present = [value for value in values if value is not MISSING and value is not None]
+        if not present:
+            return None
+        return (min if operator == "$min" else max)(present, key=sort_key)
+    raise NotImplementedError(f"accumulator {operator}")
+
+
+def _set_path(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for parent in parents:
+        doc = doc.setdefault(parent, {})
+    doc[leaf] = value
+
+
+def _unset_path(doc: dict, path: str):
+    *parents, leaf = path.split(".")
+    for parent in parents:
+        doc = doc.get(parent)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+
+def project(doc: dict, spec: dict, variables: dict | None = None) -> dict:
+    """The ``$project`` of *doc*; also used for ``find`` projections."""
+    values = {key: value for key, value in spec.items() if key != "_id"}
+    exclusion = bool(values) and all(value in (0, False) for value in values.values())
+    if not values and spec.get("_id") in (0, False):
+        exclusion = True
+    if exclusion:
+        result = _copy(doc)
+        for path, value in spec.items():
+            if value in (0, False):
+                _unset_path(result, path)
+        return result
+    result = {}
+    if spec.get("_id", 1) not in (0, False) and "_id" in doc:
+        result["_id"] = doc["_id"] if spec.get("_id", 1) in (1, True) else evaluate(spec["_id"], doc, variables)
+    for path, value in values.items():
+        if value in (1, True):
+            found = get_field(doc, path)
+            if found is not MISSING:
+                _set_path(result, path, _copy(found))
+        else:
+            found = evaluate(value, doc, variables)
+            if found is not MISSING:
+                _set_path(result, path, found)
+    return result
+
+
+def _add_fields(doc: dict, spec: dict, variables: dict | None = None) -> dict:
+    result = _copy(doc)
+    for path, expr in spec.items():
+        value = evaluate(expr, doc, variables)
+        if value is MISSING:
+            _unset_path(result, path)
+        else:
+            _set_path(result, path, value)
+    return result
+
+
+def apply_update(doc: dict, update, inserted: bool = False) -> None:
+    """Applies an update document or an update pipeline to *doc* in place."""
+    if isinstance(update, list):
+        for stage in update:
+            (operator, spec), = stage.items()
+            if operator in ("$set", "$addFields"):
+                new = _add_fields(doc, spec)
+            elif operator == "$unset":
+                new = _copy(doc)
+                for path in [spec] if isinstance(spec, str) else spec:
+                    _unset_path(new, path)
+            elif operator == "$project":
+                new = project(doc, spec)
+            else:
+                raise NotImplementedError(f"update pipeline stage {operator}")
+            doc.clear()
+            doc.update(new)
+        return
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserted:
+            continue
+        for path, value in fields.items():
+            if operator in ("$set", "$setOnInsert"):
+                _set_path(doc, path, _copy(value))
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                current = get_field(doc, path)
+                _set_path(doc, path, (0 if current is MISSING else current) + value)
+            elif operator in ("$min", "$max"):
+                current = get_field(doc, path)
+                order = _compare(value, current)
+                if current is MISSING or (order < 0 if operator == "$min" else order > 0):
+                    _set_path(doc, path, _copy(value))
+            elif operator in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                current = get_field(doc, path)
+                array = [] if current is MISSING else current
+                for item in items:
+                    if operator == "$push" or item not in array:
+                        array.append(_copy(item))
+                _set_path(doc, path, array)
+            elif operator == "$pull":
+                current = get_field(doc, path)
+                if isinstance(current, list):
+                    if _is_operator_doc(value):
+                        kept = [item for item in current if not _conditions([item], value)]
+                    elif isinstance(value, dict):
+                        kept = [item for item in current if not (isinstance(item, dict) and matches(item, value))]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(doc, path, kept)
+            else:
+                raise NotImplementedError(f"update operator {operator}")
+
+
+def _upsert_seed(query: dict) -> dict:
+    """The fields an upsert takes from the equality conditions of its query."""
+    doc: dict = {}
+    for key, cond in query.items():
+        if key == "$and":
+            for sub in cond:
+                for path, value in _upsert_seed(sub).items():
+                    doc[path] = value
+        elif key.startswith("$"):
+            continue
+        elif _is_operator_doc(cond):
+            if "$eq" in cond:
+                doc[key] = _copy(cond["$eq"])
+        else:
+            doc[key] = _copy(cond)
+    return doc
+
+
+def _seeded(query: dict) -> dict:
+    doc: dict = {}
+    for path, value in _upsert_seed(query).items():
+        _set_path(doc, path, value)
+    return doc
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", docs: Iterable[dict], projection: dict | None = None):
+        self._collection = collection
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int | None = None) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            spec = [(key_or_list, direction or 1)]
+        elif isinstance(key_or_list, dict):
+            spec = list(key_or_list.items())
+        else:
+            spec = list(key_or_list)
+        docs = list(self._docs)
+        for name, order in reversed(spec):
+            docs.sort(key=lambda doc: sort_key(get_field(doc, name)), reverse=order < 0)
+        self._docs = docs
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = n
+        return self
+
+    def _results(self) -> Iterator[dict]:
+        docs = islice(self._docs, self._skip, self._skip + self._limit if self._limit else None)
+        for doc in docs:
+            yield project(doc, self._projection) if self._projection else _copy(doc)
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        await self._collection._round_trip()
+        return list(islice(self._results(), length))
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        await self._collection._round_trip()
+        for doc in self._results():
+            yield doc
+
+
+class MemoryCollection:
+    """One collection of a :class:`MemoryDatabase`.
+
+    Queries by ``_id`` or ``user_id`` are looked up, the rest scan in natural
+    order, which puts the last modified documents last. Documents are copied
+    in and out, so callers never share state with the collection.
+    """
+
+    def __init__(
+            self,
+            docs: Iterable[dict] = (),
+            latency: float = 0.0,
+            name: str = "collection",
+            database: "MemoryDatabase | None" = None,
+        ):
+        self.name = name
+        self.database = database
+        self.latency = latency
+        self.ops: Counter[str] = Counter()
+        self._docs: dict = {}
+        self._by_user: dict[Any, set] = {}
+        self._order: dict = {}  # position of every document in the natural order
+        self._ids = count(1)
+        self._positions = count()
+        for doc in docs:
+            self._insert(_copy(doc))
+
+    @property
+    def docs(self) -> list[dict]:
+        """The stored documents themselves, in natural order.
+
+        Tests change them in place to stage a concurrent write."""
+        return list(self._docs.values())
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _insert(self, doc: dict):
+        if "_id" not in doc:
+            doc["_id"] = next(self._ids)
+            while doc["_id"] in self._docs:
+                doc["_id"] = next(self._ids)
+        if _freeze(doc["_id"]) in self._docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r}")
+        self._docs[_freeze(doc["_id"])] = doc
+        self._order[_freeze(doc["_id"])] = next(self._positions)
+        self._by_user.setdefault(_freeze(doc.get("user_id")), set()).add(_freeze(doc["_id"]))
+
+    def _remove(self, doc: dict):
+        del self._docs[_freeze(doc["_id"])]
+        del self._order[_freeze(doc["_id"])]
+        self._by_user.get(_freeze(doc.get("user_id")), set()).discard(_freeze(doc["_id"]))
+
+    def _replace(self, doc: dict, new: dict):
+        """Stores *new* in place of *doc*, moving it to the end of the natural order."""
+        self._remove(doc)
+        self._insert(new)
+
+    def _candidates(self, query: dict) -> list[dict]:
+        for key in ("_id", "user_id"):
+            cond = query.get(key)
+            if isinstance(cond, dict) and list(cond) == ["$in"]:
+                values = cond["$in"]
+            elif key in query and not _is_operator_doc(cond):
+                values = [cond]
+            else:
+                continue
+            if key == "_id":
+                found = (self._docs.get(_freeze(value)) for value in values)
+                return [doc for doc in found if doc is not None]
+            ids = {id_ for value in values for id_ in self._by_user.get(_freeze(value), ())}
+            return [self._docs[id_] for id_ in sorted(ids, key=self._order.__getitem__)]
+        return list(self._docs.values())
+
+    def _matching(self, query: dict | None) -> Iterator[dict]:
+        query = query or {}
+        return (doc for doc in self._candidates(query) if matches(doc, query))
+
+    def _first(self, query: dict | None, sort=None) -> dict | None:
+        docs = self._matching(query)
+        if sort:
+            return next(iter(MemoryCursor(self, docs).sort(sort)._docs), None)
+        return next(docs, None)
+
+    def find(self, query: dict | None = None, projection: dict | None = None, sort=None, **kwargs) -> MemoryCursor:
+        self.ops["find"] += 1
+        cursor = MemoryCursor(self, self._matching(query), projection)
+        return cursor.sort(sort) if sort else cursor
+
+    async def find_one(self, query: dict | None = None, projection: dict | None = None, sort=None, **kwargs) -> dict | None:
+        self.ops["find_one"] += 1
+        await self._round_trip()
+        found = self._first(query, sort)
+        if found is None:
+            return None
+        return project(found, projection) if projection else _copy(found)
+
+    async def count_documents(self, query: dict, **kwargs) -> int:
+        self.ops["count_documents"] += 1
+        await self._round_trip()
+        return sum(1 for _ in self._matching(query))
+
+    async def distinct(self, key: str, query: dict | None = None, **kwargs) -> list:
+        self.ops["distinct"] += 1
+        await self._round_trip()
+        values = []
+        for doc in self._matching(query):
+            found = get_field(doc, key)
+            for value in found if isinstance(found, list) else [found]:
+                if value is not MISSING and value not in values:
+                    values.append(value)
+        return values
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        self.ops["insert_one"] += 1
+        await self._round_trip()
+        doc = _copy(document)
+        self._insert(doc)
+        document.setdefault("_id", doc["_id"])
+        return InsertOneResult(doc["_id"], True)
+
+    async def insert_many(self, documents: Iterable[dict], **kwargs) -> InsertManyResult:
+        self.ops["insert_many"] += 1
+        await self._round_trip()
+        ids = []
+        for document in documents:
+            doc = _copy(document)
+            self._insert(doc)
+            document.setdefault("_id", doc["_id"])
+            ids.append(doc["_id"])
+        return InsertManyResult(ids, True)
+
+    def _update_docs(self, query: dict, update, upsert: bool, many: bool, replace: bool = False) -> tuple[int, int, Any]:
+        found = list(islice(self._matching(query), None if many else 1))
+        modified = 0
+        for doc in found:
+            if replace:
+                new = {"_id": doc["_id"], **_copy(update)}
+            else:
+                new = _copy(doc)
+                apply_update(new, update)
+            if new != doc:
+                modified += 1
+                self._replace(doc, new)
+        if found or not upsert:
+            return len(found), modified, None
+        doc = _seeded(query)
+        if replace:
+            doc = {**({"_id": doc["_id"]} if "_id" in doc else {}), **_copy(update)}
+        else:
+            apply_update(doc, update, inserted=True)
+        self._insert(doc)
+        return 0, 0, doc["_id"]
+
+    @staticmethod
+    def _update_result(matched: int, modified: int, upserted_id) -> UpdateResult:
+        raw = {"n": matched if upserted_id is None else 1, "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_one(self, query: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        self.ops["update_one"] += 1
+        await self._round_trip()
+        return self._update_result(*self._update_docs(query, update, upsert, many=False))
+
+    async def update_many(self, query: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        self.ops["update_many"] += 1
+        await self._round_trip()
+        return self._update_result(*self._update_docs(query, update, upsert, many=True))
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        self.ops["replace_one"] += 1
+        await self._round_trip()
+        return self._update_result(*self._update_docs(query, replacement, upsert, many=False, replace=True))
+
+    async def find_one_and_update(
+            self,
+            query: dict,
+            update,
+            projection: dict | None = None,
+            sort=None,
+            upsert: bool = False,
+            return_document=ReturnDocument.BEFORE,
+            **kwargs,
+        ) -> dict | None:
+        self.ops["find_one_and_update"] += 1
+        await self._round_trip()
+        doc = self._first(query, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            _, _, upserted_id = self._update_docs(query, update, upsert=True, many=False)
+            after = self._docs[_freeze(upserted_id)]
+            found = after if return_document == ReturnDocument.AFTER else None
+        else:
+            new = _copy(doc)
+            apply_update(new, update)
+            self._replace(doc, new)
+            found = new if return_document == ReturnDocument.AFTER else doc
+        if found is None:
+            return None
+        return project(found, projection) if projection else _copy(found)
+
+    async def find_one_and_delete(self, query: dict, projection: dict | None = None, sort=None, **kwargs) -> dict | None:
+        self.ops["find_one_and_delete"] += 1
+        await self._round_trip()
+        doc = self._first(query, sort)
+        if doc is None:
+            return None
+        self._remove(doc)
+        return project(doc, projection) if projection else doc
+
+    def _delete_docs(self, query: dict, many: bool) -> int:
+        found = list(islice(self._matching(query), None if many else 1))
+        for doc in found:
+            self._remove(doc)
+        return len(found)
+
+    async def delete_one(self, query: dict, **kwargs) -> DeleteResult:
+        self.ops["delete_one"] += 1
+        await self._round_trip()
+        return DeleteResult({"n": self._delete_docs(query, many=False)}, True)
+
+    async def delete_many(self, query: dict, **kwargs) -> DeleteResult:
+        self.ops["delete_many"] += 1
+        await self._round_trip()
+        return DeleteResult({"n": self._delete_docs(query, many=True)}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        """Runs the requests in order, in one round trip."""
+        self.ops["bulk_write"] += 1
+        await self._round_trip()
+        result = {
+            "nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+            "nUpserted": 0, "upserted": [], "writeErrors": [], "writeConcernErrors": [],
+        }
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                self._insert(_copy(request._doc))
+                result["nInserted"] += 1
+                continue
+            if isinstance(request, (DeleteOne, DeleteMany)):
+                result["nRemoved"] += self._delete_docs(request._filter, isinstance(request, DeleteMany))
+                continue
+            if not isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                raise NotImplementedError(f"bulk request {request!r}")
+            matched, modified, upserted_id = self._update_docs(
+                request._filter,
+                request._doc,
+                bool(request._upsert),
+                many=isinstance(request, UpdateMany),
+                replace=isinstance(request, ReplaceOne),
+            )
+            result["nMatched"] += matched
+            result["nModified"] += modified
+            if upserted_id is not None:
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": index, "_id": upserted_id})
+        return BulkWriteResult(result, True)
+
+    def aggregate(self, pipeline: list[dict], **kwargs) -> MemoryCursor:
+        self.ops["aggregate"] += 1
+        return MemoryCursor(self, run_pipeline(self, list(self._docs.values()), pipeline))
+
+    async def create_index(self, keys, **kwargs) -> str:
+        self.ops["create_index"] += 1
+        return "_".join(f"{key}_{direction}" for key, direction in (
+            [(keys, 1)] if isinstance(keys, str) else keys
+        ))
+
+
+def run_pipeline(collection: MemoryCollection, docs: list[dict], pipeline: list[dict], variables: dict | None = None) -> list[dict]:
+    """Runs aggregation *pipeline* over *docs* of *collection*."""
+    for stage in pipeline:
+        (operator, spec), = stage.items()
+        if operator == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif operator == "$project":
+            docs = [project(doc, spec, variables) for doc in docs]
+        elif operator in ("$addFields", "$set"):
+            docs = [_add_fields(doc, spec, variables) for doc in docs]
+        elif operator == "$unset":
+            docs = [project(doc, {path: 0 for path in ([spec] if isinstance(spec, str) else spec)}) for doc in docs]
+        elif operator == "$unwind":
+            docs = _unwind(docs, spec)
+        elif operator == "$group":
+            docs = _group(docs, spec, variables)
+        elif operator == "$sort":
+            docs = list(MemoryCursor(collection, docs).sort(list(spec.items()))._docs)
+        elif operator == "$limit":
+            docs = docs[:spec]
+        elif operator == "$skip":
+            docs = docs[spec:]
+        elif operator == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif operator == "$facet":
+            docs = [{
+                name: run_pipeline(collection, docs, stages, variables)
+                for name, stages in spec.items()
+            }]
+        elif operator == "$lookup":
+            docs = _lookup(collection, docs, spec)
+        elif operator == "$replaceRoot":
+            docs = [evaluate(spec["newRoot"], doc, variables) for doc in docs]
+        else:
+            raise NotImplementedError(f"aggregation stage {operator}")
+    return docs
+
+
+def _unwind(docs: list[dict], spec) -> list[dict]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    result = []
+    for doc in docs:
+        value = get_field(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = _copy(doc)
+                _set_path(unwound, path, item)
+                result.append(unwound)
+        elif isinstance(value, list) or value is MISSING or value is None:
+            if keep_empty:
+                unwound = _copy(doc)
+                if isinstance(value, list):
+                    _unset_path(unwound, path)
+                result.append(unwound)
+        else:
+            result.append(_copy(doc))
+    return result
+
+
+def _group(docs: list[dict], spec: dict, variables: dict | None) -> list[dict]:
+    groups: dict[Any, tuple[Any, list[dict]]] = {}
+    for doc in docs:
+        key = evaluate(spec["_id"], doc, variables)
+        key = None if key is MISSING else key
+        groups.setdefault(_freeze(key), (key, []))[1].append(doc)
+    return [
+        {
+            "_id": key,
+            **{
+                name: _accumulate(accumulator, members)
+                for name, accumulator in spec.items() if name != "_id"
+            },
+        }
+        for key, members in groups.values()
+    ]
+
+
+def _lookup(collection: MemoryCollection, docs: list[dict], spec: dict) -> list[dict]:
+    if collection.database is None:
+        raise NotImplementedError("$lookup needs the collection to belong to a MemoryDatabase")
+    foreign = collection.database[spec["from"]]
+    result = []
+    for doc in docs:
+        if "localField" in spec:
+            local = get_field(doc, spec["localField"])
+            values = local if isinstance(local, list) else [None if local is MISSING else local]
+            if spec["foreignField"] in ("_id", "user_id"):
+                query = {spec["foreignField"]: {"$in": values}}
+                joined = list(foreign._matching(query))
+            else:
+                joined = [
+                    item for item in foreign._docs.values()
+                    if matches(item, {spec["foreignField"]: {"$in": values}})
+                ]
+        else:
+            joined = list(foreign._docs.values())
+        variables = {
+            name: evaluate(expr, doc) for name, expr in spec.get("let", {}).items()
+        }
+        joined = run_pipeline(foreign, [_copy(item) for item in joined], spec.get("pipeline", []), variables)
+        result.append({**_copy(doc), spec["as"]: joined})
+    return result
+
+
+class MemoryDatabase:
+    """Collections by name, created on first use, for ``$lookup`` between them."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(latency=self.latency, name=name, database=self)
+        return self._collections[name]
+
+    get_collection = __getitem__
+
+    def collection(self, name: str, docs: Iterable[dict] = ()) -> MemoryCollection:
+        """Collection *name*, filled with *docs*."""
+        collection = self[name]
+        for doc in docs:
+            collection._insert(_copy(doc))
+        return collection
+
+    def ops(self) -> Counter[str]:
+        """Operations per ``collection.method`` over all collections."""
+        ops: Counter[str] = Counter()
+        for name, collection in self._collections.items():
+            for op, n in collection.ops.items():
+                ops[f"{name}.{op}"] += n
+        return ops
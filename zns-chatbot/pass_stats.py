@@ -0,0 +1,565 @@
+from contextlib import asynccontextmanager
+from copy import deepcopy
+from datetime import datetime, timedelta
+from functools import wraps
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from bson import ObjectId
+from motor.core import AgnosticCollection
+from pymongo.errors import DuplicateKeyError
+
+from .user_cache import WRITE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Pass fields the counters depend on; writes touching none of them are not tracked.
+COUNTED_FIELDS = frozenset(("state", "role", "pass_type_index", "price", "skip_in_balance_count"))
+# what a write reads to tell how it moves passes between the counters
+COUNTED_PROJECTION = {"_id": 1, "user_id": 1, **{name: 1 for name in COUNTED_FIELDS}}
+QUEUE_STATES = ("waitlist", "assigned", "paid")
+SOLD_STATES = ("assigned", "paid")
+# a counted write still pending after this long is taken for dead by reconcile()
+COUNTED_WRITE_TIMEOUT = timedelta(minutes=1)
+# how many times a counted write rereads a pass that changed under it
+COUNTED_WRITE_ATTEMPTS = 3
+
+
+class QueueStatsCache:
+    """Queue stats per pass_key, valid until a pass of that key changes.
+
+    Every write to the passes collection bumps the version of the pass_key it
+    touched (or of all keys if it can't tell). Stats computed for an older
+    version are never returned, including ones whose aggregation was still
+    running when the write happened.
+    """
+
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._generation = 0
+        self._stats: dict[str, tuple[tuple[int, int], dict]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, pass_key: str) -> tuple[int, int]:
+        return self._generation, self._versions.get(pass_key, 0)
+
+    def bump(self, pass_key: str | None = None):
+        if pass_key is None:
+            self._generation += 1
+            self._stats.clear()
+            return
+        self._versions[pass_key] = self._versions.get(pass_key, 0) + 1
+        self._stats.pop(pass_key, None)
+
+    def get(self, pass_key: str) -> dict | None:
+        entry = self._stats.get(pass_key)
+        if entry is None or entry[0] != self.version(pass_key):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return deepcopy(entry[1])
+
+    def put(self, pass_key: str, version: tuple[int, int], stats: dict):
+        if version == self.version(pass_key):
+            self._stats[pass_key] = (version, deepcopy(stats))
+
+
+def counts_in_balance(doc: dict) -> bool:
+    """Python twin of ``Passes._balance_counter_match``."""
+    skip = doc.get("skip_in_balance_count")
+    return skip is False or (skip is not True and doc.get("price") != 0)
+
+
+def counter_paths(doc: dict) -> list[str]:
+    """Counter fields a pass document contributes 1 to."""
+    state = str(doc.get("state"))
+    role = doc.get("role")
+    role = role if role in ("leader", "follower") else "other"
+    paths = [f"state.{state}.{role}"]
+    if counts_in_balance(doc):
+        paths.append(f"balance.{state}.{role}")
+    if state in SOLD_STATES:
+        tier = doc.get("pass_type_index")
+        tier = str(tier) if isinstance(tier, int) and not isinstance(tier, bool) else "none"
+        paths.append(f"sold.{tier}.{role}")
+    return paths
+
+
+def counters_to_facets(counters: dict) -> dict[str, list[dict]]:
+    """Turns a counters document into the ``$facet`` output of the queue stats pipeline."""
+    def groups(section: str, states=None) -> list[dict]:
+        return [
+            {"_id": {"state": state, "role": role}, "count": count}
+            for state, roles in counters.get(section, {}).items()
+            if states is None or state in states
+            for role, count in roles.items()
+            if count
+        ]
+
+    sold = [
+        {
+            "_id": {
+                "role": role,
+                "pass_type_index": None if tier == "none" else int(tier),
+            },
+            "count": count,
+        }
+        for tier, roles in counters.get("sold", {}).items()
+        for role, count in roles.items()
+        if count
+    ]
+    return {
+        "balance": groups("balance"),
+        "full": groups("state", QUEUE_STATES),
+        "sold": sold,
+    }
+
+
+def _nested_counts(paths: dict[str, int]) -> dict[str, dict]:
+    result: dict[str, dict] = {}
+    for path, count in paths.items():
+        section, group, role = path.split(".")
+        roles = result.setdefault(section, {}).setdefault(group, {})
+        roles[role] = roles.get(role, 0) + count
+    return result
+
+
+class CountedWrite:
+    """How the writes of one :meth:`VersionedPassesCollection.counted` block
+    moved passes between the counters, as told by the code that made them.
+
+    :meth:`move` records one pass as it was and as it is now, None for the
+    side that doesn't exist (an insert or a delete); only the
+    :data:`COUNTED_FIELDS` of the two are read. :meth:`recount` is for
+    writes whose effect isn't known: the counters of the key are rebuilt
+    once they are done.
+    """
+
+    def __init__(self):
+        self.moves: list[tuple[dict | None, dict | None]] = []
+        self.stale = False
+
+    def move(self, before: dict | None, after: dict | None):
+        self.moves.append((before, after))
+
+    def recount(self):
+        self.stale = True
+
+    def delta(self) -> dict[str, int]:
+        delta: dict[str, int] = {}
+        for before, after in self.moves:
+            for doc, sign in ((before, -1), (after, 1)):
+                for path in counter_paths(doc) if doc is not None else ():
+                    delta[path] = delta.get(path, 0) + sign
+        return {path: n for path, n in delta.items() if n != 0}
+
+
+class PassCounters:
+    """Materialized pass counts per (bot_id, pass_key).
+
+    One document holds counts by state×role (``state``), the balance-counted
+    subset of it (``balance``) and sold passes by tier×role (``sold``). The
+    code paths that change pass state keep it current through
+    :meth:`VersionedPassesCollection.counted`; :meth:`reconcile` rebuilds it
+    from the passes collection to repair drift.
+
+    A write made outside a transaction is announced in ``pending`` by
+    :meth:`begin` before it runs, and :meth:`finish` applies its ``$inc``
+    and takes the announcement back. Both bump ``seq``. :meth:`reconcile`
+    doesn't overwrite the counts while a write is pending or once ``seq``
+    has moved, so it can't count a pass write whose ``$inc`` is still to
+    come.
+    """
+
+    def __init__(self, collection: AgnosticCollection, passes: AgnosticCollection):
+        self.collection = collection
+        self.passes = passes
+
+    @staticmethod
+    def key(bot_id, pass_key: str) -> str:
+        return f"{bot_id}:{pass_key}"
+
+    async def get(self, bot_id, pass_key: str) -> dict | None:
+        return await self.collection.find_one({"_id": self.key(bot_id, pass_key)})
+
+    async def begin(self, bot_id, pass_key: str) -> str | None:
+        """Announces a write; returns its token, None if the key has no counters yet."""
+        token = str(ObjectId())
+        result = await self.collection.update_one(
+            {"_id": self.key(bot_id, pass_key)},
+            {"$set": {f"pending.{token}": datetime.now()}, "$inc": {"seq": 1}},
+        )
+        return token if result.matched_count > 0 else None
+
+    async def finish(self, bot_id, pass_key: str, delta: dict[str, int], token: str | None, **kwargs):
+        """Applies *delta* and takes back the write announced as *token*.
+
+        *kwargs* carry the session of a transaction; the ``$inc`` then
+        commits with the write and nothing was announced."""
+        update: dict[str, dict] = {"$inc": {**delta, "seq": 1}}
+        if token is not None:
+            update["$unset"] = {f"pending.{token}": ""}
+        # no upsert: a missing document is created by reconcile()
+        await self.collection.update_one({"_id": self.key(bot_id, pass_key)}, update, **kwargs)
+
+    async def reconcile(self, bot_id, pass_key: str) -> bool:
+        """Recounts from the passes collection. Returns False if it raced a write."""
+        key = self.key(bot_id, pass_key)
+        current = await self.collection.find_one({"_id": key})
+        pending = (current or {}).get("pending") or {}
+        if pending:
+            if max(pending.values()) > datetime.now() - COUNTED_WRITE_TIMEOUT:
+                return False
+            logger.warning(f"pass counters for {key}: {len(pending)} writes never finished, recounting")
+        groups = await self.passes.aggregate([
+            {"$match": {"bot_id": bot_id, "pass_key": pass_key}},
+            {"$group": {
+                "_id": {
+                    "state": "$state",
+                    "role": "$role",
+                    "pass_type_index": "$pass_type_index",
+                    "price_is_zero": {"$eq": ["$price", 0]},
+                    "skip_in_balance_count": "$skip_in_balance_count",
+                },
+                "count": {"$count": {}},
+            }},
+        ]).to_list(None)
+        paths: dict[str, int] = {}
+        for group in groups:
+            doc = dict(group["_id"])
+            if doc.pop("price_is_zero"):
+                doc["price"] = 0
+            for path in counter_paths(doc):
+                paths[path] = paths.get(path, 0) + int(group["count"])
+        counts = _nested_counts(paths)
+        counts = {section: counts.get(section, {}) for section in ("state", "balance", "sold")}
+        document = {
+            "bot_id": bot_id,
+            "pass_key": pass_key,
+            **counts,
+            "pending": {},
+            "reconciled": datetime.now(),
+        }
+        if current is None:
+            try:
+                await self.collection.insert_one({"_id": key, "seq": 0, **document})
+            except DuplicateKeyError:
+                return False
+            return True
+        drift = {
+            section: current.get(section, {})
+            for section in counts
+            if _without_zeros(current.get(section, {})) != counts[section]
+        }
+        if drift:
+            logger.warning(f"pass counters for {key} drifted, repairing: {drift} -> {counts}")
+        result = await self.collection.update_one(
+            {"_id": key, "seq": current.get("seq", 0)},
+            {"$set": document, "$inc": {"seq": 1}},
+        )
+        return result.modified_count > 0
+
+
+def _without_zeros(section: dict) -> dict:
+    return {
+        group: {role: n for role, n in roles.items() if n}
+        for group, roles in section.items()
+        if any(roles.values())
+    }
+
+
+def _touches_fields(method: str, update: Any, watched: frozenset = COUNTED_FIELDS) -> bool:
+    if method in ("replace_one", "find_one_and_replace"):
+        return True
+    stages = update if isinstance(update, list) else [update]
+    for stage in stages:
+        if not isinstance(stage, dict):
+            return True
+        for operator, fields in stage.items():
+            if isinstance(fields, dict):
+                names = fields.keys()
+            elif isinstance(fields, str):
+                names = [fields]
+            else:
+                names = fields
+            if any(name.split(".")[0] in watched for name in names):
+                return True
+    return False
+
+
+def _in_transaction(session) -> bool:
+    return session is not None and bool(getattr(session, "in_transaction", False))
+
+
+def _pass_key(query: Any) -> str | None:
+    if not isinstance(query, dict):
+        return None
+    pass_key = query.get("pass_key")
+    if isinstance(pass_key, str):
+        return pass_key
+    return None
+
+
+def _request_document(request: Any) -> Any:
+    """The filter of a ``bulk_write`` request, or the document of an ``InsertOne``."""
+    return getattr(request, "_filter", getattr(request, "_doc", None))
+
+
+class VersionedPassesCollection:
+    """Passes collection wrapper that keeps queue stats and counters coherent.
+
+    Reads pass through untouched; every write bumps the version of the
+    pass_key in its filter (or document, for inserts) in the
+    :class:`QueueStatsCache`, and writes that can change a counted field are
+    reported to the callbacks registered with :meth:`on_change`. For writes
+    inside a transaction both happen once :meth:`finish_transaction` reports
+    it over.
+
+    :class:`PassCounters` are kept by the code that changes pass state: it
+    wraps its writes in :meth:`counted` and tells how they moved the passes.
+    """
+
+    def __init__(
+            self,
+            collection: AgnosticCollection,
+            stats_cache: QueueStatsCache | None = None,
+            counters_collection: AgnosticCollection | None = None,
+        ):
+        self._collection = collection
+        self.stats_cache = stats_cache if stats_cache is not None else QueueStatsCache()
+        self.counters = (
+            PassCounters(counters_collection, collection)
+            if counters_collection is not None
+            else None
+        )
+        self._change_listeners: list[tuple[Callable[[str | None], None], frozenset]] = []
+        # id(session) -> what to do once its transaction is over
+        self._transactions: dict[int, list[Callable[[], Awaitable[None]]]] = {}
+
+    def on_change(
+            self,
+            callback: Callable[[str | None], None],
+            fields: frozenset = COUNTED_FIELDS,
+        ):
+        """Calls ``callback(pass_key)`` after writes that can change one of
+        *fields*; ``pass_key`` is None when the write can't be pinned to one
+        key."""
+        self._change_listeners.append((callback, frozenset(fields)))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._collection, name)
+        if name not in WRITE_METHODS:
+            return attr
+
+        @wraps(attr)
+        async def write(*args, **kwargs):
+            async def settle():
+                pass_keys = self._after_write(name, args, kwargs)
+                self._notify_change(name, args, kwargs, pass_keys)
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                await self._when_settled(kwargs.get("session"), settle)
+        return write
+
+    def __getitem__(self, name: str):
+        return self._collection[name]
+
+    @asynccontextmanager
+    async def counted(self, bot_id, pass_key: str, session=None) -> AsyncIterator[CountedWrite]:
+        """Wraps writes to passes of *pass_key* that change a counted field.
+
+        The caller records in the yielded :class:`CountedWrite` how its
+        writes moved the passes. The counters get the difference in *session*
+        if it is in a transaction, and under the ``pending`` guard of
+        :class:`PassCounters` otherwise. The stats of *pass_key* are bumped
+        again once the counters have it.
+        """
+        counted = CountedWrite()
+        if self.counters is None:
+            yield counted
+            return
+        token = None
+        if not _in_transaction(session):
+            session = None
+            token = await self.counters.begin(bot_id, pass_key)
+            if token is None:
+                counted.recount()  # builds the missing counters
+        try:
+            yield counted
+        except BaseException:
+            if session is None:  # a transaction takes its $inc back by itself
+                counted.recount()
+                await self._count(bot_id, pass_key, counted, token, None)
+            raise
+        await self._count(bot_id, pass_key, counted, token, session)
+
+    async def _count(self, bot_id, pass_key: str, counted: CountedWrite, token: str | None, session):
+        delta = {} if counted.stale else counted.delta()
+        if token is not None or (session is not None and delta):
+            kwargs = {"session": session} if session is not None else {}
+            try:
+                await self.counters.finish(bot_id, pass_key, delta, token, **kwargs)
+            except Exception as e:
+                if session is not None:
+                    raise  # fails the transaction along with its writes
+                logger.error(f"failed to update pass counters of {pass_key}: {e}", exc_info=1)
+                counted.recount()
+
+        async def settle():
+            self.stats_cache.bump(pass_key)
+            if not counted.stale:
+                return
+            try:
+                if not await self.counters.reconcile(bot_id, pass_key):
+                    logger.info(f"pass counters of {pass_key} changed while recounting, retry later")
+            except Exception as e:
+                logger.error(f"failed to recount pass counters of {pass_key}: {e}", exc_info=1)
+        await self._when_settled(session, settle)
+
+    async def _when_settled(self, session, action: Callable[[], Awaitable[None]]):
+        """Runs *action* now, or once the transaction of *session* is over."""
+        if _in_transaction(session):
+            self._transactions.setdefault(id(session), []).append(action)
+        else:
+            await action()
+
+    async def finish_transaction(self, session):
+        """Bumps the stats versions and notifies the listeners of the writes
+        made in *session*'s transaction, now that it has committed or aborted."""
+        for action in self._transactions.pop(id(session), []):
+            await action()
+
+    def _after_write(self, method: str, args: tuple, kwargs: dict) -> set[str] | None:
+        """Bumps the stats versions; returns the pass keys written, None if unknown."""
+        if method == "bulk_write":
+            requests = args[0] if args else kwargs.get("requests", [])
+            documents = [_request_document(request) for request in requests]
+        else:
+            query = args[0] if args else kwargs.get("filter", kwargs.get("document"))
+            documents = list(query or []) if method == "insert_many" else [query]
+        pass_keys = set()
+        for document in documents:
+            pass_key = _pass_key(document)
+            if pass_key is None:
+                self.stats_cache.bump()
+                return None
+            self.stats_cache.bump(pass_key)
+            pass_keys.add(pass_key)
+        return pass_keys
+
+    def _notify_change(self, method: str, args: tuple, kwargs: dict, pass_keys: set[str] | None):
+        for callback, fields in self._change_listeners:
+            if not self._tracked(method, args, kwargs, fields):
+                continue
+            try:
+                for pass_key in pass_keys if pass_keys is not None else [None]:
+                    callback(pass_key)
+            except Exception as e:
+                logger.error(f"pass change listener failed: {e}", exc_info=1)
+
+    @staticmethod
+    def _tracked(method: str, args: tuple, kwargs: dict, fields: frozenset = COUNTED_FIELDS) -> bool:
+        if method in ("insert_one", "insert_many", "delete_one", "delete_many",
+                      "find_one_and_delete", "bulk_write"):
+            return True
+        update = args[1] if len(args) > 1 else kwargs.get("update", kwargs.get("replacement"))
+        return _touches_fields(method, update, fields)
+
+
+@asynccontextmanager
+async def _uncounted() -> AsyncIterator[CountedWrite]:
+    yield CountedWrite()
+
+
+def counted(pass_db, bot_id, pass_key: str, **kwargs):
+    """:meth:`VersionedPassesCollection.counted`; on any other collection
+    what is recorded goes nowhere."""
+    if isinstance(pass_db, VersionedPassesCollection):
+        return pass_db.counted(bot_id, pass_key, **kwargs)
+    return _uncounted()
+
+
+async def counted_passes(pass_db, query: dict, **kwargs) -> list[dict]:
+    """The counted fields of the passes *query* matches, read before a write
+    that moves them; nothing if *pass_db* keeps no counters."""
+    if not _keeps_counters(pass_db):
+        return []
+    return await pass_db.find(query, COUNTED_PROJECTION, **kwargs).to_list(None)
+
+
+async def write_counted(
+        pass_db,
+        bot_id,
+        pass_key: str,
+        query: dict,
+        update: dict | list | None,
+        changes: dict | None,
+        *,
+        many: bool = False,
+        upsert: bool = False,
+        **kwargs,
+    ):
+    """Updates the passes of *pass_key* that *query* matches, or deletes them
+    if *update* is None, and moves them in the counters.
+
+    *changes* are the values the update gives to counted fields, None for the
+    ones it unsets; an upserted pass counts as *changes* alone. The passes are
+    read before the write, in its transaction if *kwargs* carry one.
+
+    A single pass is written only if its counted fields still are as read,
+    and read again if they are not. For ``many`` the write runs on *query*
+    as is; if it then matches a different number of passes than were read,
+    the counters are recounted instead.
+    """
+    session = {"session": kwargs["session"]} if "session" in kwargs else {}
+    if upsert:
+        kwargs["upsert"] = True
+    if not _keeps_counters(pass_db):
+        return await _write(pass_db, query, update, many, **kwargs)
+    async with counted(pass_db, bot_id, pass_key, **session) as moves:
+        if many:
+            before = await counted_passes(pass_db, query, **session)
+            result = await _write(pass_db, query, update, True, **kwargs)
+            if _written(result, update) != len(before):
+                moves.recount()
+                return result
+            for doc in before:
+                moves.move(doc, None if update is None else {**doc, **(changes or {})})
+            return result
+        for _ in range(COUNTED_WRITE_ATTEMPTS):
+            before = await pass_db.find_one(query, COUNTED_PROJECTION, **session)
+            if before is None:
+                result = await _write(pass_db, query, update, False, **kwargs)
+                if update is not None and upsert and result.upserted_id is not None:
+                    moves.move(None, dict(changes or {}))
+                elif _written(result, update):
+                    moves.recount()  # the pass showed up after it was read
+                return result
+            as_read = {"_id": before["_id"], **{name: before.get(name) for name in COUNTED_FIELDS}}
+            guarded = {**query, "$and": [*query.get("$and", []), as_read]}
+            result = await _write(pass_db, guarded, update, False, **kwargs)
+            if _written(result, update):
+                moves.move(before, None if update is None else {**before, **(changes or {})})
+                return result
+        logger.warning(f"pass of {pass_key} kept changing under a counted write, recounting")
+        moves.recount()
+        return await _write(pass_db, query, update, False, **kwargs)
+
+
+def _keeps_counters(pass_db) -> bool:
+    return isinstance(pass_db, VersionedPassesCollection) and pass_db.counters is not None
+
+
+async def _write(pass_db, query: dict, update: dict | list | None, many: bool, **kwargs):
+    if update is None:
+        kwargs.pop("upsert", None)
+        delete = pass_db.delete_many if many else pass_db.delete_one
+        return await delete(query, **kwargs)
+    write = pass_db.update_many if many else pass_db.update_one
+    return await write(query, update, **kwargs)
+
+
+def _written(result, update: dict | list | None) -> int:
+    return result.deleted_count if update is None else result.matched_count
@@ -0,0 +1,156 @@
+"""XLSX export behind ``/passes_table``.
+
+Rows are built on the event loop from one passes and one users query per
+pass key; the workbook itself is written in a worker process, in openpyxl
+write-only mode, straight into memory.
+"""
+from asyncio import get_running_loop
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import io
+import multiprocessing
+
+PASSES_TABLE_FIELDS = {
+    "user_id": {"name": "User ID", "location": "user"},
+    "username": {"name": "Username", "location": "user"},
+    "first_name": {"name": "First Name", "location": "user"},
+    "last_name": {"name": "Last Name", "location": "user"},
+    "print_name": {"name": "Print Name", "location": "user"},
+    "legal_name": {"name": "Legal Name", "location": "user"},
+    "language_code": {"name": "Language code", "location": "user", "length": 2},
+    "pass_key": {"name": "Pass Key", "location": "key"},
+    "state": {"name": "State", "location": "pass"},
+    "type": {"name": "Type", "location": "pass"},
+    "role": {"name": "Role", "location": "pass"},
+    "couple": {"name": "Couple", "location": "pass"},
+    "price": {"name": "Price", "location": "pass"},
+    "price_per_one": {"name": "Price per one", "location": "pass"},
+    "assignment_tier_number": {"name": "Assignment Tier", "location": "pass"},
+    "date_created": {"name": "Date Created", "location": "pass"},
+    "date_assignment": {"name": "Date Assignment", "location": "pass"},
+    "proof_admin": {"name": "Current Ambassador", "location": "pass"},
+    "proof_admin_received": {"name": "Proven By", "location": "pass"},
+    "proof_received": {"name": "Proof Received", "location": "pass"},
+    "proof_accepted": {"name": "Proof Accepted", "location": "pass"},
+    "proof_rejected": {"name": "Proof Rejected", "location": "pass"},
+    "proof_file": {"name": "Proof File ID", "location": "pass", "length": 5},
+    "skip_in_balance_count": {"name": "Skip in Balance Count", "location": "pass"},
+    "comment": {"name": "Comment", "location": "pass"},
+}
+USER_PROJECTION = {
+    field: 1
+    for field, info in PASSES_TABLE_FIELDS.items()
+    if info["location"] == "user"
+}
+MIN_COLUMN_WIDTH = 3
+
+_pool: ProcessPoolExecutor | None = None
+
+
+class PassesTable:
+    """Rows of the passes table, with column widths tracked as rows are added."""
+
+    def __init__(self, fields: dict = PASSES_TABLE_FIELDS):
+        self.fields = fields
+        self.headers = [info["name"] for info in fields.values()]
+        self.rows: list[list] = []
+        self._widths = [len(header) for header in self.headers]
+
+    def add(
+            self,
+            pass_key: str,
+            user: dict,
+            pass_data: dict,
+            display_price,
+        ):
+        row = []
+        for field, info in self.fields.items():
+            if field == "price":
+                row.append(display_price)
+            elif field == "price_per_one":
+                row.append(pass_data.get("price", ""))
+            elif (
+                field == "proof_admin_received"
+                and pass_data.get(field) in [None, ""]
+                and pass_data.get("state") == "paid"
+            ):
+                row.append(pass_data.get("proof_admin", ""))
+            elif field == "date_created":
+                created_at = pass_data.get(field, "")
+                if isinstance(created_at, datetime):
+                    row.append(created_at.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
+                else:
+                    row.append(created_at)
+            elif info["location"] == "key":
+                row.append(pass_key)
+            elif info["location"] == "user":
+                row.append(user.get(field, ""))
+            else:
+                row.append(pass_data.get(field, ""))
+        for i, value in enumerate(row):
+            if value is not None:
+                self._widths[i] = max(self._widths[i], len(str(value)))
+        self.rows.append(row)
+
+    def widths(self) -> list[int]:
+        return [
+            info.get("length", max(width, MIN_COLUMN_WIDTH))
+            for info, width in zip(self.fields.values(), self._widths)
+        ]
+
+    def sort_column(self) -> int:
+        return list(self.fields).index("date_created")
+
+    async def render(self) -> bytes:
+        """Writes the workbook in the worker process."""
+        global _pool
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+            )
+        return await get_running_loop().run_in_executor(
+            _pool,
+            build_passes_workbook,
+            self.headers,
+            self.rows,
+            self.widths(),
+            self.sort_column(),
+        )
+
+
+def build_passes_workbook(
+        headers: list[str],
+        rows: list[list],
+        widths: list[int],
+        sort_column: int,
+    ) -> bytes:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Passes")
+    for i, width in enumerate(widths):
+        ws.column_dimensions[get_column_letter(i + 1)].width = width
+    ws.freeze_panes = "A2"
+    last_row = len(rows) + 1
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{last_row}"
+    sort_letter = get_column_letter(sort_column + 1)
+    ws.auto_filter.add_sort_condition(f"{sort_letter}2:{sort_letter}{last_row}")
+
+    bold = Font(bold=True)
+    center = Alignment(horizontal="center")
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = bold
+        cell.alignment = center
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append(row)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
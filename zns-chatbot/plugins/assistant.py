@@ -19,6 +19,7 @@ from telegram import Update
 from telegram.ext import filters
 from telegram.constants import ParseMode
 
+from ..indexes import IndexSpec
 from ..tg_state import TGState
 from .avatar import async_thread
 from .base_plugin import PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING, BasePlugin
@@ -84,6 +85,14 @@ def unescape_markdown(md_text: str) -> str:
 
 class Assistant(BasePlugin):
     name = "assistant"
+    indexes = (
+        IndexSpec(
+            "messages_collection",
+            [("user_id", 1), ("date", 1)],
+            probe={"user_id": 0},
+            probe_sort=[("date", -1)],
+        ),
+    )
     about: str = ""
 
     @dataclass
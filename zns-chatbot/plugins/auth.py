@@ -1,8 +1,7 @@
 from motor.core import AgnosticCollection
 from ..tg_state import TGState
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
-from .base_plugin import BasePlugin, PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING
-from telegram.ext import CallbackQueryHandler
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
+from .base_plugin import BasePlugin
 from telegram.constants import ParseMode
 import logging
 from asyncio import Event, Lock
@@ -59,21 +58,16 @@ class Request:
 
 class Auth(BasePlugin):
     name = "auth"
+    callback_prefix = "auth"
     user_db: AgnosticCollection
 
     def __init__(self, base_app):
         super().__init__(base_app)
         base_app.auth = self
         self.user_db = base_app.users_collection
-        self._cbq_handler = CallbackQueryHandler(self.handle_callback_query, pattern=f"^{self.name}\\|.*")
         self.requests = dict()
         self._lock = Lock()
 
-    def test_callback_query(self, message: Update, state):
-        if self._cbq_handler.check_update(message):
-            return PRIORITY_BASIC, self.handle_callback_query
-        return PRIORITY_NOT_ACCEPTING, None
-
     async def add_request(self, msg: Message, update: TGState):
         async with self._lock:
             if update.user in self.requests:
@@ -20,11 +20,11 @@ from PIL import Image, ImageChops
 from pymongo import ReturnDocument
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, WebAppInfo
 from telegram.constants import ChatAction, ParseMode
-from telegram.ext import CallbackQueryHandler, CommandHandler, filters
+from telegram.ext import filters
 
 from ..config import full_link
 from ..tg_state import TGState
-from .base_plugin import PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING, BasePlugin
+from .base_plugin import BasePlugin
 
 logger = logging.getLogger(__name__)
 pool = ThreadPoolExecutor(max_workers=max(1, multiprocessing.cpu_count() - 1))
@@ -106,6 +106,13 @@ def touch_file(file_path):
 
 class Avatar(BasePlugin):
     name = "avatar"
+    commands = {"avatar": "handle_command"}
+    callback_prefix = "avatar"
+    callback_handler = "handle_avatar_callback_query"
+    content_filters = (
+        (filters.PHOTO, "handle_photo"),
+        (filters.Document.IMAGE, "handle_document"),
+    )
 
     def __init__(self, base_app):
         super().__init__(base_app)
@@ -116,29 +123,6 @@ class Avatar(BasePlugin):
         self.cache_dir = tempfile.gettempdir()
         sweep_folder(self.cache_dir)
         self.base_app.avatar = self
-        self._command_test = CommandHandler("avatar", self.handle_command)
-        self._cq_handler = CallbackQueryHandler(
-            self.handle_avatar_callback_query,
-            pattern=f"^{self.name}\\|.*",
-        )
-
-    def test_message(self, message: Update, state, web_app_data):
-        if filters.PHOTO.check_update(message):
-            return PRIORITY_BASIC, self.handle_photo
-        if filters.Document.IMAGE.check_update(message):
-            return PRIORITY_BASIC, self.handle_document
-        if self._command_test.check_update(message):
-            return PRIORITY_BASIC, self.handle_command
-        return PRIORITY_NOT_ACCEPTING, None
-
-    def test_callback_query(self, update_obj: Update, state):
-        if hasattr(super(), "test_callback_query"):
-            prio, cb = super().test_callback_query(update_obj, state)
-            if cb:
-                return prio, cb
-        if self._cq_handler.check_update(update_obj):
-            return PRIORITY_BASIC, self.handle_avatar_callback_query
-        return PRIORITY_NOT_ACCEPTING, None
 
     async def handle_command(self, update: TGState):
         await update.reply(
@@ -8,6 +8,14 @@ PRIORITY_BASIC = 0
 class BasePlugin():
     name = "_BasePlugin"
     base_app = None
+    # Declarative routes, indexed once at startup by routing.PluginRouter.
+    # Handlers are referenced by method name.
+    commands: dict[str, str] = {}
+    callback_prefix: str | None = None
+    callback_handler: str = "handle_callback_query"
+    content_filters: tuple = ()
+    # indexes.IndexSpec entries for this plugin's hot queries, created at startup.
+    indexes: tuple = ()
 
     def __init__(self, app) -> None:
         self.base_app = app
@@ -17,6 +25,9 @@ class BasePlugin():
     def bot(self) -> Bot:
         return self.base_app.bot.bot
 
+    def accepts_route(self, update) -> bool:
+        return True
+
     def test_message(self, update, state, web_app_data):
         return PRIORITY_NOT_ACCEPTING, None
 
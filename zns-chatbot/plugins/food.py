@@ -1,13 +1,16 @@
-from asyncio import Event, create_task, sleep
+from asyncio import Event, Semaphore, create_task, gather, sleep
 import datetime
 import json
 import logging
+from collections import Counter, defaultdict
 import csv
 import io
+import os
 from random import choice
 
 from bson import ObjectId
 from motor.core import AgnosticCollection
+from pymongo import ReturnDocument
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -19,25 +22,32 @@ from telegram import (
 )
 from telegram.constants import ParseMode
 from telegram.error import TelegramError
-from telegram.ext import CallbackQueryHandler, CommandHandler
 
 from ..config import full_link
 from ..events import Events
+from ..food_digests import FoodDigestCache
+from ..food_menu import (
+    LUNCH_COMBOS,
+    LUNCH_SUB_CATEGORIES,
+    MenuFile,
+    MenuIndex,
+)
+from ..indexes import IndexSpec
 from ..payment_methods import payment_iban_to_key
+from ..send_scheduler import SEND_BULK, send_priority
 from ..plugins.massage import now_msk
 from ..telegram_links import client_user_link_html, client_user_name
 from ..tg_state import TGState
-from .base_plugin import PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING, BasePlugin
+from .base_plugin import BasePlugin
 
 logger = logging.getLogger(__name__)
 
-LUNCH_NO_SOUP_PRICE = 555
-LUNCH_WITH_SOUP_PRICE = 665
-LUNCH_SUB_CATEGORIES = ["main", "side", "salad"]
+LOCKED_ORDER_STATUSES = ["paid", "proof_submitted"]
 CANCEL_CHR = chr(0xE007F)
 ACTIVITIES = ["open", "yoga", "cacao", "soundhealing"]
 CLASS_ACTIVITIES = ["yoga", "cacao", "soundhealing"]
 NOTIFICATION_CHECK_INTERVAL = 30  # 30 seconds
+FOOD_NOTIFICATION_CONCURRENCY = 8  # food reminders being sent at once
 
 
 class FoodUpdate:
@@ -659,6 +669,7 @@ class FoodUpdate:
         )
 
         if result.modified_count > 0:
+            self.base.order_digests.bump(order["user_id"])
             client_user_id = order.get("user_id")
             client_user_obj = None
             if client_user_id:
@@ -1047,6 +1058,7 @@ class FoodUpdate:
             },
             upsert=True,
         )
+        self.base.order_digests.bump(user["user_id"])
         if result.modified_count < 1:
             logger.warning(
                 f"Failed to update activities for user {self.user} with pass_key {self.pass_key}"
@@ -1364,6 +1376,7 @@ class FoodUpdate:
         )
 
         if result.modified_count > 0:
+            self.base.order_digests.bump(order["user_id"])
             client_user_id = order.get("user_id")
             client_user_obj = None
             if client_user_id:
@@ -1466,19 +1479,47 @@ class FoodUpdate:
             {"$set": {f"notification_{notification_type}_sent": True}},
         )
 
+MENU_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "static",
+    "menu_2025_1.json",
+)
+
+
 class Food(BasePlugin):
     name = "food"
+    commands = {
+        # "food": "handle_food_start_cmd",
+        # "activities": "handle_activities_cmd",
+        "exportfoodorders": "handle_export_orders_cmd",
+    }
+    callback_prefix = "food"
+    callback_handler = "handle_food_callback_query_entry"
+    indexes = (
+        IndexSpec(
+            "food_collection",
+            [("user_id", 1), ("pass_key", 1)],
+            probe={"user_id": 0, "pass_key": ""},
+        ),
+    )
     food_db: AgnosticCollection
+    order_digests: FoodDigestCache
     user_db: AgnosticCollection
-    menu: dict
+    menu_file: MenuFile
     food_admins: list[int]
 
     NO_LUNCH_RU = "Без обеда"
     COMBO_WITH_SOUP_RU = "Комбо с супом"
     COMBO_NO_SOUP_RU = "Комбо без супа"
+    DAY_NAMES_RU = {
+        "friday": "Пятница",
+        "saturday": "Суббота",
+        "sunday": "Воскресенье",
+    }
 
     def __init__(self, base_app):
         super().__init__(base_app)
+        self.order_digests = FoodDigestCache()
         self.food_db = base_app.mongodb[self.config.mongo_db.food_collection]
         self.user_db = base_app.users_collection
         self.base_app.food = self
@@ -1486,7 +1527,7 @@ class Food(BasePlugin):
 
         self.deadline = self.config.food.deadline
 
-        self.menu = self._load_menu()
+        self.menu_file = MenuFile(MENU_PATH)
 
         self.food_admins = [
             int(admin_id) for admin_id in self.config.food.payment_admins
@@ -1497,157 +1538,169 @@ class Food(BasePlugin):
             int(admin_id) for admin_id in self.config.food.payment_admins_old
         ]
 
-        self._command_checkers = [
-            # CommandHandler("food", self.handle_food_start_cmd),
-            # CommandHandler("activities", self.handle_activities_cmd),
-            CommandHandler("exportfoodorders", self.handle_export_orders_cmd),
-        ]
-        self._cbq_handler = CallbackQueryHandler(
-            self.handle_food_callback_query_entry, pattern=f"^{self.name}\\|.*"
-        )
         create_task(self._notification_sender())
 
     def default_pass_key(self) -> str:
         return self.events.closest_active_pass_key(now_msk())
 
+    def notification_windows(self) -> list[tuple[str, datetime.datetime, datetime.datetime]]:
+        """``(kind, opens, closes)`` of the food reminder windows."""
+        food = self.config.food
+        return [
+            # the gap keeps the first reminder from running into the last one
+            (
+                "first",
+                self.deadline - food.notification_first_time,
+                self.deadline - food.notification_last_time - food.notify_after,
+            ),
+            ("last", self.deadline - food.notification_last_time, self.deadline),
+        ]
+
+    def plan_notifications(self, now: datetime.datetime) -> tuple[list[str], float | None]:
+        """Reminder kinds due at *now* and seconds until the next window opens.
+
+        The delay is None when no window opens any more.
+        """
+        due: list[str] = []
+        upcoming: list[datetime.datetime] = []
+        for kind, opens, closes in self.notification_windows():
+            if opens <= now < closes:
+                due.append(kind)
+            elif now < opens < closes:
+                upcoming.append(opens)
+        if not upcoming:
+            return due, None
+        return due, (min(upcoming) - now).total_seconds()
+
     async def _notification_sender(self) -> None:
-        from .passes import Passes
+        send_priority.set(SEND_BULK)
+        if "food" not in self.commands:
+            logger.info("/food is disabled, not sending food reminders")
+            return
         bot_started: Event = self.base_app.bot_started
         await bot_started.wait()
-        passes_plugin: Passes = self.base_app.passes
         while True:
             try:
-                # Wait for the next notification time
-                await sleep(NOTIFICATION_CHECK_INTERVAL)
-                current_pass_key = self.default_pass_key()
-                passes = await passes_plugin.get_all_passes(with_unpaid=True)
-                pass_users = {p["user_id"]: p for p in passes}
-                # Send notifications to users with pending orders
-                if (now_msk() > ( # after the first notification time
-                        self.deadline - self.config.food.notification_first_time
-                    )
-                    and now_msk() < ( # don't send double notifications, and add a gap
-                        self.deadline - self.config.food.notification_last_time - self.config.food.notify_after
-                    )):
-                    async for order in self.food_db.find(
-                        {
-                            "pass_key": current_pass_key,
-                            "payment_status": {"$nin": ["paid", "proof_submitted"]},
-                            "notification_first_sent": {"$ne": True},
-                            "total": {"$gt": 0},  # Only notify if total > 0
-                            "last_updated": {  # do not notify if user just updated order
-                                "$lte": datetime.datetime.now(datetime.timezone.utc)
-                                - self.config.food.notify_after
-                            }
-                        }
-                    ):
-                        user = order["user_id"]
-                        try:
-                            upd = await self.create_food_update_for_user(user)
-                            await upd.send_notification(
-                                "first"
-                            )  # Notify with first notification
-                        except Exception as e:
-                            logger.error(
-                                f"Error notifying {user=}: {e}",
-                                exc_info=True,
-                            )
-                            continue
-                    for user_id, pass_doc in pass_users.items():
-                        try:
-                            upd = await self.create_food_update_for_user(user_id)
-                            order = await self.get_order(
-                                user_id=user_id
-                            )
-                            pass_data = passes_plugin._pass_doc_to_data(pass_doc) or {}
-                            notified_first = pass_data.get("notified_food_first", False)
-                            if (not order and not notified_first):
-                                await upd.update.reply(
-                                    upd.l("food-no-order-notification-first"),
-                                    parse_mode=ParseMode.HTML
-                                )
-                                await passes_plugin.update_pass_fields(
-                                    [user_id],
-                                    current_pass_key,
-                                    set_fields={"notified_food_first": True},
-                                )
-                        except Exception as e:
-                            logger.error(
-                                f"Error notifying {user=}: {e}",
-                                exc_info=True,
-                            )
-                            continue
-                # Send notifications to users with pending orders
-                if (now_msk() > ( # after the last notification time
-                        self.deadline - self.config.food.notification_last_time
-                    )
-                    and now_msk() < ( # don't send after the deadline
-                        self.deadline
-                    )):
-                    async for order in self.food_db.find(
-                        {
-                            "pass_key": current_pass_key,
-                            "payment_status": {"$nin": ["paid", "proof_submitted"]},
-                            "notification_last_sent": {"$ne": True},
-                            "total": {"$gt": 0},  # Only notify if total > 0
-                            "last_updated": {  # do not notify if user just updated order
-                                "$lte": datetime.datetime.now(datetime.timezone.utc)
-                                - self.config.food.notify_after
-                            }
-                        }
-                    ):
-                        user = order["user_id"]
-                        try:
-                            upd = await self.create_food_update_for_user(user)
-                            await upd.send_notification(
-                                "last"
-                            )  # Notify with last notification
-                        except Exception as e:
-                            logger.error(
-                                f"Error notifying {user=}: {e}",
-                                exc_info=True,
-                            )
-                            continue
-                    for user_id, pass_doc in pass_users.items():
-                        try:
-                            upd = await self.create_food_update_for_user(user_id)
-                            order = await self.get_order(
-                                user_id=user_id
-                            )
-                            pass_data = passes_plugin._pass_doc_to_data(pass_doc) or {}
-                            notified_last = pass_data.get("notified_food_last", False)
-                            if (not order and not notified_last):
-                                await upd.update.reply(
-                                    upd.l("food-no-order-notification-last"),
-                                    parse_mode=ParseMode.HTML
-                                )
-                                await passes_plugin.update_pass_fields(
-                                    [user_id],
-                                    current_pass_key,
-                                    set_fields={"notified_food_last": True},
-                                )
-                        except Exception as e:
-                            logger.error(
-                                f"Error notifying {user=}: {e}",
-                                exc_info=True,
-                            )
-                            continue
+                due, next_window = self.plan_notifications(now_msk())
+                if due:
+                    pass_key = self.default_pass_key()
+                    for kind in due:
+                        await self.send_food_reminders(kind, pass_key)
+                    # orders leave the notify_after grace period over time
+                    await sleep(NOTIFICATION_CHECK_INTERVAL)
+                elif next_window is not None:
+                    await sleep(next_window)
+                else:
+                    logger.info("food reminder windows are over")
+                    return
             except Exception as e:
                 logger.error(f"Error in food notification sender: {e}", exc_info=True)
+                await sleep(NOTIFICATION_CHECK_INTERVAL)
 
+    async def food_reminder_candidates(self, kind: str, pass_key: str) -> list[int]:
+        """Holders of assigned or paid passes with no food order who weren't reminded yet.
 
-    def _load_menu(self) -> dict:
-        import os
-        from os.path import dirname as d
+        Mirrors :meth:`get_order` before the deadline: an order counts if it
+        has details or is paid.
+        """
+        passes_plugin = self.base_app.passes
+        docs = await passes_plugin.pass_db.aggregate([
+            {
+                "$match": {
+                    "bot_id": self.bot.id,
+                    "pass_key": pass_key,
+                    "state": {"$in": ["paid", "assigned"]},
+                    f"notified_food_{kind}": {"$ne": True},
+                }
+            },
+            {
+                "$lookup": {
+                    "from": self.food_db.name,
+                    "localField": "user_id",
+                    "foreignField": "user_id",
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "pass_key": pass_key,
+                                "$or": [
+                                    {"order_details": {"$nin": [None, {}]}},
+                                    {"payment_status": {"$in": ["paid", "proof_submitted"]}},
+                                ],
+                            }
+                        },
+                        {"$limit": 1},
+                        {"$project": {"_id": 1}},
+                    ],
+                    "as": "order",
+                }
+            },
+            {"$match": {"order": []}},
+            {"$project": {"_id": 0, "user_id": 1}},
+        ]).to_list(None)
+        return list(dict.fromkeys(doc["user_id"] for doc in docs))
+
+    async def send_food_reminders(self, kind: str, pass_key: str) -> None:
+        """Sends the *kind* reminder to unpaid orders and to pass holders without one."""
+        limit = Semaphore(FOOD_NOTIFICATION_CONCURRENCY)
+        reminded: list[int] = []
+        unpaid = await self.food_db.find(
+            {
+                "pass_key": pass_key,
+                "payment_status": {"$nin": ["paid", "proof_submitted"]},
+                f"notification_{kind}_sent": {"$ne": True},
+                "total": {"$gt": 0},  # Only notify if total > 0
+                "last_updated": {  # do not notify if user just updated order
+                    "$lte": datetime.datetime.now(datetime.timezone.utc)
+                    - self.config.food.notify_after
+                },
+            },
+            {"user_id": 1},
+        ).to_list(None)
+
+        async def remind_unpaid(user_id: int) -> None:
+            async with limit:
+                try:
+                    upd = await self.create_food_update_for_user(user_id)
+                    if upd is not None:
+                        await upd.send_notification(kind)
+                except Exception as e:
+                    logger.error(f"Error notifying {user_id=}: {e}", exc_info=True)
+
+        async def remind_no_order(user_id: int) -> None:
+            async with limit:
+                try:
+                    upd = await self.create_food_update_for_user(user_id)
+                    if upd is None:
+                        return
+                    await upd.update.reply(
+                        upd.l(f"food-no-order-notification-{kind}"),
+                        parse_mode=ParseMode.HTML,
+                    )
+                    reminded.append(user_id)
+                except Exception as e:
+                    logger.error(f"Error notifying {user_id=}: {e}", exc_info=True)
+
+        await gather(
+            *(remind_unpaid(order["user_id"]) for order in unpaid),
+            *(
+                remind_no_order(user_id)
+                for user_id in await self.food_reminder_candidates(kind, pass_key)
+            ),
+        )
+        if reminded:
+            await self.base_app.passes.update_pass_fields(
+                reminded,
+                pass_key,
+                set_fields={f"notified_food_{kind}": True},
+            )
 
-        with open(
-            os.path.join(d(d(d(__file__))), "static", "menu_2025_1.json"),
-            "r",
-            encoding="utf-8",
-        ) as f:
-            menu_data = json.load(f)
+    @property
+    def menu(self) -> dict:
+        return self.menu_file.current()[0]
 
-        return menu_data
+    @property
+    def menu_index(self) -> MenuIndex:
+        return self.menu_file.current()[1]
 
     async def get_order(self, user_id: int, pass_key: str | None = None) -> dict | None:
         pass_key_to_use = pass_key or self.default_pass_key()
@@ -1662,37 +1715,36 @@ class Food(BasePlugin):
                 f"Order found for user_id: {user_id}, pass_key: {pass_key_to_use}. Order ID: "
                 f"{order.get('_id')}"
             )
-            if now_msk() > self.deadline:
-                if not order.get("order_details") or order.get("total", 0) <= 0:
-                    logger.info(
-                        f"Order {order.get('_id')} for user {user_id} is past the deadline"
-                        " and has no details or total <= 0. Treating as no order."
-                    )
-                    return None
-                if order.get("payment_status") not in [
-                    "paid",
-                    "proof_submitted",
-                ]:
-                    logger.info(
-                        f"Order {order.get('_id')} for user {user_id} is past the deadline"
-                        " and not paid/proof_submitted. Treating as no order."
-                    )
-                    return None
-            # If order_details is None or an empty dict, and status is not protective, treat as no order.
-            # An order with explicit "no-lunch" selections will have order_details populated.
-            if not order.get("order_details") and order.get("payment_status") not in [
-                "paid",
-                "proof_submitted",
-            ]:
+            return self._visible_order(order)
+        logger.debug(
+            f"No order found for user_id: {user_id}, pass_key: {pass_key_to_use}"
+        )
+        return None
+
+    def _visible_order(self, order: dict) -> dict | None:
+        """Returns *order* unless it no longer counts as one for its user."""
+        user_id = order.get("user_id")
+        if now_msk() > self.deadline:
+            if not order.get("order_details") or order.get("total", 0) <= 0:
                 logger.info(
-                    f"Order {order.get('_id')} for user {user_id} has empty/null details"
-                    " and is not paid/proof_submitted. Treating as no order."
+                    f"Order {order.get('_id')} for user {user_id} is past the deadline"
+                    " and has no details or total <= 0. Treating as no order."
                 )
                 return None
-        else:
-            logger.debug(
-                f"No order found for user_id: {user_id}, pass_key: {pass_key_to_use}"
+            if order.get("payment_status") not in LOCKED_ORDER_STATUSES:
+                logger.info(
+                    f"Order {order.get('_id')} for user {user_id} is past the deadline"
+                    " and not paid/proof_submitted. Treating as no order."
+                )
+                return None
+        # If order_details is None or an empty dict, and status is not protective, treat as no order.
+        # An order with explicit "no-lunch" selections will have order_details populated.
+        if not order.get("order_details") and order.get("payment_status") not in LOCKED_ORDER_STATUSES:
+            logger.info(
+                f"Order {order.get('_id')} for user {user_id} has empty/null details"
+                " and is not paid/proof_submitted. Treating as no order."
             )
+            return None
         return order
 
     async def get_order_by_id(self, order_id: ObjectId, pass_key: str) -> dict | None:
@@ -1738,280 +1790,67 @@ class Food(BasePlugin):
         if event is None or not event.is_active(now_msk()):
             raise ValueError(f"invalid or inactive pass_key: {pass_key}")
 
-        if not self.menu:
+        menu_index = self.menu_index
+        if not menu_index.days:
             logger.error("Menu not loaded. Cannot save order.")
             return None
 
-        # Fetch existing order details first to check its status and content
-        existing_order = await self.food_db.find_one(
-            {"user_id": user_id, "pass_key": pass_key}
-        )
-        current_payment_status_from_db = (
-            existing_order.get("payment_status") if existing_order else None
-        )
-        stored_order_details = (
-            existing_order.get("order_details") if existing_order else None
-        )
-        stored_total = existing_order.get("total") if existing_order else None
-        current_proof_admin_from_db = (
-            existing_order.get("proof_admin") if existing_order else None
-        )
-
-        calculated_total_sum = 0
-        order_is_complete = True  # Assume complete initially
-
-        # --- Loop to calculate calculated_total_sum and order_is_complete from new order_data ---
-        for day_key, day_menu_config in self.menu.items():
-            day_has_lunch_in_menu = bool(day_menu_config.get("lunch"))
-            order_for_this_day = order_data.get(day_key)
-
-            # --- Lunch Processing ---
-            if day_has_lunch_in_menu:
-                if not order_for_this_day or order_for_this_day.get("lunch") is None:
-                    # If menu offers lunch for this day, but order data has no lunch entry or it's null
-                    order_is_complete = False
-                else:
-                    lunch_details = order_for_this_day["lunch"]
-                    lunch_type = lunch_details.get("type")
-                    # Default items to appropriate empty type if not provided or null
-                    if lunch_type == "individual-items":
-                        lunch_items_payload = lunch_details.get("items", [])
-                    else:  # For combos or potentially other types if items were a dict
-                        lunch_items_payload = lunch_details.get("items", {})
-
-                    if lunch_type == "no-lunch":
-                        pass  # Complete for this day's lunch, no price added.
-                    elif lunch_type == "individual-items":
-                        if isinstance(lunch_items_payload, list):
-                            day_lunch_menu_items = day_menu_config.get("lunch", [])
-                            for item_index_obj in lunch_items_payload:
-                                try:
-                                    item_index = int(
-                                        item_index_obj
-                                    )  # Client might send string indices
-                                    if 0 <= item_index < len(day_lunch_menu_items):
-                                        lunch_item_config = day_lunch_menu_items[
-                                            item_index
-                                        ]
-                                        if lunch_item_config and isinstance(
-                                            lunch_item_config.get("price"), (int, float)
-                                        ):
-                                            calculated_total_sum += lunch_item_config[
-                                                "price"
-                                            ]
-                                        else:
-                                            logger.warning(
-                                                f"Individual lunch item {day_key}-lunch-{item_index} selected but has no/invalid price in menu config."
-                                            )
-                                    else:
-                                        logger.warning(
-                                            f"Invalid individual lunch item index {item_index} for {day_key} (max: {len(day_lunch_menu_items) - 1})."
-                                        )
-                                except (ValueError, TypeError):
-                                    logger.warning(
-                                        f"Invalid individual lunch item index format: '{item_index_obj}' for {day_key}."
-                                    )
-                        else:
-                            logger.warning(
-                                f"Malformed 'items' for 'individual-items' lunch on {day_key}. Expected list, got {type(lunch_items_payload)}."
-                            )
-                            order_is_complete = (
-                                False  # Treat as an error making order incomplete
-                            )
-
-                    elif lunch_type == "combo-with-soup":
-                        current_day_combo_complete = True
-                        if (
-                            not isinstance(lunch_items_payload, dict)
-                            or lunch_items_payload.get("soup_index") is None
-                        ):
-                            current_day_combo_complete = False
-                        if (
-                            current_day_combo_complete
-                        ):  # Only check sub-categories if soup is present
-                            for category in LUNCH_SUB_CATEGORIES:  # main, side, salad
-                                if lunch_items_payload.get(f"{category}_index") is None:
-                                    current_day_combo_complete = False
-                                    break
-
-                        if current_day_combo_complete:
-                            calculated_total_sum += LUNCH_WITH_SOUP_PRICE
-                        else:
-                            order_is_complete = False
-
-                    elif lunch_type == "combo-no-soup":
-                        current_day_combo_complete = True
-                        if not isinstance(lunch_items_payload, dict):
-                            current_day_combo_complete = (
-                                False  # items payload itself is wrong type
-                            )
-                        else:
-                            for category in LUNCH_SUB_CATEGORIES:  # main, side, salad
-                                if lunch_items_payload.get(f"{category}_index") is None:
-                                    current_day_combo_complete = False
-                                    break
-
-                        if current_day_combo_complete:
-                            calculated_total_sum += LUNCH_NO_SOUP_PRICE
-                        else:
-                            order_is_complete = False
-                    else:  # Invalid or missing lunch type when lunch_details object itself exists
-                        logger.warning(
-                            f"Invalid or missing lunch_type '{lunch_type}' for {day_key}."
-                        )
-                        order_is_complete = False
-
-            # --- Dinner Sum Calculation (remains largely the same, but ensure robustness) ---
-            if order_for_this_day and "dinner" in order_for_this_day:
-                dinner_order_indices = order_for_this_day.get(
-                    "dinner", []
-                )  # Default to empty list
-                dinner_menu_items_config = day_menu_config.get("dinner", [])
-
-                if isinstance(dinner_order_indices, list) and dinner_menu_items_config:
-                    for item_index_obj in dinner_order_indices:
-                        try:
-                            item_index = int(
-                                item_index_obj
-                            )  # Client might send string indices
-                            if 0 <= item_index < len(dinner_menu_items_config):
-                                dinner_item_details = dinner_menu_items_config[
-                                    item_index
-                                ]
-                                if dinner_item_details and isinstance(
-                                    dinner_item_details.get("price"), (int, float)
-                                ):
-                                    calculated_total_sum += dinner_item_details["price"]
-                                else:
-                                    logger.warning(
-                                        f"Dinner item {day_key}-dinner-{item_index} in order is missing price or has invalid price in menu config: {dinner_item_details}"
-                                    )
-                            else:
-                                logger.warning(
-                                    f"Invalid dinner item index {item_index} for day {day_key} in order data. Max index: {len(dinner_menu_items_config) - 1}"
-                                )
-                        except (ValueError, TypeError) as e:
-                            logger.warning(
-                                f"Invalid dinner item index format: '{item_index_obj}' for day {day_key}. Error: {e}"
-                            )
-            elif day_menu_config.get("dinner") and not (
-                order_for_this_day and "dinner" in order_for_this_day
-            ):
-                # Dinner is offered in menu, but no dinner data in order for this day. This is fine, dinner is optional and doesn't affect completeness.
-                pass
-        # --- End of calculation loop ---
-
-        # Check for modification attempts on paid/proof_submitted orders
-        if existing_order and current_payment_status_from_db in [
-            "paid",
-            "proof_submitted",
-        ]:
-            is_data_changed = order_data != stored_order_details
-            # Compare new calculated total with the total stored from the existing order
-            is_total_changed = calculated_total_sum != stored_total
-
-            if is_data_changed or is_total_changed:
-                error_msg = (
-                    f"Attempt to modify order {existing_order['_id']} (user {user_id}) "
-                    f"which is in status '{current_payment_status_from_db}'. Modifications"
-                    " are not allowed."
-                )
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-
+        calculated_total_sum, order_is_complete = menu_index.price(order_data)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        order_filter = {"user_id": user_id, "pass_key": pass_key}
         db_order_doc = {
             "user_id": user_id,
             "pass_key": pass_key,
             "order_details": order_data,
             "total": calculated_total_sum,
             "is_complete": order_is_complete,
-            "last_updated": datetime.datetime.now(datetime.timezone.utc),
+            "last_updated": now,
         }
-
         if original_message_id is not None and chat_id is not None:
             db_order_doc["origin_info"] = {
                 "message_id": original_message_id,
                 "chat_id": chat_id,
             }
+        # An editable order has to be paid anew after any save.
+        editable_doc = {**db_order_doc, "payment_status": None, "proof_admin": None}
 
-        # Determine payment_status for the document to be saved
-        if order_is_complete:
-            if current_payment_status_from_db in ["paid", "proof_submitted"] and (
-                not existing_order
-                or (
-                    order_data == stored_order_details
-                    and calculated_total_sum == stored_total
-                )
-            ):
-                # If status was 'paid' or 'proof_submitted' and no actual change was made (error wasn't raised), preserve it.
-                db_order_doc["payment_status"] = current_payment_status_from_db
-            else:
-                # Order is complete, but either wasn't paid/proof_submitted,
-                # or it was but changes were made (which would have reset it if not for the error being raised for paid/proof_submitted).
-                # This path is taken if it's newly complete, or was editable and is still complete.
-                db_order_doc["payment_status"] = None
-        else:  # Order is not complete
-            db_order_doc["payment_status"] = None
-
-        # Manage proof_admin
-        if (
-            db_order_doc["payment_status"] == "paid"
-            or db_order_doc["payment_status"] == "proof_submitted"
-        ):
-            # This means the status was preserved from current_payment_status_from_db
-            if current_proof_admin_from_db:
-                db_order_doc["proof_admin"] = current_proof_admin_from_db
-            else:
-                # This case (paid/proof_submitted but no proof_admin in existing order) implies an inconsistency.
-                # Log it, and set proof_admin to None if it was None.
-                db_order_doc["proof_admin"] = None
-                if (
-                    existing_order
-                ):  # Only log warning if it's an existing order that's inconsistent
-                    logger.warning(
-                        f"Order {existing_order['_id']} has status "
-                        f"{db_order_doc['payment_status']} but no current_proof_admin_from_db "
-                        "during save."
-                    )
-        else:  # payment_status is None (incomplete, or complete but awaiting payment initiation)
-            db_order_doc["proof_admin"] = (
-                None  # Clear admin if not in active payment/paid state
-            )
-
-        update_payload = {
-            "$set": db_order_doc,
-            "$setOnInsert": {
-                "created_at": datetime.datetime.now(datetime.timezone.utc)
-            },
-        }
-
-        result = await self.food_db.update_one(
-            {"user_id": user_id, "pass_key": pass_key}, update_payload, upsert=True
-        )
-
-        saved_order_doc = None  # Initialize
-        if result.upserted_id:
-            logger.info(
-                f"New order inserted for user_id: {user_id}, pass_key: {pass_key}. Order ID: "
-                f"{result.upserted_id}. Complete: {order_is_complete}, Total: "
-                f"{calculated_total_sum}"
-            )
-            saved_order_doc = await self.get_order(user_id, pass_key)
-        elif result.modified_count > 0:
-            logger.info(
-                f"Order updated for user_id: {user_id}, pass_key: {pass_key}. Complete: "
-                f"{order_is_complete}, Total: {calculated_total_sum}"
+        saved_order_doc = None
+        for _ in range(2):  # once more if the order changes status under us
+            saved_order_doc = await self.food_db.find_one_and_update(
+                {**order_filter, "payment_status": {"$nin": LOCKED_ORDER_STATUSES}},
+                {"$set": editable_doc},
+                return_document=ReturnDocument.AFTER,
             )
-            saved_order_doc = await self.get_order(user_id, pass_key)
-        else:
-            # This case (matched_count > 0, modified_count == 0) means the new data was identical to existing.
-            logger.info(
-                f"Order for user_id: {user_id}, pass_key: {pass_key} was not modified"
-                " (data identical). Complete: {order_is_complete}, Total: "
-                f"{calculated_total_sum}"
-            )
-            # Still fetch to ensure consistency for the return value and potential message update
-            saved_order_doc = await self.get_order(user_id, pass_key)
+            if saved_order_doc is not None:
+                logger.info(
+                    f"Order saved for user_id: {user_id}, pass_key: {pass_key}. Complete: "
+                    f"{order_is_complete}, Total: {calculated_total_sum}"
+                )
+                break
+            # Either there is no order yet, or it is locked.
+            new_order_id = ObjectId()
+            saved_order_doc = await self.food_db.find_one_and_update(
+                order_filter,
+                {"$setOnInsert": {"_id": new_order_id, **editable_doc, "created_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            if saved_order_doc["_id"] == new_order_id:
+                logger.info(
+                    f"New order inserted for user_id: {user_id}, pass_key: {pass_key}. Order ID: "
+                    f"{new_order_id}. Complete: {order_is_complete}, Total: "
+                    f"{calculated_total_sum}"
+                )
+                break
+            if saved_order_doc.get("payment_status") in LOCKED_ORDER_STATUSES:
+                saved_order_doc = await self._resave_locked_order(
+                    saved_order_doc, db_order_doc
+                )
+                if saved_order_doc is not None:
+                    break
+        self.order_digests.bump(user_id)
+        if saved_order_doc is not None:
+            saved_order_doc = self._visible_order(saved_order_doc)
 
         if (
             saved_order_doc
@@ -2032,23 +1871,48 @@ class Food(BasePlugin):
 
         return saved_order_doc
 
+    async def _resave_locked_order(self, existing_order: dict, db_order_doc: dict) -> dict | None:
+        """Saves a paid or proof_submitted order again, refusing any change to it.
+
+        Returns None if the order left its status in the meantime.
+        """
+        status = existing_order["payment_status"]
+        if (
+            db_order_doc["order_details"] != existing_order.get("order_details")
+            or db_order_doc["total"] != existing_order.get("total")
+        ):
+            error_msg = (
+                f"Attempt to modify order {existing_order['_id']} (user "
+                f"{existing_order.get('user_id')}) which is in status '{status}'. "
+                "Modifications are not allowed."
+            )
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        if not existing_order.get("proof_admin"):
+            logger.warning(
+                f"Order {existing_order['_id']} has status {status} but no proof_admin "
+                "during save."
+            )
+        set_fields = dict(db_order_doc)
+        if not db_order_doc["is_complete"]:
+            set_fields.update(payment_status=None, proof_admin=None)
+        order = await self.food_db.find_one_and_update(
+            {"_id": existing_order["_id"], "payment_status": status},
+            {"$set": set_fields},
+            return_document=ReturnDocument.AFTER,
+        )
+        if order is not None:
+            logger.info(
+                f"Order {existing_order['_id']} in status {status} saved unchanged."
+            )
+        return order
+
     async def handle_food_start_cmd(self, update: TGState):
         return await self.create_update(update).handle_start()
 
     async def handle_food_callback_query_entry(self, update: TGState):
         return await self.create_update(update).handle_callback_query()
 
-    def test_message(self, message: Update, state, web_app_data):
-        for checker in self._command_checkers:
-            if checker.check_update(message):
-                return PRIORITY_BASIC, checker.callback
-        return PRIORITY_NOT_ACCEPTING, None
-
-    def test_callback_query(self, query: Update, state):
-        if self._cbq_handler.check_update(query):
-            return PRIORITY_BASIC, self._cbq_handler.callback
-        return PRIORITY_NOT_ACCEPTING, None
-
     def create_update(self, update_obj: TGState) -> FoodUpdate:
         return FoodUpdate(self, update_obj)
 
@@ -2107,304 +1971,230 @@ class Food(BasePlugin):
     async def handle_export_orders_cmd(self, update: TGState):
         assert update.user in self.config.food.admins, f"User {update.user} is not an admin."
 
+        orders_csv, summary_csv = await gather(
+            self._orders_csv(), self._meal_summary_csv(), return_exceptions=True,
+        )
+        stamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         try:
-            header = [
-                "ID Пользователя",
-                "Username",
-                "Print Name",
-                "Legal Name",
-                "Оплачено",
-                "Платеж Подтвержден",
-                "Итого Сумма",
-            ]
-            
-            day_meal_columns_info = [] # To store (day_key, meal_type, column_header_name)
-
-            if self.menu:
-                for day_key in self.menu.keys():
-                    day_menu_config = self.menu[day_key]
-                    day_name_ru = {
-                        "friday": "Пятница",
-                        "saturday": "Суббота",
-                        "sunday": "Воскресенье",
-                    }[day_key]
-                    if day_menu_config.get("lunch"):
-                        lunch_col_name = f"{day_name_ru} Обед"
-                        header.append(lunch_col_name)
-                        day_meal_columns_info.append({"day_key": day_key, "meal": "lunch", "header": lunch_col_name})
-                    if day_menu_config.get("dinner"):
-                        dinner_col_name = f"{day_name_ru} Ужин"
-                        header.append(dinner_col_name)
-                        day_meal_columns_info.append({"day_key": day_key, "meal": "dinner", "header": dinner_col_name})
-            
-            csv_rows = []
-            csv_rows.append(header)
-
-            orders_cursor = self.food_db.find({"pass_key": self.default_pass_key()})
-            async for order in orders_cursor:
-                user_id = order.get("user_id")
-                user_doc = await self.user_db.find_one({"user_id": user_id, "bot_id": self.bot.bot.id})
-
-                username = user_doc.get("username", "") if user_doc else ""
-                print_name = user_doc.get("print_name", "") if user_doc else ""
-                legal_name = user_doc.get("legal_name", "") if user_doc else ""
-
-                is_paid = order.get("payment_status") == "paid"
-                payment_confirmed = order.get("payment_confirmed_date") is not None
-                total = order.get("total", 0.0)
-
-                row_data = [
-                    user_id,
-                    username,
-                    print_name,
-                    legal_name,
-                    "Да" if is_paid else "Нет",
-                    "Да" if payment_confirmed else "Нет",
-                    total,
-                ]
-
-                order_details = order.get("order_details", {})
-                
-                for col_info in day_meal_columns_info:
-                    day_key = col_info["day_key"]
-                    meal_type = col_info["meal"] 
-                    
-                    day_menu_config = self.menu.get(day_key, {})
-                    order_details_for_day = order_details.get(day_key, {})
-                    
-                    items_str = self._extract_meal_textual_contents(meal_type, day_key, order_details_for_day, day_menu_config)
-
-                    row_data.append(items_str)
-                csv_rows.append(row_data)
-
-            if not csv_rows or len(csv_rows) <= 1: 
+            if isinstance(orders_csv, Exception):
+                raise orders_csv
+            if orders_csv is None:
                 await update.reply("Нет заказов для экспорта.")
                 return
-
-            # Create the first CSV (orders export)
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerows(csv_rows)
-            csv_data_bytes = output.getvalue().encode('utf-8')
-            output.close()
-
-            filename = f"food_orders_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
-            
-            input_file = InputFile(io.BytesIO(csv_data_bytes), filename=filename)
-            await update.update.effective_message.reply_document(document=input_file, caption="Экспорт заказов на питание завершен.")
-
-            # Create the second CSV (meal summary)
-            await self._export_meal_summary(update)
-
+            await update.update.effective_message.reply_document(
+                document=InputFile(io.BytesIO(orders_csv), filename=f"food_orders_{stamp}.csv"),
+                caption="Экспорт заказов на питание завершен.",
+            )
         except Exception as e:
             logger.error(f"Error exporting food orders: {e}", exc_info=True)
             await update.reply(f"Произошла ошибка при экспорте заказов: {e}")
+            return
 
-    async def _export_meal_summary(self, update: TGState):
-        """Create and send a CSV export with meal summary statistics."""
         try:
-            # Headers for the summary CSV
-            summary_header = [
-                "День",
-                "Прием пищи", 
-                "Название блюда",
-                "Цена",
-                "Количество заказов",
-                "Сумма"
-            ]
-            
-            summary_rows = [summary_header]
-            
-            # Day names mapping
-            day_names_ru = {
-                "friday": "Пятница",
-                "saturday": "Суббота", 
-                "sunday": "Воскресенье",
-            }
-            
-            # Count occurrences of each meal item
-            meal_counts = {}  # Structure: {day: {meal_type: {item_key: count}}}
-            combo_counts = {}  # Structure: {day: {combo_type: count}}
-            # Process all orders
-            orders_cursor = self.food_db.find({
-                "pass_key": self.default_pass_key(),
-                "payment_status": "paid",
-                "payment_confirmed_date": {"$exists": True},
-            })
-            async for order in orders_cursor:
-                order_details = order.get("order_details", {})
-                
-                for day_key, day_order in order_details.items():
-                    if day_key not in meal_counts:
-                        meal_counts[day_key] = {"lunch": {}, "dinner": {}}
-                    if day_key not in combo_counts:
-                        combo_counts[day_key] = {}
-                    
-                    # Process lunch
-                    if day_order and "lunch" in day_order:
-                        lunch_details = day_order["lunch"]
-                        if lunch_details:
-                            lunch_type = lunch_details.get("type")
-                            lunch_items = lunch_details.get("items")
-                            
-                            if lunch_type == "individual-items" and isinstance(lunch_items, list):
-                                # Count individual lunch items
-                                day_lunch_menu = self.menu.get(day_key, {}).get("lunch", [])
-                                for item_index_obj in lunch_items:
-                                    try:
-                                        item_index = int(item_index_obj)
-                                        if 0 <= item_index < len(day_lunch_menu):
-                                            item_key = f"lunch_individual_{item_index}"
-                                            meal_counts[day_key]["lunch"][item_key] = meal_counts[day_key]["lunch"].get(item_key, 0) + 1
-                                    except (ValueError, TypeError):
-                                        pass
-                            
-                            elif lunch_type in ["combo-with-soup", "combo-no-soup"]:
-                                # Count combos
-                                combo_counts[day_key][lunch_type] = combo_counts[day_key].get(lunch_type, 0) + 1
-                                
-                                # Count individual items within combos
-                                if isinstance(lunch_items, dict):
-                                    day_lunch_menu = self.menu.get(day_key, {}).get("lunch", [])
-                                    
-                                    # Count soup for combo-with-soup
-                                    if lunch_type == "combo-with-soup":
-                                        soup_index_obj = lunch_items.get("soup_index")
-                                        if soup_index_obj is not None:
-                                            try:
-                                                soup_index = int(soup_index_obj)
-                                                if 0 <= soup_index < len(day_lunch_menu):
-                                                    item_key = f"lunch_combo_soup_{soup_index}"
-                                                    meal_counts[day_key]["lunch"][item_key] = meal_counts[day_key]["lunch"].get(item_key, 0) + 1
-                                            except (ValueError, TypeError):
-                                                pass
-                                    
-                                    # Count main, side, salad for combos
-                                    for category in ["main", "side", "salad"]:
-                                        item_index_obj = lunch_items.get(f"{category}_index")
-                                        if item_index_obj is not None:
-                                            try:
-                                                item_index = int(item_index_obj)
-                                                if 0 <= item_index < len(day_lunch_menu):
-                                                    item_key = f"lunch_combo_{category}_{item_index}"
-                                                    meal_counts[day_key]["lunch"][item_key] = meal_counts[day_key]["lunch"].get(item_key, 0) + 1
-                                            except (ValueError, TypeError):
-                                                pass
-                    
-                    # Process dinner
-                    if day_order and "dinner" in day_order:
-                        dinner_indices = day_order.get("dinner", [])
-                        day_dinner_menu = self.menu.get(day_key, {}).get("dinner", [])
-                        for item_index_obj in dinner_indices:
-                            try:
-                                item_index = int(item_index_obj)
-                                if 0 <= item_index < len(day_dinner_menu):
-                                    item_key = f"dinner_{item_index}"
-                                    meal_counts[day_key]["dinner"][item_key] = meal_counts[day_key]["dinner"].get(item_key, 0) + 1
-                            except (ValueError, TypeError):
-                                pass
-            
-            # Generate summary rows
-            for day_key in sorted(meal_counts.keys()):
-                day_name_ru = day_names_ru.get(day_key, day_key.capitalize())
-                
-                # Add combo summary rows first
-                if day_key in combo_counts:
-                    for combo_type, count in combo_counts[day_key].items():
-                        combo_name = self.COMBO_WITH_SOUP_RU if combo_type == "combo-with-soup" else self.COMBO_NO_SOUP_RU
-                        combo_price = LUNCH_WITH_SOUP_PRICE if combo_type == "combo-with-soup" else LUNCH_NO_SOUP_PRICE
-                        total = combo_price * count
-                        
-                        summary_rows.append([
-                            day_name_ru,
-                            "Обед",
-                            combo_name, 
-                            combo_price,
-                            count,
-                            total
-                        ])
-                
-                # Add individual meal items
-                day_menu_config = self.menu.get(day_key, {})
-                
-                # Lunch items
-                lunch_menu = day_menu_config.get("lunch", [])
-                for item_key, count in meal_counts[day_key]["lunch"].items():
-                    if item_key.startswith("lunch_individual_"):
-                        item_index = int(item_key.split("_")[-1])
-                        if 0 <= item_index < len(lunch_menu):
-                            item = lunch_menu[item_index]
-                            price = item.get("price", 0)
-                            total = price * count
-                            
-                            summary_rows.append([
-                                day_name_ru,
-                                "Обед",
-                                item.get("title_ru", f"Item {item_index}"),
-                                price,
-                                count, 
-                                total
-                            ])
-                    
-                    elif item_key.startswith("lunch_combo_"):
-                        # For combo items, mark price as "Комбо" and no sum
-                        parts = item_key.split("_")
-                        if len(parts) >= 4:
-                            category = parts[2]  # soup, main, side, salad
-                            item_index = int(parts[3])
-                            if 0 <= item_index < len(lunch_menu):
-                                item = lunch_menu[item_index]
-                                
-                                summary_rows.append([
-                                    day_name_ru,
-                                    "Обед",
-                                    item.get("title_ru", f"Item {item_index}"),
-                                    "Комбо",
-                                    count,
-                                    ""  # No sum for combo components
-                                ])
-                
-                # Dinner items  
-                dinner_menu = day_menu_config.get("dinner", [])
-                for item_key, count in meal_counts[day_key]["dinner"].items():
-                    if item_key.startswith("dinner_"):
-                        item_index = int(item_key.split("_")[-1])
-                        if 0 <= item_index < len(dinner_menu):
-                            item = dinner_menu[item_index]
-                            price = item.get("price", 0)
-                            total = price * count
-                            
-                            summary_rows.append([
-                                day_name_ru,
-                                "Ужин",
-                                item.get("title_ru", f"Item {item_index}"),
-                                price,
-                                count,
-                                total
-                            ])
-            
-            if len(summary_rows) <= 1:
+            if isinstance(summary_csv, Exception):
+                raise summary_csv
+            if summary_csv is None:
                 await update.reply("Нет данных для сводки по блюдам.")
                 return
-            
-            # Create and send the summary CSV
-            summary_output = io.StringIO()
-            summary_writer = csv.writer(summary_output)
-            summary_writer.writerows(summary_rows)
-            summary_csv_data = summary_output.getvalue().encode('utf-8')
-            summary_output.close()
-            
-            summary_filename = f"meal_summary_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
-            summary_input_file = InputFile(io.BytesIO(summary_csv_data), filename=summary_filename)
             await update.update.effective_message.reply_document(
-                document=summary_input_file, 
-                caption="Сводка по блюдам экспортирована."
+                document=InputFile(io.BytesIO(summary_csv), filename=f"meal_summary_{stamp}.csv"),
+                caption="Сводка по блюдам экспортирована.",
             )
-            
         except Exception as e:
             logger.error(f"Error exporting meal summary: {e}", exc_info=True)
             await update.reply(f"Произошла ошибка при экспорте сводки: {e}")
 
+    async def _orders_csv(self) -> bytes | None:
+        """CSV of all orders of the current event with their users, None if there are none.
+
+        The users come in with the orders from a single aggregation, and each
+        order is written out as soon as it arrives.
+        """
+        menu = self.menu
+        header = [
+            "ID Пользователя",
+            "Username",
+            "Print Name",
+            "Legal Name",
+            "Оплачено",
+            "Платеж Подтвержден",
+            "Итого Сумма",
+        ]
+        day_meal_columns = []  # (day_key, meal_type)
+        for day_key, day_menu_config in menu.items():
+            day_name_ru = self.DAY_NAMES_RU.get(day_key, day_key.capitalize())
+            if day_menu_config.get("lunch"):
+                header.append(f"{day_name_ru} Обед")
+                day_meal_columns.append((day_key, "lunch"))
+            if day_menu_config.get("dinner"):
+                header.append(f"{day_name_ru} Ужин")
+                day_meal_columns.append((day_key, "dinner"))
+
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(header)
+        has_orders = False
+        async for order in self.food_db.aggregate([
+            {"$match": {"pass_key": self.default_pass_key()}},
+            {
+                "$lookup": {
+                    "from": self.user_db.name,
+                    "localField": "user_id",
+                    "foreignField": "user_id",
+                    "pipeline": [
+                        {"$match": {"bot_id": self.bot.bot.id}},
+                        {"$project": {"_id": 0, "username": 1, "print_name": 1, "legal_name": 1}},
+                        {"$limit": 1},
+                    ],
+                    "as": "user",
+                }
+            },
+        ]):
+            has_orders = True
+            user_doc = order["user"][0] if order.get("user") else {}
+            order_details = order.get("order_details") or {}
+            writer.writerow([
+                order.get("user_id"),
+                user_doc.get("username", ""),
+                user_doc.get("print_name", ""),
+                user_doc.get("legal_name", ""),
+                "Да" if order.get("payment_status") == "paid" else "Нет",
+                "Да" if order.get("payment_confirmed_date") is not None else "Нет",
+                order.get("total", 0.0),
+                *(
+                    self._extract_meal_textual_contents(
+                        meal_type, day_key, order_details.get(day_key, {}), menu.get(day_key, {}),
+                    )
+                    for day_key, meal_type in day_meal_columns
+                ),
+            ])
+        if not has_orders:
+            return None
+        return output.getvalue().encode('utf-8')
+
+    def _meal_summary_pipeline(self, menu: dict) -> list[dict]:
+        """Counts every dish and combo of the paid orders per day and meal.
+
+        Each order is flattened into one entry per picked item, which are
+        then grouped and counted. Indices are counted as stored: they are
+        validated against the menu when the summary is written.
+        """
+        entries = []
+        for day_key in menu:
+            lunch = f"$order_details.{day_key}.lunch"
+            dinner = f"$order_details.{day_key}.dinner"
+            entries += [
+                {"$cond": [
+                    {"$and": [
+                        {"$eq": [f"{lunch}.type", "individual-items"]},
+                        {"$isArray": f"{lunch}.items"},
+                    ]},
+                    {"$map": {
+                        "input": f"{lunch}.items",
+                        "as": "index",
+                        "in": {"day": day_key, "kind": "lunch", "index": "$$index"},
+                    }},
+                    [],
+                ]},
+                {"$cond": [
+                    {"$in": [f"{lunch}.type", list(LUNCH_COMBOS)]},
+                    [
+                        {"day": day_key, "kind": "combo", "index": f"{lunch}.type"},
+                        {"day": day_key, "kind": "combo_soup", "index": {"$cond": [
+                            {"$eq": [f"{lunch}.type", "combo-with-soup"]},
+                            f"{lunch}.items.soup_index",
+                            None,
+                        ]}},
+                        *(
+                            {
+                                "day": day_key,
+                                "kind": f"combo_{category}",
+                                "index": f"{lunch}.items.{category}_index",
+                            }
+                            for category in LUNCH_SUB_CATEGORIES
+                        ),
+                    ],
+                    [],
+                ]},
+                {"$cond": [
+                    {"$isArray": dinner},
+                    {"$map": {
+                        "input": dinner,
+                        "as": "index",
+                        "in": {"day": day_key, "kind": "dinner", "index": "$$index"},
+                    }},
+                    [],
+                ]},
+            ]
+        return [
+            {"$match": {
+                "pass_key": self.default_pass_key(),
+                "payment_status": "paid",
+                "payment_confirmed_date": {"$exists": True},
+            }},
+            {"$project": {"_id": 0, "entry": {"$concatArrays": entries}}},
+            {"$unwind": "$entry"},
+            {"$group": {"_id": "$entry", "count": {"$sum": 1}}},
+        ]
+
+    async def _meal_summary_csv(self) -> bytes | None:
+        """CSV with the number of orders of every dish and combo, None if nothing was ordered."""
+        menu = self.menu
+        combo_counts: dict[str, Counter] = defaultdict(Counter)  # day -> combo type -> count
+        item_counts: dict[str, Counter] = defaultdict(Counter)  # day -> (kind, index) -> count
+        async for group in self.food_db.aggregate(self._meal_summary_pipeline(menu)):
+            entry, count = group["_id"], group["count"]
+            if entry["kind"] == "combo":
+                combo_counts[entry["day"]][entry["index"]] += count
+                continue
+            try:
+                item_index = int(entry.get("index"))
+            except (ValueError, TypeError):
+                continue
+            meal_type = "dinner" if entry["kind"] == "dinner" else "lunch"
+            if 0 <= item_index < len(menu.get(entry["day"], {}).get(meal_type, [])):
+                item_counts[entry["day"]][(entry["kind"], item_index)] += count
+
+        kinds = ["lunch", *(f"combo_{category}" for category in ["soup", *LUNCH_SUB_CATEGORIES]), "dinner"]
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow([
+            "День",
+            "Прием пищи",
+            "Название блюда",
+            "Цена",
+            "Количество заказов",
+            "Сумма",
+        ])
+        has_rows = False
+        for day_key in sorted(combo_counts.keys() | item_counts.keys()):
+            day_name_ru = self.DAY_NAMES_RU.get(day_key, day_key.capitalize())
+            for combo_type, (combo_price, _) in LUNCH_COMBOS.items():
+                count = combo_counts[day_key][combo_type]
+                if count:
+                    combo_name = (
+                        self.COMBO_WITH_SOUP_RU if combo_type == "combo-with-soup" else self.COMBO_NO_SOUP_RU
+                    )
+                    writer.writerow([day_name_ru, "Обед", combo_name, combo_price, count, combo_price * count])
+                    has_rows = True
+            for (kind, item_index), count in sorted(
+                item_counts[day_key].items(), key=lambda item: (kinds.index(item[0][0]), item[0][1]),
+            ):
+                meal_type = "dinner" if kind == "dinner" else "lunch"
+                item = menu[day_key][meal_type][item_index]
+                title = item.get("title_ru", f"Item {item_index}")
+                meal_name = "Ужин" if kind == "dinner" else "Обед"
+                if kind.startswith("combo_"):
+                    # combo components are paid for as part of the combo
+                    writer.writerow([day_name_ru, meal_name, title, "Комбо", count, ""])
+                else:
+                    price = item.get("price", 0)
+                    writer.writerow([day_name_ru, meal_name, title, price, count, price * count])
+                has_rows = True
+        if not has_rows:
+            return None
+        return output.getvalue().encode('utf-8')
+
     def _extract_meal_textual_contents(self, meal_type: str, day_key: str, order_details_for_day: dict, day_menu_config: dict) -> str:
         """
         Extract textual contents for a specific meal type and day.
@@ -2497,14 +2287,28 @@ class Food(BasePlugin):
         Returns:
             Dictionary in format {day: {meal: "textual contents"}, "activities": [list of selected activities]}
             Example: {"friday": {"lunch": "Комбо с супом; Борщ, Котлета, Рис, Салат", "dinner": "Суп, Хлеб"}, "activities": ["Вечеринка", "Какао церемония"]}
+
+        The digest is cached until the user's order is saved, deleted or paid
+        for, or the menu or the current event changes.
         """
-        if not self.menu:
+        menu = self.menu
+        pass_key = self.default_pass_key()
+        version = self.order_digests.version(user_id, (self.menu_file.generation, pass_key))
+        digest = self.order_digests.get(user_id, version)
+        if digest is None:
+            digest = await self._order_digest(user_id, pass_key, menu)
+            self.order_digests.put(user_id, version, digest)
+        return digest
+
+    async def _order_digest(self, user_id: int, pass_key: str, menu: dict) -> dict:
+        """Renders the paid order of *user_id* for :meth:`get_order_contents_by_user`."""
+        if not menu:
             return {}
-            
+
         # Find the user's order
         order = await self.food_db.find_one({
             "user_id": user_id,
-            "pass_key": self.default_pass_key(),
+            "pass_key": pass_key,
             "payment_status": "paid",
             "payment_confirmed_date": {"$exists": True},
         })
@@ -2515,8 +2319,8 @@ class Food(BasePlugin):
         order_details = order.get("order_details", {})
         
         # Process each day in the menu
-        for day_key in self.menu.keys():
-            day_menu_config = self.menu[day_key]
+        for day_key in menu.keys():
+            day_menu_config = menu[day_key]
             order_details_for_day = order_details.get(day_key, {})
             day_result = {}
             
@@ -4,13 +4,14 @@ import pytz
 from ..tg_state import TGState
 from ..telegram_links import client_user_link_html, client_user_name
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, WebAppInfo
-from .base_plugin import BasePlugin, PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING
-from telegram.ext import CommandHandler, CallbackQueryHandler
+from .base_plugin import BasePlugin
 from telegram.constants import ParseMode
 import logging
 from bson.objectid import ObjectId
 from ..config import Party, full_link
 from ..events import Events
+from ..indexes import IndexSpec
+from ..send_scheduler import SEND_BULK, send_priority
 from datetime import datetime, timedelta
 from asyncio import Lock, create_task, gather
 from math import floor, ceil
@@ -1097,6 +1098,20 @@ class UserMassages:
 
 class MassagePlugin(BasePlugin):
     name = "massage"
+    commands = {"massage": "handle_start"}
+    callback_prefix = "massage"
+    indexes = (
+        IndexSpec(
+            "massage_collection",
+            [("specialist", 1), ("party", 1), ("pass_key", 1)],
+            probe={"specialist": 0, "party": 0, "pass_key": ""},
+        ),
+        IndexSpec(
+            "massage_collection",
+            [("pass_key", 1), ("start", 1)],
+            probe={"pass_key": "", "start": {"$gte": 0}},
+        ),
+    )
     user_db: AgnosticCollection
     massage_db: AgnosticCollection
 
@@ -1118,8 +1133,6 @@ class MassagePlugin(BasePlugin):
                 self.parties_end = party.end
         self.parties_begin -= EARLY_COMER_TOLERANCE
         self.parties_end += EARLY_COMER_TOLERANCE
-        self._cmd_checker = CommandHandler(self.name, self.handle_start)
-        self._cq_checker = CallbackQueryHandler(self.handle_callback_query, pattern=f"^{self.name}\\|.*")
         create_task(self._notifier())
         base_app.massages = self
 
@@ -1128,6 +1141,7 @@ class MassagePlugin(BasePlugin):
 
     async def _notifier(self):
         from asyncio import sleep
+        send_priority.set(SEND_BULK)
         logger.info("starting MassagePlugin.notifier loop ")
         while True:
             await sleep(NOTIFICATOR_LOOP)
@@ -1329,16 +1343,6 @@ class MassagePlugin(BasePlugin):
         }
         return ret
 
-    def test_message(self, message: Update, state, web_app_data):
-        if self._cmd_checker.check_update(message):
-            return PRIORITY_BASIC, self.handle_start
-        return PRIORITY_NOT_ACCEPTING, None
-    
-    def test_callback_query(self, query: Update, state):
-        if self._cq_checker.check_update(query):
-            return PRIORITY_BASIC, self.handle_callback_query
-        return PRIORITY_NOT_ACCEPTING, None
-    
     async def create_user_massage(self, update) -> UserMassages:
         ret = UserMassages(self, update)
         await ret.get_user()
@@ -2,17 +2,18 @@ import asyncio
 import datetime
 from motor.core import AgnosticCollection
 from ..config import full_link
+from ..indexes import IndexSpec
 from ..tg_state import TGState
 from telegram import InlineKeyboardMarkup, Update, InlineKeyboardButton, WebAppInfo
-from .base_plugin import BasePlugin, PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING
-from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from .base_plugin import BasePlugin
+from telegram.ext import filters
 from telegram.constants import ParseMode
 from bson.objectid import ObjectId
-from pymongo.errors import DuplicateKeyError
 from ..telegram_links import client_user_link_html, client_user_name
 import logging
 from .massage import now_msk
 from math import ceil
+from time import monotonic
 
 def currency_ceil(sum):
     # if sum < 100:
@@ -46,6 +47,9 @@ CAPACITY_LIMITS = {
     GRODNO_GORODNITSA_SERVICE: 25,
 }
 
+CAPACITY_CACHE_TTL = 5  # seconds
+CAPACITY_RECONCILE_ATTEMPTS = 5
+
 DEADLINE=datetime.datetime(2026, 9, 19, 0, 0, 0)
 
 
@@ -836,6 +840,16 @@ class OrdersUpdate:
 
 class Orders(BasePlugin):
     name = "orders"
+    commands = {"orders": "handle_start"}
+    callback_prefix = "orders"
+    content_filters = ((filters.Document.PDF, "handle_payment"),)
+    indexes = (
+        IndexSpec(
+            "food_collection",
+            [("event_key", 1)],
+            probe={"event_key": ""},
+        ),
+    )
     food_db: AgnosticCollection
 
     def __init__(self, base_app):
@@ -847,16 +861,22 @@ class Orders(BasePlugin):
         ]
         self._capacity_slots_ready = set()
         self._capacity_slots_lock = asyncio.Lock()
-        self._checker = CommandHandler(self.name, self.handle_start)
-        self._file_checker = MessageHandler(filters.Document.PDF, self.handle_payment)
-        self._cbq_handler = CallbackQueryHandler(self.handle_callback_query, pattern=f"^{self.name}\\|.*")
+        self._capacity_cache = None  # (expires, availability)
+        self._capacity_generation = 0  # bumped when this process changes a counter
         self.menu = self.get_menu()
 
     def _capacity_event_key(self):
         return self.config.orders.event_key
 
+    def _capacity_counter_id(self, service):
+        return f"{self._capacity_event_key()}:{service}"
+
     async def _ensure_capacity_slots(self, service):
-        capacity = CAPACITY_LIMITS[service]
+        """Creates the counter of *service* and reconciles it, once per process.
+
+        Every (event_key, service) has one counter document holding the ids
+        of the orders that reserved a place and their count.
+        """
         event_key = self._capacity_event_key()
         ready_key = (event_key, service)
         if ready_key in self._capacity_slots_ready:
@@ -865,126 +885,134 @@ class Orders(BasePlugin):
             if ready_key in self._capacity_slots_ready:
                 return
 
-            await self.capacity_db.create_index(
-                [
-                    ("event_key", 1),
-                    ("service", 1),
-                    ("reservation_id", 1),
-                ],
-                unique=True,
-                partialFilterExpression={"reservation_id": {"$exists": True}},
-            )
-            for seat in range(capacity):
-                await self.capacity_db.update_one(
-                    {"_id": f"{event_key}:{service}:{seat}"},
-                    {"$setOnInsert": {
-                        "event_key": event_key,
-                        "service": service,
-                        "seat": seat,
-                    }},
-                    upsert=True,
-                )
-
-            existing_orders = await self.food_db.find(
-                {
-                    "event_key": event_key,
-                    f"choice.extras.{service}": {"$exists": True},
-                },
-                {"_id": 1},
-            ).to_list(None)
-            existing_order_ids = {order["_id"] for order in existing_orders}
-            reserved_slots = await self.capacity_db.find(
+            await self.capacity_db.update_one(
+                {"_id": self._capacity_counter_id(service)},
                 {
-                    "event_key": event_key,
-                    "service": service,
-                    "reservation_id": {"$exists": True},
-                },
-                {"reservation_id": 1},
-            ).to_list(None)
-            reserved_order_ids = {
-                slot["reservation_id"] for slot in reserved_slots
-                if slot.get("reservation_id") in existing_order_ids
-            }
-            for slot in reserved_slots:
-                reservation_id = slot.get("reservation_id")
-                if reservation_id not in existing_order_ids:
-                    await self.capacity_db.update_one(
-                        {
-                            "_id": slot["_id"],
-                            "reservation_id": reservation_id,
-                        },
-                        {"$unset": {"reservation_id": "", "reserved_at": ""}},
-                    )
-
-            for order_id in existing_order_ids - reserved_order_ids:
-                await self.capacity_db.find_one_and_update(
-                    {
+                    "$setOnInsert": {
                         "event_key": event_key,
                         "service": service,
-                        "reservation_id": {"$exists": False},
+                        "count": 0,
+                        "reservations": [],
                     },
-                    {"$set": {
-                        "reservation_id": order_id,
-                        "reserved_at": datetime.datetime.now(),
-                    }},
-                    sort=[("seat", 1)],
-                )
-
+                    "$set": {"limit": CAPACITY_LIMITS[service]},
+                },
+                upsert=True,
+            )
+            await self._reconcile_capacity(service)
             self._capacity_slots_ready.add(ready_key)
 
+    async def _reconcile_capacity(self, service):
+        """Matches the reservations of *service* to its orders in one write.
+
+        Reservations of orders that are gone are dropped, and orders without
+        one get the free places, as far as they go.
+        """
+        counter_id = self._capacity_counter_id(service)
+        existing_orders = await self.food_db.find(
+            {
+                "event_key": self._capacity_event_key(),
+                f"choice.extras.{service}": {"$exists": True},
+            },
+            {"_id": 1},
+        ).to_list(None)
+        order_ids = [order["_id"] for order in existing_orders]
+        existing_order_ids = set(order_ids)
+        for _ in range(CAPACITY_RECONCILE_ATTEMPTS):
+            counter = await self.capacity_db.find_one({"_id": counter_id})
+            reservations = counter.get("reservations", [])
+            kept = [order_id for order_id in reservations if order_id in existing_order_ids]
+            kept_ids = set(kept)
+            missing = [order_id for order_id in order_ids if order_id not in kept_ids]
+            reconciled = kept + missing[:max(0, CAPACITY_LIMITS[service] - len(kept))]
+            if reconciled == reservations and counter.get("count") == len(reservations):
+                return
+            # Guarded on the reservations read, so a concurrent one isn't lost.
+            result = await self.capacity_db.update_one(
+                {"_id": counter_id, "reservations": reservations},
+                {"$set": {"reservations": reconciled, "count": len(reconciled)}},
+            )
+            if result.matched_count:
+                self._forget_capacity()
+                if len(reconciled) < len(kept) + len(missing):
+                    logger.warning(
+                        f"{len(kept) + len(missing) - len(reconciled)} orders of {service} "
+                        "are over its capacity"
+                    )
+                return
+        logger.warning(f"could not reconcile {service} reservations: they kept changing")
+
+    def _forget_capacity(self):
+        self._capacity_generation += 1
+        self._capacity_cache = None
+
     async def reserve_service_seat(self, service, order_id):
         await self._ensure_capacity_slots(service)
-        event_key = self._capacity_event_key()
-        existing = await self.capacity_db.find_one({
-            "event_key": event_key,
-            "service": service,
-            "reservation_id": order_id,
-        })
-        if existing is not None:
+        counter_id = self._capacity_counter_id(service)
+        result = await self.capacity_db.update_one(
+            {
+                "_id": counter_id,
+                "reservations": {"$ne": order_id},
+                "count": {"$lt": CAPACITY_LIMITS[service]},
+            },
+            {"$addToSet": {"reservations": order_id}, "$inc": {"count": 1}},
+        )
+        self._forget_capacity()
+        if result.matched_count:
             return True
-        try:
-            claimed = await self.capacity_db.find_one_and_update(
-                {
-                    "event_key": event_key,
-                    "service": service,
-                    "reservation_id": {"$exists": False},
-                },
-                {"$set": {
-                    "reservation_id": order_id,
-                    "reserved_at": datetime.datetime.now(),
-                }},
-                sort=[("seat", 1)],
-            )
-        except DuplicateKeyError:
-            # A concurrent request may have reserved another slot for this order.
-            claimed = await self.capacity_db.find_one({
-                "event_key": event_key,
-                "service": service,
-                "reservation_id": order_id,
-            })
-        return claimed is not None
+        # Either it is full, or this order already holds a place.
+        held = await self.capacity_db.find_one(
+            {"_id": counter_id, "reservations": order_id},
+            {"_id": 1},
+        )
+        return held is not None
 
     async def release_service_seat(self, service, order_id):
         await self._ensure_capacity_slots(service)
         await self.capacity_db.update_one(
-            {
-                "event_key": self._capacity_event_key(),
-                "service": service,
-                "reservation_id": order_id,
-            },
-            {"$unset": {"reservation_id": "", "reserved_at": ""}},
+            {"_id": self._capacity_counter_id(service), "reservations": order_id},
+            {"$pull": {"reservations": order_id}, "$inc": {"count": -1}},
         )
+        self._forget_capacity()
+
+    async def capacity_availability(self):
+        """Whether each capacity-limited service has a free place.
+
+        All counters are read at once and the answer is reused for
+        ``CAPACITY_CACHE_TTL`` seconds, or until this process reserves or
+        releases a place.
+        """
+        cached = self._capacity_cache
+        if cached is not None and cached[0] > monotonic():
+            return dict(cached[1])
+        for service in CAPACITY_LIMITS:
+            await self._ensure_capacity_slots(service)
+        generation = self._capacity_generation
+        counters = await self.capacity_db.find(
+            {"_id": {"$in": [self._capacity_counter_id(service) for service in CAPACITY_LIMITS]}},
+            {"service": 1, "count": 1},
+        ).to_list(None)
+        counts = {counter["service"]: counter.get("count", 0) for counter in counters}
+        availability = {
+            service: counts.get(service, 0) < limit
+            for service, limit in CAPACITY_LIMITS.items()
+        }
+        if generation == self._capacity_generation:
+            self._capacity_cache = (monotonic() + CAPACITY_CACHE_TTL, availability)
+        return dict(availability)
+
+    async def services_available(self, current_choice=None):
+        """:meth:`service_available` for every capacity-limited service."""
+        held = choice_capacity_services(current_choice or {})
+        availability = await self.capacity_availability()
+        return {
+            service: service in held or available
+            for service, available in availability.items()
+        }
 
     async def service_available(self, service, current_choice=None):
         if service in choice_capacity_services(current_choice or {}):
             return True
-        await self._ensure_capacity_slots(service)
-        free_slot = await self.capacity_db.find_one({
-            "event_key": self._capacity_event_key(),
-            "service": service,
-            "reservation_id": {"$exists": False},
-        })
-        return free_slot is not None
+        return (await self.capacity_availability())[service]
 
     async def reserve_shuttle_seat(self, order_id):
         return await self.reserve_service_seat(SHUTTLE_SERVICE, order_id)
@@ -1022,18 +1050,6 @@ class Orders(BasePlugin):
             "event_key": self.config.orders.event_key,
         })
 
-    def test_message(self, message: Update, state, web_app_data):
-        if self._checker.check_update(message):
-            return PRIORITY_BASIC, self.handle_start
-        if self._file_checker.check_update(message):
-            return PRIORITY_BASIC, self.handle_payment
-        return PRIORITY_NOT_ACCEPTING, None
-    
-    def test_callback_query(self, query: Update, state):
-        if self._cbq_handler.check_update(query):
-            return PRIORITY_BASIC, self.handle_callback_query
-        return PRIORITY_NOT_ACCEPTING, None
-    
     def create_update(self, update) -> OrdersUpdate:
         return OrdersUpdate(self, update)
     
@@ -1,29 +1,68 @@
-from asyncio import Event, Lock, create_task, sleep
+from asyncio import (
+    Event,
+    Lock,
+    Semaphore,
+    TimeoutError,
+    create_task,
+    gather,
+    sleep,
+    wait_for,
+)
+from collections import OrderedDict
+from contextlib import suppress
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from itertools import count
 from random import choice
+from typing import Awaitable, Callable, TypeVar
+import io
 import logging
 
+from bson import ObjectId
 from motor.core import AgnosticCollection
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
 from telegram import (
     Contact,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputFile,
     MessageOriginUser,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
     Update,
 )
 from telegram.constants import ParseMode
-from telegram.ext import CallbackQueryHandler, CommandHandler, filters
-
-from ..events import EventInfo, EventPassType, Events
+from telegram.ext import filters
+
+from ..batch_loader import BatchLoader
+from ..events import EventInfo, EventPassType, Events, PassTypes
+from ..indexes import IndexSpec
+from ..pass_stats import (
+    COUNTED_FIELDS,
+    QUEUE_STATES,
+    SOLD_STATES,
+    PassCounters,
+    QueueStatsCache,
+    VersionedPassesCollection,
+    counted,
+    counted_passes,
+    counter_paths,
+    counters_to_facets,
+    write_counted,
+)
+from ..passes_table import USER_PROJECTION, PassesTable
 from ..payment_methods import payment_iban_to_key
+from ..send_scheduler import SEND_BULK, send_priority
 from ..telegram_links import client_user_link_html, client_user_name
 from ..tg_state import SilentArgumentParser, TGState
-from .base_plugin import PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING, BasePlugin
+from .base_plugin import BasePlugin
 from .massage import now_msk, split_list
 
 logger = logging.getLogger(__name__)
+T = TypeVar("T")
 
 CANCEL_CHR = chr(0xE007F)  # Tag cancel
 MAX_CONCURRENT_ASSIGNMENTS = 10
@@ -33,6 +72,11 @@ CURRENT_PRICE = {
     "pass_2026_1": 12500,
 }
 TIMEOUT_PROCESSOR_TICK = 3600
+COUNTERS_RECONCILE_INTERVAL = 600
+QUEUE_RECALC_CONCURRENCY = 4  # pass keys recalculated at once
+PASSPORT_REMINDER_CONCURRENCY = 8  # reminders being sent at once
+HYPE_THREAD_INTERVAL = 10  # seconds between announcement rounds
+HYPE_THREAD_BATCH = 20  # registrations per announcement message
 INVITATION_TIMEOUT = timedelta(days=2, hours=10)
 PAYMENT_TIMEOUT = timedelta(days=8)
 PAYMENT_TIMEOUT_NOTIFY2 = timedelta(days=7)
@@ -40,6 +84,123 @@ PAYMENT_TIMEOUT_NOTIFY = timedelta(days=6)
 PASS_TYPES_ASSIGNABLE = ["solo", "couple", "sputnik"]
 ROLE_BALANCE_TOLERANCE = 52  # percent of higher_role/total
 
+# topologies that support multi-document transactions
+TRANSACTION_TOPOLOGIES = ("ReplicaSetWithPrimary", "Sharded")
+
+
+async def _transaction_client(pass_db) -> AsyncIOMotorClient | None:
+    """The client of *pass_db* if its deployment runs multi-document transactions."""
+    client = getattr(getattr(pass_db, "database", None), "client", None)
+    if not isinstance(client, AsyncIOMotorClient):
+        return None
+    if client.topology_description.topology_type_name == "Unknown":
+        # the topology is only known after the first round trip
+        try:
+            await client.admin.command("ping")
+        except PyMongoError as e:
+            logger.warning(f"cannot discover the mongo topology: {e}")
+            return None
+    if client.topology_description.topology_type_name not in TRANSACTION_TOPOLOGIES:
+        return None
+    return client
+
+
+async def run_pass_transaction(pass_db, body: Callable[[dict], Awaitable[T]]) -> T:
+    """Runs ``body(kwargs)``, the writes of a couple, in one transaction where
+    Mongo supports it, and returns what it returns.
+
+    *kwargs* are for the writes: ``{"session": ...}`` inside a transaction on
+    replica sets and sharded clusters, ``{}`` (plain writes) on a standalone
+    server. A transaction that fails with a transient error or an unknown
+    commit result is retried by the driver, so *body* must start over from
+    what it reads. The stats versions and change listeners of a
+    :class:`VersionedPassesCollection` see the writes once it is over.
+    """
+    client = await _transaction_client(pass_db)
+    if client is None:
+        return await body({})
+    async with await client.start_session() as session:
+        try:
+            return await session.with_transaction(lambda session: body({"session": session}))
+        finally:
+            if isinstance(pass_db, VersionedPassesCollection):
+                await pass_db.finish_transaction(session)
+
+
+def _assignment_write(
+    bot_id: int,
+    pass_key: str,
+    user_id: int,
+    user_ids: list[int],
+    price: int,
+    pass_type_index: int | None,
+    assignment_ts: datetime,
+    *,
+    free_proof_admin: int | None = None,
+    pass_type: str | None = None,
+    uncouple: bool = False,
+    comment: str | None = None,
+    skip_in_balance_count: bool = False,
+) -> tuple[dict[str, object], list[dict[str, object]]]:
+    """Filter and update pipeline that assign the waitlisted pass of
+    *user_id*, one of the *user_ids* assigned together, at *price*.
+
+    A free pass is paid right away, with *free_proof_admin* as its proof
+    admin. A couple is matched only while both passes point at each other;
+    *uncouple* drops the link.
+    """
+    state = "paid" if price == 0 else "assigned"
+    set_fields: dict[str, object] = {
+        "state": state,
+        "date_assignment": assignment_ts,
+    }
+    if comment is not None:
+        set_fields["comment"] = comment
+    if pass_type is not None:
+        set_fields["type"] = pass_type
+    if skip_in_balance_count:
+        set_fields["skip_in_balance_count"] = True
+    if state == "paid":
+        set_fields["proof_received"] = assignment_ts
+        set_fields["proof_file"] = "free_pass"
+        set_fields["proof_admin"] = free_proof_admin
+        set_fields["proof_admin_received"] = free_proof_admin
+        set_fields["proof_accepted"] = assignment_ts
+
+    match_fields: dict[str, object] = {
+        "bot_id": bot_id,
+        "pass_key": pass_key,
+        "user_id": user_id,
+        "state": "waitlist",
+    }
+    if len(user_ids) > 1:
+        match_fields["couple"] = {"$in": user_ids}
+    set_fields["price"] = int(price)
+    if pass_type_index is not None:
+        set_fields["pass_type_index"] = {"$ifNull": ["$pass_type_index", pass_type_index]}
+        set_fields["assignment_tier_number"] = {
+            "$ifNull": ["$assignment_tier_number", pass_type_index + 1]
+        }
+    update_pipeline: list[dict[str, object]] = [{"$set": set_fields}]
+    if uncouple:
+        update_pipeline.append({"$unset": "couple"})
+    return match_fields, update_pipeline
+
+
+def _assigned_pass(
+    before: dict,
+    price: int,
+    pass_type_index: int | None,
+    skip_in_balance_count: bool = False,
+) -> dict:
+    """*before* as :func:`_assignment_write` leaves it, as far as counters go."""
+    after = {**before, "state": "paid" if price == 0 else "assigned", "price": int(price)}
+    if skip_in_balance_count:
+        after["skip_in_balance_count"] = True
+    if pass_type_index is not None and before.get("pass_type_index") is None:
+        after["pass_type_index"] = pass_type_index
+    return after
+
 
 class PassUpdate:
     base: "Passes"
@@ -57,6 +218,49 @@ class PassUpdate:
         self.user = None
         self.pass_owner_id: int | None = None
         self.pass_data: dict | None = None
+        # lookups made while rendering are batched into $in queries
+        self.user_loader: BatchLoader[int, dict] = BatchLoader(self._load_users)
+        self.pass_loader: BatchLoader[tuple[str, int], dict] = BatchLoader(self._load_passes)
+
+    async def _load_users(self, user_ids: list[int]) -> dict[int, dict]:
+        if len(user_ids) == 1:
+            user = await self.base.user_db.find_one(
+                {"user_id": user_ids[0], "bot_id": self.bot}
+            )
+            return {user_ids[0]: user} if user is not None else {}
+        return {
+            user["user_id"]: user
+            async for user in self.base.user_db.find(
+                {"user_id": {"$in": user_ids}, "bot_id": self.bot}
+            )
+        }
+
+    async def _load_passes(self, keys: list[tuple[str, int]]) -> dict[tuple[str, int], dict]:
+        uids_by_pass_key: dict[str, list[int]] = {}
+        for pass_key, user_id in keys:
+            uids_by_pass_key.setdefault(pass_key, []).append(user_id)
+
+        async def load(pass_key: str, user_ids: list[int]) -> dict[tuple[str, int], dict]:
+            if len(user_ids) == 1:
+                pass_data = await self.base.get_pass_for_user(user_ids[0], pass_key)
+                return {(pass_key, user_ids[0]): pass_data} if pass_data is not None else {}
+            docs = await self.base.pass_db.find(
+                {"bot_id": self.bot, "pass_key": pass_key, "user_id": {"$in": user_ids}}
+            ).to_list(None)
+            return {
+                (pass_key, doc["user_id"]): self.base._pass_doc_to_data(doc)
+                for doc in docs
+            }
+
+        found: dict[tuple[str, int], dict] = {}
+        for part in await gather(*(load(k, uids) for k, uids in uids_by_pass_key.items())):
+            found.update(part)
+        return found
+
+    async def _load_user(self, user):
+        if isinstance(user, int):
+            return await self.user_loader.load(user)
+        return user
 
     def _pass_localization_keys(
         self,
@@ -126,7 +330,7 @@ class PassUpdate:
         self,
         message_id: str,
         user: int | dict | None = None,
-        for_user: int | None = None,
+        for_user: int | dict | None = None,
         u_pass: dict | None = None,
         couple: int | dict | None = None,
         admin: int | dict | None = None,
@@ -137,12 +341,19 @@ class PassUpdate:
             pass_key = self.pass_key
         if user is None:
             user = self.update.user
-        if not isinstance(user, dict):
-            user = await self.base.user_db.find_one(
-                {
-                    "user_id": user,
-                    "bot_id": self.bot,
-                }
+
+        async def own_pass():
+            if isinstance(u_pass, dict):
+                return u_pass
+            if isinstance(user, dict):
+                return await self.get_pass(pass_key, user.get("user_id"))
+            return await self.get_pass(pass_key, user)
+
+        if isinstance(user, dict):
+            recipient, u_pass = await gather(self._load_user(for_user), own_pass())
+        else:
+            user, recipient, u_pass = await gather(
+                self.user_loader.load(user), self._load_user(for_user), own_pass(),
             )
         if not isinstance(user, dict):
             logger.error(
@@ -153,50 +364,43 @@ class PassUpdate:
         l = self.l  # noqa: E741
         lc = self.update.language_code
         if for_user is not None:
-            upd = await self.base.create_update_from_user(for_user)
-            l = upd.l  # noqa: E741
-            lc = upd.update.language_code
-        if not isinstance(u_pass, dict):
-            u_pass = await self.get_pass(pass_key, user.get("user_id"))
+            lc = (recipient or {}).get("language_code", "en")
+
+            def l(s, **kwargs):  # noqa: E741, E743
+                return self.base.base_app.localization(s, args=kwargs, locale=lc)
         if not isinstance(u_pass, dict):
             u_pass = {}
         keys = dict(u_pass)
-        couple_pass = None
         keys["passKey"] = pass_key
         keys.update(self.base.get_event_localization_keys(pass_key, lc))
         keys["name"] = user.get("legal_name", "")
         keys["link"] = client_user_link_html(user, language_code=lc)
         if couple is None:
             couple = u_pass.get("couple")
-        if isinstance(couple, int):
-            couple = await self.base.user_db.find_one(
-                {
-                    "user_id": couple,
-                    "bot_id": self.bot,
-                }
-            )
+        if admin is None:
+            if "proof_admin" in u_pass:
+                admin = u_pass["proof_admin"]
+        couple_id = couple.get("user_id") if isinstance(couple, dict) else couple
+
+        async def couple_pass_of():
+            if couple_id is None:
+                return None
+            return await self.get_pass(pass_key, couple_id)
+
+        couple, couple_pass, admin = await gather(
+            self._load_user(couple), couple_pass_of(), self._load_user(admin),
+        )
         if isinstance(couple, dict):
-            couple_pass = await self.get_pass(
-                pass_key, couple.get("user_id")
-            )
             keys["coupleName"] = couple.get("legal_name")
             keys["coupleRole"] = couple_pass.get("role") if isinstance(couple_pass, dict) else ""
             keys["coupleLink"] = client_user_link_html(couple, language_code=lc)
             if "type" not in keys:
                 keys["type"] = "couple"
-        elif "type" not in keys:
-            keys["type"] = "solo"
+        else:
+            couple_pass = None
+            if "type" not in keys:
+                keys["type"] = "solo"
         keys["price"] = self.base.get_pass_display_price(u_pass, couple_pass)
-        if admin is None:
-            if "proof_admin" in u_pass:
-                admin = u_pass["proof_admin"]
-        if isinstance(admin, int):
-            admin = await self.base.user_db.find_one(
-                {
-                    "user_id": admin,
-                    "bot_id": self.bot,
-                }
-            )
         if isinstance(admin, dict):
             keys.update(self.admin_to_keys(admin, lc))
         keys.update(additional_keys)
@@ -494,7 +698,10 @@ class PassUpdate:
                     updated_pass["type"] = "solo"
                 await self.base.save_pass_data(self.update.user, self.pass_key, updated_pass)
         else:
-            result = await self.base.pass_db.update_one(
+            result = await write_counted(
+                self.base.pass_db,
+                self.bot,
+                self.pass_key,
                 {
                     "bot_id": self.bot,
                     "user_id": self.update.user,
@@ -506,6 +713,7 @@ class PassUpdate:
                     "$unset": {"couple": ""},
                     "$set": {"state": "waitlist", "type": "solo"},
                 },
+                {"state": "waitlist"},
             )
             if result.modified_count > 0:
                 success = True
@@ -638,20 +846,20 @@ class PassUpdate:
                 "proof_accepted": accepted_ts,
             },
         )
-        await self.update.reply(
-            await self.format_message(
+        user_text, admin_text = await gather(
+            self.format_message(
                 "passes-payment-proof-accepted",
                 user=user_id,
                 for_user=user_id,
             ),
-            user_id,
-            parse_mode=ParseMode.HTML,
-        )
-        await self.update.edit_message_text(
-            await self.format_message(
+            self.format_message(
                 "passes-adm-payment-proof-accepted",
                 user=user_id,
             ),
+        )
+        await self.update.reply(user_text, user_id, parse_mode=ParseMode.HTML)
+        await self.update.edit_message_text(
+            admin_text,
             parse_mode=ParseMode.HTML,
             reply_markup=InlineKeyboardMarkup([]),
         )
@@ -691,20 +899,20 @@ class PassUpdate:
                 "proof_rejected": rejected_ts,
             },
         )
-        await self.update.reply(
-            await self.format_message(
+        user_text, admin_text = await gather(
+            self.format_message(
                 "passes-payment-proof-rejected",
                 user=user_id,
                 for_user=user_id,
             ),
-            user_id,
-            parse_mode=ParseMode.HTML,
-        )
-        await self.update.edit_message_text(
-            await self.format_message(
+            self.format_message(
                 "passes-adm-payment-proof-rejected",
                 user=user_id,
             ),
+        )
+        await self.update.reply(user_text, user_id, parse_mode=ParseMode.HTML)
+        await self.update.edit_message_text(
+            admin_text,
             parse_mode=ParseMode.HTML,
             reply_markup=InlineKeyboardMarkup([]),
         )
@@ -766,7 +974,10 @@ class PassUpdate:
             req["couple"] = {"$in": uids}
         req["user_id"] = {"$in": uids}
         proof_received = now_msk()
-        result = await self.base.pass_db.update_many(
+        result = await write_counted(
+            self.base.pass_db,
+            self.bot,
+            self.pass_key,
             req,
             {
                 "$set": {
@@ -777,18 +988,15 @@ class PassUpdate:
                     "proof_admin_received": assigned_proof_admin,
                 }
             },
+            {"state": "paid"},
+            many=True,
         )
         if result.modified_count <= 0:
             return
         if assigned_proof_admin in self.base.get_all_payment_admins(
             self.pass_key
         ):
-            admin = await self.base.user_db.find_one(
-                {
-                    "user_id": assigned_proof_admin,
-                    "bot_id": self.bot,
-                }
-            )
+            admin = await self.user_loader.load(assigned_proof_admin)
             lc = "ru"
             if admin is not None and "language_code" in admin:
                 lc = admin["language_code"]
@@ -801,7 +1009,8 @@ class PassUpdate:
                 await self.format_message(
                     "passes-adm-payment-proof-received",
                     user=self.update.user,
-                    for_user=admin["user_id"],
+                    for_user=admin,
+                    admin=admin,
                 ),
                 chat_id=admin["user_id"],
                 parse_mode=ParseMode.HTML,
@@ -1315,7 +1524,7 @@ class PassUpdate:
         uid = user_id or self.update.user
         if self.pass_data is not None and self.pass_owner_id == uid:
             return self.pass_data
-        pass_doc = await self.base.get_pass_for_user(uid, pass_key)
+        pass_doc = await self.pass_loader.load((pass_key, uid))
         if pass_doc is not None and uid == self.update.user:
             self.pass_data = pass_doc
             self.pass_owner_id = uid
@@ -1403,73 +1612,85 @@ class PassUpdate:
             and (ignore_date_blocks or price_subset_solo_fallback)
         )
 
-        state_by_user = {
-            uid: ("paid" if prices.get(uid, 0) == 0 else "assigned")
-            for uid in uids
-        }
         split_couple_for_free = (
             is_couple
             and any(prices.get(uid, 0) == 0 for uid in uids)
         )
         assignment_ts = now_msk()
-        update_matched_count = 0
-        have_changes = False
-        for uid in uids:
-            set_fields: dict[str, object] = {
-                "state": state_by_user.get(uid, "assigned"),
-                "date_assignment": assignment_ts,
-            }
-            if comment is not None:
-                set_fields["comment"] = comment
-            if split_couple_for_free:
-                set_fields["type"] = "solo"
-            elif type is not None:
-                set_fields["type"] = type
-            elif stale_couple_fallback and uid == self.update.user:
-                set_fields["type"] = "solo"
-            if skip_in_balance_count:
-                set_fields["skip_in_balance_count"] = True
-
-            if state_by_user.get(uid) == "paid":
-                free_proof_admin = proof_admin
-                if free_proof_admin is None:
-                    free_proof_admin = pass_data.get("proof_admin")
-                if free_proof_admin is None:
-                    free_proof_admin = self.base.pick_payment_admin(self.pass_key)
-                set_fields["proof_received"] = assignment_ts
-                set_fields["proof_file"] = "free_pass"
-                set_fields["proof_admin"] = free_proof_admin
-                set_fields["proof_admin_received"] = free_proof_admin
-                set_fields["proof_accepted"] = assignment_ts
 
-            match_fields: dict[str, object] = {
-                "bot_id": self.bot,
-                "pass_key": self.pass_key,
-                "user_id": uid,
-                "state": "waitlist",
-            }
-            if is_couple:
-                match_fields["couple"] = {"$in": uids}
-            set_fields["price"] = int(prices.get(uid, 0))
-            if (
-                resolved_pass_type_index_by_user is not None
-                and uid in resolved_pass_type_index_by_user
-            ):
-                tier_index = int(resolved_pass_type_index_by_user[uid])
-                set_fields["pass_type_index"] = {"$ifNull": ["$pass_type_index", tier_index]}
-                set_fields["assignment_tier_number"] = {
-                    "$ifNull": ["$assignment_tier_number", tier_index + 1]
+        async def assign(txn: dict) -> tuple[int, bool]:
+            update_matched_count = 0
+            have_changes = False
+            async with counted(self.base.pass_db, self.bot, self.pass_key, **txn) as moves:
+                waitlisted = {
+                    doc["user_id"]: doc
+                    for doc in await counted_passes(
+                        self.base.pass_db,
+                        {
+                            "bot_id": self.bot,
+                            "pass_key": self.pass_key,
+                            "user_id": {"$in": uids},
+                            "state": "waitlist",
+                        },
+                        **txn,
+                    )
                 }
-            update_pipeline: list[dict[str, object]] = [{"$set": set_fields}]
-            if split_couple_for_free:
-                update_pipeline.append({"$unset": "couple"})
-            elif stale_couple_fallback and uid == self.update.user:
-                update_pipeline.append({"$unset": "couple"})
-
-            result = await self.base.pass_db.update_one(match_fields, update_pipeline)
-            update_matched_count += result.matched_count
-            if result.modified_count > 0:
-                have_changes = True
+                for uid in uids:
+                    uid_price = int(prices.get(uid, 0))
+                    uncouple = split_couple_for_free or (
+                        stale_couple_fallback and uid == self.update.user
+                    )
+                    pass_type = type
+                    if split_couple_for_free or (uncouple and type is None):
+                        pass_type = "solo"
+                    free_proof_admin = None
+                    if uid_price == 0:
+                        free_proof_admin = proof_admin
+                        if free_proof_admin is None:
+                            free_proof_admin = pass_data.get("proof_admin")
+                        if free_proof_admin is None:
+                            free_proof_admin = self.base.pick_payment_admin(self.pass_key)
+                    tier_index = None
+                    if (
+                        resolved_pass_type_index_by_user is not None
+                        and uid in resolved_pass_type_index_by_user
+                    ):
+                        tier_index = int(resolved_pass_type_index_by_user[uid])
+                    match_fields, update_pipeline = _assignment_write(
+                        self.bot,
+                        self.pass_key,
+                        uid,
+                        uids,
+                        uid_price,
+                        tier_index,
+                        assignment_ts,
+                        free_proof_admin=free_proof_admin,
+                        pass_type=pass_type,
+                        uncouple=uncouple,
+                        comment=comment,
+                        skip_in_balance_count=skip_in_balance_count,
+                    )
+
+                    result = await self.base.pass_db.update_one(
+                        match_fields, update_pipeline, **txn,
+                    )
+                    update_matched_count += result.matched_count
+                    if result.modified_count > 0:
+                        have_changes = True
+                    if result.matched_count == 0:
+                        continue
+                    before = waitlisted.get(uid)
+                    if before is None:
+                        moves.recount()
+                        continue
+                    moves.move(
+                        before,
+                        _assigned_pass(before, uid_price, tier_index, skip_in_balance_count),
+                    )
+            return update_matched_count, have_changes
+
+        # a couple is assigned together or not at all
+        update_matched_count, have_changes = await run_pass_transaction(self.base.pass_db, assign)
 
         current_count = await self.base.pass_db.count_documents(
             {"bot_id": self.bot, "pass_key": self.pass_key, "user_id": {"$in": uids}}
@@ -1497,20 +1718,11 @@ class PassUpdate:
                         parse_mode=ParseMode.HTML,
                     )
             else:
-                pass_info = pass_docs_after.get(uid, pass_data)
-                logger.info(
-                    f"assigned pass to {uid}, role {pass_info.get('role')}, name {user_doc.get('legal_name', client_user_name(user_doc))}"
-                )
-                upd = await self.base.create_update_from_user(uid)
-                upd.set_pass_key(self.pass_key)
-                await upd.show_pass_edit(
+                await self.base._tell_assigned(
+                    self.pass_key,
                     user_doc,
-                    pass_info,
-                    (
-                        "passes-pass-free-assigned"
-                        if prices.get(uid, 0) == 0
-                        else "passes-pass-assigned"
-                    ),
+                    pass_docs_after.get(uid, pass_data),
+                    prices.get(uid, 0),
                 )
         return have_changes
 
@@ -1570,13 +1782,19 @@ class PassUpdate:
             upd = await self.base.create_update_from_user(pass_data["couple"])
             upd.set_pass_key(self.pass_key)
             await upd.inform_pass_cancelled()
-        delete_result = await self.base.pass_db.delete_many(
+        delete_result = await write_counted(
+            self.base.pass_db,
+            self.bot,
+            self.pass_key,
             {
                 "bot_id": self.bot,
                 "pass_key": self.pass_key,
                 "user_id": {"$in": uids},
                 "state": {"$ne": "paid"},
-            }
+            },
+            None,
+            None,
+            many=True,
         )
         return delete_result.deleted_count > 0
 
@@ -1921,27 +2139,13 @@ class PassUpdate:
         assignment_ts = now_msk()
         set_fields: dict[str, object] = {"date_assignment": assignment_ts}
         unset_fields: dict[str, str] = {}
-        have_changes = False
 
         couple_id = pass_data.get("couple")
-        if (
+        uncouple_partner = (
             pass_data.get("type") == "couple"
             and isinstance(couple_id, int)
-        ):
-            partner_result = await self.base.pass_db.update_one(
-                {
-                    "bot_id": self.bot,
-                    "pass_key": pass_key,
-                    "user_id": couple_id,
-                    "couple": user_id,
-                },
-                {
-                    "$set": {"type": "solo"},
-                    "$unset": {"couple": ""},
-                },
-            )
-            if partner_result.modified_count > 0:
-                have_changes = True
+        )
+        if uncouple_partner:
             set_fields["type"] = "solo"
             unset_fields["couple"] = ""
         if pass_type is not None:
@@ -1974,15 +2178,41 @@ class PassUpdate:
         update_doc: dict[str, object] = {"$set": set_fields}
         if len(unset_fields) > 0:
             update_doc["$unset"] = unset_fields
-        result = await self.base.pass_db.update_one(
-            {
-                "bot_id": self.bot,
-                "pass_key": pass_key,
-                "user_id": user_id,
-            },
-            update_doc,
-        )
-        return have_changes or result.modified_count > 0
+
+        async def reassign(txn: dict) -> bool:
+            have_changes = False
+            if uncouple_partner:
+                partner_result = await self.base.pass_db.update_one(
+                    {
+                        "bot_id": self.bot,
+                        "pass_key": pass_key,
+                        "user_id": couple_id,
+                        "couple": user_id,
+                    },
+                    {
+                        "$set": {"type": "solo"},
+                        "$unset": {"couple": ""},
+                    },
+                    **txn,
+                )
+                if partner_result.modified_count > 0:
+                    have_changes = True
+            result = await write_counted(
+                self.base.pass_db,
+                self.bot,
+                pass_key,
+                {
+                    "bot_id": self.bot,
+                    "pass_key": pass_key,
+                    "user_id": user_id,
+                },
+                update_doc,
+                {name: set_fields[name] for name in COUNTED_FIELDS if name in set_fields},
+                **txn,
+            )
+            return have_changes or result.modified_count > 0
+
+        return await run_pass_transaction(self.base.pass_db, reassign)
 
     async def handle_passes_tier(self):
         args_list = self.update.parse_cmd_arguments()
@@ -2138,12 +2368,17 @@ class PassUpdate:
                             logger.error(
                                 f"pass {args.pass_key=} for {recipient=} couple {partner_id} was not changed to solo"
                             )
-                result = await self.base.pass_db.delete_one(
+                result = await write_counted(
+                    self.base.pass_db,
+                    self.bot,
+                    self.pass_key,
                     {
                         "bot_id": self.bot,
                         "user_id": recipient,
                         "pass_key": self.pass_key,
-                    }
+                    },
+                    None,
+                    None,
                 )
                 if result.deleted_count <= 0:
                     logger.info(
@@ -2325,55 +2560,7 @@ class PassUpdate:
         assert pass_keys_for_this_user, (
             f"{self.update.user} is not admin for any pass key"
         )
-        import openpyxl
-        from openpyxl.styles import Font, Alignment
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Passes"
-
-        fields = {
-            "user_id": {"name": "User ID", "location": "user"},
-            "username": {"name": "Username", "location": "user"},
-            "first_name": {"name": "First Name", "location": "user"},
-            "last_name": {"name": "Last Name", "location": "user"},
-            "print_name": {"name": "Print Name", "location": "user"},
-            "legal_name": {"name": "Legal Name", "location": "user"},
-            "language_code": {"name": "Language code", "location": "user", "length": 2},
-            "pass_key": {
-                "func": lambda u, p, k: k,
-                "name": "Pass Key",
-            },
-            "state": {"name": "State", "location": "pass"},
-            "type": {"name": "Type", "location": "pass"},
-            "role": {"name": "Role", "location": "pass"},
-            "couple": {"name": "Couple", "location": "pass"},
-            "price": {"name": "Price", "location": "pass"},
-            "price_per_one": {"name": "Price per one", "location": "pass"},
-            "assignment_tier_number": {"name": "Assignment Tier", "location": "pass"},
-            "date_created": {"name": "Date Created", "location": "pass"},
-            "date_assignment": {"name": "Date Assignment", "location": "pass"},
-            "proof_admin": {"name": "Current Ambassador", "location": "pass"},
-            "proof_admin_received": {"name": "Proven By", "location": "pass"},
-            "proof_received": {"name": "Proof Received", "location": "pass"},
-            "proof_accepted": {"name": "Proof Accepted", "location": "pass"},
-            "proof_rejected": {"name": "Proof Rejected", "location": "pass"},
-            "proof_file": {"name": "Proof File ID", "location": "pass", "length": 5},
-            "skip_in_balance_count": {"name": "Skip in Balance Count", "location": "pass"},
-            "comment": {"name": "Comment", "location": "pass"},
-        }
-
-        bold = Font(bold=True)
-        center = Alignment(horizontal="center")
-        ws.append([field["name"] for field in fields.values()])
-        for cell in ws["1:1"]:
-            cell.font = bold
-            cell.alignment = center
-
-        for i, field in enumerate(fields.values()):
-            field["column_number"] = i + 1
-            field["column_letter"] = ws.cell(row=1, column=i + 1).column_letter
-
+        table = PassesTable()
         for pass_key in pass_keys_for_this_user:
             pass_docs = await self.base.pass_db.find(
                 {
@@ -2385,63 +2572,330 @@ class PassUpdate:
                 doc["user_id"]: self.base._pass_doc_to_data(doc) or {}
                 for doc in pass_docs
             }
+            users = {
+                user["user_id"]: user
+                async for user in self.base.user_db.find(
+                    {"bot_id": self.bot, "user_id": {"$in": list(pass_data_by_uid)}},
+                    USER_PROJECTION,
+                )
+            }
             for pass_doc in pass_docs:
-                user = await self.base.user_db.find_one(
-                    {"bot_id": self.bot, "user_id": pass_doc.get("user_id")}
-                ) or {}
                 pass_data = pass_data_by_uid.get(pass_doc.get("user_id"), {})
                 couple_pass = pass_data_by_uid.get(pass_data.get("couple"))
-                display_price = self.base.get_pass_display_price(pass_data, couple_pass)
-                row = []
-                for field, info in fields.items():
-                    if field == "price":
-                        row.append(display_price)
-                    elif field == "price_per_one":
-                        row.append(pass_data.get("price", ""))
-                    elif (
-                        field == "proof_admin_received"
-                        and pass_data.get(field) in [None, ""]
-                        and pass_data.get("state") == "paid"
-                    ):
-                        row.append(pass_data.get("proof_admin", ""))
-                    elif field == "date_created":
-                        created_at = pass_data.get(field, "")
-                        if isinstance(created_at, datetime):
-                            row.append(created_at.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
-                        else:
-                            row.append(created_at)
-                    elif "func" in info:
-                        row.append(info["func"](user, pass_data, pass_key))
-                    elif info["location"] == "user":
-                        row.append(user.get(field, ""))
-                    elif info["location"] == "pass":
-                        row.append(pass_data.get(field, ""))
-                ws.append(row)
-        ws.freeze_panes = "A2"
-        ws.auto_filter.ref = ws.dimensions
-        ws.auto_filter.add_sort_condition(fields["date_created"]["column_letter"] + "2:" + fields["date_created"]["column_letter"] + str(ws.max_row))
-        for i, field in enumerate(fields.values()):
-            if "length" in field:
-                ws.column_dimensions[field["column_letter"]].width = field["length"]
-            else: # auto width
-                max_length = max(
-                    len(str(cell.value)) if cell.value is not None else 0
-                    for cell in ws[field["column_letter"]]
+                table.add(
+                    pass_key,
+                    users.get(pass_doc.get("user_id"), {}),
+                    pass_data,
+                    self.base.get_pass_display_price(pass_data, couple_pass),
                 )
-                ws.column_dimensions[field["column_letter"]].width = max(max_length, 3)
 
-        wb.save("passes.xlsx")
         await self.update.bot.send_document(
             self.update.user,
-            open("passes.xlsx", "rb"),
+            InputFile(io.BytesIO(await table.render()), filename="passes.xlsx"),
             caption="Passes table",
         )
-        import os
-        os.remove("passes.xlsx")
+
+
+class WaitlistQueues:
+    """The waitlist of one pass_key split by role, in sign-up order.
+
+    Used by ``Passes.recalculate_queues_pk`` to avoid re-downloading the
+    whole waitlist after every assignment.
+    """
+
+    def __init__(self, docs: list[dict]):
+        self._queues: dict[str, OrderedDict[int, dict]] = {
+            "leader": OrderedDict(),
+            "follower": OrderedDict(),
+        }
+        self.known: set[int] = set()  # every user ever added
+        self.newest: datetime | None = None  # the latest date_created added
+        self.add(docs)
+
+    def __bool__(self) -> bool:
+        return any(self._queues.values())
+
+    def add(self, docs: list[dict]) -> None:
+        """Appends *docs*, sorted by sign-up, to the queues of their roles."""
+        for doc in docs:
+            self.known.add(doc["user_id"])
+            created = doc.get("date_created")
+            if isinstance(created, datetime) and (self.newest is None or created > self.newest):
+                self.newest = created
+            queue = self._queues.get(doc.get("role"))
+            if queue is not None:
+                queue[doc["user_id"]] = doc
+
+    def get(self, user_id: int) -> dict | None:
+        for queue in self._queues.values():
+            doc = queue.get(user_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def remove(self, user_ids) -> None:
+        for queue in self._queues.values():
+            for user_id in user_ids:
+                queue.pop(user_id, None)
+
+    def top(self, role: str) -> dict | None:
+        queue = self._queues[role]
+        if not queue:
+            return None
+        return next(iter(queue.values()))
+
+    def first_solo(self, role: str) -> dict | None:
+        for doc in self._queues[role].values():
+            if "couple" not in doc:
+                return doc
+        return None
+
+    def refresh(self, user_ids: set[int], waiting: dict[int, dict]) -> bool:
+        """Applies fresh docs of *user_ids*; missing ones have left the waitlist."""
+        dropped = False
+        for role, queue in self._queues.items():
+            for user_id in user_ids:
+                if user_id not in queue:
+                    continue
+                doc = waiting.get(user_id)
+                if doc is None or doc.get("role") != role:
+                    del queue[user_id]
+                    dropped = True
+                else:
+                    queue[user_id] = doc
+        return dropped
+
+
+class PlannedAssignment:
+    """A candidate of a :class:`QueuePlan` with the waitlisted passes it
+    takes, its couple's included, as they were read."""
+
+    def __init__(
+        self,
+        candidate: dict,
+        passes: dict[int, dict],
+        prices: dict[int, int],
+        pass_type_indexes: dict[int, int],
+        allow_promo: bool,
+    ):
+        self.candidate = candidate
+        self.passes = passes
+        self.prices = prices
+        self.pass_type_indexes = pass_type_indexes
+        self.allow_promo = allow_promo
+        self.user_ids = sorted(prices)
+
+    def assigned(self, user_id: int) -> dict:
+        return _assigned_pass(
+            self.passes[user_id], self.prices[user_id], self.pass_type_indexes.get(user_id),
+        )
+
+
+class QueuePlan:
+    """Assignments of a ``Passes._assign_queue_pk`` round, decided in memory.
+
+    While the plan is current (see :data:`queue_plan`),
+    ``Passes._assign_wl_candidate`` stages its candidates here instead of
+    writing them: they leave :attr:`queues` and :attr:`stats` counts them
+    as assigned, so the rule cascade goes on without a round trip.
+    ``Passes._write_queue_plan`` writes the plan in one bulk write.
+    """
+
+    def __init__(self, pass_key: str, queues: WaitlistQueues, stats: dict[str, object]):
+        self.pass_key = pass_key
+        self.queues = queues
+        self.stats = stats
+        self.assignments: list[PlannedAssignment] = []
+
+    def stage(self, assignment: PlannedAssignment) -> None:
+        self.assignments.append(assignment)
+        for user_id in assignment.user_ids:
+            self._count(assignment.passes[user_id], -1)
+            self._count(assignment.assigned(user_id), 1)
+        self.queues.remove(assignment.user_ids)
+
+    def _count(self, doc: dict, n: int) -> None:
+        """Moves *doc* by *n* in :attr:`stats`, the way ``Passes._stats_from_facets`` counts it."""
+        stats = self.stats
+        for path in counter_paths(doc):
+            section, group, role = path.split(".")
+            known_role = role in ("leader", "follower")
+            if section == "balance" and known_role:
+                role_counts = stats.setdefault("role_counts", {}).setdefault(role, {})
+                role_counts[group] = role_counts.get(group, 0) + n
+                if group in SOLD_STATES:
+                    role_counts["RA"] = role_counts.get("RA", 0) + n
+            elif section == "state" and known_role and group in QUEUE_STATES:
+                full_counts = stats.setdefault("full_role_counts", {}).setdefault(role, {})
+                full_counts[group] = full_counts.get(group, 0) + n
+            elif section == "sold":
+                stats["participants_total"] = int(stats.get("participants_total", 0)) + n
+                tier = None if group == "none" else int(group)
+                if tier is not None:
+                    usage = stats.setdefault("tier_usage_total", {})
+                    usage[tier] = usage.get(tier, 0) + n
+                if known_role:
+                    by_role = stats.setdefault("participants_by_role", {})
+                    by_role[role] = by_role.get(role, 0) + n
+                    if tier is not None:
+                        usage = stats.setdefault("tier_usage_by_role", {}).setdefault(role, {})
+                        usage[tier] = usage.get(tier, 0) + n
+
+
+# the plan of the queue round running in this task, if any
+queue_plan: ContextVar[QueuePlan | None] = ContextVar("queue_plan", default=None)
+
+
+class PassTimeouts:
+    """Payment and invitation timeouts of passes, fired when they are due.
+
+    Due instants are computed from the pass fields (see :meth:`due`) and kept
+    in a min-heap. :meth:`mark_dirty` makes :meth:`run` reload a pass key
+    through *load*, an entry whose due instant changed in the meantime is
+    skipped when popped. *fire* gets ``(user_id, pass_key, action)`` and is
+    expected to re-check the pass before acting. A fired timeout is not
+    fired again for the same instant until the next :meth:`reconcile`.
+    """
+
+    FIELDS = frozenset((
+        "state",
+        "date_assignment",
+        "date_created",
+        "notified_deadline_close",
+        "notified_deadline_close2",
+    ))
+    STATES = ("assigned", "waiting-for-couple")
+
+    def __init__(
+            self,
+            load: Callable[[str], Awaitable[list[dict]]],
+            fire: Callable[[int, str, str], Awaitable[None]],
+        ):
+        self.load = load
+        self.fire = fire
+        self._heap: list[tuple[datetime, int, int, str, str]] = []
+        self._due: dict[str, dict[tuple[int, str], datetime]] = {}
+        self._fired: dict[str, dict[tuple[int, str], datetime]] = {}
+        self._dirty: set[str] = set()
+        self._seq = count()
+        self._changed = Event()
+
+    @staticmethod
+    def due(doc: dict) -> dict[str, datetime]:
+        """Timeout actions of a pass document and when they are due."""
+        state = doc.get("state")
+        if state == "waiting-for-couple":
+            if isinstance(doc.get("date_created"), datetime):
+                return {"invitation": doc["date_created"] + INVITATION_TIMEOUT}
+            return {}
+        if state != "assigned":
+            return {}
+        notified = doc.get("notified_deadline_close")
+        if not isinstance(notified, datetime):
+            if isinstance(doc.get("date_assignment"), datetime):
+                return {"notify": doc["date_assignment"] + PAYMENT_TIMEOUT_NOTIFY}
+            return {}
+        result = {"cancel": notified + PAYMENT_TIMEOUT - PAYMENT_TIMEOUT_NOTIFY}
+        if "notified_deadline_close2" not in doc:
+            result["notify2"] = notified + PAYMENT_TIMEOUT_NOTIFY2 - PAYMENT_TIMEOUT_NOTIFY
+        return result
+
+    def replace(self, pass_key: str, docs: list[dict]):
+        """Replaces the timeouts of *pass_key* with the ones of *docs*."""
+        fresh = {
+            (doc["user_id"], action): due
+            for doc in docs
+            for action, due in self.due(doc).items()
+        }
+        current = self._due.get(pass_key, {})
+        fired = self._fired.setdefault(pass_key, {})
+        for entry in list(fired):
+            if fresh.get(entry) != fired[entry]:
+                del fired[entry]
+        for entry, due in list(fresh.items()):
+            if fired.get(entry) == due:
+                del fresh[entry]
+            elif current.get(entry) != due:
+                heappush(self._heap, (due, next(self._seq), entry[0], pass_key, entry[1]))
+        self._due[pass_key] = fresh
+
+    def mark_dirty(self, pass_key: str):
+        self._dirty.add(pass_key)
+        self._changed.set()
+
+    async def reconcile(self, pass_keys: list[str]):
+        """Reloads every pass key, one query each."""
+        for pass_key in pass_keys:
+            self._dirty.discard(pass_key)
+            self._fired.pop(pass_key, None)
+            self.replace(pass_key, await self.load(pass_key))
+        self._changed.set()
+
+    async def run(self):
+        while True:
+            try:
+                self._changed.clear()
+                while self._dirty:
+                    pass_key = self._dirty.pop()
+                    self.replace(pass_key, await self.load(pass_key))
+                if not self._heap:
+                    await self._changed.wait()
+                    continue
+                delay = (self._heap[0][0] - now_msk()).total_seconds()
+                if delay > 0:
+                    with suppress(TimeoutError):
+                        await wait_for(self._changed.wait(), delay)
+                    continue
+                due, _, user_id, pass_key, action = heappop(self._heap)
+                entries = self._due.get(pass_key, {})
+                if entries.get((user_id, action)) != due:
+                    continue
+                del entries[(user_id, action)]
+                self._fired.setdefault(pass_key, {})[(user_id, action)] = due
+                create_task(self._fire(user_id, pass_key, action))
+            except Exception as e:
+                logger.error(f"error in PassTimeouts: {e}", exc_info=1)
+
+    async def _fire(self, user_id: int, pass_key: str, action: str):
+        try:
+            await self.fire(user_id, pass_key, action)
+        except Exception as e:
+            logger.error(
+                f"pass timeout {action} for {user_id} in {pass_key} failed: {e}",
+                exc_info=1,
+            )
 
 
 class Passes(BasePlugin):
     name = "passes"
+    commands = {
+        "passes": "handle_start",
+        "passes_assign": "handle_passes_assign_cmd",
+        "passes_cancel": "handle_passes_cancel_cmd",
+        "passes_tier": "handle_passes_tier_cmd",
+        "passes_switch_to_me": "handle_passes_switch_to_me_cmd",
+        "passes_uncouple": "handle_passes_uncouple_cmd",
+        "passes_table": "handle_passes_table_cmd",
+        "legal_name": "handle_name_cmd",
+        "passport": "handle_passport_data_cmd",
+        "role": "handle_role_cmd",
+    }
+    callback_prefix = "passes"
+    # percent of higher_role/total; the queue simulator tries other values
+    role_balance_tolerance = ROLE_BALANCE_TOLERANCE
+    indexes = (
+        IndexSpec(
+            "passes_collection",
+            [("bot_id", 1), ("pass_key", 1), ("state", 1), ("date_created", 1), ("user_id", 1)],
+            probe={"bot_id": 0, "pass_key": "", "state": "waitlist"},
+            probe_sort=[("date_created", 1), ("user_id", 1)],
+        ),
+        IndexSpec(
+            "passes_collection",
+            [("user_id", 1), ("bot_id", 1), ("pass_key", 1)],
+            probe={"user_id": 0, "bot_id": 0, "pass_key": ""},
+        ),
+    )
 
     def __init__(self, base_app):
         super().__init__(base_app)
@@ -2455,24 +2909,22 @@ class Passes(BasePlugin):
         self.pass_db: AgnosticCollection = base_app.passes_collection
         self.refresh_events_cache()
         self.user_db: AgnosticCollection = base_app.users_collection
-        self._command_checkers = [
-            CommandHandler(self.name, self.handle_start),
-            CommandHandler("passes_assign", self.handle_passes_assign_cmd),
-            CommandHandler("passes_cancel", self.handle_passes_cancel_cmd),
-            CommandHandler("passes_tier", self.handle_passes_tier_cmd),
-            CommandHandler("passes_switch_to_me", self.handle_passes_switch_to_me_cmd),
-            CommandHandler("passes_uncouple", self.handle_passes_uncouple_cmd),
-            CommandHandler("passes_table", self.handle_passes_table_cmd),
-            CommandHandler("legal_name", self.handle_name_cmd),
-            CommandHandler("passport", self.handle_passport_data_cmd),
-            CommandHandler("role", self.handle_role_cmd),
-        ]
-        self._cbq_handler = CallbackQueryHandler(
-            self.handle_callback_query, pattern=f"^{self.name}\\|.*"
-        )
-        self._queue_lock = Lock()
-        self._queue_recalc_pending = False
+        self._queue_locks: dict[str, Lock] = {}
+        self._queue_notify_locks: dict[str, Lock] = {}
+        self._queue_recalc_pending: set[str] = set()
+        # pass keys whose queues changed since the last debounced recalculation,
+        # None for "can't tell which"
+        self._queue_dirty: set[str | None] = set()
+        self._queue_dirty_event = Event()
+        self._hype_thread_pending = Event()
+        self.timeouts = PassTimeouts(self._load_pass_timeouts, self._fire_pass_timeout)
+        if isinstance(self.pass_db, VersionedPassesCollection):
+            self.pass_db.on_change(self.mark_queue_dirty)
+            self.pass_db.on_change(self._pass_timeouts_changed, PassTimeouts.FIELDS)
         create_task(self._timeout_processor())
+        create_task(self._counters_reconciler())
+        create_task(self._queue_recalc_worker())
+        create_task(self._hype_thread_publisher())
 
     def refresh_events_cache(self) -> None:
         active_events: list[EventInfo] = list(self.events.active_events(now_msk()))
@@ -2623,13 +3075,12 @@ class Passes(BasePlugin):
     ) -> int:
         return role_counts.get(role, {}).get("RA", 0)
 
-    @staticmethod
-    def _is_within_balance_tolerance(leader_count: int, follower_count: int) -> bool:
+    def _is_within_balance_tolerance(self, leader_count: int, follower_count: int) -> bool:
         total = leader_count + follower_count
         if total <= 1:
             return True
         higher_role = max(leader_count, follower_count)
-        return higher_role * 100 <= ROLE_BALANCE_TOLERANCE * total
+        return higher_role * 100 <= self.role_balance_tolerance * total
 
     def _can_assign_with_balance(
         self,
@@ -2679,9 +3130,7 @@ class Passes(BasePlugin):
         tier_index: int,
         assignment_rule: str,
     ) -> int:
-        if assignment_rule == "paired":
-            return sum(pass_type.amount // 2 for pass_type in pass_types[:tier_index])
-        return sum(pass_type.amount for pass_type in pass_types[:tier_index])
+        return PassTypes.of(pass_types).prior_capacity(tier_index, assignment_rule)
 
     @staticmethod
     def _tier_capacity_for_rule(
@@ -2837,19 +3286,9 @@ class Passes(BasePlugin):
         *,
         pass_types: tuple[EventPassType, ...],
     ) -> int | None:
-        now = now_msk()
-        floor_index: int | None = None
-        first_assignable: int | None = None
-        for tier_index, pass_type in enumerate(pass_types):
-            # Keep promo tiers in the scan so that blocked promo tiers
-            # can still stop automatic couple assignments.
-            if first_assignable is None:
-                first_assignable = tier_index
-            if pass_type.start <= now:
-                floor_index = tier_index
-        if floor_index is not None:
-            return floor_index
-        return first_assignable
+        # Promo tiers count too, so that blocked promo tiers can still stop
+        # automatic couple assignments.
+        return PassTypes.of(pass_types).time_floor(now_msk())
 
     @staticmethod
     def _tier_is_date_blocked(pass_type: EventPassType, reference_time) -> bool:
@@ -3006,69 +3445,60 @@ class Passes(BasePlugin):
         return role_counts, max_assigned
 
     async def _collect_queue_stats(self, pass_key: str) -> dict[str, object]:
-        aggregation = await self.pass_db.aggregate(
-            [
-                {
-                    "$match": {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "$and": [self._balance_counter_match()],
-                    },
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "state": "$state",
-                            "role": "$role",
-                        },
-                        "count": {"$count": {}},
-                    }
-                },
-            ]
-        ).to_list(None)
-        role_counts, _ = self._role_counts_from_aggregation(aggregation)
-        full_aggregation = await self.pass_db.aggregate(
-            [
-                {
-                    "$match": {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "state": {"$in": ["waitlist", "assigned", "paid"]},
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "state": "$state",
-                            "role": "$role",
-                        },
-                        "count": {"$count": {}},
-                    }
-                },
-            ]
+        cache = getattr(self.pass_db, "stats_cache", None)
+        if not isinstance(cache, QueueStatsCache):
+            return await self._aggregate_queue_stats(pass_key)
+        stats = cache.get(pass_key)
+        if stats is None:
+            version = cache.version(pass_key)
+            stats = await self._aggregate_queue_stats(pass_key)
+            cache.put(pass_key, version, stats)
+        return stats
+
+    def _queue_stats_pipeline(self, pass_key: str) -> list[dict[str, object]]:
+        def count_by(*fields: str) -> dict[str, object]:
+            return {
+                "$group": {
+                    "_id": {field: f"${field}" for field in fields},
+                    "count": {"$count": {}},
+                }
+            }
+
+        return [
+            {"$match": {"bot_id": self.bot.id, "pass_key": pass_key}},
+            {
+                "$facet": {
+                    "balance": [
+                        {"$match": self._balance_counter_match()},
+                        count_by("state", "role"),
+                    ],
+                    "full": [
+                        {"$match": {"state": {"$in": ["waitlist", "assigned", "paid"]}}},
+                        count_by("state", "role"),
+                    ],
+                    "sold": [
+                        {"$match": {"state": {"$in": ["assigned", "paid"]}}},
+                        count_by("role", "pass_type_index"),
+                    ],
+                }
+            },
+        ]
+
+    async def _aggregate_queue_stats(self, pass_key: str) -> dict[str, object]:
+        counters = getattr(self.pass_db, "counters", None)
+        if isinstance(counters, PassCounters):
+            counters_doc = await counters.get(self.bot.id, pass_key)
+            if counters_doc is not None:
+                return self._stats_from_facets(counters_to_facets(counters_doc))
+        facets = await self.pass_db.aggregate(
+            self._queue_stats_pipeline(pass_key)
         ).to_list(None)
-        full_role_counts, _ = self._role_counts_from_aggregation(full_aggregation)
+        return self._stats_from_facets(facets[0] if facets else {})
 
-        sold_aggregation = await self.pass_db.aggregate(
-            [
-                {
-                    "$match": {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "state": {"$in": ["assigned", "paid"]},
-                    },
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "role": "$role",
-                            "pass_type_index": "$pass_type_index",
-                        },
-                        "count": {"$count": {}},
-                    }
-                },
-            ]
-        ).to_list(None)
+    def _stats_from_facets(self, facets: dict[str, list]) -> dict[str, object]:
+        role_counts, _ = self._role_counts_from_aggregation(facets.get("balance", []))
+        full_role_counts, _ = self._role_counts_from_aggregation(facets.get("full", []))
+        sold_aggregation = facets.get("sold", [])
         participants_total = 0
         participants_by_role: dict[str, int] = {"leader": 0, "follower": 0}
         tier_usage_total: dict[int, int] = {}
@@ -3700,9 +4130,13 @@ class Passes(BasePlugin):
         doc["user_id"] = user_id
         doc["pass_key"] = pass_key
         doc["bot_id"] = self.bot.id
-        await self.pass_db.update_one(
+        await write_counted(
+            self.pass_db,
+            self.bot.id,
+            pass_key,
             {"bot_id": self.bot.id, "user_id": user_id, "pass_key": pass_key},
             {"$set": doc},
+            {name: doc[name] for name in COUNTED_FIELDS if name in doc},
             upsert=True,
         )
 
@@ -3740,27 +4174,53 @@ class Passes(BasePlugin):
             update.setdefault("$unset", {})
             for field in unset_fields:
                 update["$unset"][field] = ""
-        if update:
-            for uid in user_ids:
-                await self.pass_db.update_one(
-                    {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "user_id": uid,
-                    },
-                    update,
+        if not update:
+            return
+        # only writes to the counted fields need to tell the counters
+        changes = {
+            name: value for name, value in (set_fields or {}).items() if name in COUNTED_FIELDS
+        }
+        changes.update((name, None) for name in unset_fields or [] if name in COUNTED_FIELDS)
+        query = {"bot_id": self.bot.id, "pass_key": pass_key}
+        if len(set(user_ids)) > 1:
+            query_many = {**query, "user_id": {"$in": list(user_ids)}}
+            if changes:
+                result = await write_counted(
+                    self.pass_db, self.bot.id, pass_key, query_many, update, changes, many=True,
+                )
+            else:
+                result = await self.pass_db.update_many(query_many, update)
+            if result.matched_count >= len(set(user_ids)):
+                return
+        # single pass, or some passes don't exist yet and are created here
+        for uid in user_ids:
+            if changes:
+                await write_counted(
+                    self.pass_db, self.bot.id, pass_key, {**query, "user_id": uid}, update, changes,
                     upsert=True,
                 )
+                continue
+            await self.pass_db.update_one(
+                {**query, "user_id": uid},
+                update,
+                upsert=True,
+            )
 
     async def delete_passes(self, user_ids: list[int], pass_key: str) -> None:
         if not user_ids:
             return
-        await self.pass_db.delete_many(
+        await write_counted(
+            self.pass_db,
+            self.bot.id,
+            pass_key,
             {
                 "bot_id": self.bot.id,
                 "pass_key": pass_key,
                 "user_id": {"$in": user_ids},
-            }
+            },
+            None,
+            None,
+            many=True,
         )
 
     def get_all_payment_admins(self, pass_key: str) -> list[int]:
@@ -3818,45 +4278,157 @@ class Passes(BasePlugin):
             query["state"] = {"$in": states}
         return await self.pass_db.find(query).to_list(None)
 
-    async def _timeout_processor(self) -> None:
-        bot_started: Event = self.base_app.bot_started
-        await bot_started.wait()
-        self.refresh_events_cache()
-        logger.info("timeout processor started")
-        migration_result = await self.pass_db.update_many(
+    async def _counters_reconciler(self) -> None:
+        counters = getattr(self.pass_db, "counters", None)
+        if not isinstance(counters, PassCounters):
+            return
+        await self.base_app.bot_started.wait()
+        while True:
+            for pass_key in self.all_pass_keys():
+                try:
+                    if not await counters.reconcile(self.bot.id, pass_key):
+                        logger.info(
+                            "pass counters for %s changed while reconciling, retry later",
+                            pass_key,
+                        )
+                except Exception as e:
+                    logger.error(
+                        "Exception in Passes._counters_reconciler for %s: %s",
+                        pass_key, e, exc_info=1,
+                    )
+            await sleep(COUNTERS_RECONCILE_INTERVAL)
+
+    async def backfill_proof_admins(self, pass_key: str) -> int:
+        """Assigns a random payment admin to passes of *pass_key* that have none.
+
+        Passes are grouped by the admin picked for them, one update per admin.
+        """
+        uids_by_admin: dict[int, list[int]] = {}
+        async for pass_doc in self.pass_db.find(
             {
                 "bot_id": self.bot.id,
-                "state": "payed",
+                "pass_key": pass_key,
+                "proof_admin": {"$exists": False},
             },
-            {"$set": {"state": "paid"}},
-        )
-        if migration_result.modified_count:
-            logger.info(
-                "Migrated %s passes from payed to paid",
-                migration_result.modified_count,
-            )
-        # await self.migrate_embedded_passes()
-        for pass_key in self.pass_keys:
-            async for pass_doc in self.pass_db.find(
+            {"user_id": 1},
+        ):
+            admin = self.pick_payment_admin(pass_key)
+            uids_by_admin.setdefault(admin, []).append(pass_doc["user_id"])
+        updated = 0
+        for admin, uids in uids_by_admin.items():
+            result = await self.pass_db.update_many(
                 {
                     "bot_id": self.bot.id,
                     "pass_key": pass_key,
+                    "user_id": {"$in": uids},
                     "proof_admin": {"$exists": False},
+                },
+                {"$set": {"proof_admin": admin}},
+            )
+            updated += result.modified_count
+        return updated
+
+    async def passport_reminder_candidates(self, pass_key: str) -> list[int]:
+        """Holders of assigned or paid passes with no passport data who weren't reminded yet."""
+        docs = await self.pass_db.aggregate([
+            {
+                "$match": {
+                    "bot_id": self.bot.id,
+                    "pass_key": pass_key,
+                    "state": {"$in": ["assigned", "paid"]},
                 }
-            ):
+            },
+            {
+                "$lookup": {
+                    "from": self.user_db.name,
+                    "localField": "user_id",
+                    "foreignField": "user_id",
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "bot_id": self.bot.id,
+                                "passport_number": {"$exists": False},
+                                "notified_passport_data_required": {"$exists": False},
+                            }
+                        },
+                        {"$project": {"_id": 1}},
+                    ],
+                    "as": "user",
+                }
+            },
+            {"$match": {"user": {"$ne": []}}},
+            {"$project": {"_id": 0, "user_id": 1}},
+        ]).to_list(None)
+        return list(dict.fromkeys(doc["user_id"] for doc in docs))
+
+    async def remind_passport_data(self, pass_key: str) -> list[int]:
+        """Asks pass holders of *pass_key* for their passport data, once per user."""
+        limit = Semaphore(PASSPORT_REMINDER_CONCURRENCY)
+        notified: list[int] = []
+
+        async def remind(user_id: int) -> None:
+            async with limit:
                 try:
-                    new_admin = self.pick_payment_admin(pass_key)
-                    await self.update_pass_fields(
-                        [pass_doc["user_id"]],
-                        pass_key,
-                        set_fields={"proof_admin": new_admin},
-                    )
+                    upd = await self.create_update_from_user(user_id)
+                    upd.set_pass_key(pass_key)
+                    await upd.require_passport_data()
+                    notified.append(user_id)
                 except Exception as e:
                     logger.error(
-                        "Exception in Passes._timeout_processor setting initial proof_admin "+
-                        f"for user {pass_doc['user_id']}, pass {pass_key}: {e}",
+                        "Exception in Passes._timeout_processor passport notification "+
+                        f"for user {user_id}: {e}",
                         exc_info=1,
                     )
+
+        await gather(*(remind(uid) for uid in await self.passport_reminder_candidates(pass_key)))
+        if notified:
+            await self.user_db.update_many(
+                {
+                    "bot_id": self.bot.id,
+                    "user_id": {"$in": notified},
+                    "passport_number": {"$exists": False},
+                    "notified_passport_data_required": {"$exists": False},
+                },
+                {"$set": {"notified_passport_data_required": True}},
+            )
+        return notified
+
+    async def _timeout_processor(self) -> None:
+        send_priority.set(SEND_BULK)
+        bot_started: Event = self.base_app.bot_started
+        await bot_started.wait()
+        self.refresh_events_cache()
+        logger.info("timeout processor started")
+        migrated = 0
+        for pass_key in await self.pass_db.distinct(
+            "pass_key", {"bot_id": self.bot.id, "state": "payed"},
+        ):
+            migration_result = await write_counted(
+                self.pass_db,
+                self.bot.id,
+                pass_key,
+                {
+                    "bot_id": self.bot.id,
+                    "pass_key": pass_key,
+                    "state": "payed",
+                },
+                {"$set": {"state": "paid"}},
+                {"state": "paid"},
+                many=True,
+            )
+            migrated += migration_result.modified_count
+        if migrated:
+            logger.info("Migrated %s passes from payed to paid", migrated)
+        # await self.migrate_embedded_passes()
+        for pass_key in self.pass_keys:
+            try:
+                await self.backfill_proof_admins(pass_key)
+            except Exception as e:
+                logger.error(
+                    "Exception in Passes._timeout_processor setting initial proof_admin "+
+                    f"for pass {pass_key}: {e}",
+                    exc_info=1,
+                )
         processed_waiting: set[int] = set()
         for pass_key in self.pass_keys:
             all_payment_admins = self.get_all_payment_admins(pass_key)
@@ -3924,121 +4496,33 @@ class Passes(BasePlugin):
             event = self.get_event(pass_key)
             if event is None or not event.require_passport:
                 continue
-            async for pass_doc in self.pass_db.find(
-                {
-                    "bot_id": self.bot.id,
-                    "pass_key": pass_key,
-                    "state": {"$in": ["assigned", "paid"]},
-                }
-            ):
-                try:
-                    user = await self.user_db.find_one(
-                        {
-                            "bot_id": self.bot.id,
-                            "user_id": pass_doc["user_id"],
-                            "passport_number": {"$exists": False},
-                            "notified_passport_data_required": {"$exists": False},
-                        }
-                    )
-                    if user is None:
-                        continue
-                    upd = await self.create_update_from_user(pass_doc["user_id"])
-                    upd.set_pass_key(pass_key)
-                    await upd.require_passport_data()
-                    await self.user_db.update_one(
-                        {
-                            "bot_id": self.bot.id,
-                            "user_id": pass_doc["user_id"],
-                            "passport_number": {"$exists": False},
-                            "notified_passport_data_required": {"$exists": False},
-                        },
-                        {
-                            "$set": {
-                                "notified_passport_data_required": True
-                            }
-                        }
-                    )
-                except Exception as e:
-                    logger.error(
-                        "Exception in Passes._timeout_processor passport notification "+
-                        f"for user {pass_doc['user_id']}: {e}",
-                        exc_info=1,
-                    )
+            try:
+                await self.remind_passport_data(pass_key)
+            except Exception as e:
+                logger.error(
+                    "Exception in Passes._timeout_processor passport notification "+
+                    f"for {pass_key}: {e}",
+                    exc_info=1,
+                )
 
+        try:
+            await self.timeouts.reconcile(self.pass_keys)
+        except Exception as e:
+            logger.error(
+                "Exception in Passes._timeout_processor timeouts %s", e, exc_info=1
+            )
+        create_task(self.timeouts.run())
         await self.recalculate_queues()
         while True:
+            await sleep(TIMEOUT_PROCESSOR_TICK)
             self.refresh_events_cache()
-            if len(self.pass_keys) == 0:
-                await sleep(TIMEOUT_PROCESSOR_TICK)
-                continue
-            for pass_key in self.pass_keys:
-                try:
-                    await sleep(TIMEOUT_PROCESSOR_TICK)
-                    async for pass_doc in self.pass_db.find(
-                        {
-                            "bot_id": self.bot.id,
-                            "pass_key": pass_key,
-                            "state": "assigned",
-                            "notified_deadline_close": {
-                                "$lt": now_msk()
-                                - PAYMENT_TIMEOUT
-                                + PAYMENT_TIMEOUT_NOTIFY,
-                            },
-                        }
-                    ):
-                        upd = await self.create_update_from_user(pass_doc["user_id"])
-                        await upd.cancel_due_deadline(pass_key)
-                    async for pass_doc in self.pass_db.find(
-                        {
-                            "bot_id": self.bot.id,
-                            "pass_key": pass_key,
-                            "state": "waiting-for-couple",
-                            "date_created": {
-                                "$lt": now_msk() - INVITATION_TIMEOUT,
-                            },
-                        }
-                    ):
-                        upd = await self.create_update_from_user(pass_doc["user_id"])
-                        await upd.decline_due_deadline(pass_key)
-                        if "couple" in pass_doc:
-                            upd_c = await self.create_update_from_user(
-                                pass_doc["couple"]
-                            )
-                            await upd_c.decline_invitation_due_deadline(pass_key)
-                    async for pass_doc in self.pass_db.find(
-                        {
-                            "bot_id": self.bot.id,
-                            "pass_key": pass_key,
-                            "state": "assigned",
-                            "date_assignment": {
-                                "$lt": now_msk() - PAYMENT_TIMEOUT_NOTIFY,
-                            },
-                            "notified_deadline_close": {"$exists": False},
-                        }
-                    ):
-                        upd = await self.create_update_from_user(pass_doc["user_id"])
-                        upd.set_pass_key(pass_key)
-                        await upd.notify_deadline_close()
-                    async for pass_doc in self.pass_db.find(
-                        {
-                            "bot_id": self.bot.id,
-                            "pass_key": pass_key,
-                            "state": "assigned",
-                            "notified_deadline_close": {
-                                "$lt": now_msk()
-                                - PAYMENT_TIMEOUT_NOTIFY2
-                                + PAYMENT_TIMEOUT_NOTIFY,
-                            },
-                            "notified_deadline_close2": {"$exists": False},
-                        }
-                    ):
-                        upd = await self.create_update_from_user(pass_doc["user_id"])
-                        upd.set_pass_key(pass_key)
-                        await upd.notify_deadline_close("2")
-                except Exception as e:
-                    logger.error(
-                        "Exception in Passes._timeout_processor %s", e, exc_info=1
-                    )
+            try:
+                # safety net: timeouts are kept current through pass changes
+                await self.timeouts.reconcile(self.pass_keys)
+            except Exception as e:
+                logger.error(
+                    "Exception in Passes._timeout_processor timeouts %s", e, exc_info=1
+                )
             try:
                 await self.recalculate_queues()
             except Exception as e:
@@ -4048,27 +4532,127 @@ class Passes(BasePlugin):
                     exc_info=1,
                 )
 
+    def _pass_timeouts_changed(self, pass_key: str | None) -> None:
+        for key in self.pass_keys if pass_key is None else [pass_key]:
+            if key in self.pass_keys:
+                self.timeouts.mark_dirty(key)
+
+    async def _load_pass_timeouts(self, pass_key: str) -> list[dict]:
+        return await self.pass_db.find(
+            {
+                "bot_id": self.bot.id,
+                "pass_key": pass_key,
+                "state": {"$in": list(PassTimeouts.STATES)},
+            },
+            {"user_id": 1, **{field: 1 for field in PassTimeouts.FIELDS}},
+        ).to_list(None)
+
+    async def _fire_pass_timeout(self, user_id: int, pass_key: str, action: str) -> None:
+        pass_doc = await self.pass_db.find_one(
+            {"bot_id": self.bot.id, "pass_key": pass_key, "user_id": user_id}
+        )
+        if pass_doc is None:
+            return
+        due = PassTimeouts.due(pass_doc).get(action)
+        if due is None:
+            return
+        if due > now_msk():
+            self.timeouts.mark_dirty(pass_key)
+            return
+        upd = await self.create_update_from_user(user_id)
+        if action == "cancel":
+            await upd.cancel_due_deadline(pass_key)
+        elif action == "invitation":
+            await upd.decline_due_deadline(pass_key)
+            if "couple" in pass_doc:
+                upd_c = await self.create_update_from_user(pass_doc["couple"])
+                await upd_c.decline_invitation_due_deadline(pass_key)
+        else:
+            upd.set_pass_key(pass_key)
+            await upd.notify_deadline_close("2" if action == "notify2" else "")
+
     async def recalculate_queues(self) -> None:
-        if self._queue_lock.locked():
-            self._queue_recalc_pending = True
+        self.refresh_events_cache()
+        await self._recalculate_pass_keys(self.pass_keys)
+
+    async def _recalculate_pass_keys(self, pass_keys: list[str]) -> None:
+        limit = Semaphore(QUEUE_RECALC_CONCURRENCY)
+
+        async def recalculate(pass_key: str) -> None:
+            async with limit:
+                await self.recalculate_queue(pass_key)
+
+        await gather(*(recalculate(key) for key in pass_keys))
+
+    def mark_queue_dirty(self, pass_key: str | None = None) -> None:
+        """Schedule a debounced recalculation of the pass key's queue (all if None)."""
+        self._queue_dirty.add(pass_key)
+        self._queue_dirty_event.set()
+
+    async def _queue_recalc_worker(self) -> None:
+        """Recalculates queues of dirty pass keys shortly after they change.
+
+        Changes arriving within ``config.passes.queue_recalc_debounce`` of the
+        first one are recalculated together. The hourly sweep in
+        :meth:`_timeout_processor` stays as a safety net.
+        """
+        await self.base_app.bot_started.wait()
+        while True:
+            await self._queue_dirty_event.wait()
+            await sleep(self.config.passes.queue_recalc_debounce)
+            self._queue_dirty_event.clear()
+            dirty, self._queue_dirty = self._queue_dirty, set()
+            try:
+                self.refresh_events_cache()
+                pass_keys = [
+                    key for key in self.pass_keys
+                    if None in dirty or key in dirty
+                ]
+                logger.debug("recalculating dirty pass queues: %s", pass_keys)
+                await self._recalculate_pass_keys(pass_keys)
+            except Exception as e:
+                logger.error(
+                    "Exception in Passes._queue_recalc_worker %s", e, exc_info=1
+                )
+
+    async def recalculate_queue(self, pass_key: str) -> None:
+        """Recalculate one pass key; calls made while it runs coalesce into one rerun.
+
+        Assignment is serialized per pass key, notifications are sent after
+        the key's lock is released so they don't delay the next assignment.
+        """
+        lock = self._queue_locks.setdefault(pass_key, Lock())
+        if lock.locked():
+            self._queue_recalc_pending.add(pass_key)
             logger.debug(
-                "recalculate_queues coalesced: queued rerun after current recalculation"
+                "recalculate_queues coalesced for %s: queued rerun after current recalculation",
+                pass_key,
             )
             return
-        async with self._queue_lock:
+        async with lock:
             while True:
-                self._queue_recalc_pending = False
-                self.refresh_events_cache()
-                for key in self.pass_keys:
-                    await self.recalculate_queues_pk(key)
-                if not self._queue_recalc_pending:
+                self._queue_recalc_pending.discard(pass_key)
+                await self._assign_queue_pk(pass_key)
+                if pass_key not in self._queue_recalc_pending:
                     break
                 logger.debug(
-                    "recalculate_queues rerunning due to coalesced recalculation request"
+                    "recalculate_queues rerunning %s due to coalesced recalculation request",
+                    pass_key,
                 )
+        notify_lock = self._queue_notify_locks.setdefault(pass_key, Lock())
+        async with notify_lock:
+            await self._notify_queue_pk(pass_key)
 
     async def recalculate_queues_pk(self, pass_key: str) -> None:
-        """Recalculate the assignment queue for a single pass key.
+        """Recalculate the assignment queue for a single pass key and notify.
+
+        See :meth:`_assign_queue_pk` for the assignment rules.
+        """
+        await self._assign_queue_pk(pass_key)
+        await self._notify_queue_pk(pass_key)
+
+    async def _assign_queue_pk(self, pass_key: str) -> None:
+        """Assign passes from the waitlist of a single pass key.
 
         Downloads all waitlist applications and finds the next assignments
         according to the following rules:
@@ -4110,216 +4694,183 @@ class Passes(BasePlugin):
           leave partial imbalance.
         """
         event = self.require_event(pass_key)
-        enforce_max_concurrent_assignments = (
-            not event.disable_max_concurrent_assignments
-        )
 
         try:
             # ── Main assignment loop ─────────────────────────────────
+            # The waitlist is downloaded once. Each round runs the rules
+            # against it with the counters kept in memory, and its plan is
+            # written in one bulk write; sign-ups that arrived in the
+            # meantime join the next round.
+            queues = WaitlistQueues(await self._download_waitlist(pass_key))
             while True:
-                stats = await self._collect_queue_stats(pass_key)
-                role_counts = stats.get("role_counts", {})
-                if not isinstance(role_counts, dict):
+                plan = None
+                # plans are written through the counted writes of the
+                # versioned collection, a bare one assigns one by one
+                if isinstance(self.pass_db, VersionedPassesCollection):
+                    plan = QueuePlan(
+                        pass_key, queues, await self._collect_queue_stats(pass_key)
+                    )
+                token = queue_plan.set(plan)
+                try:
+                    await self._run_queue_rules(pass_key, event, queues)
+                finally:
+                    queue_plan.reset(token)
+                if plan is not None and await self._write_queue_plan(pass_key, event, plan):
+                    # passes changed under the plan: start over from the stored ones
+                    queues = WaitlistQueues(await self._download_waitlist(pass_key))
+                    continue
+                arrived = [
+                    doc
+                    for doc in await self._download_waitlist(pass_key, since=queues.newest)
+                    if doc["user_id"] not in queues.known
+                ]
+                if not arrived:
                     break
+                queues.add(arrived)
+        except Exception as e:
+            logger.error(
+                f"Exception in recalculate_queues: {e}", exc_info=1
+            )
 
-                # Download ALL waitlist applications sorted by sign-up date
-                all_waitlist = await self.pass_db.find(
-                    {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "state": "waitlist",
-                    }
-                ).sort(
-                    [("date_created", 1), ("user_id", 1)]
-                ).to_list(None)
+    async def _run_queue_rules(
+        self,
+        pass_key: str,
+        event: EventInfo,
+        queues: WaitlistQueues,
+    ) -> None:
+        """Applies the rules of :meth:`_assign_queue_pk` to *queues* until
+        nothing more can be assigned."""
+        plan = self._queue_plan(pass_key)
+        enforce_max_concurrent_assignments = (
+            not event.disable_max_concurrent_assignments
+        )
+        while queues:
+            stats = await self._queue_stats(pass_key)
+            role_counts = stats.get("role_counts", {})
+            if not isinstance(role_counts, dict):
+                break
 
-                if not all_waitlist:
-                    break
+            top_leader = queues.top("leader")
+            top_follower = queues.top("follower")
 
-                leader_wl = [
-                    p for p in all_waitlist if p.get("role") == "leader"
-                ]
-                follower_wl = [
-                    p for p in all_waitlist if p.get("role") == "follower"
-                ]
-                if not leader_wl and not follower_wl:
-                    break
+            leader_ra = self._role_total_from_counts(role_counts, "leader")
+            follower_ra = self._role_total_from_counts(
+                role_counts, "follower"
+            )
+            in_balance = self._is_within_balance_tolerance(
+                leader_ra, follower_ra
+            )
 
-                leader_ra = self._role_total_from_counts(role_counts, "leader")
-                follower_ra = self._role_total_from_counts(
-                    role_counts, "follower"
-                )
-                in_balance = self._is_within_balance_tolerance(
-                    leader_ra, follower_ra
-                )
+            # Total passes in "assigned" state (not yet paid).
+            # Use full_role_counts so skip_in_balance_count passes are
+            # still counted toward the concurrency limit.
+            full_rc = stats.get("full_role_counts", {})
+            if not isinstance(full_rc, dict):
+                full_rc = {"leader": {}, "follower": {}}
+            total_assigned_not_paid = (
+                full_rc.get("leader", {}).get("assigned", 0)
+                + full_rc.get("follower", {}).get("assigned", 0)
+            )
 
-                # Total passes in "assigned" state (not yet paid).
-                # Use full_role_counts so skip_in_balance_count passes are
-                # still counted toward the concurrency limit.
-                full_rc = stats.get("full_role_counts", {})
-                if not isinstance(full_rc, dict):
-                    full_rc = {"leader": {}, "follower": {}}
-                total_assigned_not_paid = (
-                    full_rc.get("leader", {}).get("assigned", 0)
-                    + full_rc.get("follower", {}).get("assigned", 0)
+            def has_concurrency_capacity(increment: int) -> bool:
+                if not enforce_max_concurrent_assignments:
+                    return True
+                return (
+                    total_assigned_not_paid + increment
+                    <= MAX_CONCURRENT_ASSIGNMENTS
                 )
 
-                def has_concurrency_capacity(increment: int) -> bool:
-                    if not enforce_max_concurrent_assignments:
-                        return True
-                    return (
-                        total_assigned_not_paid + increment
-                        <= MAX_CONCURRENT_ASSIGNMENTS
-                    )
+            touched: set[int] = set()
 
-                assigned = False
+            def touch(*docs: dict) -> None:
+                for doc in docs:
+                    touched.add(doc["user_id"])
+                    if isinstance(doc.get("couple"), int):
+                        touched.add(doc["couple"])
 
-                # ── Rule 1: imbalance-improving solo ─────────────────
-                if not in_balance:
-                    minority = (
-                        "follower" if leader_ra > follower_ra else "leader"
-                    )
-                    minority_wl = (
-                        leader_wl if minority == "leader" else follower_wl
-                    )
-                    if minority_wl and "couple" not in minority_wl[0]:
-                        if has_concurrency_capacity(1):
-                            delta_kw = (
-                                {"leader_delta": 1}
-                                if minority == "leader"
-                                else {"follower_delta": 1}
-                            )
-                            if self._can_assign_with_balance(
-                                role_counts, **delta_kw
-                            ):
-                                result = await self._assign_wl_candidate(
-                                    pass_key,
-                                    event,
-                                    stats,
-                                    minority_wl[0],
-                                    allow_promo=True,
-                                )
-                                if result:
-                                    assigned = True
+            assigned = False
 
-                # ── Rule 2: both WLs have a pass ────────────────────
-                if not assigned and leader_wl and follower_wl:
-                    top_leader = leader_wl[0]
-                    top_follower = follower_wl[0]
-                    leader_is_solo = "couple" not in top_leader
-                    follower_is_solo = "couple" not in top_follower
+            # ── Rule 1: imbalance-improving solo ─────────────────
+            if not in_balance:
+                minority = (
+                    "follower" if leader_ra > follower_ra else "leader"
+                )
+                minority_top = queues.top(minority)
+                if minority_top is not None and "couple" not in minority_top:
+                    if has_concurrency_capacity(1):
+                        delta_kw = (
+                            {"leader_delta": 1}
+                            if minority == "leader"
+                            else {"follower_delta": 1}
+                        )
+                        if self._can_assign_with_balance(
+                            role_counts, **delta_kw
+                        ):
+                            touch(minority_top)
+                            result = await self._assign_wl_candidate(
+                                pass_key,
+                                event,
+                                stats,
+                                minority_top,
+                                allow_promo=True,
+                            )
+                            if result:
+                                assigned = True
 
-                    # 2a: both solo + balance met → double-solo
-                    if (
-                        leader_is_solo
-                        and follower_is_solo
-                        and in_balance
-                    ):
-                        if has_concurrency_capacity(2):
-                            if self._can_assign_with_balance(
-                                role_counts,
-                                leader_delta=1,
-                                follower_delta=1,
-                                strict=True,
-                            ):
-                                result = (
-                                    await self._try_double_solo_assignment(
-                                        pass_key,
-                                        event,
-                                        stats,
-                                        top_leader,
-                                        top_follower,
-                                    )
-                                )
-                                if result:
-                                    assigned = True
+            # ── Rule 2: both WLs have a pass ────────────────────
+            if not assigned and top_leader is not None and top_follower is not None:
+                leader_is_solo = "couple" not in top_leader
+                follower_is_solo = "couple" not in top_follower
 
-                    # 2b: at least one is a couple → try couple
-                    if not assigned and (
-                        not leader_is_solo or not follower_is_solo
-                    ):
-                        if has_concurrency_capacity(2):
-                            couple_candidates_2b = []
-                            if not leader_is_solo:
-                                couple_candidates_2b.append(top_leader)
-                            if not follower_is_solo:
-                                couple_candidates_2b.append(top_follower)
-                            couple_candidate = min(
-                                couple_candidates_2b,
-                                key=lambda p: (
-                                    p.get("date_created"),
-                                    p.get("user_id", 0),
-                                ),
-                            )
-                            if self._can_assign_with_balance(
-                                role_counts,
-                                leader_delta=1,
-                                follower_delta=1,
-                            ):
-                                result = await self._assign_wl_candidate(
+                # 2a: both solo + balance met → double-solo
+                if (
+                    leader_is_solo
+                    and follower_is_solo
+                    and in_balance
+                ):
+                    if has_concurrency_capacity(2):
+                        if self._can_assign_with_balance(
+                            role_counts,
+                            leader_delta=1,
+                            follower_delta=1,
+                            strict=True,
+                        ):
+                            touch(top_leader, top_follower)
+                            result = (
+                                await self._try_double_solo_assignment(
                                     pass_key,
                                     event,
                                     stats,
-                                    couple_candidate,
-                                    allow_promo=False,
+                                    top_leader,
+                                    top_follower,
                                 )
-                                if result:
-                                    assigned = True
+                            )
+                            if result:
+                                assigned = True
 
-                # ── Rule 3: fallback single solo / couple ───────
-                if not assigned:
-                    target_group = self._target_role(role_counts)
-                    other_group = (
-                        "follower" if target_group == "leader" else "leader"
-                    )
-                    for try_role in (target_group, other_group):
-                        if not has_concurrency_capacity(1):
-                            break
-                        try_wl = (
-                            leader_wl if try_role == "leader" else follower_wl
-                        )
-                        solo_candidates = [
-                            p for p in try_wl if "couple" not in p
-                        ]
-                        if not solo_candidates:
-                            continue
-                        delta_kw = (
-                            {"leader_delta": 1}
-                            if try_role == "leader"
-                            else {"follower_delta": 1}
-                        )
-                        if not self._can_assign_with_balance(
-                            role_counts, **delta_kw
-                        ):
-                            continue
-                        result = await self._assign_wl_candidate(
-                            pass_key,
-                            event,
-                            stats,
-                            solo_candidates[0],
-                            allow_promo=True,
-                        )
-                        if result:
-                            assigned = True
-                            break
-
-                if not assigned and has_concurrency_capacity(2):
-                    # Try couple from queue top only (do not scan deep).
-                    top_couple_candidates = []
-                    if leader_wl and "couple" in leader_wl[0]:
-                        top_couple_candidates.append(leader_wl[0])
-                    if follower_wl and "couple" in follower_wl[0]:
-                        top_couple_candidates.append(follower_wl[0])
-                    if top_couple_candidates:
+                # 2b: at least one is a couple → try couple
+                if not assigned and (
+                    not leader_is_solo or not follower_is_solo
+                ):
+                    if has_concurrency_capacity(2):
+                        couple_candidates_2b = []
+                        if not leader_is_solo:
+                            couple_candidates_2b.append(top_leader)
+                        if not follower_is_solo:
+                            couple_candidates_2b.append(top_follower)
                         couple_candidate = min(
-                            top_couple_candidates,
-                            key=lambda p: (p.get("date_created"), p.get("user_id", 0)),
+                            couple_candidates_2b,
+                            key=lambda p: (
+                                p.get("date_created"),
+                                p.get("user_id", 0),
+                            ),
                         )
                         if self._can_assign_with_balance(
                             role_counts,
                             leader_delta=1,
                             follower_delta=1,
                         ):
+                            touch(couple_candidate)
                             result = await self._assign_wl_candidate(
                                 pass_key,
                                 event,
@@ -4330,9 +4881,241 @@ class Passes(BasePlugin):
                             if result:
                                 assigned = True
 
+            # ── Rule 3: fallback single solo / couple ───────
+            if not assigned:
+                target_group = self._target_role(role_counts)
+                other_group = (
+                    "follower" if target_group == "leader" else "leader"
+                )
+                for try_role in (target_group, other_group):
+                    if not has_concurrency_capacity(1):
+                        break
+                    solo_candidate = queues.first_solo(try_role)
+                    if solo_candidate is None:
+                        continue
+                    delta_kw = (
+                        {"leader_delta": 1}
+                        if try_role == "leader"
+                        else {"follower_delta": 1}
+                    )
+                    if not self._can_assign_with_balance(
+                        role_counts, **delta_kw
+                    ):
+                        continue
+                    touch(solo_candidate)
+                    result = await self._assign_wl_candidate(
+                        pass_key,
+                        event,
+                        stats,
+                        solo_candidate,
+                        allow_promo=True,
+                    )
+                    if result:
+                        assigned = True
+                        break
+
+            if not assigned and has_concurrency_capacity(2):
+                # Try couple from queue top only (do not scan deep).
+                top_couple_candidates = []
+                if top_leader is not None and "couple" in top_leader:
+                    top_couple_candidates.append(top_leader)
+                if top_follower is not None and "couple" in top_follower:
+                    top_couple_candidates.append(top_follower)
+                if top_couple_candidates:
+                    couple_candidate = min(
+                        top_couple_candidates,
+                        key=lambda p: (p.get("date_created"), p.get("user_id", 0)),
+                    )
+                    if self._can_assign_with_balance(
+                        role_counts,
+                        leader_delta=1,
+                        follower_delta=1,
+                    ):
+                        touch(couple_candidate)
+                        result = await self._assign_wl_candidate(
+                            pass_key,
+                            event,
+                            stats,
+                            couple_candidate,
+                            allow_promo=False,
+                        )
+                        if result:
+                            assigned = True
+
+            # Staged candidates have left the queues already. Otherwise keep
+            # going while the waitlist shrinks: either something was
+            # assigned, or a failed candidate had already left it.
+            if plan is not None:
                 if not assigned:
                     break
+            elif not touched or not await self._refresh_waitlist(
+                pass_key, queues, touched
+            ):
+                break
+
+    @staticmethod
+    def _queue_plan(pass_key: str) -> QueuePlan | None:
+        plan = queue_plan.get()
+        return plan if plan is not None and plan.pass_key == pass_key else None
+
+    async def _queue_stats(self, pass_key: str) -> dict[str, object]:
+        """Queue stats as the rules see them: those of the current plan, if any."""
+        plan = self._queue_plan(pass_key)
+        if plan is not None:
+            return plan.stats
+        return await self._collect_queue_stats(pass_key)
+
+    async def _download_waitlist(
+        self,
+        pass_key: str,
+        since: datetime | None = None,
+    ) -> list[dict]:
+        """Waitlisted passes of *pass_key* in sign-up order, those that signed
+        up at or after *since* if given."""
+        query: dict[str, object] = {
+            "bot_id": self.bot.id,
+            "pass_key": pass_key,
+            "state": "waitlist",
+        }
+        if since is not None:
+            query["date_created"] = {"$gte": since}
+        return await self.pass_db.find(query).sort(
+            [("date_created", 1), ("user_id", 1)]
+        ).to_list(None)
+
+    async def _write_queue_plan(
+        self,
+        pass_key: str,
+        event: EventInfo,
+        plan: QueuePlan,
+    ) -> bool:
+        """Writes *plan* in one bulk write and tells the users about their passes.
+
+        A pass is written only while its counted fields are as the plan read
+        them. A candidate with a pass that changed is assigned on its own
+        instead, after half a couple the bulk wrote is put back. Returns
+        ``True`` if that happened.
+        """
+        if not plan.assignments:
+            return False
+        assigned_at = now_msk()
+        # as Mongo stores it, to find the passes written below
+        assigned_at = assigned_at.replace(microsecond=assigned_at.microsecond // 1000 * 1000)
+        requests = []
+        for assignment in plan.assignments:
+            candidate_data = self._pass_doc_to_data(assignment.candidate) or {}
+            is_couple = len(assignment.user_ids) > 1
+            split_couple_for_free = is_couple and 0 in assignment.prices.values()
+            for uid in assignment.user_ids:
+                price = assignment.prices[uid]
+                uncouple = split_couple_for_free or (
+                    not is_couple and "couple" in candidate_data
+                )
+                free_proof_admin = None
+                if price == 0:
+                    free_proof_admin = candidate_data.get("proof_admin")
+                    if free_proof_admin is None:
+                        free_proof_admin = self.pick_payment_admin(pass_key)
+                match_fields, update_pipeline = _assignment_write(
+                    self.bot.id,
+                    pass_key,
+                    uid,
+                    assignment.user_ids,
+                    price,
+                    assignment.pass_type_indexes.get(uid),
+                    assigned_at,
+                    free_proof_admin=free_proof_admin,
+                    pass_type="solo" if uncouple else None,
+                    uncouple=uncouple,
+                )
+                before = assignment.passes[uid]
+                match_fields.update({name: before.get(name) for name in COUNTED_FIELDS})
+                requests.append(UpdateOne(match_fields, update_pipeline))
+
+        user_ids = [uid for assignment in plan.assignments for uid in assignment.user_ids]
+        done: list[PlannedAssignment] = []
+        conflicts: list[PlannedAssignment] = []
+        async with counted(self.pass_db, self.bot.id, pass_key) as moves:
+            result = await self.pass_db.bulk_write(requests, ordered=False)
+            written = set(user_ids)
+            if result.matched_count < len(requests):
+                written = {
+                    doc["user_id"]
+                    for doc in await self.pass_db.find(
+                        {
+                            "bot_id": self.bot.id,
+                            "pass_key": pass_key,
+                            "user_id": {"$in": user_ids},
+                            "date_assignment": assigned_at,
+                        },
+                        {"user_id": 1},
+                    ).to_list(None)
+                }
+            for assignment in plan.assignments:
+                if written.issuperset(assignment.user_ids):
+                    for uid in assignment.user_ids:
+                        moves.move(assignment.passes[uid], assignment.assigned(uid))
+                    done.append(assignment)
+                    continue
+                conflicts.append(assignment)
+                for uid in written.intersection(assignment.user_ids):
+                    before = assignment.passes[uid]
+                    restored = await self.pass_db.replace_one(
+                        {"_id": before["_id"], "date_assignment": assigned_at}, before,
+                    )
+                    if restored.matched_count == 0:
+                        moves.recount()
+
+        if done:
+            done_ids = [uid for assignment in done for uid in assignment.user_ids]
+            users = {
+                doc["user_id"]: doc
+                async for doc in self.user_db.find(
+                    {"bot_id": self.bot.id, "user_id": {"$in": done_ids}}
+                )
+            }
+            pass_docs_after = {
+                doc["user_id"]: self._pass_doc_to_data(doc)
+                for doc in await self.pass_db.find(
+                    {"bot_id": self.bot.id, "pass_key": pass_key, "user_id": {"$in": done_ids}}
+                ).to_list(None)
+            }
+            for assignment in done:
+                for uid in assignment.user_ids:
+                    if uid not in users:
+                        continue
+                    await self._tell_assigned(
+                        pass_key,
+                        users[uid],
+                        pass_docs_after.get(uid) or self._pass_doc_to_data(assignment.passes[uid]),
+                        assignment.prices[uid],
+                    )
 
+        for assignment in conflicts:
+            candidate_doc = await self.pass_db.find_one(
+                {
+                    "bot_id": self.bot.id,
+                    "pass_key": pass_key,
+                    "user_id": assignment.candidate["user_id"],
+                    "state": "waitlist",
+                }
+            )
+            if candidate_doc is None:
+                continue
+            await self._assign_wl_candidate(
+                pass_key,
+                event,
+                await self._collect_queue_stats(pass_key),
+                candidate_doc,
+                allow_promo=assignment.allow_promo,
+            )
+        return bool(conflicts)
+
+    async def _notify_queue_pk(self, pass_key: str) -> None:
+        """Tell the remaining waitlist that there are no passes left and
+        announce new registrations in the event's hype thread."""
+        event = self.require_event(pass_key)
+        try:
             # ── Notify remaining waitlisted users ────────────────────
             while True:
                 selected = await self.pass_db.find(
@@ -4362,64 +5145,137 @@ class Passes(BasePlugin):
             )
 
         # ── Hype-thread announcements ────────────────────────────────
-        try:
-            async for pass_doc in self.pass_db.find(
+        self.announce_registrations()
+
+    def announce_registrations(self) -> None:
+        """Wake the hype thread publisher to announce new registrations."""
+        pending = getattr(self, "_hype_thread_pending", None)
+        if pending is not None:
+            pending.set()
+
+    async def _hype_thread_publisher(self) -> None:
+        """Announces new registrations in the events' hype threads.
+
+        Registrations that arrive within ``HYPE_THREAD_INTERVAL`` are
+        combined into one message per event.
+        """
+        send_priority.set(SEND_BULK)
+        await self.base_app.bot_started.wait()
+        while True:
+            await self._hype_thread_pending.wait()
+            self._hype_thread_pending.clear()
+            for pass_key in list(self.pass_keys):
+                try:
+                    if await self.publish_registrations(pass_key):
+                        self._hype_thread_pending.set()
+                except Exception as e:
+                    logger.error(
+                        f"Exception in Passes._hype_thread_publisher for {pass_key}: {e}",
+                        exc_info=1,
+                    )
+            await sleep(HYPE_THREAD_INTERVAL)
+
+    async def publish_registrations(self, pass_key: str) -> bool:
+        """Claims up to ``HYPE_THREAD_BATCH`` unannounced passes of *pass_key*
+        and announces them in one message. Returns True if more are pending."""
+        pending = await self.pass_db.find(
+            {
+                "bot_id": self.bot.id,
+                "pass_key": pass_key,
+                "sent_to_hype_thread": {"$exists": False},
+            },
+            {"user_id": 1, "role": 1},
+        ).sort([("date_created", 1)]).to_list(HYPE_THREAD_BATCH + 1)
+        batch = pending[:HYPE_THREAD_BATCH]
+        if not batch:
+            return False
+        # a concurrent publisher may claim some of the batch first; announce
+        # only the passes that carry this run's claim
+        claim = ObjectId()
+        await self.pass_db.update_many(
+            {
+                "_id": {"$in": [doc["_id"] for doc in batch]},
+                "sent_to_hype_thread": {"$exists": False},
+            },
+            {"$set": {"sent_to_hype_thread": now_msk(), "hype_claim": claim}},
+        )
+        claimed = await self.pass_db.find(
+            {"_id": {"$in": [doc["_id"] for doc in batch]}, "hype_claim": claim},
+            {"user_id": 1, "role": 1},
+        ).sort([("date_created", 1)]).to_list(None)
+        more_pending = len(pending) > len(batch)
+        event = self.get_event(pass_key)
+        if not claimed or event is None or event.thread_channel == "":
+            return more_pending
+        users = {
+            user["user_id"]: user
+            async for user in self.user_db.find(
                 {
                     "bot_id": self.bot.id,
-                    "pass_key": pass_key,
-                    "sent_to_hype_thread": {"$exists": False},
+                    "user_id": {"$in": [doc["user_id"] for doc in claimed]},
                 }
-            ):
-                sent_ts = now_msk()
-                await self.update_pass_fields(
-                    [pass_doc["user_id"]],
-                    pass_key,
-                    set_fields={"sent_to_hype_thread": sent_ts},
-                )
-                user = (
-                    await self.user_db.find_one(
-                        {
-                            "bot_id": self.bot.id,
-                            "user_id": pass_doc["user_id"],
-                        }
-                    )
-                    or {}
-                )
-                if event.thread_channel != "":
-                    try:
-                        ch = event.thread_channel
-                        if isinstance(ch, str):
-                            ch = "@" + ch
-                        logger.debug(
-                            f"chat id: {ch}, type {type(ch)}"
-                        )
-                        args = {
-                            "name": client_user_name(user),
-                            "role": pass_doc.get("role", ""),
-                            "passKey": pass_key,
-                        }
-                        await self.bot.send_message(
-                            chat_id=ch,
-                            message_thread_id=event.thread_id,
-                            text=self.base_app.localization(
-                                "passes-announce-user-registered",
-                                args=args,
-                                locale=event.thread_locale,
-                            ),
-                            parse_mode=ParseMode.HTML,
-                        )
-                    except Exception as e:
-                        logger.error(
-                            f"Exception in recalculate_queues: {e}",
-                            exc_info=1,
-                        )
+            )
+        }
+        lines = [
+            self.base_app.localization(
+                "passes-announce-user-registered",
+                args={
+                    "name": client_user_name(users.get(doc["user_id"], {})),
+                    "role": doc.get("role", ""),
+                    "passKey": pass_key,
+                },
+                locale=event.thread_locale,
+            )
+            for doc in claimed
+        ]
+        if len(lines) > 1:
+            lines.insert(0, self.base_app.localization(
+                "passes-announce-users-registered",
+                args={"count": len(lines), "passKey": pass_key},
+                locale=event.thread_locale,
+            ))
+        ch = event.thread_channel
+        if isinstance(ch, str):
+            ch = "@" + ch
+        try:
+            await self.bot.send_message(
+                chat_id=ch,
+                message_thread_id=event.thread_id,
+                text="\n".join(lines),
+                parse_mode=ParseMode.HTML,
+            )
         except Exception as e:
             logger.error(
-                f"Exception in recalculate_queues: {e}", exc_info=1
+                f"Exception in Passes.publish_registrations: {e}",
+                exc_info=1,
             )
+        return more_pending
 
     # ── Assignment helper methods ────────────────────────────────────
 
+    async def _refresh_waitlist(
+        self,
+        pass_key: str,
+        queues: "WaitlistQueues",
+        user_ids: set[int],
+    ) -> bool:
+        """Re-read *user_ids* and drop from *queues* those no longer waiting.
+
+        Returns ``True`` when something was dropped.
+        """
+        docs = await self.pass_db.find(
+            {
+                "bot_id": self.bot.id,
+                "pass_key": pass_key,
+                "state": "waitlist",
+                "user_id": {"$in": sorted(user_ids)},
+            }
+        ).to_list(None)
+        return queues.refresh(
+            user_ids,
+            {doc["user_id"]: doc for doc in docs if doc.get("user_id") in user_ids},
+        )
+
     async def _assign_wl_candidate(
         self,
         pass_key: str,
@@ -4432,8 +5288,11 @@ class Passes(BasePlugin):
         """Resolve tier pricing for *candidate_doc* and assign the pass.
 
         For couples the partner's waitlist document is fetched automatically.
-        Returns ``True`` when the assignment succeeds.
+        Within a queue round the pass is staged in its :class:`QueuePlan`
+        and the partner is taken from the plan's queues. Returns ``True``
+        when the assignment succeeds.
         """
+        plan = self._queue_plan(pass_key)
         pass_types = self._event_pass_types(event)
         assignment_rule = self._event_assignment_rule(event)
         if not pass_types:
@@ -4465,15 +5324,20 @@ class Passes(BasePlugin):
                 )
                 is_couple = False
             else:
-                couple_pass_doc = await self.pass_db.find_one(
-                    {
-                        "bot_id": self.bot.id,
-                        "pass_key": pass_key,
-                        "user_id": couple_user_id,
-                        "state": "waitlist",
-                        "couple": candidate_user_id,
-                    }
-                )
+                if plan is not None:
+                    couple_pass_doc = plan.queues.get(couple_user_id)
+                    if couple_pass_doc is not None and couple_pass_doc.get("couple") != candidate_user_id:
+                        couple_pass_doc = None
+                else:
+                    couple_pass_doc = await self.pass_db.find_one(
+                        {
+                            "bot_id": self.bot.id,
+                            "pass_key": pass_key,
+                            "user_id": couple_user_id,
+                            "state": "waitlist",
+                            "couple": candidate_user_id,
+                        }
+                    )
                 if couple_pass_doc is None:
                     logger.warning(
                         "stale couple data for user=%s pass=%s: no reciprocal waitlist "
@@ -4546,6 +5410,18 @@ class Passes(BasePlugin):
                 price_by_user[uid] = pass_types[tier_index].price
                 pass_type_index_by_user[uid] = tier_index
 
+        if plan is not None:
+            plan.stage(PlannedAssignment(
+                candidate_doc,
+                {
+                    uid: candidate_doc if uid == candidate_user_id else couple_pass_doc
+                    for uid in price_by_user
+                },
+                price_by_user,
+                pass_type_index_by_user,
+                allow_promo,
+            ))
+            return True
         upd = await self.create_update_from_user(candidate_user_id)
         return await upd.assign_pass(
             pass_key,
@@ -4573,28 +5449,40 @@ class Passes(BasePlugin):
         # Re-collect stats after the first assignment so that tier
         # usage is up-to-date for the second one.
         if leader_ok:
-            stats = await self._collect_queue_stats(pass_key)
+            stats = await self._queue_stats(pass_key)
         follower_ok = await self._assign_wl_candidate(
             pass_key, event, stats, follower_doc, allow_promo=True,
         )
         return leader_ok or follower_ok
 
+    async def _tell_assigned(
+        self,
+        pass_key: str,
+        user_doc: dict,
+        pass_info: dict,
+        price: int,
+    ) -> None:
+        uid = user_doc["user_id"]
+        logger.info(
+            f"assigned pass to {uid}, role {pass_info.get('role')}, name {user_doc.get('legal_name', client_user_name(user_doc))}"
+        )
+        upd = await self.create_update_from_user(uid)
+        upd.set_pass_key(pass_key)
+        await upd.show_pass_edit(
+            user_doc,
+            pass_info,
+            (
+                "passes-pass-free-assigned"
+                if price == 0
+                else "passes-pass-assigned"
+            ),
+        )
+
     async def create_update_from_user(self, user: int) -> PassUpdate:
         upd = TGState(user, self.base_app)
         await upd.get_state()
         return PassUpdate(self, upd)
 
-    def test_message(self, message: Update, state, web_app_data):
-        for checker in self._command_checkers:
-            if checker.check_update(message):
-                return PRIORITY_BASIC, checker.callback
-        return PRIORITY_NOT_ACCEPTING, None
-
-    def test_callback_query(self, query: Update, state):
-        if self._cbq_handler.check_update(query):
-            return PRIORITY_BASIC, self.handle_callback_query
-        return PRIORITY_NOT_ACCEPTING, None
-
     def create_update(self, update) -> PassUpdate:
         return PassUpdate(self, update)
     
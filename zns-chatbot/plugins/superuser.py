@@ -8,13 +8,14 @@ from motor.core import AgnosticCollection
 from tornado.template import Template
 from telegram import ReplyKeyboardMarkup, Update, ReplyKeyboardRemove
 from telegram.constants import ParseMode
-from telegram.ext import CommandHandler, filters
+from telegram.ext import filters
 from json import loads
 from typing import Literal
 
+from ..send_scheduler import SEND_BULK
 from ..telegram_links import client_user_link_html, client_user_link_url, client_user_name
 from ..tg_state import TGState, SilentArgumentParser
-from .base_plugin import BasePlugin, PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING
+from .base_plugin import BasePlugin
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +37,13 @@ PASS_SHORTCUT_CATEGORIES = {
 
 class Superuser(BasePlugin):
     name = "superuser"
+    commands = {
+        "user_echo": "handle_message",
+        "get_file": "handle_get_file",
+        "send_message_to": "send_message_to",
+        "refresh_events": "refresh_events",
+        "index_check": "index_check",
+    }
     admins: set[int]
     user_db: AgnosticCollection
 
@@ -54,23 +62,9 @@ class Superuser(BasePlugin):
             if base_app.mongodb is not None
             else None
         )
-        self._checker = CommandHandler("user_echo", self.handle_message)
-        self._checker_gf = CommandHandler("get_file", self.handle_get_file)
-        self._checker_send_message_to = CommandHandler("send_message_to", self.send_message_to)
-        self._checker_refresh_events = CommandHandler("refresh_events", self.refresh_events)
-
-    def test_message(self, message: Update, state, web_app_data):
-        if message.effective_user.id not in self.admins:
-            return PRIORITY_NOT_ACCEPTING, None
-        if self._checker.check_update(message):
-            return PRIORITY_BASIC, self.handle_message
-        if self._checker_gf.check_update(message):
-            return PRIORITY_BASIC, self.handle_get_file
-        if self._checker_send_message_to.check_update(message):
-            return PRIORITY_BASIC, self.send_message_to
-        if self._checker_refresh_events.check_update(message):
-            return PRIORITY_BASIC, self.refresh_events
-        return PRIORITY_NOT_ACCEPTING, None
+
+    def accepts_route(self, update: Update) -> bool:
+        return update.effective_user.id in self.admins
 
     async def refresh_events(self, update: TGState):
         try:
@@ -94,6 +88,28 @@ class Superuser(BasePlugin):
             logger.error("Error in refresh_events %s", err, exc_info=1)
             await update.reply(f"Error in refresh_events {err=}", parse_mode=None)
     
+    async def index_check(self, update: TGState):
+        indexes = getattr(self.base_app, "indexes", None)
+        if indexes is None:
+            await update.reply("Indexes are not initialized.", parse_mode=None)
+            return
+        try:
+            problems = await indexes.check()
+        except Exception as err:
+            logger.error("Error in index_check %s", err, exc_info=1)
+            await update.reply(f"Error in index_check {err=}", parse_mode=None)
+            return
+        if not problems:
+            await update.reply(
+                f"All {len(indexes.specs)} indexed queries use an index.",
+                parse_mode=None,
+            )
+            return
+        await update.reply(
+            "Queries doing a COLLSCAN:\n" + "\n".join(problems),
+            parse_mode=None,
+        )
+
     async def send_message_to(self, update: TGState):
         try:
             args_list = update.parse_cmd_arguments()
@@ -406,6 +422,7 @@ class Superuser(BasePlugin):
                                 message_thread_id=message_thread_id,
                                 message_id=update.message.message_id,
                                 from_chat_id=update.update.effective_chat.id,
+                                rate_limit_args=SEND_BULK,
                             )
                         else:
                             logger.debug(f"sending message to {recipient=}, {message_thread_id=}")
@@ -442,6 +459,7 @@ class Superuser(BasePlugin):
                                 message_thread_id=message_thread_id,
                                 text=real_text,
                                 parse_mode=parse_mode,
+                                rate_limit_args=SEND_BULK,
                             )
                     except Exception as err:
                         logger.error(f"Error in send_message_to__stage2 {err=}, {recipient=}, {message_thread_id=}", exc_info=1)
@@ -0,0 +1,240 @@
+"""Offline replay of the passes assignment queue.
+
+A snapshot of one pass key (its passes and their users) is loaded into
+in-memory collections, and ``Passes.recalculate_queues_pk`` runs against
+them unchanged. Messages to users are recorded instead of sent. This shows
+what a config change (tier amounts, promo tiers, the balance tolerance)
+would assign on a real waitlist without touching production::
+
+    python -m zns-chatbot.queue_simulator pass_2026_1 --tolerance 55 --amounts 40,60,80
+
+The pass counters are rebuilt from the snapshotted passes, the same way
+``PassCounters.reconcile`` repairs them in production.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from time import perf_counter
+from types import SimpleNamespace
+
+from .events import EventInfo
+from .memory_db import MemoryDatabase, sort_key
+from .pass_stats import VersionedPassesCollection
+from .plugins.passes import ROLE_BALANCE_TOLERANCE, Passes, PassUpdate
+
+ASSIGNED_MESSAGES = ("passes-pass-assigned", "passes-pass-free-assigned")
+WAITLIST_MESSAGE = "passes-added-to-waitlist"
+
+
+@dataclass
+class QueueSnapshot:
+    bot_id: int
+    pass_key: str
+    passes: list[dict]
+    users: list[dict]
+
+    @property
+    def waitlist(self) -> int:
+        return sum(1 for doc in self.passes if doc.get("state") == "waitlist")
+
+
+async def take_snapshot(pass_db, user_db, bot_id: int, pass_key: str) -> QueueSnapshot:
+    """Reads every pass of *pass_key* and the users holding them."""
+    passes = await pass_db.find({"bot_id": bot_id, "pass_key": pass_key}).to_list(None)
+    users = await user_db.find(
+        {"bot_id": bot_id, "user_id": {"$in": [doc["user_id"] for doc in passes]}}
+    ).to_list(None)
+    return QueueSnapshot(bot_id, pass_key, passes, users)
+
+
+@dataclass(frozen=True)
+class Assignment:
+    user_id: int
+    role: str | None
+    state: str | None
+    tier: int | None
+    price: int | None
+    couple: int | None
+
+
+@dataclass
+class SimulationReport:
+    pass_key: str
+    waitlist: int
+    assignments: list[Assignment]
+    notified: int
+    elapsed: float
+    db_ops: Counter[str] = field(default_factory=Counter)
+
+    def by_tier(self) -> dict[int | None, Counter[str]]:
+        tiers: dict[int | None, Counter[str]] = {}
+        for assignment in self.assignments:
+            tiers.setdefault(assignment.tier, Counter())[assignment.role] += 1
+        return tiers
+
+    def summary(self) -> str:
+        lines = [
+            f"{self.pass_key}: {len(self.assignments)} of {self.waitlist} waitlisted "
+            f"assigned, {self.notified} told there are no passes left",
+            f"{self.elapsed:.2f}s, {sum(self.db_ops.values())} db operations",
+        ]
+        for tier, roles in sorted(self.by_tier().items(), key=lambda item: sort_key(item[0])):
+            name = "no tier" if tier is None else f"tier {tier + 1}"
+            lines.append(
+                f"  {name}: {roles.get('leader', 0)} leaders, {roles.get('follower', 0)} followers"
+            )
+        for op, n in sorted(self.db_ops.items()):
+            lines.append(f"  {op}: {n}")
+        return "\n".join(lines)
+
+
+class SimulatedPassUpdate(PassUpdate):
+    """Records the messages a queue run would send."""
+
+    async def show_pass_edit(self, user, u_pass, text_key: str | None = None):
+        self.base.messages.append((self.update.user, text_key, dict(u_pass)))
+
+
+class SimulatedPasses(Passes):
+    """``Passes`` bound to in-memory collections, with no background tasks."""
+
+    def __init__(
+            self,
+            snapshot: QueueSnapshot,
+            event: EventInfo,
+            tolerance: int = ROLE_BALANCE_TOLERANCE,
+            latency: float = 0.0,
+        ):
+        bot = SimpleNamespace(id=snapshot.bot_id)
+        self.base_app = SimpleNamespace(bot=SimpleNamespace(bot=bot))
+        self.event = event
+        self.role_balance_tolerance = tolerance
+        self.pass_keys = [event.key]
+        self.payment_admins = {event.key: list(event.payment_admin)}
+        self.hidden_payment_admins = {event.key: list(event.hidden_payment_admins)}
+        self.database = MemoryDatabase(latency)
+        self.passes_collection = self.database.collection("passes", snapshot.passes)
+        self.counters_collection = self.database["counters"]
+        self.pass_db = VersionedPassesCollection(
+            self.passes_collection, counters_collection=self.counters_collection,
+        )
+        self.user_db = self.database.collection("users", snapshot.users)
+        self.messages: list[tuple[int, str | None, dict]] = []
+
+    def refresh_events_cache(self) -> None:
+        pass
+
+    def get_event(self, pass_key: str) -> EventInfo | None:
+        return self.event if pass_key == self.event.key else None
+
+    async def create_update_from_user(self, user: int) -> PassUpdate:
+        async def get_user():
+            return await self.user_db.find_one({"bot_id": self.bot.id, "user_id": user})
+
+        async def reply(*args, **kwargs):
+            self.messages.append((user, "reply", {}))
+
+        state = SimpleNamespace(
+            user=user,
+            bot=self.bot,
+            update=None,
+            l=lambda key, **kwargs: key,
+            get_user=get_user,
+            reply=reply,
+        )
+        return SimulatedPassUpdate(self, state)
+
+    def db_ops(self) -> Counter[str]:
+        return self.database.ops()
+
+
+async def simulate(
+        snapshot: QueueSnapshot,
+        event: EventInfo,
+        tolerance: int = ROLE_BALANCE_TOLERANCE,
+        latency: float = 0.0,
+    ) -> SimulationReport:
+    """Runs one queue recalculation of *snapshot* under *event*'s config."""
+    passes = SimulatedPasses(snapshot, event, tolerance, latency)
+    await passes.pass_db.counters.reconcile(snapshot.bot_id, event.key)
+    passes.passes_collection.ops.clear()
+    passes.counters_collection.ops.clear()
+    started = perf_counter()
+    await passes.recalculate_queues_pk(event.key)
+    elapsed = perf_counter() - started
+    assignments = [
+        Assignment(
+            user_id=user_id,
+            role=pass_data.get("role"),
+            state=pass_data.get("state"),
+            tier=pass_data.get("pass_type_index"),
+            price=pass_data.get("price"),
+            couple=pass_data.get("couple"),
+        )
+        for user_id, text_key, pass_data in passes.messages
+        if text_key in ASSIGNED_MESSAGES
+    ]
+    return SimulationReport(
+        pass_key=event.key,
+        waitlist=snapshot.waitlist,
+        assignments=assignments,
+        notified=sum(1 for _, text_key, _ in passes.messages if text_key == WAITLIST_MESSAGE),
+        elapsed=elapsed,
+        db_ops=passes.db_ops(),
+    )
+
+
+async def main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from .config import Config
+    from .events import Events
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("pass_key")
+    parser.add_argument("--tolerance", type=int, default=ROLE_BALANCE_TOLERANCE,
+                        help="balance tolerance, percent of the larger role")
+    parser.add_argument("--amounts", default="",
+                        help="comma separated tier amounts to use instead of the event's")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds charged per database round trip")
+    args = parser.parse_args()
+
+    cfg = Config()
+    app = SimpleNamespace(
+        config=cfg, mongodb=AsyncIOMotorClient(cfg.mongo_db.address).get_database(),
+    )
+    events = Events(app)
+    await events.refresh()
+    event = events.get_event(args.pass_key)
+    if event is None:
+        parser.error(f"unknown pass key {args.pass_key}")
+    if args.amounts:
+        amounts = [int(amount) for amount in args.amounts.split(",")]
+        if len(amounts) != len(event.pass_types):
+            parser.error(f"{args.pass_key} has {len(event.pass_types)} tiers")
+        event = replace(event, pass_types=tuple(
+            replace(pass_type, amount=amount)
+            for pass_type, amount in zip(event.pass_types, amounts)
+        ))
+    bot_id = int(cfg.telegram.token.get_secret_value().split(":")[0])
+    snapshot = await take_snapshot(
+        app.mongodb[cfg.mongo_db.passes_collection],
+        app.mongodb[cfg.mongo_db.users_collection],
+        bot_id,
+        args.pass_key,
+    )
+    report = await simulate(snapshot, event, args.tolerance, args.latency)
+    print(report.summary())
+    for assignment in report.assignments:
+        print(
+            f"{assignment.user_id}\t{assignment.role}\t{assignment.state}\t"
+            f"tier {assignment.tier}\t{assignment.price}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+import logging
+from typing import Callable, NamedTuple
+
+from telegram import MessageEntity, Update
+from telegram.ext.filters import BaseFilter
+
+from .plugins.base_plugin import PRIORITY_BASIC, PRIORITY_NOT_ACCEPTING, BasePlugin
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_SEPARATOR = "|"
+
+
+class Route(NamedTuple):
+    plugin: BasePlugin
+    handle: Callable | None
+    priority: int = PRIORITY_BASIC
+    hits: int = 1
+
+
+def message_command(update: Update, bot_username: str | None) -> str | None:
+    """Extracts a command the same way ``CommandHandler.check_update`` does."""
+    message = update.effective_message
+    if message is None or not message.text or not message.entities:
+        return None
+    entity = message.entities[0]
+    if entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+        return None
+    command, _, mention = message.text[1:entity.length].partition("@")
+    if mention and bot_username is not None and mention.lower() != bot_username.lower():
+        return None
+    return command.lower()
+
+
+def callback_prefix(update: Update) -> str | None:
+    query = update.callback_query
+    if query is None or not isinstance(query.data, str):
+        return None
+    prefix, separator, _ = query.data.partition(CALLBACK_SEPARATOR)
+    if not separator:
+        return None
+    return prefix
+
+
+def _overrides(plugin: BasePlugin, method: str) -> bool:
+    return getattr(type(plugin), method) is not getattr(BasePlugin, method)
+
+
+class PluginRouter:
+    """Dispatch index built once from the plugins' declared routes.
+
+    Commands and callback prefixes are dict lookups, content filters are
+    checked in plugin order, and only plugins that still implement
+    ``test_message``/``test_callback_query`` are polled by priority for
+    whatever is left (free text, media).
+    """
+
+    def __init__(self, plugins: dict[str, BasePlugin]):
+        self.commands: dict[str, list[Route]] = {}
+        self.callbacks: dict[str, Route] = {}
+        self.content_routes: list[tuple[BaseFilter, Route]] = []
+        self.message_fallbacks: list[BasePlugin] = []
+        self.callback_fallbacks: list[BasePlugin] = []
+        for plugin in plugins.values():
+            self.register(plugin)
+
+    def register(self, plugin: BasePlugin):
+        for command, handle_name in plugin.commands.items():
+            self.commands.setdefault(command.lower(), []).append(
+                Route(plugin, getattr(plugin, handle_name))
+            )
+        if plugin.callback_prefix is not None:
+            if plugin.callback_prefix in self.callbacks:
+                logger.warning(
+                    f"callback prefix {plugin.callback_prefix} of {plugin.name} is "
+                    f"already routed to {self.callbacks[plugin.callback_prefix].plugin.name}"
+                )
+            else:
+                self.callbacks[plugin.callback_prefix] = Route(
+                    plugin, getattr(plugin, plugin.callback_handler)
+                )
+        for content_filter, handle_name in plugin.content_filters:
+            self.content_routes.append(
+                (content_filter, Route(plugin, getattr(plugin, handle_name)))
+            )
+        if _overrides(plugin, "test_message"):
+            self.message_fallbacks.append(plugin)
+        if _overrides(plugin, "test_callback_query"):
+            self.callback_fallbacks.append(plugin)
+
+    def route_message(
+        self, update: Update, state, web_app_data, bot_username: str | None = None
+    ) -> Route | None:
+        command = message_command(update, bot_username)
+        if command is not None:
+            for route in self.commands.get(command, ()):
+                if route.plugin.accepts_route(update):
+                    return route
+        for content_filter, route in self.content_routes:
+            if content_filter.check_update(update) and route.plugin.accepts_route(update):
+                return route
+        return self._poll(
+            self.message_fallbacks,
+            lambda plugin: plugin.test_message(update, state, web_app_data),
+        )
+
+    def route_callback_query(self, update: Update, state) -> Route | None:
+        prefix = callback_prefix(update)
+        if prefix is not None:
+            route = self.callbacks.get(prefix)
+            if route is not None and route.plugin.accepts_route(update):
+                return route
+        return self._poll(
+            self.callback_fallbacks,
+            lambda plugin: plugin.test_callback_query(update, state),
+        )
+
+    @staticmethod
+    def _poll(plugins: list[BasePlugin], test) -> Route | None:
+        chosen = None
+        hits = 0
+        for plugin in plugins:
+            priority, handle = test(plugin)
+            if priority > PRIORITY_NOT_ACCEPTING:
+                hits += 1
+            if priority > (chosen.priority if chosen else PRIORITY_NOT_ACCEPTING):
+                chosen = Route(plugin, handle, priority)
+        if chosen is None:
+            return None
+        return chosen._replace(hits=hits)
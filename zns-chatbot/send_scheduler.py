@@ -0,0 +1,204 @@
+import asyncio
+from contextvars import ContextVar
+from datetime import timedelta
+from heapq import heappop, heappush
+from itertools import count
+import logging
+from time import monotonic
+from typing import Any, Callable, Coroutine
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+SEND_INTERACTIVE = 0
+SEND_BULK = 1
+
+MAX_RETRIES = 3
+STATS_LOG_INTERVAL = 60  # seconds
+LIMITED_ENDPOINT_PREFIXES = ("send", "copyMessage", "forwardMessage", "editMessage")
+# typing indicators aren't messages; queueing them behind the reply they announce helps no one
+UNLIMITED_ENDPOINTS = frozenset(("sendChatAction",))
+
+# Background loops set this to SEND_BULK for everything they send.
+send_priority: ContextVar[int] = ContextVar("send_priority", default=SEND_INTERACTIVE)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def _is_group(chat_id) -> bool:
+    return not isinstance(chat_id, int) or chat_id < 0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """Takes a token in advance, returns how long to wait until it's ours."""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class SendScheduler(BaseRateLimiter):
+    """Global outbound limiter for every request the bot makes.
+
+    Message-sending endpoints first wait for their chat's bucket (private
+    chats and groups have separate rates), then for a slot of the global
+    bucket. Global slots are handed out by priority, so interactive
+    replies overtake queued bulk notifications. ``RetryAfter`` pauses the
+    whole bot for the requested time and retries the request.
+    """
+
+    def __init__(
+            self,
+            global_rate: float = 30,
+            chat_rate: float = 1,
+            group_rate: float = 20 / 60,
+            max_retries: int = MAX_RETRIES,
+        ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        # no burst allowance: Telegram counts the global limit over a sliding window
+        self._global = TokenBucket(global_rate, 1)
+        self._chats: dict[Any, TokenBucket] = {}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = count()
+        self._pump: asyncio.Task | None = None
+        self._paused_until = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._pump is not None:
+            self._pump.cancel()
+        for _, _, waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+
+    def stats(self) -> dict:
+        waiting = [0, 0]
+        for priority, _, waiter in self._waiters:
+            if not waiter.done():
+                waiting[priority] += 1
+        return {
+            "waiting_interactive": waiting[SEND_INTERACTIVE],
+            "waiting_bulk": waiting[SEND_BULK],
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            stats = self.stats()
+            if stats["waiting_interactive"] or stats["waiting_bulk"] or stats["retried"]:
+                logger.info(f"send scheduler: {stats}")
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._chats = {
+                    key: value for key, value in self._chats.items() if not value.idle()
+                }
+            if _is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, 3)
+            else:
+                bucket = TokenBucket(self.chat_rate, 1)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_global(self, priority: int):
+        waiter = asyncio.get_running_loop().create_future()
+        heappush(self._waiters, (priority, next(self._seq), waiter))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await waiter
+
+    async def _run_pump(self):
+        while self._waiters:
+            delay = max(self._global.wait_time(), self._paused_until - monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, waiter = heappop(self._waiters)
+            if waiter.done():
+                continue
+            self._global.take()
+            waiter.set_result(None)
+
+    async def process_request(
+            self,
+            callback: Callable[..., Coroutine[Any, Any, bool | dict[str, Any] | None]],
+            args: Any,
+            kwargs: dict[str, Any],
+            endpoint: str,
+            data: dict[str, Any],
+            rate_limit_args: int | None,
+        ) -> bool | dict[str, Any] | None:
+        if endpoint in UNLIMITED_ENDPOINTS or not endpoint.startswith(LIMITED_ENDPOINT_PREFIXES):
+            return await callback(*args, **kwargs)
+        priority = rate_limit_args if rate_limit_args is not None else send_priority.get()
+        chat_id = data.get("chat_id")
+        started = monotonic()
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_global(priority)
+            self.max_wait = max(self.max_wait, monotonic() - started)
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                retry_after = _retry_after_seconds(e)
+                logger.warning(f"{endpoint} to {chat_id} hit flood control, retrying in {retry_after}s")
+                self._paused_until = max(self._paused_until, monotonic() + retry_after)
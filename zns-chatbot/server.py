@@ -13,10 +13,10 @@ import tornado.platform.asyncio
 import tornado.web
 from bson import ObjectId
 from PIL import Image, features as pil_features
-from telegram import Bot
+from telegram import Bot, Update
 from tornado.httputil import HTTPServerRequest
 
-from .config import Config
+from .config import Config, telegram_webhook_secret
 from .events import Events
 from .plugins.massage import now_msk
 from .plugins.orders import (
@@ -211,6 +211,7 @@ class OrdersHandler(RequestHandlerWithApp):
         from .plugins.orders import (
             GRODNO_GORODNITSA_SERVICE,
             GRODNO_OVERVIEW_SERVICE,
+            SHUTTLE_SERVICE,
             Orders,
         )
         orders: Orders = self.app.orders
@@ -237,9 +238,10 @@ class OrdersHandler(RequestHandlerWithApp):
         if locale_str.startswith("ru"):
             lang = "ru"
 
-        shuttle_available = await orders.shuttle_available(choice)
+        availability = await orders.services_available(choice)
+        shuttle_available = availability[SHUTTLE_SERVICE]
         grodno_excursion_availability = {
-            service: await orders.service_available(service, choice)
+            service: availability[service]
             for service in (GRODNO_OVERVIEW_SERVICE, GRODNO_GORODNITSA_SERVICE)
         }
 
@@ -785,6 +787,31 @@ class BotNameHandler(RequestHandlerWithApp):
         self.write({"name": self.bot.name[1:]})
 
 
+class TelegramWebhookHandler(RequestHandlerWithApp):
+    def initialize(self, app, secret: str):
+        super().initialize(app)
+        self.secret = secret
+
+    async def post(self, path_secret: str):
+        header_secret = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not (
+            hmac.compare_digest(path_secret, self.secret)
+            and hmac.compare_digest(header_secret, self.secret)
+        ):
+            logger.warning("telegram webhook called with a wrong secret")
+            raise tornado.web.HTTPError(403)
+        if self.app.bot is None:
+            # not started yet or shutting down, Telegram will redeliver
+            raise tornado.web.HTTPError(503)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.app.bot.bot)
+        except Exception as e:
+            logger.error(f"malformed webhook update: {e}", exc_info=1)
+            raise tornado.web.HTTPError(400)
+        await self.app.bot.update_queue.put(update)
+        self.set_status(200)
+
+
 class ErrorHandler(RequestHandlerWithApp):
     async def post(self):
         try:
@@ -844,22 +871,29 @@ async def create_server(config: Config, base_app):
         f"secret {config.telegram.token.get_secret_value()} {config.mongo_db.address}".encode()
     ).hexdigest()
 
+    handlers = [
+        (r"/fit_frame", FitFrameHandler, {"app": base_app}),
+        (r"/get_compensations", GetCompensationsHandler, {"app": base_app}),
+        (r"/massage_timetable", MassageTimetablePageHandler, {"app": base_app}),
+        (r"/massage_timetable_data", MassageTimetableHandler, {"app": base_app}),
+        (r"/bot_name", BotNameHandler, {"app": base_app}),
+        (r"/auth", AuthHandler, {"app": base_app}),
+        (r"/orders", OrdersHandler, {"app": base_app}),
+        # (r"/food_get_orders", FoodGetOrders, {"app": base_app}),
+        (r"/menu", MenuHandler, {"app": base_app}),
+        (r"/error", ErrorHandler, {"app": base_app}),
+        (r"/photos/(.*)", PhotoHandler),
+        (r"/static/x/(.*)", CustomStaticFileHandler, {"path": "static/x/"}),
+        (r"/static/(.*)", tornado.web.StaticFileHandler, {"path": "static/"}),
+    ]
+    if config.server.telegram_webhook:
+        handlers.append((
+            r"/tg_webhook/([^/]+)",
+            TelegramWebhookHandler,
+            {"app": base_app, "secret": telegram_webhook_secret(config)},
+        ))
     app = tornado.web.Application(
-        [
-            (r"/fit_frame", FitFrameHandler, {"app": base_app}),
-            (r"/get_compensations", GetCompensationsHandler, {"app": base_app}),
-            (r"/massage_timetable", MassageTimetablePageHandler, {"app": base_app}),
-            (r"/massage_timetable_data", MassageTimetableHandler, {"app": base_app}),
-            (r"/bot_name", BotNameHandler, {"app": base_app}),
-            (r"/auth", AuthHandler, {"app": base_app}),
-            (r"/orders", OrdersHandler, {"app": base_app}),
-            # (r"/food_get_orders", FoodGetOrders, {"app": base_app}),
-            (r"/menu", MenuHandler, {"app": base_app}),
-            (r"/error", ErrorHandler, {"app": base_app}),
-            (r"/photos/(.*)", PhotoHandler),
-            (r"/static/x/(.*)", CustomStaticFileHandler, {"path": "static/x/"}),
-            (r"/static/(.*)", tornado.web.StaticFileHandler, {"path": "static/"}),
-        ],
+        handlers,
         template_path="templates/",
         cookie_secret=secret,
     )
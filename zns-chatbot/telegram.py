@@ -1,8 +1,10 @@
 import asyncio
 import datetime
+import heapq
+import itertools
 import json
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from telegram import BotCommand, InlineKeyboardMarkup, MenuButtonCommands, Update, User
 from telegram.constants import ParseMode
@@ -17,14 +19,15 @@ from telegram.ext import (
     filters,
 )
 
-from .config import Config
-from .plugins.base_plugin import PRIORITY_NOT_ACCEPTING
+from .config import Config, full_link, telegram_webhook_secret
+from .routing import PluginRouter
+from .send_scheduler import SendScheduler
 from .tg_state import TGState
+from .update_scheduler import UpdateScheduler
 
 logger = logging.getLogger(__name__)
 
 CROPPER = 1
-DEADLINE_TICK = 200
 
 
 def user_print_name(user: User) -> str:
@@ -34,7 +37,9 @@ def user_print_name(user: User) -> str:
 
 
 async def start(update: Update, context: CallbackContext):
-    asyncio.create_task(start_task(update, context))
+    context.application.scheduler.submit(
+        update.effective_user.id, lambda: start_task(update, context)
+    )
 
 
 async def start_task(update: Update, context: CallbackContext):
@@ -108,18 +113,23 @@ class TGUpdate(TGState):
             s, args=kwargs, locale=self.update.effective_user.language_code
         )
 
+    def profile_fields(self) -> dict:
+        effective_user = self.update.effective_user
+        return {
+            "username": effective_user.username,
+            "first_name": effective_user.first_name,
+            "last_name": effective_user.last_name,
+            "language_code": effective_user.language_code,
+            "print_name": user_print_name(effective_user),
+        }
+
     async def get_state(self):
-        user = await self.load_user()
+        user = await self.get_user()
+        profile = self.profile_fields()
         if user is None and self.user_db is not None:
             await self.update_user(
                 {
-                    "$set": {
-                        "username": self.update.effective_user.username,
-                        "first_name": self.update.effective_user.first_name,
-                        "last_name": self.update.effective_user.last_name,
-                        "language_code": self.update.effective_user.language_code,
-                        "print_name": user_print_name(self.update.effective_user),
-                    },
+                    "$set": profile,
                     "$inc": {
                         "starts_called": 1,
                     },
@@ -133,19 +143,10 @@ class TGUpdate(TGState):
                 },
                 upsert=True,
             )
-        else:
-            await self.update_user(
-                {
-                    "$set": {
-                        "username": self.update.effective_user.username,
-                        "first_name": self.update.effective_user.first_name,
-                        "last_name": self.update.effective_user.last_name,
-                        "language_code": self.update.effective_user.language_code,
-                        "print_name": user_print_name(self.update.effective_user),
-                    }
-                },
-                upsert=True,
-            )
+        elif user is not None and any(
+            user.get(field) != value for field, value in profile.items()
+        ):
+            await self.update_user({"$set": profile}, upsert=True)
         self.language_code = self.update.effective_user.language_code
         if user is not None and "state" in user:
             self.state = user["state"]
@@ -183,31 +184,18 @@ class TGUpdate(TGState):
         return await self.state_cq_empty()
 
     async def state_empty(self):
-        chosen_handle = None
-        chosen_priority = PRIORITY_NOT_ACCEPTING
-        chosen_plugin = None
-        accepted_plugins = []
-        hits = 0
         # TODO: for several messages chosen at the same priority, if they have priority title, send a selector message
-        for _, plugin in self.context.application.plugins.items():
-            priority, handle = plugin.test_message(
-                self.update, self.state, self.web_app_data
-            )
-            if priority > PRIORITY_NOT_ACCEPTING:
-                hits += 1
-                accepted_plugins.append((plugin, handle))
-            if priority > chosen_priority:
-                chosen_priority = priority
-                chosen_handle = handle
-                chosen_plugin = plugin
-        if chosen_plugin is not None:
+        route = self.context.application.router.route_message(
+            self.update, self.state, self.web_app_data, self.bot.username
+        )
+        if route is not None:
             logger.info(
-                f"from {hits} accepting plugins for user {self.user} selected plugin {chosen_plugin.name} based on priority {chosen_priority}"
+                f"from {route.hits} accepting plugins for user {self.user} selected plugin {route.plugin.name} based on priority {route.priority}"
             )
-            if chosen_handle is not None:
-                await chosen_handle(self)
+            if route.handle is not None:
+                await route.handle(self)
             else:
-                await chosen_plugin.handle_message(self)
+                await route.plugin.handle_message(self)
         else:
             await self.update.message.reply_markdown(
                 self.l("unsupported-message-error")
@@ -219,29 +207,17 @@ class TGUpdate(TGState):
         await self.update.message.reply_markdown(self.l("undefined-state-error"))
 
     async def state_cq_empty(self):
-        chosen_handle = None
-        chosen_priority = PRIORITY_NOT_ACCEPTING
-        chosen_plugin = None
-        accepted_plugins = []
-        hits = 0
-        # TODO: for several messages chosen at the same priority, if they have priority title, send a selector message
-        for _, plugin in self.context.application.plugins.items():
-            priority, handle = plugin.test_callback_query(self.update, self.state)
-            if priority > PRIORITY_NOT_ACCEPTING:
-                hits += 1
-                accepted_plugins.append((plugin, handle))
-            if priority > chosen_priority:
-                chosen_priority = priority
-                chosen_handle = handle
-                chosen_plugin = plugin
-        if chosen_plugin is not None:
+        route = self.context.application.router.route_callback_query(
+            self.update, self.state
+        )
+        if route is not None:
             logger.info(
-                f"from {hits} accepting plugins for user {self.user} selected plugin {chosen_plugin.name} based on priority {chosen_priority}"
+                f"from {route.hits} accepting plugins for user {self.user} selected plugin {route.plugin.name} based on priority {route.priority}"
             )
-            if chosen_handle is not None:
-                await chosen_handle(self)
+            if route.handle is not None:
+                await route.handle(self)
             else:
-                await chosen_plugin.handle_callback_query(self)
+                await route.plugin.handle_callback_query(self)
         else:
             logger.debug(f"unsupported message: {self.update=}")
             await self.update.callback_query.edit_message_text(
@@ -341,43 +317,90 @@ class TGApplication(Application):
         self.base_app = base_app
         self.config = base_config
         self.plugins = chat_plugins
+        self.router = PluginRouter(chat_plugins)
+        self.scheduler = UpdateScheduler(
+            base_config.telegram.update_workers,
+            base_config.telegram.callback_query_max_age,
+        )
 
 
-async def deadline_cleaner_task(app, plugins):
-    from asyncio import sleep
-
-    from motor.core import AgnosticCollection
+class DeadlineScheduler:
+    """Fires input timeouts set by ``TGState.require_input``/``require_anything``.
+
+    Deadlines live in a min-heap seeded from Mongo at startup and fed by
+    :meth:`push`, so each one fires on time and nothing is polled while idle.
+    The state is claimed with a conditional update, so a deadline that was
+    replaced or already handled (e.g. by another replica) is skipped.
+    """
+
+    def __init__(self, app, plugins):
+        self.app = app
+        self.plugins = plugins
+        self.user_db = app.users_collection
+        self._heap: list[tuple[datetime.datetime, int, int, str]] = []
+        self._latest: dict[int, datetime.datetime] = {}
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def push(self, user_id: int, state: dict):
+        deadline = state["deadline"]
+        self._latest[user_id] = deadline
+        heapq.heappush(
+            self._heap, (deadline, next(self._seq), user_id, state["state"])
+        )
+        if self._heap[0][2] == user_id:
+            self._changed.set()
 
-    user_db: AgnosticCollection = app.users_collection
-    while True:
+    async def start(self):
         try:
-            await sleep(DEADLINE_TICK)
-            now = datetime.datetime.now()
-            async for user in user_db.find(
-                {
-                    "bot_id": app.bot.bot.id,
-                    "state.deadline": {"$lt": now},
-                }
+            bot_id = self.app.bot.bot.id
+            async for user in self.user_db.find(
+                {"bot_id": bot_id, "state.deadline": {"$exists": True}},
+                {"user_id": 1, "state.deadline": 1, "state.state": 1},
             ):
-                result = await user_db.update_one(
-                    {
-                        "bot_id": app.bot.bot.id,
-                        "user_id": user["user_id"],
-                        "state.state": user["state"]["state"],
-                        "state.deadline": {
-                            "$lte": user["state"]["deadline"]
-                            + datetime.timedelta(seconds=1),
-                            "$gte": user["state"]["deadline"]
-                            - datetime.timedelta(seconds=1),
-                        },
-                    },
-                    {"$set": {"state": {"state": ""}}},
-                )
-                if result.modified_count > 0:
-                    d = TGDeadline(user["user_id"], app, plugins, user["state"])
-                    asyncio.create_task(d.process())
+                if user["user_id"] not in self._latest:
+                    self.push(user["user_id"], user["state"])
         except Exception as e:
-            logger.error(f"error in deadline_cleaner_task: {e}", exc_info=1)
+            logger.error(f"failed to seed deadlines: {e}", exc_info=1)
+        await self.run()
+
+    async def run(self):
+        while True:
+            try:
+                self._changed.clear()
+                if not self._heap:
+                    await self._changed.wait()
+                    continue
+                delay = (self._heap[0][0] - datetime.datetime.now()).total_seconds()
+                if delay > 0:
+                    with suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._changed.wait(), delay)
+                    continue
+                deadline, _, user_id, state_name = heapq.heappop(self._heap)
+                if self._latest.get(user_id) != deadline:
+                    continue
+                del self._latest[user_id]
+                await self.fire(user_id, deadline, state_name)
+            except Exception as e:
+                logger.error(f"error in DeadlineScheduler: {e}", exc_info=1)
+
+    async def fire(self, user_id: int, deadline: datetime.datetime, state_name: str):
+        user = await self.user_db.find_one_and_update(
+            {
+                "bot_id": self.app.bot.bot.id,
+                "user_id": user_id,
+                "state.state": state_name,
+                "state.deadline": {
+                    "$lte": deadline + datetime.timedelta(seconds=1),
+                    "$gte": deadline - datetime.timedelta(seconds=1),
+                },
+            },
+            {"$set": {"state": {"state": ""}}},
+            projection={"state": 1},
+        )
+        if user is not None:
+            d = TGDeadline(user_id, self.app, self.plugins, user["state"])
+            asyncio.create_task(d.process())
 
 
 async def check_startup_actions(app):
@@ -438,7 +461,9 @@ async def check_startup_actions(app):
 
 
 async def parse_message(tgupdate: Update, context: CallbackContext):
-    asyncio.create_task(parse_message_task(tgupdate, context))
+    context.application.scheduler.submit(
+        tgupdate.effective_user.id, lambda: parse_message_task(tgupdate, context)
+    )
 
 
 async def parse_message_task(tgupdate: Update, context: CallbackContext):
@@ -460,7 +485,11 @@ async def parse_message_task(tgupdate: Update, context: CallbackContext):
 
 async def parse_callback_query(tgupdate: Update, context: CallbackContext):
     await tgupdate.callback_query.answer()
-    asyncio.create_task(parse_callback_query_task(tgupdate, context))
+    context.application.scheduler.submit(
+        tgupdate.effective_user.id,
+        lambda: parse_callback_query_task(tgupdate, context),
+        is_callback_query=True,
+    )
 
 
 async def parse_callback_query_task(tgupdate: Update, context: CallbackContext):
@@ -492,6 +521,13 @@ async def create_telegram_bot(config: Config, app, plugins) -> TGApplication: #
             },
         )
         .token(token=config.telegram.token.get_secret_value())
+        .rate_limiter(
+            SendScheduler(
+                global_rate=config.telegram.global_send_rate,
+                chat_rate=config.telegram.chat_send_rate,
+                group_rate=config.telegram.group_send_rate,
+            )
+        )
         .build()
     )
 
@@ -508,17 +544,30 @@ async def create_telegram_bot(config: Config, app, plugins) -> TGApplication: #
     try:
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        if config.server.telegram_webhook:
+            # updates arrive via server.TelegramWebhookHandler
+            secret = telegram_webhook_secret(config)
+            await application.bot.set_webhook(
+                url=full_link(app, f"/tg_webhook/{secret}"),
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            await application.updater.start_polling()
 
         app.bot = application
 
         await app.storage.refresh(application.bot.id)
         app.bot_started.set()
         asyncio.create_task(check_startup_actions(app))
-        asyncio.create_task(deadline_cleaner_task(app, plugins))
+        app.deadlines = DeadlineScheduler(app, plugins)
+        asyncio.create_task(app.deadlines.start())
+        asyncio.create_task(application.scheduler.log_stats())
+        asyncio.create_task(application.bot.rate_limiter.log_stats())
         yield application
     finally:
         app.bot = None
         await application.stop()
-        await application.updater.stop()
+        if application.updater.running:
+            await application.updater.stop()
         await application.shutdown()
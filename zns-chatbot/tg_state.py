@@ -201,10 +201,22 @@ class TGState:
             }, request, upsert=upsert)
 
     async def load_user(self):
-        self._user = await self.user_db.find_one({
-            "user_id": self.user,
-            "bot_id": self.bot.id,
-        })
+        cache = getattr(self.user_db, "cache", None)
+        if cache is None:
+            self._user = await self.user_db.find_one({
+                "user_id": self.user,
+                "bot_id": self.bot.id,
+            })
+            return self._user
+        key = (self.bot.id, self.user)
+        self._user = cache.get(key)
+        if self._user is None:
+            token = cache.begin_load(key)
+            self._user = await self.user_db.find_one({
+                "user_id": self.user,
+                "bot_id": self.bot.id,
+            })
+            cache.finish_load(key, token, self._user)
         return self._user
 
     async def get_user(self):
@@ -236,6 +248,11 @@ class TGState:
             }
         })
     
+    def schedule_deadline(self):
+        deadlines = getattr(self.app, "deadlines", None)
+        if deadlines is not None and "deadline" in self.state:
+            deadlines.push(self.user, self.state)
+
     async def require_input(self, plugin_name: str, plugin_callback_name: str, data: Any,
             timeout_callback: str|None = None,
             timeout_time: float = INPUT_TIMEOUT,
@@ -249,6 +266,7 @@ class TGState:
             self.state["timeout_callback"] = timeout_callback
             self.state["deadline"] = datetime.now() + timedelta(seconds=timeout_time)
         await self.save_state()
+        self.schedule_deadline()
 
     async def require_anything(self, plugin_name: str, plugin_callback_name: str, data: Any,
             timeout_callback: str|None = None,
@@ -263,6 +281,7 @@ class TGState:
             self.state["timeout_callback"] = timeout_callback
             self.state["deadline"] = datetime.now() + timedelta(seconds=timeout_time)
         await self.save_state()
+        self.schedule_deadline()
     
     async def keep_sending_chat_action_until(self, until: Event, chat_id=None, action=ChatAction.TYPING):
         if chat_id is None:
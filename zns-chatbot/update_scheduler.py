@@ -0,0 +1,102 @@
+import asyncio
+from collections import deque
+import logging
+from time import monotonic
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+USER_QUEUE_LIMIT = 50
+STATS_LOG_INTERVAL = 60  # seconds
+
+
+class UpdateScheduler:
+    """Per-user FIFO actors sharing a global worker budget.
+
+    Updates of one user run strictly one after another, so handlers never
+    race on the same user's ``state``. At most ``workers`` handlers run at
+    once; the rest wait as cheap queue entries instead of live tasks.
+    Callback queries that waited longer than ``callback_query_max_age``
+    are shed, since the user has already moved on.
+    """
+
+    def __init__(
+            self,
+            workers: int,
+            callback_query_max_age: float,
+            user_queue_limit: int = USER_QUEUE_LIMIT,
+        ):
+        self.workers = workers
+        self.callback_query_max_age = callback_query_max_age
+        self.user_queue_limit = user_queue_limit
+        self._budget = asyncio.Semaphore(workers)
+        self._queues: dict[Hashable, deque] = {}
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.processed = 0
+        self.shed = 0
+        self.dropped = 0
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._queues),
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "processed": self.processed,
+            "shed": self.shed,
+            "dropped": self.dropped,
+        }
+
+    def submit(
+            self,
+            key: Hashable,
+            job: Callable[[], Awaitable],
+            is_callback_query: bool = False,
+        ) -> bool:
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self.user_queue_limit:
+            self.dropped += 1
+            logger.warning(f"update queue of {key} is full, dropping update")
+            return False
+        start_actor = queue is None
+        if start_actor:
+            queue = deque()
+            self._queues[key] = queue
+        queue.append((monotonic(), is_callback_query, job))
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        if start_actor:
+            asyncio.create_task(self._run_actor(key, queue))
+        return True
+
+    async def _run_actor(self, key: Hashable, queue: deque):
+        try:
+            while queue:
+                enqueued_at, is_callback_query, job = queue.popleft()
+                self.queued -= 1
+                async with self._budget:
+                    waited = monotonic() - enqueued_at
+                    if is_callback_query and waited > self.callback_query_max_age:
+                        self.shed += 1
+                        logger.info(f"shedding callback query of {key} after {waited:.1f}s")
+                        continue
+                    self.running += 1
+                    try:
+                        await job()
+                    except Exception as e:
+                        logger.error(f"Exception in update of {key}: {e}", exc_info=1)
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+        finally:
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+            self.queued -= len(queue)
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            if self.queued > 0 or self.shed > 0 or self.dropped > 0:
+                logger.info(f"update scheduler: {self.stats()}")
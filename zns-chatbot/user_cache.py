@@ -0,0 +1,206 @@
+from collections import OrderedDict
+from copy import deepcopy
+from functools import wraps
+import logging
+import time
+from typing import Any
+
+from motor.core import AgnosticCollection
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = 120  # seconds
+USER_CACHE_SIZE = 10000
+
+USER_KEY_FIELDS = frozenset(("user_id", "bot_id"))
+WRITE_METHODS = frozenset((
+    "update_one",
+    "update_many",
+    "replace_one",
+    "find_one_and_update",
+    "find_one_and_replace",
+    "find_one_and_delete",
+    "delete_one",
+    "delete_many",
+    "insert_one",
+    "insert_many",
+    "bulk_write",
+))
+APPLICABLE_OPERATORS = frozenset(("$set", "$unset", "$inc", "$setOnInsert"))
+
+
+def _resolve_parent(document: dict, path: str, create: bool) -> tuple[dict, str] | None:
+    parts = path.split(".")
+    node = document
+    for part in parts[:-1]:
+        child = node.get(part)
+        if child is None:
+            if not create:
+                return None
+            child = {}
+            node[part] = child
+        if not isinstance(child, dict):
+            return None
+        node = child
+    return node, parts[-1]
+
+
+def apply_update(document: dict, update: dict) -> bool:
+    """Applies a simple update document in place.
+
+    Returns False if the update uses something the cache can't reproduce,
+    in which case the document must be dropped.
+    """
+    if not update or any(op not in APPLICABLE_OPERATORS for op in update):
+        return False
+    for path, value in update.get("$set", {}).items():
+        parent = _resolve_parent(document, path, True)
+        if parent is None:
+            return False
+        parent[0][parent[1]] = deepcopy(value)
+    for path in update.get("$unset", {}):
+        parent = _resolve_parent(document, path, False)
+        if parent is not None:
+            parent[0].pop(parent[1], None)
+    for path, value in update.get("$inc", {}).items():
+        parent = _resolve_parent(document, path, True)
+        if parent is None:
+            return False
+        node, key = parent
+        node[key] = node.get(key, 0) + value
+    # $setOnInsert is a no-op here: a cached document already exists.
+    return True
+
+
+class UserCache:
+    """Per-process LRU of user documents keyed by (bot_id, user_id)."""
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._loads: dict[tuple, object] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, document = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return deepcopy(document)
+
+    def begin_load(self, key: tuple) -> object:
+        token = object()
+        self._loads[key] = token
+        return token
+
+    def finish_load(self, key: tuple, token: object, document: dict | None):
+        """Stores a freshly read document unless the key was written meanwhile."""
+        if self._loads.get(key) is not token:
+            return
+        del self._loads[key]
+        if document is not None:
+            self._put(key, deepcopy(document))
+
+    def _put(self, key: tuple, document: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, document)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def apply(self, key: tuple, update: dict):
+        self._loads.pop(key, None)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if not apply_update(entry[1], update):
+            del self._entries[key]
+
+    def invalidate(self, key: tuple):
+        self._loads.pop(key, None)
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._loads.clear()
+        self._entries.clear()
+
+
+def _user_key(query: Any) -> tuple | None:
+    if not isinstance(query, dict):
+        return None
+    user_id = query.get("user_id")
+    bot_id = query.get("bot_id")
+    if user_id is None or bot_id is None:
+        return None
+    if isinstance(user_id, dict) or isinstance(bot_id, dict):
+        return None
+    return bot_id, user_id
+
+
+class CachedUsersCollection:
+    """Users collection wrapper that keeps a :class:`UserCache` coherent.
+
+    Reads pass through untouched; every write either applies itself to the
+    cached document (plain ``{user_id, bot_id}`` filter with ``$set``,
+    ``$unset`` or ``$inc``) or evicts whatever it could have touched.
+    """
+
+    def __init__(self, collection: AgnosticCollection, cache: UserCache | None = None):
+        self._collection = collection
+        self.cache = cache if cache is not None else UserCache()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._collection, name)
+        if name not in WRITE_METHODS:
+            return attr
+
+        @wraps(attr)
+        async def write(*args, **kwargs):
+            try:
+                result = await attr(*args, **kwargs)
+            except BaseException:
+                self._after_write(name, args, kwargs, failed=True)
+                raise
+            self._after_write(name, args, kwargs)
+            return result
+        return write
+
+    def __getitem__(self, name: str):
+        return self._collection[name]
+
+    def _after_write(self, method: str, args: tuple, kwargs: dict, failed: bool = False):
+        query = args[0] if args else kwargs.get("filter")
+        if method in ("insert_one", "insert_many"):
+            documents = [query] if method == "insert_one" else list(query or [])
+            for document in documents:
+                key = _user_key(document)
+                if key is None:
+                    self.cache.clear()
+                    return
+                self.cache.invalidate(key)
+            return
+        key = _user_key(query) if method != "bulk_write" else None
+        if key is None:
+            self.cache.clear()
+            return
+        update = args[1] if len(args) > 1 else kwargs.get("update")
+        if (
+            not failed
+            and method == "update_one"
+            and set(query.keys()) == USER_KEY_FIELDS
+            and isinstance(update, dict)
+        ):
+            self.cache.apply(key, update)
+        else:
+            self.cache.invalidate(key)